@@ -0,0 +1,149 @@
+"""
+Compiler throughput and scaling benchmark.
+
+Compiles synthetic programs (see program_generator.py) of growing size,
+times every pipeline stage and fits time = a * n^k per stage, n being the
+statement count. A stage whose exponent k grows past the baseline's by more
+than --tolerance is reported as a scaling regression (exit status 1), so a
+quadratic pass shows up even on a faster machine.
+
+usage: python benchmarks/compile_throughput.py [--max-size 100000]
+       python benchmarks/compile_throughput.py --update-baseline
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import sys
+import tempfile
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+
+from build import compile_file
+from build_cache import compiler_version
+from pass_stats import CompileStats
+from program_generator import generate_program
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_BASELINE = os.path.join(BENCHMARKS, "baselines", "compile_throughput.json")
+NOISE_FLOOR = 0.001     # seconds, shorter timings are left out of the fit
+
+
+def measure(path, repeat):
+    """
+    Fastest time of every phase over `repeat` compilations of one file.
+    """
+    best = {}
+    for _ in range(repeat):
+        gc.collect()
+        stats = CompileStats(path, trace_memory=False)
+        compile_file(path, stats=stats)
+        for record in stats.phases:
+            best[record.name] = min(best.get(record.name, math.inf), record.wall)
+        best["total"] = min(best.get("total", math.inf), stats.total()[0])
+    return best
+
+
+def fit_power_law(sizes, seconds):
+    """
+    Least squares fit of log t = log a + k log n, returns (a, k) or None
+    when fewer than two timings are above the noise floor.
+    """
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, seconds) if t >= NOISE_FLOOR]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    k = sxy / sxx
+    return math.exp(mean_y - k * mean_x), k
+
+
+def run(sizes, shape, repeat, report=print):
+    """
+    Benchmark every size, return the results as a JSON-ready dict.
+    """
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            path = os.path.join(tmp, f"prog{size}.txt")
+            with open(path, "w") as file:
+                file.write(generate_program(size, **shape))
+            # large programs take long enough to be stable with one run
+            best = measure(path, repeat if size <= 10_000 else 1)
+            for name, seconds in best.items():
+                timings.setdefault(name, []).append(seconds)
+            report(f"{size:>9} statements  {best['total']:9.3f} s  {size / best['total']:10.0f} statements/s")
+    phases = {}
+    for name, seconds in timings.items():
+        fit = fit_power_law(sizes, seconds)
+        phases[name] = {"seconds": seconds,
+                        "coefficient": fit[0] if fit else None,
+                        "exponent": fit[1] if fit else None}
+    return {"compiler_version": compiler_version(), "shape": shape,
+            "sizes": sizes, "phases": phases}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Table of exponents against the baseline, returns the regressed phases.
+    """
+    regressions = []
+    print(f"{'phase':<28} {'exponent':>9} {'baseline':>9}  at n={results['sizes'][-1]}")
+    for name, phase in results["phases"].items():
+        exponent = phase["exponent"]
+        base = baseline.get("phases", {}).get(name, {}).get("exponent")
+        status = ""
+        if exponent is not None and base is not None and exponent > base + tolerance:
+            status = "  REGRESSION"
+            regressions.append(name)
+        shown = lambda k: "-" if k is None else f"{k:.2f}"
+        print(f"{name:<28} {shown(exponent):>9} {shown(base):>9}  {phase['seconds'][-1]:.3f} s{status}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiler throughput and scaling benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Statement counts to compile")
+    parser.add_argument("--max-size", type=int, help="Skip sizes above this")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size up to 10000 statements")
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--variables", type=int, default=20)
+    parser.add_argument("--strings", type=int, default=4)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Allowed growth of a scaling exponent over the baseline")
+    args = parser.parse_args()
+
+    sizes = [size for size in args.sizes if args.max_size is None or size <= args.max_size]
+    shape = {"width": args.width, "depth": args.depth,
+             "variables": args.variables, "strings": args.strings}
+    results = run(sizes, shape, args.repeat)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"baseline written to {args.baseline}")
+        return
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline.get("shape") != shape:
+            print("warning: the baseline was measured on differently shaped programs")
+    if compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
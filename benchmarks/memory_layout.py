@@ -0,0 +1,121 @@
+"""
+Memory benchmark for the compact data layouts.
+
+Builds a synthetic program and measures (tracemalloc) the memory held by
+its tokens, AST and IR in three layouts:
+    plain  - classes with a per-instance __dict__ (the old layout)
+    slots  - the __slots__ classes used by the compiler
+    array  - struct-of-arrays TokenArray / IRArray
+
+usage: python benchmarks/memory_layout.py [--statements 1000000]
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import ast_classes
+from lexical_analysis.lexer import Lexer
+from lexical_analysis.token import Token
+from lexical_analysis.token_array import TokenArray
+from syntax_analysis.parser import Parser
+from intermediate_representation.ir_generator import IRGenerator
+from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.ir_array import IRArray
+
+
+def plain_class(cls):
+    """
+    Same constructor as `cls`, but instances keep their fields in a __dict__.
+    """
+    return type("Plain" + cls.__name__, (), {"__init__": cls.__init__})
+
+PlainToken = plain_class(Token)
+PlainIRInstr = plain_class(IRInstr)
+PLAIN_AST = {cls: plain_class(cls) for cls in vars(ast_classes).values()
+             if isinstance(cls, type) and issubclass(cls, ast_classes.ASTNode)}
+
+
+def synthetic_program(statements, variables=100):
+    lines = [f"int v{i} = {i};" for i in range(variables)]
+    for i in range(statements - variables):
+        a, b, c = i % variables, (i * 7) % variables, (i * 13) % variables
+        if i % 50 == 0:
+            lines.append(f"print(v{a});")
+        else:
+            lines.append(f"v{a} = v{b} + v{c} * {i % 97};")
+    return "\n".join(lines)
+
+
+def copy_ast(node, plain):
+    """
+    Copy an AST into fresh slotted nodes, or plain (dict-backed) ones.
+    """
+    if isinstance(node, list):
+        return [copy_ast(n, plain) for n in node]
+    if not isinstance(node, ast_classes.ASTNode):
+        return node
+    cls = PLAIN_AST[type(node)] if plain else type(node)
+    copy = cls.__new__(cls)
+    for slot in type(node).__slots__:
+        setattr(copy, slot, copy_ast(getattr(node, slot), plain))
+    return copy
+
+
+def measure(build):
+    """
+    Bytes still allocated by the object returned from build().
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def report(name, sizes, count):
+    base = sizes["plain"]
+    print(f"{name} ({count:,} items)")
+    for layout, size in sizes.items():
+        print(f"    {layout:<6} {size / 2**20:10.1f} MiB  {size / count:7.1f} B/item"
+              f"  {100 * size / base:6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory use of token/AST/IR layouts")
+    parser.add_argument("--statements", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    source = synthetic_program(args.statements)
+    tokens = list(Lexer(source).stream())
+    report("tokens", {
+        "plain": measure(lambda: [PlainToken(t.kind, t.text, t.offset, t.positions, t.code) for t in tokens]),
+        "slots": measure(lambda: [Token(t.kind, t.text, t.offset, t.positions, t.code) for t in tokens]),
+        "array": measure(lambda: TokenArray(tokens)),
+    }, len(tokens))
+
+    asts = Parser(tokens).parse()
+    del tokens
+    report("ast", {
+        "plain": measure(lambda: copy_ast(asts, plain=True)),
+        "slots": measure(lambda: copy_ast(asts, plain=False)),
+    }, args.statements)
+
+    ir = IRGenerator(asts).gen()
+    del asts
+    report("ir", {
+        "plain": measure(lambda: [PlainIRInstr(i.op, i.arg1, i.arg2, i.dest) for i in ir]),
+        "slots": measure(lambda: [IRInstr(i.op, i.arg1, i.arg2, i.dest) for i in ir]),
+        "array": measure(lambda: IRArray(ir)),
+    }, len(ir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Synthetic source programs for the benchmarks.
+
+The shape of a program is set by:
+    statements - total number of statements, nested ones included
+    width      - operands per assignment expression
+    depth      - if/while nesting depth of the control blocks
+    variables  - number of int variables
+    strings    - number of string literals (one str variable each)
+
+Programs are deterministic for a given seed, they compile without errors
+and terminate when run: every while loop counts its own counter down.
+
+usage: python benchmarks/program_generator.py --statements 1000 --depth 3 > prog.txt
+"""
+import argparse
+import random
+
+OPERATORS = ("+", "-", "*")
+BLOCK_EVERY = 8     # one control block per this many top level statements
+
+
+class ProgramGenerator:
+    def __init__(self, statements, width=3, depth=2, variables=20, strings=4, seed=0):
+        if width < 1 or variables < 1:
+            raise ValueError("width and variables must be at least 1")
+        self.statements = statements
+        self.width = width
+        self.depth = depth
+        self.variables = variables
+        self.strings = strings
+        self.random = random.Random(seed)
+        self.lines = []
+        self.count = 0
+
+    def emit(self, indent, text):
+        self.lines.append("    " * indent + text)
+        self.count += 1
+
+    def var(self):
+        return f"v{self.random.randrange(self.variables)}"
+
+    def expression(self):
+        terms = [self.var() if self.random.random() < 0.7 else str(self.random.randrange(1, 100))
+                 for _ in range(self.width)]
+        expr = terms[0]
+        for previous, term in zip(terms, terms[1:]):
+            op = self.random.choice(OPERATORS)
+            # a variable divided by a literal: never by zero, never folded
+            if previous[0] == "v" and self.random.random() < 0.1:
+                op, term = "/", str(self.random.randrange(2, 10))
+            expr = f"{expr} {op} {term}"
+        return expr
+
+    def simple(self, indent):
+        roll = self.random.random()
+        if roll < 0.05 and self.strings:
+            self.emit(indent, f"print(s{self.random.randrange(self.strings)});")
+        elif roll < 0.1:
+            self.emit(indent, f"print({self.var()});")
+        else:
+            self.emit(indent, f"{self.var()} = {self.expression()};")
+
+    def block(self, indent, level):
+        """
+        if/while nest `depth - level` deep, a simple statement at every level.
+        """
+        if level == self.depth:
+            self.simple(indent)
+            return
+        if level % 2 == 0:
+            counter = f"n{level}"
+            self.emit(indent, f"{counter} = 3;")
+            self.emit(indent, f"while ({counter} > 0) {{")
+            self.emit(indent + 1, f"{counter} = {counter} - 1;")
+        else:
+            self.emit(indent, f"if ({self.var()} > {self.var()}) {{")
+        self.simple(indent + 1)
+        self.block(indent + 1, level + 1)
+        self.lines.append("    " * indent + "}")
+
+    def generate(self):
+        for i in range(self.variables):
+            self.emit(0, f"int v{i} = {i + 1};")
+        for i in range(self.strings):
+            self.emit(0, f'str s{i} = "string {i}";')
+        for level in range(0, self.depth, 2):
+            self.emit(0, f"int n{level} = 0;")
+        top = 0
+        while self.count < self.statements:
+            if self.depth and top % BLOCK_EVERY == BLOCK_EVERY - 1:
+                self.block(0, 0)
+            else:
+                self.simple(0)
+            top += 1
+        self.lines.append("print(v0);")
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_program(statements, width=3, depth=2, variables=20, strings=4, seed=0):
+    return ProgramGenerator(statements, width, depth, variables, strings, seed).generate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a synthetic source program")
+    parser.add_argument("--statements", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--variables", type=int, default=20)
+    parser.add_argument("--strings", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate_program(args.statements, args.width, args.depth, args.variables,
+                           args.strings, args.seed), end="")
+
+
+if __name__ == "__main__":
+    main()
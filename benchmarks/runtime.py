@@ -0,0 +1,125 @@
+"""
+Runtime benchmark of the generated code.
+
+Compiles every program in benchmarks/programs at every optimization level,
+checks that all levels print the same output, runs each executable several
+times and reports the median wall time, the retired instruction count
+(when `perf stat` is available) and the size of the machine code.
+
+usage: python benchmarks/runtime.py [--runs 5] [--printf] [--output results.json] [programs...]
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, "..", "src"))
+
+from build import compile_file
+from build_cache import compiler_version
+from code_generator.x86_encoder import Assembler
+from code_generator.elf_writer import ElfWriter
+from intermediate_representation.ir_optimizer import IROptimizer
+
+PROGRAMS = os.path.join(BENCHMARKS, "programs")
+
+
+def build(source, opt_level, exe_path, printf=False):
+    """
+    Compile with the builtin backend, return the .text size in bytes.
+    """
+    asm = compile_file(source, opt_level=opt_level, printf=printf)["asm"]
+    encoded = Assembler().assemble(asm)
+    ElfWriter(encoded).write_executable(exe_path)
+    return len(encoded.sections[".text"].data)
+
+
+def output_digest(exe_path):
+    result = subprocess.run([exe_path], stdout=subprocess.PIPE, check=True)
+    return hashlib.sha256(result.stdout).hexdigest()
+
+
+def wall_times(exe_path, runs):
+    """
+    Wall time of every run, output discarded.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([exe_path], stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def instruction_count(exe_path):
+    """
+    User space instructions retired by one run, None without perf.
+    """
+    if shutil.which("perf") is None:
+        return None
+    result = subprocess.run(["perf", "stat", "-x,", "-e", "instructions:u", exe_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    for line in result.stderr.splitlines():
+        fields = line.split(",")
+        if len(fields) > 2 and fields[2].startswith("instructions") and fields[0].isdigit():
+            return int(fields[0])
+    return None
+
+
+def run(sources, opt_levels, runs, report=print, printf=False):
+    """
+    Benchmark every source at every level, return a JSON-ready dict.
+    Raises RuntimeError when the levels disagree on a program's output.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for source in sources:
+            name = os.path.splitext(os.path.basename(source))[0]
+            results[name] = {}
+            digests = set()
+            for level in opt_levels:
+                exe_path = os.path.join(tmp, f"{name}-O{level}")
+                code_size = build(source, level, exe_path, printf)
+                digests.add(output_digest(exe_path))
+                times = wall_times(exe_path, runs)
+                results[name][f"O{level}"] = {
+                    "median_s": statistics.median(times), "times_s": times,
+                    "instructions": instruction_count(exe_path), "code_bytes": code_size}
+                row = results[name][f"O{level}"]
+                instructions = "-" if row["instructions"] is None else f"{row['instructions']:,}"
+                report(f"{name:<16} O{level}  {row['median_s'] * 1000:10.1f} ms  "
+                       f"{instructions:>16}  {code_size:>8} B")
+            if len(digests) > 1:
+                raise RuntimeError(f"{name}: optimization levels print different output")
+    return {"compiler_version": compiler_version(), "runs": runs, "printf": printf, "programs": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime benchmark of the generated code")
+    parser.add_argument("programs", nargs="*", help="Source files (default: benchmarks/programs/*.txt)")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per executable, the median is reported")
+    parser.add_argument("-O", "--opt-level", type=int, action="append", choices=sorted(IROptimizer.OPT_LEVELS),
+                        help="Only these optimization levels (default: all)")
+    parser.add_argument("--printf", action="store_true", help="Print with printf instead of the output runtime")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    sources = args.programs or sorted(glob.glob(os.path.join(PROGRAMS, "*.txt")))
+    opt_levels = args.opt_level or sorted(IROptimizer.OPT_LEVELS)
+    print(f"{'program':<16} lvl  {'median':>13}  {'instructions':>16}  {'code':>10}")
+    results = run(sources, opt_levels, args.runs, printf=args.printf)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,14 @@
 Abstract Syntax Tree Clases
 """
 class ASTNode:
+    __slots__ = ()
+
     def __repr__(self):
         return f"{self.__class__.__name__}()"
 
 class NumberExpr(ASTNode):
+    __slots__ = ("value",)
+
     def __init__(self, value: int):
         self.value = value
 
@@ -14,18 +18,24 @@ class NumberExpr(ASTNode):
         return f"NumberExpr({self.value})"
 
 class StringExpr(ASTNode):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
     def __repr__(self):
         return f'StringExpr({self.value!r})'
 
 class VarIdentifier(ASTNode):
+    __slots__ = ("name",)
+
     def __init__(self, name: str):
         self.name = name
     def __repr__(self):
         return f"VarExpr({self.name!r})"
 
 class PrintStmt(ASTNode):
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
         self.expr = expr
 
@@ -33,6 +43,8 @@ class PrintStmt(ASTNode):
         return f"PrintStmt({self.expr})"
 
 class BinaryExpr(ASTNode):
+    __slots__ = ("op", "left", "right")
+
     def __init__(self, operator: str, left, right):
         self.op = operator
         self.left = left
@@ -42,6 +54,8 @@ class BinaryExpr(ASTNode):
         return f"BinaryExpr({self.left!r}, '{self.op}', {self.right!r})"
     
 class VarDeclStmt(ASTNode):
+    __slots__ = ("var_type", "var_name", "expr")
+
     def __init__(self, var_type, var_name: str, expr):
         self.var_type = var_type
         self.var_name = var_name
@@ -51,6 +65,8 @@ class VarDeclStmt(ASTNode):
         return f"VarDeclStmt({self.var_name}, {self.expr})"
     
 class AssignStmt(ASTNode):
+    __slots__ = ("var_name", "expr")
+
     def __init__(self, var_name, expr):
         self.var_name = var_name
         self.expr = expr
@@ -58,6 +74,8 @@ class AssignStmt(ASTNode):
         return f"AssignStmt({self.var_name}, {self.expr})"
 
 class IfStmt(ASTNode):
+    __slots__ = ("condition", "then_branch", "else_branch")
+
     def __init__(self, condition, then_branch, else_branch=None):
         self.condition = condition
         self.then_branch = then_branch
@@ -67,6 +85,8 @@ class IfStmt(ASTNode):
         return f"IfStmt({self.condition!r}, {self.then_branch!r}, {self.else_branch!r})"
 
 class WhileStmt(ASTNode):
+    __slots__ = ("condition", "body")
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -75,6 +95,8 @@ class WhileStmt(ASTNode):
         return f"WhileStmt({self.condition!r}, {self.body!r})"
 
 class CompareExpr(ASTNode):
+    __slots__ = ("left", "op", "right")
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
@@ -84,8 +106,72 @@ class CompareExpr(ASTNode):
         return f"CompareExpr({self.left!r}, '{self.op}', {self.right!r})"
 
 class BlockStmt(ASTNode):
+    __slots__ = ("statements",)
+
     def __init__(self, statements):
         self.statements = statements
 
     def __repr__(self):
-        return f"BlockStmt({self.statements!r})"
\ No newline at end of file
+        return f"BlockStmt({self.statements!r})"
+
+class CallExpr(ASTNode):
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __repr__(self):
+        return f"CallExpr({self.name!r}, {self.args!r})"
+
+class ReturnStmt(ASTNode):
+    __slots__ = ("expr",)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def __repr__(self):
+        return f"ReturnStmt({self.expr!r})"
+
+class FunctionDecl(ASTNode):
+    __slots__ = ("return_type", "name", "params", "body")
+
+    def __init__(self, return_type, name, params, body):
+        self.return_type = return_type
+        self.name = name
+        self.params = params    # [(type, name)]
+        self.body = body
+
+    def __repr__(self):
+        return f"FunctionDecl({self.return_type}, {self.name!r}, {self.params!r}, {self.body!r})"
+
+class ArrayDeclStmt(ASTNode):
+    __slots__ = ("name", "size")
+
+    def __init__(self, name, size: int):
+        self.name = name
+        self.size = size    # element count, the elements start at 0
+
+    def __repr__(self):
+        return f"ArrayDeclStmt({self.name!r}, {self.size})"
+
+class IndexExpr(ASTNode):
+    __slots__ = ("name", "index")
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+    def __repr__(self):
+        return f"IndexExpr({self.name!r}, {self.index!r})"
+
+class IndexAssignStmt(ASTNode):
+    __slots__ = ("name", "index", "expr")
+
+    def __init__(self, name, index, expr):
+        self.name = name
+        self.index = index
+        self.expr = expr
+
+    def __repr__(self):
+        return f"IndexAssignStmt({self.name!r}, {self.index!r}, {self.expr!r})"
@@ -0,0 +1,72 @@
+# ast_visitor.py
+"""
+Table dispatched, non-recursive AST visitor
+"""
+from inspect import isgeneratorfunction
+
+class ASTVisitor:
+    """
+    Base class for passes over the AST.
+
+    Subclasses map node classes to handler method names in `handlers`.
+    The table is resolved once per node class (following the node's MRO)
+    and cached, so dispatch is a single dict lookup.
+
+    A handler for a node with children is a generator: `value = yield child`
+    visits the child and sends back its result, and the generator's return
+    value is the result of the node. Leaf handlers are plain methods.
+    visit() drives the generators with an explicit stack, so the depth of
+    the tree is not limited by the Python recursion limit.
+    """
+    handlers = {}
+
+    @classmethod
+    def dispatch_table(cls):
+        # one cache per visitor class, created on first use
+        if "_dispatch" not in cls.__dict__:
+            cls._dispatch = {}
+        return cls._dispatch
+
+    @classmethod
+    def resolve(cls, node_type):
+        table = cls.dispatch_table()
+        entry = table.get(node_type)
+        if entry is None:
+            for klass in node_type.__mro__:
+                name = cls.handlers.get(klass)
+                if name is not None:
+                    method = getattr(cls, name)
+                    break
+            else:
+                method = cls.generic_visit
+            entry = (method, isgeneratorfunction(method))
+            table[node_type] = entry
+        return entry
+
+    def generic_visit(self, node):
+        raise NotImplementedError(f"{self.__class__.__name__} can't handle AST: {type(node)}")
+
+    def visit(self, node):
+        """
+        Visit `node` and its children without recursion, return node's result.
+        """
+        resolve = self.resolve
+        method, is_gen = resolve(type(node))
+        if not is_gen:
+            return method(self, node)
+        stack = [method(self, node)]
+        result = None
+        while stack:
+            try:
+                child = stack[-1].send(result)
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            method, is_gen = resolve(type(child))
+            if is_gen:
+                stack.append(method(self, child))
+                result = None
+            else:
+                result = method(self, child)
+        return result
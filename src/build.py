@@ -0,0 +1,455 @@
+# build.py
+"""
+Compiling source files to executables, one at a time or as a parallel batch,
+or to objects linked into one program
+"""
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from code_generator.asm_generator import AsmGenerator, entry_asm
+from code_generator.peephole import PeepholeOptimizer
+from code_generator.x86_encoder import Assembler
+from code_generator.elf_writer import ElfWriter
+from code_generator.linker import Linker
+from lexical_analysis.lexer import Lexer
+from syntax_analysis.parser import Parser
+from semantic_analysis.semantic_analyzer import SemanticAnalyzer, array_size
+from intermediate_representation.ir_generator import IRGenerator
+from intermediate_representation.ir_optimizer import IROptimizer
+from intermediate_representation.ir_function import called_functions
+from pass_stats import NO_STATS, count_nodes
+
+NASM_CMD = ["nasm", "-felf64"]
+GCC_CMD  = ["gcc", "-no-pie"]
+
+# compile errors reported per file in batch mode, anything else is a bug
+COMPILE_ERRORS = (SyntaxError, RuntimeError, NotImplementedError, ValueError,
+                  ZeroDivisionError, OSError, subprocess.CalledProcessError)
+
+
+def compile_file(path, keep_tokens=False, stats=NO_STATS, opt_level=IROptimizer.DEFAULT_OPT_LEVEL,
+                 printf=False, gen_asm=True, module=None, imports=None):
+    """
+    Run the whole pipeline on a source file, return every stage's output.
+    With `printf` print calls printf instead of the output runtime, without
+    `gen_asm` it stops at the optimized IR and the "asm" stage is None.
+    With `module` the file is compiled as one part of a linked program,
+    `imports` are the variables (name -> type) it uses from other files.
+    The source is memory-mapped and tokens are streamed into the parser,
+    the token list is only built when it has to be kept. When measuring,
+    the tokens are built first so lexing and parsing are timed apart.
+    """
+    with Lexer.from_file(path) as lexer:
+        keep_tokens = keep_tokens or stats.enabled
+        with stats.phase("lex") as record:
+            tokens = lexer.tokenize() if keep_tokens else lexer.stream()
+            if keep_tokens:
+                record.counts["tokens"] = len(tokens)
+        with stats.phase("parse") as record:
+            ast = Parser(tokens).parse()
+            if stats.enabled:
+                record.counts["ast_nodes"] = count_nodes(ast)
+    with stats.phase("semantic"):
+        analyzer = SemanticAnalyzer(ast)
+        analyzer.var_symbols.update(imports or {})
+        analyzer.analyze()
+    with stats.phase("irgen") as record:
+        generator = IRGenerator(ast)
+        generator.var_symbols.update(imports or {})
+        ir = generator.gen()
+        record.counts["ir"] = len(ir)
+    # functions in declaration order, each one can be inlined into the later ones
+    functions = generator.functions
+    if functions:
+        with stats.phase("opt.functions") as record:
+            for function in functions.values():
+                function.ir_opt = IROptimizer(function.ir_list, opt_level=opt_level,
+                                              functions=functions, function=function).optimize()
+            record.counts["functions"] = len(functions)
+    # the variables of a module are read by the files after it
+    live_out = analyzer.var_symbols if module else ()
+    ir_opt = IROptimizer(ir, live_out=live_out, stats=stats, opt_level=opt_level,
+                         functions=functions).optimize()
+    stages = {"tokens": tokens, "ast": ast, "ir": ir, "ir_opt": ir_opt, "functions": functions, "asm": None}
+    if not gen_asm:
+        return stages
+    with stats.phase("asmgen") as record:
+        exports = [name for name in analyzer.var_symbols if name not in (imports or {})]
+        asm = AsmGenerator(ir_opt, printf=printf, module=module, exports=exports, imports=imports or {},
+                           functions=called_functions(ir_opt, functions)).gen()
+        if stats.enabled:
+            record.counts["asm_lines"] = asm.count("\n")
+    if opt_level > 0:
+        with stats.phase("peephole") as record:
+            peephole = PeepholeOptimizer(asm)
+            asm = peephole.optimize()
+            if stats.enabled:
+                record.counts["asm_lines"] = asm.count("\n")
+                record.counts.update(peephole.hits)
+    stages["asm"] = asm
+    return stages
+
+
+def toolchain(assembler, linker, opt_level=IROptimizer.DEFAULT_OPT_LEVEL, printf=False):
+    """
+    Build flags that decide the produced binary, part of the cache key.
+    """
+    return {"assembler": NASM_CMD if assembler == "nasm" else assembler,
+            "linker": GCC_CMD if linker == "gcc" else linker,
+            "opt_level": opt_level, "printf": printf}
+
+
+def build_outputs(asm_path, obj_path, exe_path, linker):
+    """
+    Cached file name -> produced path.
+    """
+    outputs = {"out.asm": asm_path, "a.out": exe_path}
+    if linker == "gcc":
+        outputs["out.o"] = obj_path
+    return outputs
+
+
+def assemble(asm, asm_path, obj_path, exe_path, assembler="builtin", linker="builtin", stats=NO_STATS):
+    """
+    Write the asm and run the builtin assembler/linker steps, return the
+    external commands still needed to produce the executable.
+    """
+    with open(asm_path, "w") as asm_file:
+        asm_file.write(asm)
+    commands = []
+    if assembler == "nasm":
+        commands.append(NASM_CMD + [asm_path, "-o", obj_path])
+    else:
+        with stats.phase("assemble") as record:
+            encoded = Assembler().assemble(asm)
+            record.counts["code_bytes"] = len(encoded.sections[".text"].data) if ".text" in encoded.sections else 0
+        writer = ElfWriter(encoded)
+        with stats.phase("link" if linker == "builtin" else "write_object"):
+            if linker == "builtin":
+                writer.write_executable(exe_path)
+                return commands
+            writer.write_object(obj_path)
+    commands.append(GCC_CMD + [obj_path, "-o", exe_path])
+    return commands
+
+
+def assemble_and_link(asm, asm_path, obj_path, exe_path, assembler="builtin", linker="builtin", stats=NO_STATS):
+    """
+    The builtin assembler encodes the asm in-process, the builtin linker
+    writes a dynamically linked executable directly, so the default build
+    runs no external tools. The object file is only written for gcc.
+    """
+    for command in assemble(asm, asm_path, obj_path, exe_path, assembler, linker, stats):
+        with stats.phase(os.path.basename(command[0])):
+            subprocess.run(command, check=True)
+
+
+### Batch mode ###
+class BuildResult:
+    """
+    Status of one input of a batch build.
+    """
+    def __init__(self, source, exe_path):
+        self.source = source
+        self.exe_path = exe_path
+        self.lines = 0
+        self.error = None
+        self.cached = False
+        self.commands = []      # external steps left for the tool threads
+        self.seconds = 0.0
+
+    def status(self):
+        if self.error is not None:
+            return f"FAILED  {self.source}: {self.error}"
+        label = "cached" if self.cached else "ok"
+        return f"{label:<8}{self.source} -> {self.exe_path} ({self.seconds * 1000:.1f} ms)"
+
+
+def output_bases(sources, out_dir):
+    """
+    Output path without extension for every input: out_dir/<file stem>,
+    numbered when the name is taken. A number is only given when no input
+    before has that name, so for a.txt d/a.txt a-2.txt the last one is
+    a-2-2, not the a-2 of d/a.txt.
+    """
+    bases, taken = [], set()
+    for source in sources:
+        stem = os.path.splitext(os.path.basename(source))[0]
+        name, count = stem, 1
+        while name in taken:
+            count += 1
+            name = f"{stem}-{count}"
+        taken.add(name)
+        bases.append(os.path.join(out_dir, name))
+    return bases
+
+
+def compile_job(source, base, assembler, linker, cache, opt_level, printf):
+    """
+    Worker process: the Python pipeline and the builtin backend steps.
+    External nasm/gcc steps are returned in result.commands.
+    """
+    start = time.perf_counter()
+    result = BuildResult(source, base)
+    asm_path, obj_path = base + ".asm", base + ".o"
+    try:
+        with open(source, "rb") as file:
+            result.lines = file.read().count(b"\n")
+        if cache is not None:
+            key = cache.key(source, toolchain(assembler, linker, opt_level, printf))
+            if cache.lookup(key, build_outputs(asm_path, obj_path, base, linker)):
+                result.cached = True
+                result.seconds = time.perf_counter() - start
+                return result
+        asm = compile_file(source, opt_level=opt_level, printf=printf)["asm"]
+        result.commands = assemble(asm, asm_path, obj_path, base, assembler, linker)
+        if cache is not None and not result.commands:
+            cache.store(key, build_outputs(asm_path, obj_path, base, linker))
+    except COMPILE_ERRORS as error:
+        result.error = str(error) or type(error).__name__
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def link_job(result, linker, cache, assembler, opt_level, printf):
+    """
+    Tool thread: run the external steps of a compiled input.
+    """
+    start = time.perf_counter()
+    for command in result.commands:
+        try:
+            process = subprocess.run(command, capture_output=True, text=True)
+        except OSError as error:    # nasm or gcc missing
+            result.error = str(error) or type(error).__name__
+            break
+        if process.returncode != 0:
+            result.error = (process.stderr.strip() or f"{command[0]} failed").splitlines()[-1]
+            break
+    else:
+        if cache is not None:
+            key = cache.key(result.source, toolchain(assembler, linker, opt_level, printf))
+            base = result.exe_path
+            cache.store(key, build_outputs(base + ".asm", base + ".o", base, linker))
+    result.commands = []
+    result.seconds += time.perf_counter() - start
+    return result
+
+
+def build_batch(sources, jobs, out_dir, assembler="builtin", linker="builtin", cache=None, report=print,
+                opt_level=IROptimizer.DEFAULT_OPT_LEVEL, printf=False):
+    """
+    Compile `sources` with a pool of `jobs` processes. As soon as an input
+    leaves the Python pipeline its nasm/gcc steps start on a tool thread,
+    overlapping with the compilation of the other inputs. Every input gets
+    its own outputs in out_dir. Reports one status line per input and the
+    aggregate throughput, returns the BuildResults.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool, ThreadPoolExecutor(max_workers=jobs) as tools:
+        compiles = [pool.submit(compile_job, source, base, assembler, linker, cache, opt_level, printf)
+                    for source, base in zip(sources, output_bases(sources, out_dir))]
+        links = []
+        for future in as_completed(compiles):
+            result = future.result()
+            if result.commands and result.error is None:
+                links.append(tools.submit(link_job, result, linker, cache, assembler, opt_level, printf))
+            else:
+                report(result.status())
+                results.append(result)
+        for future in as_completed(links):
+            result = future.result()
+            report(result.status())
+            results.append(result)
+    elapsed = time.perf_counter() - start
+    failed = sum(result.error is not None for result in results)
+    lines = sum(result.lines for result in results)
+    report(f"{len(results)} files, {failed} failed in {elapsed:.2f} s: "
+           f"{len(results) / elapsed:.1f} files/s, {lines / elapsed:.0f} lines/s")
+    return results
+
+
+### Linked programs ###
+def scan_interface(path):
+    """
+    The variables a file declares (name -> type) and the names it uses,
+    from its tokens alone: a declaration is the only place a type keyword
+    is followed by an identifier, an array's keyword by "[" Number "]"
+    first. An identifier followed by "(" is a
+    function, and functions are local to their file: the tokens of a
+    function declaration up to the end of its body are skipped, as the
+    body only sees the function's parameters and locals.
+    """
+    declared, used = {}, set()
+    previous = None
+    pending = None      # (identifier, kind of the token before it)
+    depth = None        # brace depth inside a function declaration
+    kinds = []          # kinds of the last four tokens
+    size = None         # the Number of the last "int [ Number ]"
+    with Lexer.from_file(path) as lexer:
+        for token in lexer.stream():
+            if depth is not None:
+                if token.kind == "LBRACE":
+                    depth += 1
+                elif token.kind == "RBRACE":
+                    depth -= 1
+                    if depth == 0:
+                        depth = None
+            elif pending is not None and token.kind == "LPAREN":
+                if pending[1] in ("INT", "STRING"):
+                    depth = 0
+            elif pending is not None:
+                name, kind = pending
+                if kind in ("INT", "STRING") or array_size(kind):
+                    declared.setdefault(name, kind)
+                else:
+                    used.add(name)
+            if token.kind == "NUMBER":
+                size = token.text
+            kinds = kinds[-3:] + [token.kind]
+            if kinds == ["INT", "LBRACKET", "NUMBER", "RBRACKET"]:
+                kinds[-1] = f"INT[{size}]"
+            pending = (token.text, previous) if token.kind == "IDENT" and depth is None else None
+            previous = kinds[-1]
+    return declared, used
+
+
+def interface_job(path):
+    """
+    Worker process: scan_interface, or the error that stops the build.
+    """
+    try:
+        return scan_interface(path) + (None,)
+    except COMPILE_ERRORS as error:
+        return {}, set(), str(error) or type(error).__name__
+
+
+def module_names(bases):
+    """
+    Function name of every file of a linked program: module.<output name>,
+    with the characters identifiers can't hold replaced.
+    """
+    names = []
+    for base in bases:
+        name = "module." + re.sub(r"\W", "_", os.path.basename(base))
+        while name in names:
+            name += "_"
+        names.append(name)
+    return names
+
+
+def write_object(asm, asm_path, obj_path, assembler="builtin"):
+    """
+    Write the asm and assemble it into a relocatable object.
+    """
+    with open(asm_path, "w") as asm_file:
+        asm_file.write(asm)
+    if assembler == "nasm":
+        process = subprocess.run(NASM_CMD + [asm_path, "-o", obj_path], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError((process.stderr.strip() or "nasm failed").splitlines()[-1])
+    else:
+        ElfWriter(Assembler().assemble(asm)).write_object(obj_path)
+
+
+def module_job(source, base, module, imports, assembler, cache, opt_level, printf):
+    """
+    Worker process: compile one file of a linked program to its object.
+    The cache key holds the imported variables the file uses, so a file
+    is only compiled again when it or the declarations it uses change.
+    """
+    start = time.perf_counter()
+    result = BuildResult(source, base + ".o")
+    outputs = {"out.asm": base + ".asm", "out.o": base + ".o"}
+    try:
+        with open(source, "rb") as file:
+            result.lines = file.read().count(b"\n")
+        if cache is not None:
+            flags = dict(toolchain(assembler, None, opt_level, printf), module=module,
+                         imports=sorted(imports.items()))
+            key = cache.key(source, flags)
+            if cache.lookup(key, outputs):
+                result.cached = True
+                result.seconds = time.perf_counter() - start
+                return result
+        asm = compile_file(source, opt_level=opt_level, printf=printf, module=module, imports=imports)["asm"]
+        write_object(asm, base + ".asm", base + ".o", assembler)
+        if cache is not None:
+            cache.store(key, outputs)
+    except COMPILE_ERRORS as error:
+        result.error = str(error) or type(error).__name__
+    result.seconds = time.perf_counter() - start
+    return result
+
+
+def link_program(objects, exe_path, linker="builtin"):
+    if linker == "gcc":
+        process = subprocess.run(GCC_CMD + objects + ["-o", exe_path], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError((process.stderr.strip() or "gcc failed").splitlines()[-1])
+        return
+    linker = Linker()
+    for path in objects:
+        linker.add_file(path)
+    ElfWriter(linker.link()).write_executable(exe_path)
+
+
+def build_program(sources, exe_path, out_dir, jobs=1, assembler="builtin", linker="builtin", cache=None,
+                  report=print, opt_level=IROptimizer.DEFAULT_OPT_LEVEL, printf=False):
+    """
+    Build one program from several files. Every file is compiled on its
+    own, in a pool of `jobs` processes, to out_dir/<name>.o; its statements
+    become a function, and main in an entry object calls them in the order
+    of `sources`. Variables are shared: a file uses the variables the
+    others declare, every name may only be declared by one file. Only the
+    link step sees all files. Reports one status line per file and one
+    for the link, returns the BuildResults.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    bases = output_bases(list(sources) + ["main"], out_dir)
+    modules = module_names(bases[:-1])
+    results = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        interfaces = list(pool.map(interface_job, sources))
+        declared_in, types = {}, {}
+        for source, (declared, _, error) in zip(sources, interfaces):
+            for name, typ in declared.items():
+                if name in declared_in:
+                    error = f"Variable {name} declared in both {declared_in[name]} and {source}"
+                declared_in.setdefault(name, source)
+                types[name] = types.get(name, typ)
+            if error is not None:
+                result = BuildResult(source, None)
+                result.error = error
+                results.append(result)
+        if not results:
+            compiles = []
+            for source, base, module, (declared, used, _) in zip(sources, bases, modules, interfaces):
+                imports = {name: types[name] for name in sorted(used) if name in types and name not in declared}
+                compiles.append(pool.submit(module_job, source, base, module, imports,
+                                            assembler, cache, opt_level, printf))
+            results = [future.result() for future in compiles]
+    for result in results:
+        report(result.status())
+
+    if all(result.error is None for result in results):
+        link = BuildResult("link", exe_path)
+        link_start = time.perf_counter()
+        try:
+            write_object(entry_asm(modules, printf), bases[-1] + ".asm", bases[-1] + ".o", assembler)
+            link_program([base + ".o" for base in bases], exe_path, linker)
+        except COMPILE_ERRORS as error:
+            link.error = str(error) or type(error).__name__
+        link.seconds = time.perf_counter() - link_start
+        report(link.status())
+        results.append(link)
+    elapsed = time.perf_counter() - start
+    compiled = sum(result.error is None and not result.cached for result in results[:len(sources)])
+    cached = sum(result.cached for result in results)
+    failed = sum(result.error is not None for result in results)
+    report(f"{len(sources)} files, {compiled} compiled, {cached} cached, {failed} failed in {elapsed:.2f} s")
+    return results
@@ -0,0 +1,133 @@
+# build_cache.py
+"""
+Content-addressed on-disk cache of build outputs
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "simple_compiler")
+DEFAULT_MAX_SIZE = 256 * 2**20  # bytes
+
+_compiler_version = None
+
+def compiler_version():
+    """
+    Hash of the compiler's own sources, so any change to the compiler
+    invalidates every cached build.
+    """
+    global _compiler_version
+    if _compiler_version is None:
+        root = os.path.dirname(os.path.abspath(__file__))
+        digest = hashlib.sha256()
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+            for name in sorted(filenames):
+                if name.endswith(".py"):
+                    path = os.path.join(dirpath, name)
+                    digest.update(os.path.relpath(path, root).encode())
+                    with open(path, "rb") as file:
+                        digest.update(file.read())
+        _compiler_version = digest.hexdigest()
+    return _compiler_version
+
+def hash_file(path, digest=None):
+    digest = digest or hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest
+
+
+class BuildCache:
+    """
+    Cache entries are directories named by the build key and hold the
+    generated assembly, object file and executable. The mtime of an entry
+    is its last use; when the cache grows over max_size the least recently
+    used entries are evicted.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    def key(self, source_path, flags):
+        """
+        Build key: source content + compiler version + flags (any JSON value).
+        """
+        digest = hashlib.sha256()
+        digest.update(compiler_version().encode())
+        digest.update(json.dumps(flags, sort_keys=True).encode())
+        return hash_file(source_path, digest).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key, outputs):
+        """
+        Copy cached files to `outputs` (cached name -> destination path).
+        Returns False on a miss.
+        """
+        entry = self.entry_path(key)
+        if not all(os.path.isfile(os.path.join(entry, name)) for name in outputs):
+            return False
+        for name, dest in outputs.items():
+            shutil.copy2(os.path.join(entry, name), dest)
+        os.utime(entry)     # mark as recently used
+        return True
+
+    def store(self, key, outputs):
+        """
+        Save build outputs (cached name -> produced path) under `key`.
+        Files are written to a temporary directory and renamed in place,
+        so concurrent builds never see a partial entry.
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.cache_dir)
+        try:
+            for name, src in outputs.items():
+                shutil.copy2(src, os.path.join(tmp, name))
+            entry = self.entry_path(key)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict()
+
+    def entries(self):
+        """
+        (last use, size, path) of every entry, oldest first.
+        """
+        result = []
+        if not os.path.isdir(self.cache_dir):
+            return result
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".tmp-") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(path))
+                result.append((os.stat(path).st_mtime, size, path))
+            except FileNotFoundError:
+                continue    # evicted by a concurrent build
+        result.sort()
+        return result
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits max_size.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
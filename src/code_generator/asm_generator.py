@@ -1,16 +1,76 @@
+from code_generator.register_allocator import LinearScanAllocator
+from code_generator.instruction_selector import BOUNDS_TRAP, InstructionSelector, Node, is_imm32
+from code_generator.output_runtime import FUNCTIONS, RUNTIME_ASM, string_length
+from intermediate_representation.ir_instruction import IRInstr
+
+# System V AMD64 integer argument registers, the other arguments go on the stack
+ARG_REGS = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
+
+def entry_asm(modules, printf=False):
+    """
+    Entry object of a program linked from separately compiled files: main
+    calls the function of every file in order, then flushes the output
+    runtime, which is defined here for all of them.
+    """
+    asm = ["section .text", "    global main", f"    extern {', '.join(modules)}"]
+    if not printf:
+        asm.append(f"    global {', '.join(FUNCTIONS)}")
+    asm += ["", "main:", "    push rbp", "    mov rbp, rsp"]
+    asm += [f"    call {module}" for module in modules]
+    if not printf:
+        asm.append("    call out_flush")
+    asm += ["    mov rax, 0", "    pop rbp", "    ret"]
+    if not printf:
+        asm.append("")
+        asm.extend(RUNTIME_ASM.splitlines())
+    return "\n".join(asm)
+
 
 class AsmGenerator:
-    # Temporary registers for x86-64
-    TEMP_REGS = ["rdx", "rcx", "r8", "r9", "r10", "r11", "r12", "r13", "r14", "r15"] 
+    """
+    print goes through the buffered output runtime (output_runtime.py),
+    appended to the program, or through printf with `printf` set. With
+    `runtime` off the runtime functions are extern, the REPL loads them
+    once for the whole session.
+
+    With `module` set the code is one file of a program linked from
+    separately compiled files: it becomes the function `module`, which
+    main of the entry object calls. The variables in `exports` are global,
+    the ones in `imports` are defined by another file and extern here.
 
-    def __init__(self, ir_list):
+    An int array of N elements is N qwords in .bss. A failed bounds check
+    jumps to BOUNDS_TRAP after main's code, a ud2: the program dies with
+    SIGILL, as it would on any other trap.
+
+    The user functions in `functions` (IRFunction) follow main, each one
+    generated by an AsmGenerator with `function` set. A function follows
+    the System V calling convention: arguments in rdi, rsi, rdx, rcx, r8,
+    r9 and then on the stack, the result in rax, rbx and r12-r15 kept.
+    Its variables live in its stack frame, below the spill slots, the
+    register arguments are stored there by the prologue. Its labels get
+    the function's name as prefix, they share the file with main's.
+    """
+    def __init__(self, ir_list, printf=False, runtime=True, module=None, exports=(), imports=(),
+                 functions=(), function=None):
+        if function is not None:
+            ir_list = [IRInstr(instr.op, instr.arg1, instr.arg2, f"{function.symbol}.{instr.dest}")
+                       if instr.op == "label" or instr.op in IRInstr.JUMP_OPS else instr
+                       for instr in ir_list]
         self.ir_list = ir_list
-        self.ir_list_index = 0
+        self.printf = printf
+        self.runtime = runtime and module is None
+        self.module = module
+        self.exports = exports
+        self.imports = imports
+        self.functions = functions
+        self.function = function
         self.asm = []
-        self.free_regs = set(self.TEMP_REGS) 
-        self.temp_to_reg = {} # Map temporary variables to registers
-        self.param_queue = [] # Queue for parameters for printf
+        self.temp_to_loc = {} # Map temporary variables to registers or stack slots
         self.string_vars = {} # Store string variables for .data section
+        self.homes = {}       # variable operand "[x]" of a function -> its stack slot
+        self.frame_vars = []  # variables of a function in its frame
+        self.selector = InstructionSelector(ir_list, printf=printf)
+        self.allocator = LinearScanAllocator(ir_list, selection=self.selector)
 
     
     def gen(self):
@@ -18,43 +78,120 @@ class AsmGenerator:
         Generate assembly code from the intermediate representation (IR) list.
         """
         self.collect_strings()
+        bodies = [AsmGenerator(function.ir_opt, printf=self.printf, function=function)
+                  for function in self.functions]
+        for body in bodies:
+            body.collect_strings()
+            self.string_vars.update(body.string_vars)
+        self.selector.select()
+        self.allocate_regs()
         self.gen_header()
-        for instr in self.ir_list:
-            self.gen_emit(instr)
-            self.ir_list_index += 1
+        self.gen_body()
         self.gen_footer()
+        for body in bodies:
+            self.asm.append("")
+            self.asm.extend(body.gen_function())
+        if not self.printf and self.runtime:
+            self.asm.append("")
+            self.asm.extend(RUNTIME_ASM.splitlines())
         return "\n".join(self.asm)
 
-    def gen_emit(self, instr):
-        handler = getattr(self, f"emit_{instr.op}", None)
-        if handler:
-            handler(instr)
-        else:
-            raise NotImplementedError(f"Unsupported IR: {instr.op}")
+    def gen_body(self):
+        for index in range(len(self.ir_list)):
+            for instr in self.selector.code.get(index, ()):
+                self.lower(instr)
+
+    def gen_function(self):
+        """
+        Lines of the function's code, its data is in main's sections.
+        """
+        self.selector.select()
+        self.allocate_regs()
+        params = self.function.param_names
+        variables = self.collect_vars()
+        for number, name in enumerate(params[len(ARG_REGS):]):
+            # above the return address, pushed by the caller
+            self.homes[f"[{name}]"] = f"qword [rbp+{16 + 8 * number}]"
+        self.frame_vars = sorted(variables - set(params[len(ARG_REGS):]))
+        first = 8 * (len(self.allocator.used_callee_saved) + self.allocator.spill_slots)
+        for number, name in enumerate(self.frame_vars):
+            self.homes[f"[{name}]"] = f"qword [rbp-{first + 8 * (number + 1)}]"
+        self.asm.append(f"{self.function.symbol}:")
+        self.gen_prologue()
+        for name, reg in zip(params, ARG_REGS):
+            if name in variables:
+                self.asm.append(f"    mov {self.homes[f'[{name}]']}, {reg}")
+        self.gen_body()
+        return self.asm
+
+    def gen_prologue(self):
+        self.asm.append("    push rbp")
+        self.asm.append("    mov rbp, rsp")
+        for reg in self.allocator.used_callee_saved:
+            self.asm.append(f"    push {reg}")
+        if self.frame_size():
+            self.asm.append(f"    sub rsp, {self.frame_size()}")
+
+    def gen_epilogue(self):
+        if self.frame_size():
+            self.asm.append(f"    add rsp, {self.frame_size()}")
+        for reg in reversed(self.allocator.used_callee_saved):
+            self.asm.append(f"    pop {reg}")
+        self.asm.append("    pop rbp")
+        self.asm.append("    ret")
     
     def gen_header(self):
         self.asm.append("section .data")
-        self.asm.append('    fmt_int: db "%d", 10, 0')
-        self.asm.append('    fmt_str: db "%s", 10, 0')
+        if self.printf:
+            self.asm.append('    fmt_int: db "%d", 10, 0')
+            self.asm.append('    fmt_str: db "%s", 10, 0')
         # Add string variables to the .data section
         for name, value in self.string_vars.items():
+            if not self.printf:
+                # out_str reads the length in front of the string
+                self.asm.append(f'    dq {string_length(value)}')
             self.asm.append(f'    {name}: db {value}, 0')
         self.asm.append("")
         self.asm.append("section .bss")
         # Allocate space for variables in the .bss section
-        for var in self.collect_vars():
-            if var not in self.string_vars:
+        variables = self.collect_vars()
+        arrays = self.collect_arrays()
+        for var in variables:
+            if var not in self.string_vars and var not in self.imports:
                 self.asm.append(f"    {var}: resq 1")
+        for name, size in self.collect_arrays().items():
+            if name not in self.imports:
+                self.asm.append(f"    {name}: resq {size}")
         self.asm.append("")
         self.asm.append("section .text")
-        self.asm.append("    global main")
-        self.asm.append("    extern printf")
+        function = self.module or "main"
+        self.asm.append(f"    global {function}")
+        defined = [name for name in self.exports
+                   if name in self.string_vars or name in arrays
+                   or (name in variables and name not in self.imports)]
+        if defined:
+            self.asm.append(f"    global {', '.join(defined)}")
+        variables.update(instr.arg1 for instr in self.ir_list if instr.op == "param")
+        variables.update(self.used_arrays())
+        imported = [name for name in self.imports if name in variables]
+        if imported:
+            self.asm.append(f"    extern {', '.join(imported)}")
+        if self.printf:
+            self.asm.append("    extern printf")
+        elif not self.runtime:
+            self.asm.append(f"    extern {', '.join(FUNCTIONS)}")
         self.asm.append("")
-        self.asm.append("main:")
+        self.asm.append(f"{function}:")
+        self.gen_prologue()
 
     def gen_footer(self):
+        if not self.printf and self.module is None:
+            self.asm.append("    call out_flush")
         self.asm.append("    mov rax, 0")
-        self.asm.append("    ret")
+        self.gen_epilogue()
+        if any(instr.op == "check" for instr in self.ir_list):
+            self.asm.append(f"{BOUNDS_TRAP}:")
+            self.asm.append("    ud2")
     
     def collect_strings(self):
         for instr in self.ir_list:
@@ -69,6 +206,19 @@ class AsmGenerator:
             if instr.op == "load":
                 vars.add(instr.arg1)
         return vars
+
+    def collect_arrays(self):
+        # arrays declared here -> their size
+        return {instr.arg1: instr.arg2 for instr in self.ir_list if instr.op == "array"}
+
+    def used_arrays(self):
+        arrays = set()
+        for instr in self.ir_list:
+            if instr.op in ("load_idx", "vload"):
+                arrays.add(instr.arg1)
+            elif instr.op in ("store_idx", "vstore"):
+                arrays.add(instr.dest)
+        return arrays
     
     def reg_byte(self, reg):
         # Map 64-bit register to its 8-bit version for set* instructions
@@ -81,190 +231,214 @@ class AsmGenerator:
         }
         return mapping.get(reg, reg)
     
-    def allocate_reg(self, temp):
+    def allocate_regs(self):
         """
-        Allocate a register for a temporary variable.
+        Run linear scan once over the selected code and map every temp with
+        a location to a register or to a stack slot below the saved
+        callee-saved registers.
         """
-        if temp not in self.temp_to_reg:
-            if not self.free_regs:
-                raise RuntimeError("Ran out of temp registers!")
-            reg = self.free_regs.pop()
-            self.temp_to_reg[temp] = reg
-        return self.temp_to_reg[temp]
-    
-    def deallocate_reg(self, temp):
+        intervals = self.allocator.allocate()
+        saved = len(self.allocator.used_callee_saved)
+        for temp, interval in intervals.items():
+            if interval.reg is not None:
+                self.temp_to_loc[temp] = interval.reg
+            else:
+                offset = 8 * (saved + interval.slot + 1)
+                self.temp_to_loc[temp] = f"qword [rbp-{offset}]"
+
+    def frame_size(self):
+        # keep rsp 16-byte aligned at calls: rbp push + saved regs + slots
+        size = 8 * (self.allocator.spill_slots + len(self.frame_vars))
+        if (8 * len(self.allocator.used_callee_saved) + size) % 16:
+            size += 8
+        return size
+
+    def loc(self, temp):
+        return self.temp_to_loc[temp]
+
+    def is_memory(self, operand):
+        return operand.endswith("]")
+
+    def is_immediate(self, operand):
+        return operand.lstrip("-").isdigit()
+
+    def sized(self, operand):
+        # a variable in memory needs a size when nothing else gives it
+        if self.is_memory(operand) and not operand.startswith("qword"):
+            return f"qword {operand}"
+        return operand
+
+    def operand(self, operand):
+        if isinstance(operand, Node):
+            return self.loc(operand.temp)
+        return self.homes.get(operand, operand)
+
+    def emit_move(self, dest, src):
         """
-        Deallocate a register for a temporary variable.
+        mov between any two operands, going through rax for memory to memory.
         """
-        if temp in self.temp_to_reg:
-            reg = self.temp_to_reg[temp]
-            self.free_regs.add(reg)
-            del self.temp_to_reg[temp]
-    
-    def is_temp_used_later(self, temp):
+        if dest == src:
+            return
+        if self.is_memory(dest):
+            if self.is_memory(src) or (self.is_immediate(src) and not is_imm32(int(src))):
+                self.asm.append(f"    mov rax, {src}")
+                src = "rax"
+            elif self.is_immediate(src):
+                dest = self.sized(dest)
+        self.asm.append(f"    mov {dest}, {src}")
+
+    ### Lowering of the selected instructions ###
+    def lower(self, instr):
+        mnemonic, operands = instr[0], [self.operand(op) for op in instr[1:]]
+        handler = getattr(self, f"lower_{mnemonic}", None)
+        if handler:
+            handler(*operands)
+        else:
+            self.lower_instruction(mnemonic, *operands)
+
+    def lower_instruction(self, mnemonic, *operands):
         """
-        Check if a temporary variable is used later in the IR list.
+        Plain instruction, at most one memory operand.
         """
-        for instr in self.ir_list[self.ir_list_index+1:]:
-            if instr.dest == temp or instr.arg1 == temp or instr.arg2 == temp:
-                return True
-        return False
-
-    ### Assembly Code Generation Methods ###
-    def emit_label(self, instr):
-        self.asm.append(f"{instr.dest}:")
-
-    def emit_goto(self, instr):
-        self.asm.append(f"    jmp {instr.dest}")
-
-    def emit_if(self, instr):
-        reg = self.temp_to_reg[instr.arg1]
-        self.asm.append(f"    cmp {reg}, 0")
-        self.asm.append(f"    jne {instr.dest}")
-
-    def emit_if_false(self, instr):
-        reg = self.temp_to_reg[instr.arg1]
-        self.asm.append(f"    cmp {reg}, 0")
-        self.asm.append(f"    je {instr.dest}")
-
-    def emit_store(self, instr):
-        reg = self.temp_to_reg[instr.arg2]
-        self.asm.append(f"    mov [{instr.arg1}], {reg}")
-
-    def emit_store_str(self, instr):
-        # Already handled in .data
-        pass
-
-    def emit_load(self, instr):
-        reg = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg}, [{instr.arg1}]")
-
-    def emit_const(self, instr):
-        reg = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg}, {instr.arg1}")
-
-    def emit_add(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, {reg1}")
-        self.asm.append(f"    add {reg_res}, {reg2}")
-        #delocate reg if not used later
-        if not self.is_temp_used_later(instr.arg1):
-            self.deallocate_reg(instr.arg1)
-        if not self.is_temp_used_later(instr.arg2):
-            self.deallocate_reg(instr.arg2)
-
-    def emit_sub(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, {reg1}")
-        self.asm.append(f"    sub {reg_res}, {reg2}")
-        #delocate reg if not used later
-        if not self.is_temp_used_later(instr.arg1):
-            self.deallocate_reg(instr.arg1)
-        if not self.is_temp_used_later(instr.arg2):
-            self.deallocate_reg(instr.arg2)
-
-    def emit_mul(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, {reg1}")
-        self.asm.append(f"    imul {reg_res}, {reg2}")
-        #delocate reg if not used later
-        if not self.is_temp_used_later(instr.arg1):
-            self.deallocate_reg(instr.arg1)
-        if not self.is_temp_used_later(instr.arg2):
-            self.deallocate_reg(instr.arg2)
-
-    def emit_div(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov rax, {reg1}")
-        self.asm.append(f"    cqo")
-        self.asm.append(f"    idiv {reg2}")
-        self.asm.append(f"    mov {reg_res}, rax")
-        #delocate reg if not used later
-        if not self.is_temp_used_later(instr.arg1):
-            self.deallocate_reg(instr.arg1)
-        if not self.is_temp_used_later(instr.arg2):
-            self.deallocate_reg(instr.arg2)
-
-    def emit_gt(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    setg {self.reg_byte(reg_res)}")
-
-    def emit_geq(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    setge {self.reg_byte(reg_res)}")
-
-    def emit_lt(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    setl {self.reg_byte(reg_res)}")
-
-    def emit_leq(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    setle {self.reg_byte(reg_res)}")
-
-    def emit_eq(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    sete {self.reg_byte(reg_res)}")
-
-    def emit_neq(self, instr):
-        reg1 = self.temp_to_reg[instr.arg1]
-        reg2 = self.temp_to_reg[instr.arg2]
-        reg_res = self.allocate_reg(instr.dest)
-        self.asm.append(f"    mov {reg_res}, 0")
-        self.asm.append(f"    cmp {reg1}, {reg2}")
-        self.asm.append(f"    setne {self.reg_byte(reg_res)}")
-
-    def emit_param(self, instr):
-        self.param_queue.append(instr.arg1)
-
-    def emit_call(self, instr):
-        
-        if len(self.param_queue) < 2:
-            raise RuntimeError("Not enough parameters for printf call")
-        fmt = self.param_queue[-2]
-        val = self.param_queue[-1]
-
-        if fmt == "fmt_int":
-            self.asm.append("    lea rdi, [rel fmt_int]")
-        elif fmt == "fmt_str":
-            self.asm.append("    lea rdi, [rel fmt_str]")
+        operands = list(operands)
+        if len(operands) == 2 and self.is_memory(operands[0]) and self.is_memory(operands[1]):
+            self.asm.append(f"    mov rax, {operands[1]}")
+            operands[1] = "rax"
+        if operands and self.is_memory(operands[0]) and (len(operands) == 1 or self.is_immediate(operands[1])):
+            operands[0] = self.sized(operands[0])
+        self.asm.append(f"    {mnemonic} {', '.join(operands)}".rstrip())
+
+    def lower_addr(self, dest, label):
+        work = "rax" if self.is_memory(dest) else dest
+        self.asm.append(f"    lea {work}, [rel {label}]")
+        self.emit_move(dest, work)
+
+    def lower_invoke(self, symbol, dest, *args):
+        """
+        Call a user function: the arguments are pushed and the first six
+        popped into their registers, so no argument register is written
+        before every argument is read. The stack arguments are padded to
+        keep rsp 16-byte aligned at the call.
+        """
+        stack_args = max(0, len(args) - len(ARG_REGS))
+        pad = 8 * (stack_args % 2)
+        if pad:
+            self.asm.append(f"    sub rsp, {pad}")
+        for arg in reversed(args):
+            self.asm.append(f"    push {self.sized(arg)}")
+        for reg in ARG_REGS[:len(args)]:
+            self.asm.append(f"    pop {reg}")
+        self.asm.append(f"    call {symbol}")
+        if stack_args:
+            self.asm.append(f"    add rsp, {8 * stack_args + pad}")
+        self.emit_move(dest, "rax")
+
+    def lower_return(self, value):
+        self.emit_move("rax", value)
+        self.gen_epilogue()
+
+    def lower_label(self, name):
+        self.asm.append(f"{name}:")
+
+    def lower_move(self, dest, src):
+        self.emit_move(dest, src)
+
+    def lower_binary(self, mnemonic, dest, src1, src2):
+        # only a temp written by several copies can be dest and an operand
+        if dest == src2 and dest != src1 and mnemonic in ("add", "imul"):
+            src1, src2 = src2, src1
+        work = "rax" if self.is_memory(dest) or dest == src2 != src1 else dest
+        self.emit_move(work, src1)
+        self.asm.append(f"    {mnemonic} {work}, {src2}")
+        self.emit_move(dest, work)
+
+    def lower_address(self, dest, base, index, scale, disp):
+        """
+        dest = base + index*scale + disp, one lea when base and index are
+        registers. index is None or base itself when scale is not 1.
+        """
+        work = "rax" if self.is_memory(dest) or dest == index != base else dest
+        if self.is_memory(base) or (index is not None and self.is_memory(index)):
+            if scale != 1:
+                self.asm.append(f"    imul {work}, {base}, {scale + 1}")
+            else:
+                self.emit_move(work, base)
+                if index is not None:
+                    self.asm.append(f"    add {work}, {index}")
+            if disp:
+                self.asm.append(f"    add {work}, {disp}")
         else:
-            raise RuntimeError(f"Unknown format string: {fmt}")
-        # Set value
-        if isinstance(val, str) and val.startswith("t"):
-            reg = self.temp_to_reg[val]
-            self.asm.append(f"    mov rsi, {reg}")
+            address = base
+            if index is not None:
+                address += f"+{index}" if scale == 1 else f"+{index}*{scale}"
+            if disp:
+                address += f"{disp:+d}"
+            if address == base:
+                self.emit_move(work, base)
+            elif index is None and base == work:
+                self.asm.append(f"    add {work}, {disp}")
+            else:
+                self.asm.append(f"    lea {work}, [{address}]")
+        self.emit_move(dest, work)
+
+    def lower_imul3(self, dest, src, value):
+        work = "rax" if self.is_memory(dest) else dest
+        self.asm.append(f"    imul {work}, {src}, {value}")
+        self.emit_move(dest, work)
+
+    def lower_divide(self, dest, src1, src2):
+        self.emit_move("rax", src1)
+        self.asm.append(f"    cqo")
+        self.asm.append(f"    idiv {self.sized(src2)}")
+        self.emit_move(dest, "rax")
+
+    def lower_set(self, cc, dest, src1, src2):
+        if self.is_memory(dest) or dest in (src1, src2):
+            self.lower_instruction("cmp", src1, src2)
+            self.asm.append(f"    set{cc} al")
+            self.asm.append(f"    movzx rax, al")
+            self.asm.append(f"    mov {dest}, rax")
         else:
-            # Assume it's a variable name (string label)
-            self.asm.append(f"    lea rsi, [rel {val}]")
-        self.asm.append("    xor eax, eax")
-        self.asm.append(f"    call {instr.arg1}")
-        self.param_queue.clear()
-        
+            self.asm.append(f"    mov {dest}, 0")
+            self.lower_instruction("cmp", src1, src2)
+            self.asm.append(f"    set{cc} {self.reg_byte(dest)}")
+
+    def element(self, array, index, disp):
+        """
+        Memory operand [array+index*8+disp], an index in memory goes through rax.
+        """
+        address = array
+        if index is not None:
+            if self.is_memory(index):
+                self.asm.append(f"    mov rax, {index}")
+                index = "rax"
+            address += f"+{index}*8"
+        if disp:
+            address += f"{disp:+d}"
+        return f"[{address}]"
+
+    def lower_load_element(self, dest, array, index, disp):
+        self.emit_move(dest, self.element(array, index, disp))
+
+    def lower_store_element(self, array, index, disp, value):
+        address = self.element(array, index, disp)
+        if self.is_memory(value) or (self.is_immediate(value) and not is_imm32(int(value))):
+            # rax may hold the index
+            self.asm.append(f"    mov rdx, {value}")
+            value = "rdx"
+        elif self.is_immediate(value):
+            address = self.sized(address)
+        self.asm.append(f"    mov {address}, {value}")
+
+    def lower_load_vector(self, dest, array, index, disp):
+        self.asm.append(f"    movdqu {dest}, {self.element(array, index, disp)}")
+
+    def lower_store_vector(self, array, index, disp, src):
+        self.asm.append(f"    movdqu {self.element(array, index, disp)}, {src}")
+
+    def lower_splat(self, dest, src):
+        if self.is_immediate(src):
+            self.asm.append(f"    mov rax, {src}")
+            src = "rax"
+        self.asm.append(f"    movq {dest}, {self.sized(src)}")
+        self.asm.append(f"    punpcklqdq {dest}, {dest}")
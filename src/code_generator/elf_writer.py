@@ -0,0 +1,372 @@
+# elf_writer.py
+"""
+ELF64 writer for the in-process assembler: relocatable objects that any
+linker accepts, or a complete dynamically linked executable that only
+needs the system's dynamic loader and libc at run time.
+"""
+import os
+import re
+import struct
+import sys
+from code_generator.x86_encoder import PC32, PLT32, ABS32S, ABS64
+
+RELOC_TYPES = {ABS64: 1, PC32: 2, PLT32: 4, ABS32S: 11}
+R_X86_64_GLOB_DAT = 6
+
+SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB, SHT_RELA, SHT_NOBITS = 1, 2, 3, 4, 8
+SHF_WRITE, SHF_ALLOC, SHF_EXECINSTR, SHF_INFO_LINK = 1, 2, 4, 0x40
+STB_LOCAL, STB_GLOBAL = 0, 1
+STT_NOTYPE, STT_OBJECT, STT_FUNC, STT_SECTION = 0, 1, 2, 3
+PT_LOAD, PT_DYNAMIC, PT_INTERP, PT_PHDR, PT_GNU_STACK = 1, 2, 3, 6, 0x6474E551
+PF_X, PF_W, PF_R = 1, 2, 4
+DT_NULL, DT_NEEDED, DT_HASH, DT_STRTAB, DT_SYMTAB = 0, 1, 4, 5, 6
+DT_RELA, DT_RELASZ, DT_RELAENT, DT_STRSZ, DT_SYMENT, DT_DEBUG = 7, 8, 9, 10, 11, 21
+
+EHDR_SIZE, PHDR_SIZE, SHDR_SIZE, SYM_SIZE, RELA_SIZE = 64, 56, 64, 24, 24
+BASE_ADDRESS = 0x400000
+PAGE_SIZE = 0x1000
+
+DEFAULT_INTERPRETER = "/lib64/ld-linux-x86-64.so.2"
+DEFAULT_LIBC = "libc.so.6"
+
+# Entry point of executables: there is no crt1.o, so call main directly
+# and leave through libc's exit() to flush stdio buffers.
+START_CODE = """
+section .text
+global _start
+extern exit
+_start:
+    xor ebp, ebp
+    and rsp, -16
+    call main
+    mov edi, eax
+    call exit
+"""
+
+SECTION_FLAGS = {
+    ".text": SHF_ALLOC | SHF_EXECINSTR,
+    ".rodata": SHF_ALLOC,
+}
+
+
+def align(value, alignment):
+    return (value + alignment - 1) // alignment * alignment
+
+
+def elf_header(file_type, entry, phoff, phnum, shoff, shnum, shstrndx):
+    ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + bytes(8)  # 64 bit, little endian, SysV
+    return struct.pack("<16sHHIQQQIHHHHHH", ident, file_type, 62, 1, entry, phoff, shoff, 0,
+                       EHDR_SIZE, PHDR_SIZE if phnum else 0, phnum,
+                       SHDR_SIZE if shnum else 0, shnum, shstrndx)
+
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray(b"\0")
+        self.offsets = {"": 0}
+
+    def add(self, name):
+        if name not in self.offsets:
+            self.offsets[name] = len(self.data)
+            self.data += name.encode() + b"\0"
+        return self.offsets[name]
+
+
+def find_interpreter(path=None):
+    """
+    PT_INTERP of the running Python binary, so executables use the same
+    dynamic loader as the compiler itself.
+    """
+    try:
+        with open(path or sys.executable, "rb") as file:
+            header = file.read(EHDR_SIZE)
+            if header[:4] != b"\x7fELF" or header[4] != 2:
+                return DEFAULT_INTERPRETER
+            phoff, = struct.unpack_from("<Q", header, 32)
+            phentsize, phnum = struct.unpack_from("<HH", header, 54)
+            file.seek(phoff)
+            table = file.read(phentsize * phnum)
+            for i in range(phnum):
+                p_type, _, p_offset, _, _, p_filesz = struct.unpack_from("<IIQQQQ", table, i * phentsize)
+                if p_type == PT_INTERP:
+                    file.seek(p_offset)
+                    return file.read(p_filesz).rstrip(b"\0").decode()
+    except OSError:
+        pass
+    return DEFAULT_INTERPRETER
+
+
+def find_libc():
+    """
+    Path of the libc mapped into this process, it matches the interpreter.
+    """
+    try:
+        with open("/proc/self/maps") as maps:
+            for line in maps:
+                path = line.split(None, 5)[-1].strip()
+                if re.fullmatch(r"libc(\.so\.6|-[\d.]+\.so)", os.path.basename(path)):
+                    return path
+    except OSError:
+        pass
+    return DEFAULT_LIBC
+
+
+class ElfWriter:
+    """
+    Writes the sections of an Assembler as ELF64 files.
+    """
+    def __init__(self, assembler):
+        self.assembler = assembler
+
+    def write_object(self, path):
+        with open(path, "wb") as file:
+            file.write(self.object_file())
+
+    def write_executable(self, path, interpreter=None, libc=None):
+        with open(path, "wb") as file:
+            file.write(self.executable(interpreter, libc))
+        os.chmod(path, 0o755)
+
+    ### Relocatable object ###
+    def object_file(self):
+        asm = self.assembler
+        names = list(asm.sections)
+        shstrtab, strtab = StringTable(), StringTable()
+        section_index = {name: i + 1 for i, name in enumerate(names)}
+
+        # symbols: null, section symbols, local labels, then globals and externs
+        symbols = [(0, 0, 0, 0)]   # (name offset, info, section index, value)
+        symbol_index = {}
+        for name in names:
+            symbol_index[name] = len(symbols)
+            symbols.append((0, (STB_LOCAL << 4) | STT_SECTION, section_index[name], 0))
+        for label, (section, offset) in asm.symbols.items():
+            if label not in asm.globals:
+                symbols.append((strtab.add(label), (STB_LOCAL << 4) | STT_NOTYPE,
+                                section_index[section], offset))
+        first_global = len(symbols)
+        for label in asm.globals:
+            if label not in asm.symbols:
+                continue
+            section, offset = asm.symbols[label]
+            kind = STT_FUNC if section == ".text" else STT_OBJECT
+            symbol_index[label] = len(symbols)
+            symbols.append((strtab.add(label), (STB_GLOBAL << 4) | kind, section_index[section], offset))
+        for label in asm.externs:
+            if label in asm.symbols or label in symbol_index:
+                continue
+            symbol_index[label] = len(symbols)
+            symbols.append((strtab.add(label), (STB_GLOBAL << 4) | STT_NOTYPE, 0, 0))
+
+        relas = {}
+        for reloc in asm.relocs:
+            symbol, addend = reloc.symbol, reloc.addend
+            if symbol not in symbol_index:
+                # local label: relocate against its section symbol
+                section, offset = asm.symbols[symbol]
+                symbol, addend = section, addend + offset
+            info = (symbol_index[symbol] << 32) | RELOC_TYPES[reloc.kind]
+            relas.setdefault(reloc.section, bytearray()).extend(
+                struct.pack("<QQq", reloc.offset, info, addend))
+
+        # section headers: (name, type, flags, link, info, align, entsize, data or size)
+        headers = [("", 0, 0, 0, 0, 0, 0, b"")]
+        for name in names:
+            section = asm.sections[name]
+            kind = SHT_NOBITS if section.nobits else SHT_PROGBITS
+            flags = SECTION_FLAGS.get(name, SHF_ALLOC | SHF_WRITE)
+            body = section.size if section.nobits else bytes(section.data)
+            headers.append((name, kind, flags, 0, 0, section.align, 0, body))
+        symtab_index = len(headers) + len(relas) + 1
+        for name, data in relas.items():
+            headers.append((".rela" + name, SHT_RELA, SHF_INFO_LINK, symtab_index,
+                            section_index[name], 8, RELA_SIZE, bytes(data)))
+        headers.append((".note.GNU-stack", SHT_PROGBITS, 0, 0, 0, 1, 0, b""))
+        symtab = b"".join(struct.pack("<IBBHQQ", name, info, 0, shndx, value, 0)
+                          for name, info, shndx, value in symbols)
+        headers.append((".symtab", SHT_SYMTAB, 0, symtab_index + 1, first_global, 8, SYM_SIZE, symtab))
+        headers.append((".strtab", SHT_STRTAB, 0, 0, 0, 1, 0, bytes(strtab.data)))
+        for header in headers:
+            shstrtab.add(header[0])
+        shstrtab.add(".shstrtab")
+        headers.append((".shstrtab", SHT_STRTAB, 0, 0, 0, 1, 0, bytes(shstrtab.data)))
+
+        body = bytearray()
+        section_headers = bytearray()
+        for name, kind, flags, link, info, alignment, entsize, content in headers:
+            offset = EHDR_SIZE + align(len(body), max(alignment, 1))
+            if isinstance(content, int):
+                size = content
+            else:
+                body += bytes(offset - EHDR_SIZE - len(body))
+                body += content
+                size = len(content)
+            section_headers += struct.pack("<IIQQQQIIQQ", shstrtab.add(name) if name else 0, kind,
+                                           flags, 0, offset if kind else 0, size, link, info,
+                                           alignment, entsize)
+        shoff = EHDR_SIZE + align(len(body), 8)
+        body += bytes(shoff - EHDR_SIZE - len(body))
+        header = elf_header(1, 0, 0, 0, shoff, len(headers), len(headers) - 1)
+        return header + bytes(body) + bytes(section_headers)
+
+    def relocate(self, section_address, symbol_address):
+        """
+        Patch every relocation for sections loaded at section_address(name),
+        symbol_address(name) gives the final address of any referenced symbol.
+        """
+        asm = self.assembler
+        for reloc in asm.relocs:
+            data = asm.sections[reloc.section].data
+            place = section_address(reloc.section) + reloc.offset
+            value = symbol_address(reloc.symbol) + reloc.addend
+            if reloc.kind in (PC32, PLT32):
+                data[reloc.offset:reloc.offset + 4] = struct.pack("<i", value - place)
+            elif reloc.kind == ABS32S:
+                if not -2**31 <= value < 2**31:
+                    raise ValueError(f"address of {reloc.symbol} doesn't fit 32 bits")
+                data[reloc.offset:reloc.offset + 4] = struct.pack("<i", value)
+            else:
+                data[reloc.offset:reloc.offset + 8] = struct.pack("<Q", value)
+
+    ### Executable ###
+    def executable(self, interpreter=None, libc=None):
+        """
+        Statically resolved, dynamically linked ET_EXEC image. Calls to
+        external functions go through stubs `jmp [rel got]`, the GOT slots
+        are filled by the dynamic loader (R_X86_64_GLOB_DAT).
+        """
+        asm = self.assembler
+        if "_start" not in asm.symbols:
+            asm.assemble(START_CODE)
+        interpreter = interpreter or find_interpreter()
+        libc = libc or find_libc()
+        externs = [name for name in dict.fromkeys(asm.externs) if name not in asm.symbols]
+
+        text = asm.sections[".text"]
+        text.data += b"\x90" * (-len(text.data) % 16)
+        stubs = {}
+        for name in externs:
+            stubs[name] = len(text.data)
+            text.data += b"\xff\x25" + bytes(4)
+
+        dynstr = StringTable()
+        needed = dynstr.add(libc)
+        dynsym = bytearray(SYM_SIZE)
+        for name in externs:
+            dynsym += struct.pack("<IBBHQQ", dynstr.add(name), (STB_GLOBAL << 4) | STT_FUNC, 0, 0, 0, 0)
+        nsyms = len(externs) + 1
+        # single bucket hash table, the chain visits every symbol
+        chain = [0] + list(range(nsyms - 1))
+        hash_table = struct.pack(f"<II{1 + nsyms}I", 1, nsyms, nsyms - 1, *chain)
+        interp = interpreter.encode() + b"\0"
+
+        # read-only segment: headers, interpreter, dynamic symbol tables
+        phnum = 7
+        offset = EHDR_SIZE + PHDR_SIZE * phnum
+        layout = {}
+        for name, size, alignment in (("interp", len(interp), 1), ("dynsym", len(dynsym), 8),
+                                      ("dynstr", len(dynstr.data), 1), ("hash", len(hash_table), 8),
+                                      ("rela", RELA_SIZE * len(externs), 8)):
+            offset = align(offset, alignment)
+            layout[name] = offset
+            offset += size
+        ro_end = offset
+
+        # executable segment
+        offset = align(offset, PAGE_SIZE)
+        text_start = offset
+        layout[".text"] = offset
+        offset += len(text.data)
+        text_end = offset
+
+        # writable segment: data sections, GOT, dynamic, then bss
+        offset = align(offset, PAGE_SIZE)
+        rw_start = offset
+        for name, section in asm.sections.items():
+            if name != ".text" and not section.nobits:
+                offset = align(offset, section.align)
+                layout[name] = offset
+                offset += len(section.data)
+        offset = align(offset, 8)
+        layout["got"] = offset
+        offset += 8 * len(externs)
+        layout["dynamic"] = offset
+        dynamic_count = 11
+        offset += 16 * dynamic_count
+        rw_file_end = offset
+        for name, section in asm.sections.items():
+            if section.nobits:
+                offset = align(offset, section.align)
+                layout[name] = offset
+                offset += section.size
+        rw_end = offset
+
+        def address(file_offset):
+            return BASE_ADDRESS + file_offset
+
+        def symbol_address(name):
+            if name in asm.symbols:
+                section, offset = asm.symbols[name]
+                return address(layout[section] + offset)
+            if name in stubs:
+                return address(layout[".text"] + stubs[name])
+            raise ValueError(f"undefined symbol {name}")
+
+        for name in externs:
+            # stub: jmp [rip + got slot]
+            field = stubs[name] + 2
+            slot = address(layout["got"] + 8 * externs.index(name))
+            rel = slot - address(layout[".text"] + field + 4)
+            text.data[field:field + 4] = struct.pack("<i", rel)
+
+        self.relocate(lambda section: address(layout[section]), symbol_address)
+
+        rela = b"".join(struct.pack("<QQq", address(layout["got"] + 8 * i),
+                                    ((i + 1) << 32) | R_X86_64_GLOB_DAT, 0)
+                        for i in range(len(externs)))
+        dynamic = b"".join(struct.pack("<qQ", tag, value) for tag, value in (
+            (DT_NEEDED, needed),
+            (DT_HASH, address(layout["hash"])),
+            (DT_STRTAB, address(layout["dynstr"])),
+            (DT_SYMTAB, address(layout["dynsym"])),
+            (DT_STRSZ, len(dynstr.data)),
+            (DT_SYMENT, SYM_SIZE),
+            (DT_RELA, address(layout["rela"])),
+            (DT_RELASZ, len(rela)),
+            (DT_RELAENT, RELA_SIZE),
+            (DT_DEBUG, 0),
+            (DT_NULL, 0),
+        ))
+
+        image = bytearray(rw_file_end)
+        def put(file_offset, data):
+            image[file_offset:file_offset + len(data)] = data
+        put(layout["interp"], interp)
+        put(layout["dynsym"], dynsym)
+        put(layout["dynstr"], dynstr.data)
+        put(layout["hash"], hash_table)
+        put(layout["rela"], rela)
+        for name, section in asm.sections.items():
+            if not section.nobits:
+                put(layout[name], section.data)
+        put(layout["dynamic"], dynamic)
+
+        phdr_size = PHDR_SIZE * phnum
+        segments = [
+            (PT_PHDR, PF_R, EHDR_SIZE, phdr_size, phdr_size, 8),
+            (PT_INTERP, PF_R, layout["interp"], len(interp), len(interp), 1),
+            (PT_LOAD, PF_R, 0, ro_end, ro_end, PAGE_SIZE),
+            (PT_LOAD, PF_R | PF_X, text_start, text_end - text_start, text_end - text_start, PAGE_SIZE),
+            (PT_LOAD, PF_R | PF_W, rw_start, rw_file_end - rw_start, rw_end - rw_start, PAGE_SIZE),
+            (PT_DYNAMIC, PF_R | PF_W, layout["dynamic"], len(dynamic), len(dynamic), 8),
+            (PT_GNU_STACK, PF_R | PF_W, 0, 0, 0, 16),
+        ]
+        put(EHDR_SIZE, b"".join(
+            struct.pack("<IIQQQQQQ", kind, flags, file_offset,
+                        address(file_offset) if kind != PT_GNU_STACK else 0,
+                        address(file_offset) if kind != PT_GNU_STACK else 0,
+                        filesz, memsz, alignment)
+            for kind, flags, file_offset, filesz, memsz, alignment in segments))
+        put(0, elf_header(2, symbol_address("_start"), EHDR_SIZE, phnum, 0, 0, 0))
+        return bytes(image)
+
@@ -0,0 +1,491 @@
+# instruction_selector.py
+"""
+Instruction selection by maximal munch over expression trees rebuilt from
+the three-address IR.
+"""
+from bisect import bisect_right
+from intermediate_representation.ir_instruction import IRInstr
+
+CONDITION = {"eq": "e", "neq": "ne", "lt": "l", "gt": "g", "leq": "le", "geq": "ge"}
+NEGATE = {"e": "ne", "ne": "e", "l": "ge", "ge": "l", "g": "le", "le": "g"}
+# condition code once the operands of cmp are swapped
+SWAPPED = {"e": "e", "ne": "ne", "l": "g", "g": "l", "le": "ge", "ge": "le"}
+# multiplier -> scale of the lea computing x + x*scale
+LEA_MULTIPLIERS = {3: 2, 5: 4, 9: 8}
+# label of the ud2 a failed bounds check jumps to, no identifier has a dot
+BOUNDS_TRAP = "bounds.trap"
+# SSE2 instruction of a vector op, on 64-bit lanes
+VECTOR_INSTRUCTIONS = {"vadd": "paddq", "vsub": "psubq"}
+
+
+def is_imm32(value):
+    return -2**31 <= value < 2**31
+
+
+class Node:
+    """
+    Expression tree node: the instruction at `index` writing `temp`.
+    A leaf (instr None) is a temp read from its own location.
+    """
+    __slots__ = ("temp", "index", "instr")
+
+    def __init__(self, temp, index=None, instr=None):
+        self.temp = temp
+        self.index = index
+        self.instr = instr
+
+    @property
+    def op(self):
+        return self.instr.op if self.instr is not None else "temp"
+
+    def __repr__(self):
+        return f"Node({self.temp}, {self.op})"
+
+
+class InstructionSelector:
+    """
+    Covers the IR with x86 instruction tiles, largest tile first.
+
+    A temp written once and read once, later in the same basic block, is
+    an inner node of its reader's tree: its instruction is folded into the
+    root and emitted there, it never gets a location. A `load` only folds
+    when no store to its variable lies in between. Constants fold into
+    every reader that can take an immediate and are only materialized
+    for the readers that cannot.
+
+    A temp written by several copies (a variable promoted to a temp, see
+    ssa.py) is never folded, and nothing reading it folds past one of
+    its copies. A copy takes over the instruction computing its source,
+    which then writes straight to the copy's temp.
+
+    Inside a loop a variable the loop stores keeps its plain `mov` loads:
+    an update in memory (`add [x], r`) or a load folded into an operand
+    makes the next iteration wait for the store, while a plain load is
+    forwarded from it (up to 3x slower loops in benchmarks/runtime.py
+    otherwise).
+
+    An array element is a memory operand [a+index*8+disp], a constant
+    added to the index folds into the displacement. A bounds check is a
+    cmp and an unsigned jae to BOUNDS_TRAP. A vector temp is read once,
+    by the next vector op or vstore: the tree of a vstore is evaluated
+    in xmm registers numbered by depth, xmm0 for the root, so vector
+    temps get no location either.
+
+    A print calls out_int or out_str of the output runtime, printf with
+    `printf` set. A call of a user function is an `invoke` of its
+    arguments, lowered by AsmGenerator; its result is never folded.
+
+    `code` maps each root index to its instructions, tuples of a mnemonic
+    and operands; a Node operand stands for the location of its temp,
+    which AsmGenerator knows once registers are allocated. `consumed`
+    holds the indices emitting nothing of their own, `reads` the temps
+    each root reads from their location, what the register allocator
+    needs for the live intervals.
+    """
+    def __init__(self, ir_list, printf=False):
+        self.ir_list = ir_list
+        self.printf = printf
+        self.code = {}          # root index -> [(mnemonic, operands...)]
+        self.consumed = set()   # indices folded into a root or never needed
+        self.reads = {}         # root index -> temps read from their location
+        self.needed = set()     # constants some root reads from a location
+        self.root = None        # index of the tree being covered
+        self.defs = {}          # temp -> index of its instruction
+        self.redefs = {}        # temp written more than once -> sorted indices of its copies
+        self.uses = {}          # temp -> number of reads
+        self.block = []         # index -> basic block number
+        self.stores = {}        # variable or array -> sorted indices of its stores
+        self.vectors = {}       # vector temp -> index of its instruction
+        self.params = {}        # call index -> names passed by its params
+        self.loop = []          # index -> (header, back edge) of the outermost loop or None
+        pending = []
+        labels = {}
+        loops = []
+        block = 0
+        for index, instr in enumerate(ir_list):
+            op = instr.op
+            if op == "label":
+                block += 1
+                labels[instr.dest] = index
+            self.block.append(block)
+            if op in IRInstr.JUMP_OPS:
+                block += 1
+                if instr.dest in labels:
+                    loops.append((labels[instr.dest], index))
+            if op in IRInstr.VALUE_OPS:
+                self.defs[instr.dest] = index
+            elif op == "copy":
+                if instr.dest in self.defs:
+                    self.redefs.setdefault(instr.dest, [self.defs[instr.dest]]).append(index)
+                self.defs[instr.dest] = index
+            elif op in ("store", "store_str"):
+                self.stores.setdefault(instr.arg1, []).append(index)
+            elif op in ("store_idx", "vstore"):
+                self.stores.setdefault(instr.dest, []).append(index)
+            elif op in IRInstr.VECTOR_OPS:
+                self.vectors[instr.dest] = index
+            elif op == "param":
+                pending.append(instr.arg1)
+            elif op == "call":
+                self.params[index] = pending
+                pending = []
+                if instr.arg2 is not None:
+                    self.defs[instr.dest] = index
+            for name in instr.reads():
+                self.uses[name] = self.uses.get(name, 0) + 1
+        self.loop = [None] * len(ir_list)
+        end = -1
+        for start, latch in sorted(loops):
+            if latch <= end:
+                continue
+            start = max(start, end + 1)
+            self.loop[start:latch + 1] = [(start, latch)] * (latch + 1 - start)
+            end = latch
+
+    def select(self):
+        """
+        Cover every instruction not folded into a later one, walking the IR
+        backwards so a tree is covered before its subtrees could be roots.
+        """
+        constants = []
+        for index in range(len(self.ir_list) - 1, -1, -1):
+            if index in self.consumed:
+                continue
+            instr = self.ir_list[index]
+            if instr.op == "const":
+                constants.append(index)
+                continue
+            handler = getattr(self, f"munch_{instr.op}", None)
+            if handler is None:
+                raise NotImplementedError(f"Unsupported IR: {instr.op}")
+            self.root = index
+            self.code[index] = handler(instr)
+        # every reader of a constant is covered by now
+        for index in constants:
+            instr = self.ir_list[index]
+            if instr.dest in self.needed:
+                self.code[index] = [("move", Node(instr.dest), str(instr.arg1))]
+            else:
+                self.consumed.add(index)
+        self.root = None
+        return self
+
+    ### Trees ###
+    def node(self, temp):
+        """
+        Subtree computing `temp` for the current root, a leaf when its
+        instruction cannot move down to the root.
+        """
+        index = self.defs.get(temp)
+        if index is None:
+            return Node(temp)
+        instr = self.ir_list[index]
+        if instr.op == "const":
+            return Node(temp, index, instr)
+        if instr.op == "call":
+            return Node(temp)
+        if index in self.consumed or self.uses[temp] != 1 or self.block[index] != self.block[self.root]:
+            return Node(temp)
+        if temp in self.redefs or self.redefs and any(
+                self.redefined_between(name, index, self.root) for name in instr.reads()):
+            return Node(temp)
+        if instr.op == "load" and (self.stored_between(instr.arg1, index, self.root)
+                                   or self.updated_in_loop(instr.arg1, index)):
+            return Node(temp)
+        if instr.op == "load_idx" and self.stored_between(instr.arg1, index, self.root):
+            return Node(temp)
+        return Node(temp, index, instr)
+
+    def kids(self, node):
+        return self.node(node.instr.arg1), self.node(node.instr.arg2)
+
+    def stored_between(self, var, start, end):
+        stores = self.stores.get(var, ())
+        i = bisect_right(stores, start)
+        return i < len(stores) and stores[i] < end
+
+    def redefined_between(self, temp, start, end):
+        copies = self.redefs.get(temp, ())
+        i = bisect_right(copies, start)
+        return i < len(copies) and copies[i] < end
+
+    def updated_in_loop(self, var, index):
+        loop = self.loop[index]
+        return loop is not None and self.stored_between(var, *loop)
+
+    ### Operands ###
+    def fold(self, node):
+        self.consumed.add(node.index)
+
+    def location(self, node):
+        """
+        Read `node` from the location of its temp.
+        """
+        self.reads.setdefault(self.root, []).append(node.temp)
+        if node.op == "const":
+            self.needed.add(node.temp)
+        return node
+
+    def immediate(self, node):
+        """
+        Value of a constant node if it fits an imm32 operand, else None.
+        """
+        if node.op == "const" and is_imm32(node.instr.arg1):
+            return node.instr.arg1
+        return None
+
+    def operand(self, node, imm=True, mem=True):
+        """
+        Cheapest operand for `node`: an immediate, a variable in memory or
+        the location of its temp, as far as the instruction allows.
+        """
+        if imm:
+            value = self.immediate(node)
+            if value is not None:
+                return str(value)
+        if mem and node.op == "load":
+            self.fold(node)
+            return f"[{node.instr.arg1}]"
+        return self.location(node)
+
+    def compare(self, node):
+        """
+        (condition code, left, right) of a cmp covering a compare node.
+        """
+        a, b = self.kids(node)
+        cc = CONDITION[node.op]
+        if self.immediate(a) is not None and self.immediate(b) is None:
+            a, b = b, a
+            cc = SWAPPED[cc]
+        left = self.operand(a, imm=False)
+        right = self.operand(b, mem=isinstance(left, Node))
+        return cc, left, right
+
+    ### Tiles ###
+    def munch_label(self, instr):
+        return [("label", instr.dest)]
+
+    def munch_goto(self, instr):
+        return [("jmp", instr.dest)]
+
+    def munch_if(self, instr):
+        return self.branch(instr, "jne")
+
+    def munch_if_false(self, instr):
+        return self.branch(instr, "je")
+
+    def branch(self, instr, jump):
+        node = self.node(instr.arg1)
+        if node.op in CONDITION:
+            # cmp a, b; jcc instead of materializing the condition
+            self.fold(node)
+            cc, left, right = self.compare(node)
+            if jump == "je":
+                cc = NEGATE[cc]
+            return [("cmp", left, right), ("j" + cc, instr.dest)]
+        return [("cmp", self.location(node), "0"), (jump, instr.dest)]
+
+    def munch_store(self, instr):
+        var = instr.arg1
+        value = self.node(instr.arg2)
+        return self.update_variable(var, value) or [("move", f"[{var}]", self.operand(value))]
+
+    def update_variable(self, var, value):
+        """
+        store x (x + y) as add [x], y, and as inc/dec [x] for y = +-1.
+        """
+        if value.op not in ("add", "sub"):
+            return None
+        a, b = self.kids(value)
+        if value.op == "add" and not self.is_load_of(a, var):
+            a, b = b, a
+        if not self.is_load_of(a, var):
+            return None
+        self.fold(value)
+        self.fold(a)
+        step = self.immediate(b)
+        if step in (1, -1):
+            up = (step == 1) == (value.op == "add")
+            return [("inc" if up else "dec", f"[{var}]")]
+        return [(value.op, f"[{var}]", self.operand(b, mem=False))]
+
+    def is_load_of(self, node, var):
+        return node.op == "load" and node.instr.arg1 == var
+
+    def munch_store_str(self, instr):
+        # already in .data
+        return []
+
+    def munch_load(self, instr):
+        return [("move", Node(instr.dest), f"[{instr.arg1}]")]
+
+    def munch_copy(self, instr):
+        value = self.node(instr.arg1)
+        if value.op not in ("temp", "const", "load"):
+            # compute the source straight into the copy's temp
+            self.fold(value)
+            source = value.instr
+            return getattr(self, f"munch_{source.op}")(IRInstr(source.op, source.arg1, source.arg2, instr.dest))
+        return [("move", Node(instr.dest), self.operand(value))]
+
+    def munch_add(self, instr):
+        dest = Node(instr.dest)
+        a, b = self.kids(Node(instr.dest, self.root, instr))
+        if self.immediate(a) is not None:
+            a, b = b, a
+        value = self.immediate(b)
+        if value is not None:
+            return [("address", dest, self.operand(a, imm=False), None, 1, value)]
+        if a.op == "load":
+            a, b = b, a
+        if b.op == "load":
+            return [("binary", "add", dest, self.operand(a, mem=False), self.operand(b))]
+        return [("address", dest, self.location(a), self.location(b), 1, 0)]
+
+    def munch_sub(self, instr):
+        dest = Node(instr.dest)
+        a, b = self.kids(Node(instr.dest, self.root, instr))
+        value = self.immediate(b)
+        if value is not None and is_imm32(-value):
+            return [("address", dest, self.operand(a, imm=False), None, 1, -value)]
+        return [("binary", "sub", dest, self.operand(a), self.operand(b))]
+
+    def munch_mul(self, instr):
+        dest = Node(instr.dest)
+        a, b = self.kids(Node(instr.dest, self.root, instr))
+        if self.immediate(a) is not None:
+            a, b = b, a
+        value = self.immediate(b)
+        if value is not None:
+            if value > 1 and value & (value - 1) == 0:
+                return [("binary", "shl", dest, self.operand(a, imm=False), str(value.bit_length() - 1))]
+            if value in LEA_MULTIPLIERS and a.op != "load":
+                source = self.location(a)
+                return [("address", dest, source, source, LEA_MULTIPLIERS[value], 0)]
+            return [("imul3", dest, self.operand(a, imm=False), str(value))]
+        if a.op == "load":
+            a, b = b, a
+        return [("binary", "imul", dest, self.operand(a, mem=False), self.operand(b))]
+
+    def munch_div(self, instr):
+        a, b = self.kids(Node(instr.dest, self.root, instr))
+        # idiv takes no immediate
+        return [("divide", Node(instr.dest), self.operand(a), self.operand(b, imm=False))]
+
+    def munch_compare(self, instr):
+        cc, left, right = self.compare(Node(instr.dest, self.root, instr))
+        return [("set", cc, Node(instr.dest), left, right)]
+
+    munch_eq = munch_neq = munch_lt = munch_gt = munch_leq = munch_geq = munch_compare
+
+    def munch_param(self, instr):
+        # printf reads its arguments at the call
+        return []
+
+    def munch_addr(self, instr):
+        return [("addr", Node(instr.dest), instr.arg1)]
+
+    def munch_return(self, instr):
+        return [("return", self.operand(self.node(instr.arg1)))]
+
+    def munch_call(self, instr):
+        params = self.params[self.root]
+        if instr.arg2 is not None:
+            args = [self.operand(self.node(name)) for name in params[len(params) - instr.arg2:]]
+            return [("invoke", instr.arg1, Node(instr.dest)) + tuple(args)]
+        if len(params) < 2:
+            raise RuntimeError("Not enough parameters for printf call")
+        fmt, val = params[-2:]
+        if fmt not in ("fmt_int", "fmt_str"):
+            raise RuntimeError(f"Unknown format string: {fmt}")
+        if not self.printf:
+            if fmt == "fmt_int":
+                return [("move", "rdi", self.location(self.node(val))), ("call", "out_int")]
+            if val in self.defs:
+                return [("move", "rdi", self.location(self.node(val))), ("call", "out_str")]
+            return [("lea", "rdi", f"[rel {val}]"), ("call", "out_str")]
+        code = [("lea", "rdi", f"[rel {fmt}]")]
+        if val in self.defs:
+            code.append(("move", "rsi", self.location(self.node(val))))
+        else:
+            # a string variable, passed by address
+            code.append(("lea", "rsi", f"[rel {val}]"))
+        code.append(("xor", "eax", "eax"))
+        code.append(("call", instr.arg1))
+        return code
+
+    def munch_array(self, instr):
+        # in .bss
+        return []
+
+    def munch_check(self, instr):
+        node = self.node(instr.arg1)
+        value = self.immediate(node)
+        if value is not None:
+            return [] if 0 <= value < instr.arg2 else [("jmp", BOUNDS_TRAP)]
+        # a negative index is a large unsigned one
+        return [("cmp", self.operand(node, imm=False), str(instr.arg2)), ("jae", BOUNDS_TRAP)]
+
+    def element(self, temp):
+        """
+        (index operand or None, displacement) of the element at index `temp`.
+        """
+        node = self.node(temp)
+        value = self.immediate(node)
+        if value is not None and is_imm32(8 * value):
+            return None, 8 * value
+        if node.op in ("add", "sub"):
+            a, b = self.kids(node)
+            if node.op == "add" and self.immediate(a) is not None:
+                a, b = b, a
+            value = self.immediate(b)
+            if value is not None and self.immediate(a) is None:
+                disp = 8 * value if node.op == "add" else -8 * value
+                if is_imm32(disp):
+                    self.fold(node)
+                    return self.location(a), disp
+        return self.location(node), 0
+
+    def munch_load_idx(self, instr):
+        index, disp = self.element(instr.arg2)
+        return [("load_element", Node(instr.dest), instr.arg1, index, disp)]
+
+    def munch_store_idx(self, instr):
+        index, disp = self.element(instr.arg1)
+        return [("store_element", instr.dest, index, disp, self.operand(self.node(instr.arg2)))]
+
+    def munch_vstore(self, instr):
+        code = self.vector(instr.arg2, 0)
+        index, disp = self.element(instr.arg1)
+        return code + [("store_vector", instr.dest, index, disp, "xmm0")]
+
+    def vector(self, temp, reg):
+        """
+        Code computing the vector `temp` into xmm`reg`, using the registers
+        above it as scratch.
+        """
+        index = self.vectors.get(temp)
+        if index is None or index in self.consumed or self.uses[temp] != 1 \
+                or self.block[index] != self.block[self.root]:
+            raise RuntimeError(f"vector {temp} is not read once in its block")
+        instr = self.ir_list[index]
+        if instr.op == "vload" and self.stored_between(instr.arg1, index, self.root):
+            raise RuntimeError(f"vector {temp} is not read once in its block")
+        self.consumed.add(index)
+        dest = f"xmm{reg}"
+        if instr.op == "vload":
+            element, disp = self.element(instr.arg2)
+            return [("load_vector", dest, instr.arg1, element, disp)]
+        if instr.op == "vsplat":
+            return [("splat", dest, self.operand(self.node(instr.arg1)))]
+        source = f"xmm{reg + 1}"
+        code = self.vector(instr.arg1, reg) + self.vector(instr.arg2, reg + 1)
+        if instr.op != "vmul":
+            return code + [(VECTOR_INSTRUCTIONS[instr.op], dest, source)]
+        # SSE2 has no 64-bit multiply: pmuludq multiplies the low halves,
+        # the low 64 bits of a * b are lo*lo + ((hi(a)*lo(b) + lo(a)*hi(b)) << 32)
+        high, cross = f"xmm{reg + 2}", f"xmm{reg + 3}"
+        return code + [("movdqa", high, dest), ("psrlq", high, "32"), ("pmuludq", high, source),
+                       ("movdqa", cross, source), ("psrlq", cross, "32"), ("pmuludq", cross, dest),
+                       ("paddq", high, cross), ("psllq", high, "32"),
+                       ("pmuludq", dest, source), ("paddq", dest, high)]
@@ -0,0 +1,121 @@
+# linker.py
+"""
+Static linker for relocatable ELF64 objects, the counterpart of the builtin
+assembler for programs built from several separately compiled files.
+"""
+import struct
+from code_generator.x86_encoder import Assembler, Reloc, PLT32
+from code_generator.elf_writer import (RELOC_TYPES, SHT_PROGBITS, SHT_SYMTAB, SHT_RELA, SHT_NOBITS,
+                                       SHF_ALLOC, STT_SECTION, SHDR_SIZE, SYM_SIZE, RELA_SIZE, align)
+
+RELOC_KINDS = {number: kind for kind, number in RELOC_TYPES.items()}
+SHN_UNDEF, SHN_LORESERVE = 0, 0xFF00
+
+
+class Linker:
+    """
+    Reads objects back into one Assembler: the sections of the same name
+    are concatenated, symbols and relocations move with their sections.
+    Global symbols must be defined once, local ones are renamed per object
+    (`name@index`), so equal labels of different files don't clash. What no
+    object defines stays extern. ElfWriter writes the result as an
+    executable like the output of a single file, libc functions are called
+    through its stubs.
+    """
+    def __init__(self):
+        self.linked = Assembler()
+        self.defined_in = {}    # global symbol -> object that defines it
+        self.undefined = {}     # symbol -> kinds of the relocations against it
+        self.count = 0
+
+    def add_file(self, path):
+        with open(path, "rb") as file:
+            self.add_object(file.read(), path)
+
+    def add_object(self, data, name):
+        """
+        Merge a relocatable object, `name` is only used in error messages.
+        """
+        if data[:4] != b"\x7fELF" or data[4] != 2 or struct.unpack_from("<H", data, 16)[0] != 1:
+            raise ValueError(f"{name}: not an ELF64 relocatable object")
+        shoff, = struct.unpack_from("<Q", data, 0x28)
+        shnum, shstrndx = struct.unpack_from("<HH", data, 0x3C)
+        headers = [struct.unpack_from("<IIQQQQIIQQ", data, shoff + i * SHDR_SIZE) for i in range(shnum)]
+        names = self.strings(data, headers[shstrndx])
+        index = self.count
+        self.count += 1
+
+        # section index -> (merged section name, offset of this object's part)
+        placed = {}
+        for i, (name_offset, kind, flags, _, offset, size, _, _, alignment, _) in enumerate(headers):
+            if kind not in (SHT_PROGBITS, SHT_NOBITS) or not flags & SHF_ALLOC:
+                continue
+            section_name = names(name_offset)
+            section = self.linked.get_section(section_name)
+            section.align = max(section.align, alignment)
+            start = align(section.offset(), max(alignment, 1))
+            if section.nobits:
+                section.size = start + size
+            else:
+                section.data += bytes(start - len(section.data))
+                section.data += data[offset:offset + size]
+            placed[i] = (section_name, start)
+
+        symbol_names = []
+        for symtab in (header for header in headers if header[1] == SHT_SYMTAB):
+            strtab = self.strings(data, headers[symtab[6]])
+            for number in range(symtab[5] // SYM_SIZE):
+                name_offset, info, _, shndx, value, _ = struct.unpack_from(
+                    "<IBBHQQ", data, symtab[4] + number * SYM_SIZE)
+                symbol = strtab(name_offset)
+                if number == 0:
+                    symbol_names.append(None)
+                elif shndx == SHN_UNDEF:
+                    symbol_names.append(symbol)
+                elif shndx >= SHN_LORESERVE or shndx not in placed:
+                    raise NotImplementedError(f"{name}: symbol {symbol!r} isn't in a loaded section")
+                else:
+                    section_name, start = placed[shndx]
+                    if info & 0xF == STT_SECTION:
+                        symbol = f"{section_name}@{index}"
+                    elif info >> 4 == 0:
+                        symbol = f"{symbol}@{index}"
+                    elif symbol in self.defined_in:
+                        raise ValueError(f"symbol {symbol} defined in both {self.defined_in[symbol]} and {name}")
+                    else:
+                        self.defined_in[symbol] = name
+                        self.linked.globals.append(symbol)
+                    self.linked.symbols[symbol] = (section_name, start + value)
+                    symbol_names.append(symbol)
+
+        for rela in (header for header in headers if header[1] == SHT_RELA):
+            if rela[7] not in placed:
+                continue
+            section_name, start = placed[rela[7]]
+            for number in range(rela[5] // RELA_SIZE):
+                offset, info, addend = struct.unpack_from("<QQq", data, rela[4] + number * RELA_SIZE)
+                kind = RELOC_KINDS.get(info & 0xFFFFFFFF)
+                if kind is None:
+                    raise NotImplementedError(f"{name}: relocation type {info & 0xFFFFFFFF}")
+                symbol = symbol_names[info >> 32]
+                self.linked.relocs.append(Reloc(section_name, start + offset, kind, symbol, addend))
+                if symbol not in self.linked.symbols:
+                    self.undefined.setdefault(symbol, set()).add(kind)
+
+    def strings(self, data, header):
+        table = data[header[4]:header[4] + header[5]]
+        return lambda offset: table[offset:table.index(b"\0", offset)].decode()
+
+    def link(self):
+        """
+        The merged Assembler. Calls to symbols no object defines are left
+        to the dynamic loader, any other reference to one is an error.
+        """
+        for symbol, kinds in self.undefined.items():
+            if symbol in self.linked.symbols:
+                continue
+            if kinds != {PLT32}:
+                raise ValueError(f"undefined symbol {symbol}")
+            self.linked.externs.append(symbol)
+        self.linked.resolve_local()
+        return self.linked
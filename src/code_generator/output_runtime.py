@@ -0,0 +1,130 @@
+# output_runtime.py
+"""
+Buffered output of the generated code, used by print instead of printf
+"""
+
+BUFFER_SIZE = 1 << 16
+# runtime function -> registers it reads, it clobbers what a libc call does
+FUNCTIONS = {"out_int": {"rdi", "rsp"}, "out_str": {"rdi", "rsp"}, "out_flush": {"rsp"}}
+
+# Every print appends its line to out_buf, which goes out with one write
+# syscall when the next line doesn't fit and when main returns. Only
+# caller-saved registers are used, and nothing needs an aligned stack.
+#
+# out_int prints the low 32 bits of rdi as a signed number, like printf's
+# %d did. Its digits are counted first and written backwards in place,
+# x / 10 is (x * 0xCCCCCCCD) >> 35 for any 32-bit unsigned x.
+#
+# out_str prints the string at rdi, its byte length is the qword in front
+# of it (AsmGenerator emits string data that way). A string longer than
+# the buffer is written directly.
+RUNTIME_ASM = f"""\
+section .bss
+    out_buf: resb {BUFFER_SIZE}
+    out_len: resq 1
+
+section .text
+out_int:
+    mov rsi, [rel out_len]
+    cmp rsi, {BUFFER_SIZE - 12}
+    jbe out_int_room
+    push rdi
+    call out_flush
+    pop rdi
+    xor esi, esi
+out_int_room:
+    lea r8, [rel out_buf]
+    add rsi, r8
+    movsxd rax, edi
+    test rax, rax
+    jns out_int_count
+    mov byte [rsi], 45
+    inc rsi
+    neg rax
+out_int_count:
+    mov ecx, 1
+    mov r9d, 10
+out_int_more:
+    cmp rax, r9
+    jb out_int_digits
+    inc ecx
+    lea r9, [r9+r9*4]
+    add r9, r9
+    jmp out_int_more
+out_int_digits:
+    add rsi, rcx
+    mov byte [rsi], 10
+    lea r10, [rsi+1]
+    mov r11d, 3435973837
+out_int_digit:
+    mov rdx, rax
+    imul rdx, r11
+    shr rdx, 35
+    lea r9, [rdx+rdx*4]
+    add r9, r9
+    sub rax, r9
+    add eax, 48
+    dec rsi
+    mov [rsi], al
+    mov rax, rdx
+    test rax, rax
+    jnz out_int_digit
+    sub r10, r8
+    mov [rel out_len], r10
+    ret
+
+out_str:
+    mov rdx, [rdi-8]
+    mov rsi, rdi
+    mov rax, [rel out_len]
+    lea rcx, [rax+rdx+1]
+    cmp rcx, {BUFFER_SIZE}
+    jbe out_str_copy
+    push rsi
+    push rdx
+    call out_flush
+    pop rdx
+    pop rsi
+    xor eax, eax
+    cmp rdx, {BUFFER_SIZE}
+    jb out_str_copy
+    call out_write
+    xor eax, eax
+    xor edx, edx
+out_str_copy:
+    lea rdi, [rel out_buf]
+    add rdi, rax
+    mov rcx, rdx
+    rep movsb
+    mov byte [rdi], 10
+    lea rcx, [rel out_buf]
+    sub rdi, rcx
+    inc rdi
+    mov [rel out_len], rdi
+    ret
+
+out_flush:
+    lea rsi, [rel out_buf]
+    mov rdx, [rel out_len]
+    mov qword [rel out_len], 0
+out_write:
+    test rdx, rdx
+    jle out_write_done
+    mov eax, 1
+    mov edi, 1
+    syscall
+    test rax, rax
+    jle out_write_done
+    add rsi, rax
+    sub rdx, rax
+    jmp out_write
+out_write_done:
+    ret
+"""
+
+
+def string_length(value):
+    """
+    Byte length of a string literal as the assembler encodes it.
+    """
+    return len(value[1:-1].encode())
@@ -0,0 +1,530 @@
+# peephole.py
+"""
+Peephole optimizer over the assembly text emitted by AsmGenerator.
+The rewrites are a table of rules, each a window of line patterns and its
+replacement, applied with a sliding window until no rule matches anymore.
+"""
+import re
+from functools import lru_cache
+from string import Formatter
+from code_generator.x86_encoder import (REGS64, REGS32, REGS8, REGISTERS, CONDITION_CODES,
+                                        SSE_OPS, SSE_SHIFT_OPS)
+from code_generator.output_runtime import FUNCTIONS
+
+FLAGS = "flags"
+LABEL = ":"
+
+# any register name -> the 64-bit register it is part of
+FULL_REG = {name: REGS64[code] for name, (code, size) in REGISTERS.items()}
+# callee-saved registers and the return value are read by `ret`
+RETURN_LIVE = {"rax", "rbx", "rbp", "rsp", "r12", "r13", "r14", "r15"}
+# argument registers (and al, the vector register count) read by a call
+CALL_READS = {"rax", "rdi", "rsi", "rdx", "rcx", "r8", "r9", "rsp"}
+# AsmGenerator passes printf a format string and one value, the output
+# runtime one argument in rdi
+KNOWN_CALL_READS = {"printf": {"rax", "rdi", "rsi", "rsp"}, **FUNCTIONS}
+CALL_WRITES = {"rax", "rcx", "rdx", "rsi", "rdi", "r8", "r9", "r10", "r11", FLAGS}
+ALU_WRITES = {"add", "sub", "and", "or", "xor", "adc", "sbb"}
+FOLD_OPS = {"add", "sub", "and", "or", "xor", "cmp", "imul"}
+
+NEGATE = {}
+for _cc, _opposite in (("e", "ne"), ("z", "nz"), ("l", "ge"), ("g", "le"), ("b", "ae"),
+                       ("a", "be"), ("s", "ns"), ("o", "no"), ("p", "np"), ("c", "nc"),
+                       ("nge", "nl"), ("ng", "nle"), ("nae", "nb"), ("na", "nbe"), ("pe", "po")):
+    NEGATE[_cc], NEGATE[_opposite] = _opposite, _cc
+
+
+def is_memory(operand):
+    return operand.endswith("]")
+
+
+def is_immediate(operand):
+    return re.fullmatch(r"-?\d+", operand) is not None
+
+
+def is_imm32(operand):
+    return is_immediate(operand) and -2**31 <= int(operand) < 2**31
+
+
+@lru_cache(maxsize=None)
+def registers_in(operand):
+    """
+    64-bit registers an operand reads: the register itself or the base
+    and index of a memory operand.
+    """
+    return frozenset(FULL_REG[word] for word in re.findall(r"\w+", operand) if word in FULL_REG)
+
+
+def written_register(operand):
+    """
+    64-bit register fully overwritten by a write to `operand`, None for
+    memory and for 8/16-bit registers, whose write keeps the upper bits.
+    """
+    if operand in REGISTERS and REGISTERS[operand][1] >= 32:
+        return FULL_REG[operand]
+    return None
+
+
+def qword(operand):
+    """
+    Memory operands get an explicit size, needed once the source is an immediate.
+    """
+    if is_memory(operand) and not operand.startswith(("byte", "word", "dword", "qword")):
+        return f"qword {operand}"
+    return operand
+
+
+# placeholder kind (name without trailing digits) -> check of the matched text,
+# any other name matches any operand
+KINDS = {
+    "r": lambda text: text in REGS64 and text not in ("rsp", "rbp"),
+    "i": is_imm32,
+    "L": lambda text: re.fullmatch(r"[A-Za-z_.][\w.]*", text) is not None,
+    "cc": lambda text: text in CONDITION_CODES,
+    "op": lambda text: text in FOLD_OPS,
+}
+
+# kinds with few values, a placeholder mnemonic of one of these kinds is
+# expanded to find the rules that can start at a line
+ENUMERABLE = {"cc": CONDITION_CODES, "op": FOLD_OPS}
+
+# {name:conversion} in patterns and replacements
+CONVERSIONS = {
+    "byte": lambda reg: REGS8[REGS64.index(reg)],
+    "dword": lambda reg: REGS32[REGS64.index(reg)],
+    "negate": lambda cc: NEGATE[cc],
+    "qword": qword,
+}
+
+PLACEHOLDER = re.compile(r"^(.*?)\{(\w+)(?::(\w+))?\}$")
+
+
+def parse_line(text):
+    """
+    (mnemonic, operands) of an asm line, (LABEL, (name,)) for a label.
+    """
+    text = text.strip()
+    if text.endswith(":"):
+        return LABEL, (text[:-1],)
+    mnemonic, _, rest = text.partition(" ")
+    return mnemonic, tuple(map(str.strip, rest.split(","))) if rest else ()
+
+
+@lru_cache(maxsize=None)
+def access(mnemonic, operands):
+    """
+    (read, written) registers and flags of an instruction; written means
+    fully overwritten. None for instructions not modelled here.
+    """
+    if mnemonic in ("mov", "movzx", "movsx", "movsxd", "lea"):
+        dst, src = operands
+        reads = registers_in(src) | (registers_in(dst) if is_memory(dst) else frozenset())
+        written = written_register(dst)
+        if written is None and not is_memory(dst):
+            reads |= registers_in(dst)
+        return reads, {written} if written else set()
+    if mnemonic in ALU_WRITES or mnemonic in ("cmp", "test"):
+        dst, src = operands
+        if mnemonic in ("xor", "sub") and dst == src and written_register(dst):
+            return set(), {written_register(dst), FLAGS}
+        reads = registers_in(dst) | registers_in(src)
+        if mnemonic in ("adc", "sbb"):
+            reads |= {FLAGS}
+        return reads, {FLAGS}
+    if mnemonic == "imul" and len(operands) > 1:
+        if len(operands) == 3:
+            return registers_in(operands[1]), {written_register(operands[0]), FLAGS}
+        return registers_in(operands[0]) | registers_in(operands[1]), {FLAGS}
+    if mnemonic in ("mul", "imul", "div", "idiv"):
+        return {"rax", "rdx"} | registers_in(operands[0]), {"rax", "rdx", FLAGS}
+    if mnemonic in ("neg", "not", "inc", "dec", "shl", "sal", "shr", "sar", "rol", "ror"):
+        # inc/dec keep CF and a shift by cl=0 keeps every flag
+        reads = set().union(*map(registers_in, operands))
+        return reads | {FLAGS}, {FLAGS} if mnemonic == "neg" else set()
+    if mnemonic.startswith("set") and mnemonic[3:] in CONDITION_CODES:
+        return registers_in(operands[0]) | {FLAGS}, set()
+    if mnemonic.startswith("cmov") and mnemonic[4:] in CONDITION_CODES:
+        return registers_in(operands[0]) | registers_in(operands[1]) | {FLAGS}, set()
+    if mnemonic == "cqo":
+        return {"rax"}, {"rdx"}
+    if mnemonic == "push":
+        return registers_in(operands[0]) | {"rsp"}, set()
+    if mnemonic == "pop":
+        written = written_register(operands[0])
+        return registers_in(operands[0]) | {"rsp"}, {written} if written else set()
+    if mnemonic == "call":
+        return KNOWN_CALL_READS.get(operands[0], CALL_READS) | registers_in(operands[0]), CALL_WRITES
+    if mnemonic == "syscall":
+        return {"rax", "rdi", "rsi", "rdx", "r10", "r8", "r9"}, {"rax", "rcx", "r11"}
+    if mnemonic == "nop":
+        return set(), set()
+    if mnemonic in SSE_OPS or mnemonic in SSE_SHIFT_OPS or mnemonic == "movq":
+        # xmm registers aren't tracked, only the addresses and movq sources
+        return set().union(*map(registers_in, operands)), set()
+    return None
+
+
+class Rule:
+    """
+    Rewrite of `pattern`, consecutive lines, into `replacement`. Pattern
+    lines are asm with {name} placeholders, a name binds the same text
+    everywhere in the window and its kind (KINDS) restricts what it
+    matches; {name:conversion} matches or writes a converted binding,
+    e.g. {r:byte} is the low byte of register r. The rule only fires when
+    the registers or flags in `dead` are not read after the window and
+    `where(bindings)`, if given, holds. Replacements never get longer
+    and keep the window's trailing labels, so jump targets stay put.
+    """
+    def __init__(self, name, pattern, replacement, dead=(), where=None):
+        self.name = name
+        self.pattern = [self.compile_line(line) for line in pattern]
+        # mnemonics each line can match (None for any) and its operand count, checked first
+        self.shape = [(self.mnemonics(mnemonic), len(operands)) for mnemonic, operands in self.pattern]
+        # (line, operand index or -1 for the mnemonic, literal text or None, placeholder)
+        # left to match once the shape fits: literal operands first as the cheapest
+        # rejection, conversions last
+        tokens = [(line, -1, None, mnemonic) for line, (mnemonic, _) in enumerate(self.pattern)
+                  if not isinstance(mnemonic, str)]
+        tokens += [(line, slot, token, None) if isinstance(token, str) else (line, slot, None, token)
+                   for line, (_, operands) in enumerate(self.pattern)
+                   for slot, token in enumerate(operands)]
+        self.tokens = sorted(tokens, key=lambda item: 0 if item[2] is not None else
+                             2 if item[3][2] is not None else 1)
+        # replacement lines as (literal text, placeholder name, conversion) pieces
+        self.replacement = [[(literal, name, conversion or None)
+                             for literal, name, conversion, _ in Formatter().parse(line)]
+                            for line in replacement]
+        self.dead = dead
+        self.where = where
+
+    def compile_line(self, line):
+        mnemonic, operands = parse_line(line)
+        return self.compile_token(mnemonic), tuple(map(self.compile_token, operands))
+
+    def compile_token(self, token):
+        match = PLACEHOLDER.match(token)
+        if match is None:
+            return token
+        prefix, name, conversion = match.groups()
+        return prefix, name, conversion, KINDS.get(name.rstrip("0123456789"))
+
+    def mnemonics(self, token):
+        """
+        Set of mnemonics a compiled mnemonic token can match, None for any.
+        """
+        if isinstance(token, str):
+            return {token}
+        prefix, name, conversion, _ = token
+        values = ENUMERABLE.get(name.rstrip("0123456789"))
+        if values is None or conversion is not None:
+            return None
+        return {prefix + value for value in values}
+
+    def heads(self):
+        """
+        Mnemonics the first pattern line can match, None for any.
+        """
+        return self.shape[0][0]
+
+    def fits(self, shape):
+        """
+        Whether lines of `shape`, (mnemonic, operand count) per line, can
+        match the pattern at all.
+        """
+        if len(shape) < len(self.shape):
+            return False
+        return all(count == pattern_count and (allowed is None or mnemonic in allowed)
+                   for (mnemonic, count), (allowed, pattern_count) in zip(shape, self.shape))
+
+    def match(self, window):
+        """
+        Bindings if the parsed lines starting `window`, which `fit` the
+        pattern, match it, else None.
+        """
+        bindings = {}
+        for line, slot, literal, placeholder in self.tokens:
+            text = window[line][0] if slot < 0 else window[line][1][slot]
+            if literal is not None:
+                if literal != text:
+                    return None
+                continue
+            prefix, name, conversion, check = placeholder
+            if prefix:
+                if not text.startswith(prefix):
+                    return None
+                text = text[len(prefix):]
+            if conversion is not None:
+                if name not in bindings or CONVERSIONS[conversion](bindings[name]) != text:
+                    return None
+            elif name in bindings:
+                if bindings[name] != text:
+                    return None
+            elif check is not None and not check(text):
+                return None
+            else:
+                bindings[name] = text
+        if self.where is not None and not self.where(bindings):
+            return None
+        return bindings
+
+    def rewrite(self, bindings):
+        lines = []
+        for pieces in self.replacement:
+            text = ""
+            for literal, name, conversion in pieces:
+                text += literal
+                if name is not None:
+                    value = bindings[name]
+                    text += CONVERSIONS[conversion](value) if conversion else value
+            lines.append(text)
+        return lines
+
+
+def fuse_compare(jump, replacement_jump):
+    """
+    AsmGenerator materializes every comparison with setcc and then
+    branches on the result; branch on the comparison's flags instead.
+    The setcc is left to `dead_condition` in case the result is used again.
+    """
+    return Rule(f"branch_on_compare_{jump}",
+                ["mov {r}, 0", "cmp {a}, {b}", "set{cc} {r:byte}", "cmp {r}, 0", f"{jump} {{L}}"],
+                ["mov {r}, 0", "cmp {a}, {b}", "set{cc} {r:byte}", f"{replacement_jump} {{L}}"],
+                dead=(FLAGS,), where=lambda m: m["r"] not in registers_in(m["a"]) | registers_in(m["b"]))
+
+
+def fuse_spilled_compare(jump, replacement_jump):
+    return Rule(f"branch_on_spilled_compare_{jump}",
+                ["set{cc} al", "movzx rax, al", "mov {m}, rax", "cmp {m}, 0", f"{jump} {{L}}"],
+                ["set{cc} al", "movzx rax, al", "mov {m}, rax", f"{replacement_jump} {{L}}"],
+                dead=(FLAGS,), where=lambda m: is_memory(m["m"]))
+
+
+def can_forward(m):
+    if is_memory(m["x"]) and is_memory(m["d"]) or m["r"] in registers_in(m["d"]):
+        return False
+    return not (is_immediate(m["x"]) and not is_imm32(m["x"]) and is_memory(m["d"]))
+
+
+def can_fold(m):
+    if m["r"] in registers_in(m["d"]) or is_memory(m["x"]) and is_memory(m["d"]):
+        return False
+    if is_immediate(m["x"]) and not is_imm32(m["x"]):
+        return False
+    # the two operand imul only writes a register
+    return m["op"] != "imul" or m["d"] in REGS64
+
+
+RULES = (
+    fuse_compare("je", "j{cc:negate}"),
+    fuse_compare("jne", "j{cc}"),
+    fuse_spilled_compare("je", "j{cc:negate}"),
+    fuse_spilled_compare("jne", "j{cc}"),
+    Rule("dead_condition",
+         ["mov {r}, 0", "cmp {a}, {b}", "set{cc} {r:byte}"],
+         ["cmp {a}, {b}"],
+         dead=("r",), where=lambda m: m["r"] not in registers_in(m["a"]) | registers_in(m["b"])),
+    Rule("jump_over_jump", ["j{cc} {L1}", "jmp {L2}", "{L1}:"], ["j{cc:negate} {L2}", "{L1}:"]),
+    Rule("jump_to_next_label", ["jmp {L}", "{L}:"], ["{L}:"]),
+    Rule("jump_over_labels", ["jmp {L}", "{L1}:", "{L}:"], ["{L1}:", "{L}:"]),
+    Rule("move_back", ["mov {a}, {b}", "mov {b}, {a}"], ["mov {a}, {b}"],
+         where=lambda m: not registers_in(m["a"]) & registers_in(m["b"])),
+    # mov reg_res, reg1 followed by the only use of reg_res
+    Rule("forward_move", ["mov {r}, {x}", "mov {d}, {r}"], ["mov {d:qword}, {x}"],
+         dead=("r",), where=can_forward),
+    Rule("fold_operand", ["mov {r}, {x}", "{op} {d}, {r}"], ["{op} {d:qword}, {x}"],
+         dead=("r",), where=can_fold),
+    # the operand is loaded before the two-address op copies its first operand
+    Rule("fold_operand_past_move", ["mov {r}, {x}", "mov {d}, {y}", "{op} {d}, {r}"],
+         ["mov {d}, {y}", "{op} {d:qword}, {x}"],
+         dead=("r",), where=lambda m: can_fold(m) and m["r"] not in registers_in(m["y"])
+         and not registers_in(m["d"]) & registers_in(m["x"])),
+    # a single argument of a user function call
+    Rule("push_pop", ["push {x}", "pop {r}"], ["mov {r}, {x}"], where=lambda m: m["x"] != m["r"]),
+    Rule("zero_register", ["mov {r}, 0"], ["xor {r:dword}, {r:dword}"], dead=(FLAGS,)),
+)
+
+
+class PeepholeOptimizer:
+    """
+    Applies RULES to the asm until a fixpoint. Lines are rewritten in
+    place, removed lines become None until the end so label positions
+    stay valid for the dead register search. The first sweep looks at
+    every line; a window only has to be looked at again when it overlaps
+    a rewrite, which is done right away by backing up, or when its rule
+    matched but a register or flags were still live, which can change
+    with any later rewrite and is retried in the next sweep. `hits`
+    counts the rewrites per rule.
+    """
+    # lines looked at per dead register/flags query before assuming live
+    SEARCH_LIMIT = 64
+
+    def __init__(self, asm, rules=RULES):
+        self.lines = asm.split("\n")
+        self.parsed = [parse_line(line) for line in self.lines]
+        # (mnemonic, operand count) per line, windows of these select the rules to try
+        self.shapes = [(mnemonic, len(operands)) for mnemonic, operands in self.parsed]
+        self.labels = {operands[0]: index for index, (mnemonic, operands) in enumerate(self.parsed)
+                       if mnemonic is LABEL}
+        self.rules = rules
+        self.window = max(len(rule.pattern) for rule in rules)
+        # first mnemonic -> rules that can start there, in table order
+        self.wildcard = []
+        self.candidates = {}
+        for rule in rules:
+            heads = rule.heads()
+            if heads is None:
+                self.wildcard.append(rule)
+                for candidates in self.candidates.values():
+                    candidates.append(rule)
+                continue
+            for head in heads:
+                self.candidates.setdefault(head, list(self.wildcard)).append(rule)
+        self.hits = {rule.name: 0 for rule in rules}
+        self.fitting = {}   # window shape -> rules that fit it
+        self.blocked = []   # window starts whose rule failed on a live register or flags
+
+    def optimize(self):
+        starts = range(len(self.lines))
+        while starts:
+            self.blocked = []
+            if not self.sweep(starts):
+                break
+            starts = sorted(set(self.blocked))
+        return "\n".join(line for line in self.lines if line is not None)
+
+    def sweep(self, starts):
+        """
+        Look at the windows starting at `starts` (ascending) and, after a
+        rewrite, at every window overlapping it. Returns whether anything
+        changed.
+        """
+        changed = False
+        index = limit = -1
+        for start in starts:
+            if start > limit:
+                index = limit = start
+            while index <= limit:
+                end = self.rewrite_at(index)
+                if end is None:
+                    index += 1
+                else:
+                    changed = True
+                    limit = max(limit, end)
+                    index = self.back(index)
+        return changed
+
+    def rewrite_at(self, index):
+        """
+        Apply the first matching rule to the window starting at line
+        `index`, return the window's last line index or None.
+        """
+        if index >= len(self.lines) or self.lines[index] is None:
+            return None
+        rules = self.candidates.get(self.parsed[index][0], self.wildcard)
+        if not rules:
+            return None
+        end = index + self.window
+        if None in self.lines[index:end]:
+            indices = self.live_indices(index, self.window)
+            window = [self.parsed[i] for i in indices]
+            shape = tuple(self.shapes[i] for i in indices)
+        else:
+            indices = range(index, min(end, len(self.lines)))
+            window = self.parsed[index:end]
+            shape = tuple(self.shapes[index:end])
+        fitting = self.fitting.get(shape)
+        if fitting is None:
+            fitting = self.fitting[shape] = [rule for rule in rules if rule.fits(shape)]
+        for rule in fitting:
+            bindings = rule.match(window)
+            if bindings is not None and self.apply(rule, indices[:len(rule.pattern)], bindings):
+                return indices[len(rule.pattern) - 1]
+        return None
+
+    def live_indices(self, start, count):
+        indices = []
+        index = start
+        while len(indices) < count and index < len(self.lines):
+            if self.lines[index] is not None:
+                indices.append(index)
+            index += 1
+        return indices
+
+    def back(self, index):
+        """
+        Start of the furthest window that could include line `index`.
+        """
+        steps = self.window - 1
+        while index > 0 and steps:
+            index -= 1
+            if self.lines[index] is not None:
+                steps -= 1
+        return index
+
+    def apply(self, rule, indices, bindings):
+        """
+        Replace the lines at `indices` matched by `rule`, unless a register
+        or the flags it needs dead are live after them.
+        """
+        after = indices[-1] + 1
+        if not all(self.is_dead(after, FULL_REG.get(bindings.get(name), name)) for name in rule.dead):
+            self.blocked.append(indices[0])
+            return False
+        replacement = rule.rewrite(bindings)
+        # right-aligned, so trailing labels keep their line
+        slots = indices[len(indices) - len(replacement):]
+        for i in indices:
+            self.lines[i] = None
+        for i, text in zip(slots, replacement):
+            mnemonic, operands = self.parsed[i] = parse_line(text)
+            self.shapes[i] = (mnemonic, len(operands))
+            self.lines[i] = text if mnemonic is LABEL else f"    {text}"
+        self.hits[rule.name] += 1
+        return True
+
+    def is_dead(self, start, resource):
+        """
+        True if no path from line `start` reads `resource`, a 64-bit
+        register or FLAGS, before overwriting it. Paths follow jumps to
+        labels of this text; anything unknown counts as a read.
+        """
+        budget = self.SEARCH_LIMIT
+        seen = set()
+        stack = [start]
+        while stack:
+            index = stack.pop()
+            while index not in seen:
+                seen.add(index)
+                budget -= 1
+                if budget < 0 or index >= len(self.lines):
+                    return False
+                if self.lines[index] is None:
+                    index += 1
+                    continue
+                mnemonic, operands = self.parsed[index]
+                if mnemonic is LABEL:
+                    index += 1
+                    continue
+                if mnemonic == "ret":
+                    if resource in RETURN_LIVE:
+                        return False
+                    break
+                if mnemonic == "ud2":
+                    break
+                if mnemonic == "jmp" or mnemonic.startswith("j") and mnemonic[1:] in CONDITION_CODES:
+                    target = self.labels.get(operands[0])
+                    if target is None or mnemonic != "jmp" and resource == FLAGS:
+                        return False
+                    if mnemonic == "jmp":
+                        index = target
+                        continue
+                    stack.append(target)
+                    index += 1
+                    continue
+                effect = access(mnemonic, operands)
+                if effect is None or resource in effect[0]:
+                    return False
+                if resource in effect[1]:
+                    break
+                index += 1
+        return True
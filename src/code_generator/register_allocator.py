@@ -0,0 +1,222 @@
+from bisect import bisect_right
+import heapq
+
+class Interval:
+    """
+    Live interval of one IR temporary: [start, end] as IR list indices.
+    """
+    def __init__(self, temp, start):
+        self.temp = temp
+        self.start = start
+        self.end = start
+        self.crosses_call = False
+        self.reg = None     # assigned register
+        self.slot = None    # stack slot index if spilled
+
+    def __repr__(self):
+        where = self.reg if self.reg else f"slot{self.slot}"
+        return f"Interval({self.temp}, {self.start}-{self.end}, {where})"
+
+
+class LinearScanAllocator:
+    """
+    Linear scan register allocation (Poletto & Sarkar) over the IR list.
+    Live intervals are computed once, temps that do not fit into registers
+    are spilled to stack slots in main's frame.
+
+    With an InstructionSelector, temps folded into a tree get no interval
+    and the others are live up to the roots reading them.
+    """
+    # caller-saved registers are clobbered by printf and the output runtime,
+    # callee-saved are not
+    CALLER_SAVED = ["rcx", "r8", "r9", "r10", "r11"]
+    CALLEE_SAVED = ["rbx", "r12", "r13", "r14", "r15"]
+    # rax, rdx (idiv, scratch), rdi, rsi (call arguments), rbp, rsp are reserved
+
+    VALUE_OPS = {"const", "load", "addr", "load_idx", "add", "sub", "mul", "div",
+                 "eq", "neq", "lt", "gt", "leq", "geq", "copy"}
+    BINARY_OPS = {"add", "sub", "mul", "div", "eq", "neq", "lt", "gt", "leq", "geq"}
+    JUMP_OPS = {"goto", "if", "if_false"}
+
+    def __init__(self, ir_list, caller_saved=None, callee_saved=None, selection=None):
+        self.ir_list = ir_list
+        self.selection = selection
+        self.caller_saved = list(self.CALLER_SAVED if caller_saved is None else caller_saved)
+        self.callee_saved = list(self.CALLEE_SAVED if callee_saved is None else callee_saved)
+        self.intervals = {}         # temp -> Interval
+        self.used_callee_saved = [] # callee-saved registers main has to preserve
+        self.spill_slots = 0        # number of 8-byte stack slots needed
+
+    def allocate(self):
+        """
+        Compute live intervals and assign every temp a register or a stack slot.
+        Returns dict temp -> Interval.
+        """
+        self.build_intervals()
+        self.scan()
+        return self.intervals
+
+    ### Live intervals ###
+    def build_intervals(self):
+        intervals = self.intervals
+        labels = {}
+        back_edges = []     # (header index, latch index)
+        calls = []
+        pending_params = []
+
+        def use(temp, index):
+            interval = intervals.get(temp)
+            if interval is not None and index > interval.end:
+                interval.end = index
+
+        selection = self.selection
+        for index, instr in enumerate(self.ir_list):
+            op = instr.op
+            if selection is not None:
+                if index in selection.consumed:
+                    continue
+                for temp in selection.reads.get(index, ()):
+                    use(temp, index)
+                if op == "call":
+                    calls.append(index)
+                elif op == "label":
+                    labels[instr.dest] = index
+            elif op in self.BINARY_OPS:
+                use(instr.arg1, index)
+                use(instr.arg2, index)
+            elif op == "store":
+                use(instr.arg2, index)
+            elif op in ("if", "if_false", "copy", "return"):
+                use(instr.arg1, index)
+            elif op == "param":
+                # printf reads its arguments at the call, not at the param
+                pending_params.append(instr.arg1)
+            elif op == "call":
+                for temp in pending_params:
+                    use(temp, index)
+                pending_params.clear()
+                calls.append(index)
+            elif op == "label":
+                labels[instr.dest] = index
+
+            if op in self.JUMP_OPS and instr.dest in labels:
+                back_edges.append((labels[instr.dest], index))
+            if op in self.VALUE_OPS or op == "call" and instr.arg2 is not None:
+                if instr.dest not in intervals:
+                    intervals[instr.dest] = Interval(instr.dest, index)
+                else:
+                    # a temp written by several copies keeps its register up to the last
+                    use(instr.dest, index)
+
+        self.extend_over_loops(back_edges)
+
+        for interval in intervals.values():
+            # a call strictly inside the interval clobbers caller-saved registers
+            i = bisect_right(calls, interval.start)
+            interval.crosses_call = i < len(calls) and calls[i] < interval.end
+
+    def extend_over_loops(self, back_edges):
+        """
+        A temp live at a loop header must stay live until the back edge.
+        New end = max latch over loop headers in (start, end].
+        """
+        if not back_edges:
+            return
+        back_edges.sort()
+        headers = [h for h, _ in back_edges]
+        # sparse table for range maximum of latch indices
+        table = [[latch for _, latch in back_edges]]
+        width = 1
+        while 2 * width <= len(headers):
+            prev = table[-1]
+            table.append([max(prev[i], prev[i + width]) for i in range(len(prev) - width)])
+            width *= 2
+
+        for interval in self.intervals.values():
+            lo = bisect_right(headers, interval.start)
+            hi = bisect_right(headers, interval.end)
+            if lo >= hi:
+                continue
+            level = (hi - lo).bit_length() - 1
+            row = table[level]
+            latch = max(row[lo], row[hi - (1 << level)])
+            if latch > interval.end:
+                interval.end = latch
+
+    ### Linear scan ###
+    def scan(self):
+        free_caller = list(reversed(self.caller_saved))
+        free_callee = list(reversed(self.callee_saved))
+        free_slots = []
+        active = []         # heap of (end, start, temp) holding a register
+        active_slots = []   # heap of (end, start, temp) holding a stack slot
+        used_callee = set()
+
+        for interval in sorted(self.intervals.values(), key=lambda iv: iv.start):
+            # expire intervals that ended before this one starts
+            while active and active[0][0] < interval.start:
+                old = self.intervals[heapq.heappop(active)[2]]
+                if old.reg is not None:
+                    if old.reg in self.callee_saved:
+                        free_callee.append(old.reg)
+                    else:
+                        free_caller.append(old.reg)
+            while active_slots and active_slots[0][0] < interval.start:
+                old = self.intervals[heapq.heappop(active_slots)[2]]
+                free_slots.append((old.slot, old.end))
+
+            if interval.crosses_call:
+                pool = free_callee
+            else:
+                pool = free_caller if free_caller else free_callee
+
+            if pool:
+                interval.reg = pool.pop()
+                heapq.heappush(active, (interval.end, interval.start, interval.temp))
+            else:
+                victim = self.spill_candidate(active, interval)
+                if victim is not None and victim.end > interval.end:
+                    # steal the register of the interval that lives longest
+                    interval.reg = victim.reg
+                    victim.reg = None
+                    self.assign_slot(victim, free_slots, active_slots)
+                    heapq.heappush(active, (interval.end, interval.start, interval.temp))
+                else:
+                    self.assign_slot(interval, free_slots, active_slots)
+
+            if interval.reg in self.callee_saved:
+                used_callee.add(interval.reg)
+
+        self.used_callee_saved = [r for r in self.callee_saved if r in used_callee]
+
+    def spill_candidate(self, active, interval):
+        """
+        Active interval with the furthest end whose register fits `interval`.
+        """
+        best = None
+        for _, _, temp in active:
+            other = self.intervals[temp]
+            if other.reg is None:
+                continue
+            if interval.crosses_call and other.reg not in self.callee_saved:
+                continue
+            if best is None or other.end > best.end:
+                best = other
+        return best
+
+    def assign_slot(self, interval, free_slots, active_slots):
+        """
+        A temp has one location for its whole interval, so a spilled victim
+        needs a slot that was already free at its start, not just now.
+        free_slots holds (slot, end of its last interval).
+        """
+        for i in range(len(free_slots) - 1, -1, -1):
+            slot, last_end = free_slots[i]
+            if last_end < interval.start:
+                interval.slot = slot
+                del free_slots[i]
+                break
+        else:
+            interval.slot = self.spill_slots
+            self.spill_slots += 1
+        heapq.heappush(active_slots, (interval.end, interval.start, interval.temp))
@@ -0,0 +1,705 @@
+# x86_encoder.py
+"""
+In-process assembler for the NASM subset emitted by AsmGenerator.
+Encodes x86-64 machine code into sections and records the relocations
+that the ELF writer has to emit or resolve.
+"""
+import re
+
+REGS64 = ["rax", "rcx", "rdx", "rbx", "rsp", "rbp", "rsi", "rdi",
+          "r8", "r9", "r10", "r11", "r12", "r13", "r14", "r15"]
+REGS32 = ["eax", "ecx", "edx", "ebx", "esp", "ebp", "esi", "edi",
+          "r8d", "r9d", "r10d", "r11d", "r12d", "r13d", "r14d", "r15d"]
+REGS16 = ["ax", "cx", "dx", "bx", "sp", "bp", "si", "di",
+          "r8w", "r9w", "r10w", "r11w", "r12w", "r13w", "r14w", "r15w"]
+REGS8  = ["al", "cl", "dl", "bl", "spl", "bpl", "sil", "dil",
+          "r8b", "r9b", "r10b", "r11b", "r12b", "r13b", "r14b", "r15b"]
+
+REGISTERS = {}
+for _size, _names in ((64, REGS64), (32, REGS32), (16, REGS16), (8, REGS8)):
+    for _code, _name in enumerate(_names):
+        REGISTERS[_name] = (_code, _size)
+
+# SSE registers, apart from REGISTERS: they hold no integer operand
+XMM_REGISTERS = {f"xmm{_code}": _code for _code in range(16)}
+
+SIZES = {"byte": 8, "word": 16, "dword": 32, "qword": 64}
+
+CONDITION_CODES = {
+    "o": 0, "no": 1, "b": 2, "c": 2, "nae": 2, "ae": 3, "nb": 3, "nc": 3,
+    "e": 4, "z": 4, "ne": 5, "nz": 5, "be": 6, "na": 6, "a": 7, "nbe": 7,
+    "s": 8, "ns": 9, "p": 10, "pe": 10, "np": 11, "po": 11,
+    "l": 12, "nge": 12, "ge": 13, "nl": 13, "le": 14, "ng": 14, "g": 15, "nle": 15,
+}
+
+# ALU ops: (opcode base, /digit for the immediate forms)
+ALU_OPS = {"add": (0x00, 0), "or": (0x08, 1), "adc": (0x10, 2), "sbb": (0x18, 3),
+           "and": (0x20, 4), "sub": (0x28, 5), "xor": (0x30, 6), "cmp": (0x38, 7)}
+SHIFT_OPS = {"rol": 0, "ror": 1, "shl": 4, "sal": 4, "shr": 5, "sar": 7}
+UNARY_OPS = {"not": 2, "neg": 3, "mul": 4, "imul": 5, "div": 6, "idiv": 7}
+SIMPLE_OPS = {"ret": b"\xc3", "cqo": b"\x48\x99", "cdq": b"\x99", "nop": b"\x90",
+              "leave": b"\xc9", "syscall": b"\x0f\x05", "rep movsb": b"\xf3\xa4",
+              "ud2": b"\x0f\x0b"}
+# SSE2 xmm, xmm/m128 ops: (mandatory prefix, opcode)
+SSE_OPS = {"paddq": (b"\x66", b"\x0f\xd4"), "psubq": (b"\x66", b"\x0f\xfb"),
+           "pmuludq": (b"\x66", b"\x0f\xf4"), "punpcklqdq": (b"\x66", b"\x0f\x6c"),
+           "movdqa": (b"\x66", b"\x0f\x6f"), "movdqu": (b"\xf3", b"\x0f\x6f")}
+# SSE2 shifts by an immediate: /digit of 66 0F 73
+SSE_SHIFT_OPS = {"psrlq": 2, "psllq": 6}
+
+# relocation kinds, mapped to ELF types by the writer
+PC32  = "pc32"      # S + A - P, 32 bit
+PLT32 = "plt32"     # call to an external function
+ABS32S = "abs32s"   # S + A, sign-extended 32 bit
+ABS64 = "abs64"     # S + A, 64 bit
+
+
+class Reg:
+    def __init__(self, name):
+        self.name = name
+        self.code, self.size = REGISTERS[name]
+
+    def needs_rex(self):
+        # spl, bpl, sil, dil are only addressable with a REX prefix
+        return self.size == 8 and 4 <= self.code < 8
+
+
+class Xmm(Reg):
+    def __init__(self, name):
+        self.name = name
+        self.code, self.size = XMM_REGISTERS[name], 128
+
+
+class Mem:
+    def __init__(self, size=None, base=None, index=None, scale=1, disp=0, symbol=None, rip=False):
+        self.size = size
+        self.base = base
+        self.index = index
+        self.scale = scale
+        self.disp = disp
+        self.symbol = symbol
+        self.rip = rip
+
+
+class Imm:
+    def __init__(self, value=0, symbol=None):
+        self.value = value
+        self.symbol = symbol
+
+
+class Section:
+    def __init__(self, name):
+        self.name = name
+        self.data = bytearray()
+        self.nobits = name == ".bss"
+        self.size = 0           # size of a nobits section
+        self.align = 16 if name == ".text" else 8
+
+    def offset(self):
+        return self.size if self.nobits else len(self.data)
+
+
+class Reloc:
+    def __init__(self, section, offset, kind, symbol, addend):
+        self.section = section  # section name the field lives in
+        self.offset = offset
+        self.kind = kind
+        self.symbol = symbol
+        self.addend = addend
+
+    def __repr__(self):
+        return f"Reloc({self.section}+{self.offset}, {self.kind}, {self.symbol}{self.addend:+d})"
+
+
+class Assembler:
+    """
+    Two-step assembler: encode() every line, recording a relocation for
+    every symbol reference, then resolve the pc-relative ones that stay
+    inside their own section. Jumps always use rel32 so instruction sizes
+    never depend on label positions.
+
+    Generated code repeats the same few hundred instructions (registers,
+    stack slots, variables), so every encoded instruction is cached by its
+    source text together with its relocations.
+    """
+    def __init__(self):
+        self.sections = {}
+        self.symbols = {}       # label -> (section name, offset)
+        self.globals = []
+        self.externs = []
+        self.relocs = []
+        self.encoded = {}       # instruction text -> (machine code, relocations)
+        self.section = self.get_section(".text")
+
+    def get_section(self, name):
+        if name not in self.sections:
+            self.sections[name] = Section(name)
+        return self.sections[name]
+
+    def assemble(self, text):
+        for number, line in enumerate(text.splitlines(), 1):
+            try:
+                self.assemble_line(line)
+            except (ValueError, KeyError, NotImplementedError) as error:
+                raise ValueError(f"asm line {number}: {line.strip()!r}: {error}") from None
+        self.resolve_local()
+        return self
+
+    ### Parsing ###
+    def strip_comment(self, line):
+        if ";" not in line:
+            return line
+        quote = None
+        for i, char in enumerate(line):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "\"'`":
+                quote = char
+            elif char == ";":
+                return line[:i]
+        return line
+
+    def assemble_line(self, line):
+        line = self.strip_comment(line).strip()
+        if not line:
+            return
+        match = ":" in line and re.match(r"([A-Za-z_.$?][\w.$?@]*):\s*(.*)$", line)
+        if match:
+            self.define_label(match.group(1))
+            line = match.group(2)
+            if not line:
+                return
+        cached = self.encoded.get(line)
+        if cached is not None:
+            self.emit_cached(*cached)
+            return
+        head, _, rest = line.partition(" ")
+        head = head.lower()
+        rest = rest.strip()
+        if head == "section":
+            self.section = self.get_section(rest.split()[0])
+        elif head == "global":
+            self.globals.extend(name.strip() for name in rest.split(","))
+        elif head == "extern":
+            self.externs.extend(name.strip() for name in rest.split(","))
+            self.encoded.clear()    # calls to these become plt32
+        elif head == "default":
+            if rest != "rel":
+                raise NotImplementedError("only 'default rel' is supported")
+        elif head in ("db", "dw", "dd", "dq"):
+            self.emit_data({"db": 1, "dw": 2, "dd": 4, "dq": 8}[head], rest)
+        elif head in ("resb", "resw", "resd", "resq"):
+            count = self.parse_number(rest)
+            self.reserve(count * {"resb": 1, "resw": 2, "resd": 4, "resq": 8}[head])
+        elif head == "align":
+            self.align(self.parse_number(rest))
+        else:
+            start, first = len(self.section.data), len(self.relocs)
+            self.encode(head, self.split_operands(rest))
+            # relocations are kept relative to the start of the instruction
+            relocs = [(reloc.offset - start, reloc.kind, reloc.symbol, reloc.addend)
+                      for reloc in self.relocs[first:]]
+            self.encoded[line] = (bytes(self.section.data[start:]), relocs)
+
+    def emit_cached(self, code, relocs):
+        start = len(self.section.data)
+        self.section.data += code
+        for field, kind, symbol, addend in relocs:
+            self.add_reloc(start + field, kind, symbol, addend)
+
+    def define_label(self, name):
+        if name in self.symbols:
+            raise ValueError(f"label {name} redefined")
+        self.symbols[name] = (self.section.name, self.section.offset())
+
+    def split_operands(self, text):
+        if not text:
+            return []
+        if '"' not in text and "'" not in text and "`" not in text:
+            # commas can only appear inside string literals
+            return [operand.strip() for operand in text.split(",")]
+        operands, depth, quote, start = [], 0, None, 0
+        for i, char in enumerate(text):
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in "\"'`":
+                quote = char
+            elif char == "[":
+                depth += 1
+            elif char == "]":
+                depth -= 1
+            elif char == "," and depth == 0:
+                operands.append(text[start:i].strip())
+                start = i + 1
+        if text.strip():
+            operands.append(text[start:].strip())
+        return operands
+
+    def parse_number(self, text):
+        text = text.strip().replace("_", "")
+        negative = text.startswith("-")
+        if negative or text.startswith("+"):
+            text = text[1:].strip()
+        if text.lower().startswith("0x"):
+            value = int(text, 16)
+        elif text.lower().endswith("h") and re.fullmatch(r"[0-9][0-9a-fA-F]*[hH]", text):
+            value = int(text[:-1], 16)
+        else:
+            value = int(text)
+        return -value if negative else value
+
+    def is_number(self, text):
+        try:
+            self.parse_number(text)
+            return True
+        except ValueError:
+            return False
+
+    def parse_operand(self, text):
+        lower = text.lower()
+        if lower in REGISTERS:
+            return Reg(lower)
+        if lower in XMM_REGISTERS:
+            return Xmm(lower)
+        size = None
+        words = text.split(None, 1)
+        if words and words[0].lower() in SIZES and len(words) > 1:
+            size = SIZES[words[0].lower()]
+            text = words[1].strip()
+            if text.lower().startswith("ptr "):
+                text = text[4:].strip()
+        if text.startswith("["):
+            if not text.endswith("]"):
+                raise ValueError(f"bad memory operand {text}")
+            return self.parse_memory(text[1:-1], size)
+        if self.is_number(text):
+            return Imm(self.parse_number(text))
+        symbol, offset = self.parse_symbol_expr(text)
+        return Imm(offset, symbol)
+
+    def parse_symbol_expr(self, text):
+        # label, label+number, label-number
+        match = re.fullmatch(r"([A-Za-z_.$?][\w.$?@]*)\s*(?:([+-])\s*(\w+))?", text.strip())
+        if not match:
+            raise ValueError(f"bad operand {text}")
+        offset = 0
+        if match.group(2):
+            offset = self.parse_number(match.group(3))
+            if match.group(2) == "-":
+                offset = -offset
+        return match.group(1), offset
+
+    def parse_memory(self, text, size):
+        mem = Mem(size)
+        text = text.strip()
+        if text.lower().startswith("rel "):
+            mem.rip = True
+            text = text[4:]
+        for sign, term in re.findall(r"([+-]?)\s*([^+-]+)", text):
+            term = term.strip().lower() if term.strip().lower() in REGISTERS else term.strip()
+            if "*" in term:
+                left, right = (part.strip() for part in term.split("*"))
+                reg, scale = (left, right) if left.lower() in REGISTERS else (right, left)
+                if sign == "-":
+                    raise ValueError("negative index")
+                mem.index = Reg(reg.lower())
+                mem.scale = self.parse_number(scale)
+            elif term in REGISTERS:
+                if sign == "-":
+                    raise ValueError("negative register")
+                if mem.base is None:
+                    mem.base = Reg(term)
+                else:
+                    mem.index = Reg(term)
+            elif self.is_number(term):
+                value = self.parse_number(term)
+                mem.disp += -value if sign == "-" else value
+            else:
+                if mem.symbol is not None or sign == "-":
+                    raise ValueError(f"bad memory operand {text}")
+                mem.symbol = term
+        if mem.rip and (mem.base or mem.index):
+            raise ValueError("rel with registers")
+        return mem
+
+    ### Data ###
+    def emit_data(self, width, text):
+        for item in self.split_operands(text):
+            if item[0] in "\"'`":
+                if width != 1:
+                    raise NotImplementedError("strings only in db")
+                self.section.data += item[1:-1].encode()
+            elif self.is_number(item):
+                value = self.parse_number(item)
+                self.section.data += (value & ((1 << (8 * width)) - 1)).to_bytes(width, "little")
+            elif width == 8:
+                symbol, offset = self.parse_symbol_expr(item)
+                self.add_reloc(len(self.section.data), ABS64, symbol, offset)
+                self.section.data += bytes(8)
+            else:
+                raise NotImplementedError(f"symbol {item} in {width}-byte data")
+
+    def reserve(self, size):
+        if not self.section.nobits:
+            self.section.data += bytes(size)
+        else:
+            self.section.size += size
+
+    def align(self, alignment):
+        pad = -self.section.offset() % alignment
+        if self.section.nobits:
+            self.section.size += pad
+        else:
+            fill = b"\x90" if self.section.name == ".text" else b"\x00"
+            self.section.data += fill * pad
+        self.section.align = max(self.section.align, alignment)
+
+    ### Encoding helpers ###
+    def add_reloc(self, offset, kind, symbol, addend):
+        self.relocs.append(Reloc(self.section.name, offset, kind, symbol, addend))
+
+    def emit(self, prefix, rex, opcode, modrm=b"", disp_reloc=None, imm=b"", imm_reloc=None):
+        """
+        Append one instruction. disp_reloc / imm_reloc are (kind, symbol, addend)
+        for a 4 byte field inside modrm bytes / immediate.
+        """
+        data = self.section.data
+        data += prefix
+        if rex is not None:
+            data.append(rex)
+        data += opcode
+        data += modrm
+        imm_start = len(data)
+        data += imm
+        end = len(data)
+        if disp_reloc is not None:
+            kind, symbol, addend = disp_reloc
+            field = imm_start - 4
+            if kind == PC32:
+                # rip-relative displacement is relative to the next instruction
+                addend -= end - field
+            self.add_reloc(field, kind, symbol, addend)
+        if imm_reloc is not None:
+            kind, symbol, addend = imm_reloc
+            self.add_reloc(imm_start, kind, symbol, addend)
+
+    def rex_byte(self, w, r, x, b, force=False):
+        if w or r or x or b or force:
+            return 0x40 | (w << 3) | (r << 2) | (x << 1) | b
+        return None
+
+    def modrm_bytes(self, reg_field, rm):
+        """
+        ModRM (+SIB, +displacement) for register field `reg_field` and
+        r/m operand `rm`. Returns (bytes, rex_r_x_b, disp_reloc).
+        """
+        if isinstance(rm, Reg):
+            return bytes([0xC0 | ((reg_field & 7) << 3) | (rm.code & 7)]), (0, rm.code >> 3), None
+        reg = (reg_field & 7) << 3
+        reloc = None
+        if rm.rip:
+            reloc = (PC32, rm.symbol, rm.disp) if rm.symbol else None
+            disp = 0 if rm.symbol else rm.disp
+            return bytes([reg | 0x05]) + disp.to_bytes(4, "little", signed=True), (0, 0), reloc
+        if rm.symbol:
+            reloc = (ABS32S, rm.symbol, rm.disp)
+        if rm.index is not None and rm.index.code == 4:
+            raise ValueError("rsp can't be an index")
+        if rm.scale not in (1, 2, 4, 8):
+            raise ValueError(f"bad scale {rm.scale}")
+        scale_bits = {1: 0, 2: 1, 4: 2, 8: 3}[rm.scale]
+        if rm.base is None:
+            # absolute [disp32] or [index*scale + disp32]
+            index = rm.index.code if rm.index is not None else 4
+            sib = (scale_bits << 6) | ((index & 7) << 3) | 5
+            disp = 0 if reloc else rm.disp
+            return (bytes([reg | 0x04, sib]) + disp.to_bytes(4, "little", signed=True),
+                    (index >> 3, 0), reloc)
+        base = rm.base.code
+        if reloc or not -128 <= rm.disp < 128:
+            mod, disp = 0x80, (0 if reloc else rm.disp).to_bytes(4, "little", signed=True)
+        elif rm.disp or (base & 7) == 5:
+            mod, disp = 0x40, rm.disp.to_bytes(1, "little", signed=True)
+        else:
+            mod, disp = 0x00, b""
+        if rm.index is None and (base & 7) != 4:
+            return bytes([mod | reg | (base & 7)]) + disp, (0, base >> 3), reloc
+        index = rm.index.code if rm.index is not None else 4
+        sib = (scale_bits << 6) | ((index & 7) << 3) | (base & 7)
+        return bytes([mod | reg | 0x04, sib]) + disp, (index >> 3, base >> 3), reloc
+
+    def emit_modrm(self, opcode, reg_field, rm, size, imm=b"", imm_reloc=None,
+                   force_rex=False, no_w=False):
+        modrm, (x, b), reloc = self.modrm_bytes(reg_field, rm)
+        w = 1 if size == 64 and not no_w else 0
+        r = reg_field >> 3
+        prefix = b"\x66" if size == 16 else b""
+        rex = self.rex_byte(w, r, x, b, force_rex)
+        self.emit(prefix, rex, opcode, modrm, reloc, imm, imm_reloc)
+
+    def operand_size(self, *operands):
+        sizes = {op.size for op in operands if isinstance(op, (Reg, Mem)) and op.size}
+        if not sizes:
+            raise ValueError("operation size not specified")
+        if len(sizes) > 1:
+            raise ValueError("operand size mismatch")
+        return sizes.pop()
+
+    def needs_rex(self, *operands):
+        return any(isinstance(op, Reg) and op.needs_rex() for op in operands)
+
+    def imm_bytes(self, imm, width):
+        if imm.symbol:
+            return bytes(width), (ABS32S if width == 4 else ABS64, imm.symbol, imm.value)
+        value = imm.value
+        if not -(1 << (8 * width - 1)) <= value < (1 << (8 * width)):
+            raise ValueError(f"immediate {value} doesn't fit {width} bytes")
+        return (value & ((1 << (8 * width)) - 1)).to_bytes(width, "little"), None
+
+    def branch(self, opcode, target):
+        if not isinstance(target, Imm) or target.symbol is None:
+            raise NotImplementedError("only direct branches to labels")
+        kind = PLT32 if target.symbol in self.externs else PC32
+        self.emit(b"", None, opcode, b"", None, bytes(4), None)
+        end = len(self.section.data)
+        self.add_reloc(end - 4, kind, target.symbol, target.value - 4)
+
+    ### Instructions ###
+    def encode(self, mnemonic, texts):
+        if mnemonic == "rep" and texts == ["movsb"] or mnemonic == "rep movsb":
+            self.section.data += SIMPLE_OPS["rep movsb"]
+            return
+        if mnemonic in SIMPLE_OPS:
+            self.section.data += SIMPLE_OPS[mnemonic]
+            return
+        ops = [self.parse_operand(text) for text in texts]
+
+        if mnemonic in ALU_OPS:
+            self.encode_alu(mnemonic, ops)
+        elif mnemonic == "mov":
+            self.encode_mov(ops)
+        elif mnemonic == "test":
+            dst, src = ops
+            size = self.operand_size(dst, src) if not isinstance(src, Imm) else self.operand_size(dst)
+            if isinstance(src, Reg):
+                opcode = b"\x84" if size == 8 else b"\x85"
+                self.emit_modrm(opcode, src.code, dst, size, force_rex=self.needs_rex(dst, src))
+            else:
+                width = 1 if size == 8 else 4
+                imm, reloc = self.imm_bytes(src, width)
+                opcode = b"\xf6" if size == 8 else b"\xf7"
+                self.emit_modrm(opcode, 0, dst, size, imm, reloc, self.needs_rex(dst))
+        elif mnemonic == "lea":
+            dst, src = ops
+            self.emit_modrm(b"\x8d", dst.code, src, dst.size)
+        elif mnemonic in ("movzx", "movsx"):
+            dst, src = ops
+            src_size = src.size if src.size else 8
+            base = 0xB6 if mnemonic == "movzx" else 0xBE
+            opcode = bytes([0x0F, base + (1 if src_size == 16 else 0)])
+            self.emit_modrm(opcode, dst.code, src, dst.size, force_rex=self.needs_rex(src))
+        elif mnemonic == "movsxd":
+            dst, src = ops
+            self.emit_modrm(b"\x63", dst.code, src, 64)
+        elif mnemonic == "imul" and len(ops) >= 2:
+            self.encode_imul(ops)
+        elif mnemonic in UNARY_OPS:
+            (dst,) = ops
+            size = self.operand_size(dst)
+            opcode = b"\xf6" if size == 8 else b"\xf7"
+            self.emit_modrm(opcode, UNARY_OPS[mnemonic], dst, size, force_rex=self.needs_rex(dst))
+        elif mnemonic in ("inc", "dec"):
+            (dst,) = ops
+            size = self.operand_size(dst)
+            opcode = b"\xfe" if size == 8 else b"\xff"
+            self.emit_modrm(opcode, 0 if mnemonic == "inc" else 1, dst, size,
+                            force_rex=self.needs_rex(dst))
+        elif mnemonic in SHIFT_OPS:
+            dst, count = ops
+            size = self.operand_size(dst)
+            digit = SHIFT_OPS[mnemonic]
+            if isinstance(count, Reg):
+                if count.name != "cl":
+                    raise ValueError("shift count must be cl")
+                self.emit_modrm(b"\xd2" if size == 8 else b"\xd3", digit, dst, size)
+            elif count.value == 1:
+                self.emit_modrm(b"\xd0" if size == 8 else b"\xd1", digit, dst, size)
+            else:
+                self.emit_modrm(b"\xc0" if size == 8 else b"\xc1", digit, dst, size,
+                                bytes([count.value & 0xFF]))
+        elif mnemonic.startswith("set") and mnemonic[3:] in CONDITION_CODES:
+            (dst,) = ops
+            opcode = bytes([0x0F, 0x90 + CONDITION_CODES[mnemonic[3:]]])
+            self.emit_modrm(opcode, 0, dst, 8, force_rex=self.needs_rex(dst))
+        elif mnemonic.startswith("cmov") and mnemonic[4:] in CONDITION_CODES:
+            dst, src = ops
+            opcode = bytes([0x0F, 0x40 + CONDITION_CODES[mnemonic[4:]]])
+            self.emit_modrm(opcode, dst.code, src, dst.size)
+        elif mnemonic in SSE_OPS or mnemonic in SSE_SHIFT_OPS or mnemonic == "movq":
+            self.encode_sse(mnemonic, ops)
+        elif mnemonic == "jmp":
+            self.encode_jump(b"\xe9", 4, ops[0])
+        elif mnemonic == "call":
+            self.encode_jump(b"\xe8", 2, ops[0])
+        elif mnemonic.startswith("j") and mnemonic[1:] in CONDITION_CODES:
+            self.branch(bytes([0x0F, 0x80 + CONDITION_CODES[mnemonic[1:]]]), ops[0])
+        elif mnemonic in ("push", "pop"):
+            (op,) = ops
+            if isinstance(op, Imm) and mnemonic == "push" and op.symbol is None:
+                # sign-extended to 64 bits
+                if -128 <= op.value < 128:
+                    self.emit(b"", None, b"\x6a", imm=self.imm_bytes(op, 1)[0])
+                else:
+                    self.emit(b"", None, b"\x68", imm=self.imm_bytes(op, 4)[0])
+            elif isinstance(op, Mem) and op.size in (None, 64):
+                if mnemonic == "push":
+                    self.emit_modrm(b"\xff", 6, op, 64, no_w=True)
+                else:
+                    self.emit_modrm(b"\x8f", 0, op, 64, no_w=True)
+            elif isinstance(op, Reg) and op.size == 64:
+                base = 0x50 if mnemonic == "push" else 0x58
+                self.emit(b"", self.rex_byte(0, 0, 0, op.code >> 3), bytes([base + (op.code & 7)]))
+            else:
+                raise NotImplementedError(f"{mnemonic} of a 64-bit register, memory or immediate")
+        else:
+            raise NotImplementedError(f"unsupported instruction {mnemonic}")
+
+    def encode_jump(self, opcode, digit, target):
+        if isinstance(target, Imm):
+            self.branch(opcode, target)
+        else:
+            # indirect jmp/call through register or memory
+            self.emit_modrm(b"\xff", digit, target, 64, no_w=True)
+
+    def encode_alu(self, mnemonic, ops):
+        base, digit = ALU_OPS[mnemonic]
+        dst, src = ops
+        force = self.needs_rex(dst, src)
+        if isinstance(src, Imm):
+            size = self.operand_size(dst)
+            if size == 8:
+                imm, reloc = self.imm_bytes(src, 1)
+                self.emit_modrm(b"\x80", digit, dst, size, imm, reloc, force)
+            elif src.symbol is None and -128 <= src.value < 128:
+                self.emit_modrm(b"\x83", digit, dst, size, self.imm_bytes(src, 1)[0], None, force)
+            else:
+                imm, reloc = self.imm_bytes(src, 2 if size == 16 else 4)
+                if src.symbol is None and size == 64 and not -2**31 <= src.value < 2**31:
+                    raise ValueError(f"immediate {src.value} doesn't fit 32 bits")
+                self.emit_modrm(b"\x81", digit, dst, size, imm, reloc, force)
+        elif isinstance(src, Reg):
+            size = self.operand_size(dst, src)
+            opcode = base + (0 if size == 8 else 1)
+            self.emit_modrm(bytes([opcode]), src.code, dst, size, force_rex=force)
+        else:
+            if not isinstance(dst, Reg):
+                raise ValueError("memory to memory operation")
+            size = self.operand_size(dst, src)
+            opcode = base + (2 if size == 8 else 3)
+            self.emit_modrm(bytes([opcode]), dst.code, src, size, force_rex=force)
+
+    def encode_mov(self, ops):
+        dst, src = ops
+        force = self.needs_rex(dst, src)
+        if isinstance(src, Imm):
+            if isinstance(dst, Reg):
+                size = dst.size
+                if size == 64 and src.symbol is None and not -2**31 <= src.value < 2**31:
+                    if 0 <= src.value < 2**32:
+                        # mov r32, imm32 zero-extends
+                        imm, _ = self.imm_bytes(src, 4)
+                        self.emit(b"", self.rex_byte(0, 0, 0, dst.code >> 3),
+                                  bytes([0xB8 + (dst.code & 7)]), b"", None, imm)
+                    else:
+                        imm, _ = self.imm_bytes(src, 8)
+                        self.emit(b"", self.rex_byte(1, 0, 0, dst.code >> 3),
+                                  bytes([0xB8 + (dst.code & 7)]), b"", None, imm)
+                    return
+                if size in (32, 16, 8):
+                    width = size // 8
+                    imm, reloc = self.imm_bytes(src, width)
+                    opcode = (0xB0 if size == 8 else 0xB8) + (dst.code & 7)
+                    prefix = b"\x66" if size == 16 else b""
+                    self.emit(prefix, self.rex_byte(0, 0, 0, dst.code >> 3, force),
+                              bytes([opcode]), b"", None, imm,
+                              (ABS32S, src.symbol, src.value) if reloc and width == 4 else None)
+                    return
+            size = self.operand_size(dst)
+            if size == 64 and src.symbol is None and not -2**31 <= src.value < 2**31:
+                raise ValueError(f"immediate {src.value} doesn't fit 32 bits")
+            width = 1 if size == 8 else 2 if size == 16 else 4
+            imm, reloc = self.imm_bytes(src, width)
+            self.emit_modrm(b"\xc6" if size == 8 else b"\xc7", 0, dst, size, imm, reloc, force)
+        elif isinstance(src, Reg):
+            size = self.operand_size(dst, src)
+            self.emit_modrm(b"\x88" if size == 8 else b"\x89", src.code, dst, size, force_rex=force)
+        else:
+            if not isinstance(dst, Reg):
+                raise ValueError("memory to memory mov")
+            size = self.operand_size(dst, src)
+            self.emit_modrm(b"\x8a" if size == 8 else b"\x8b", dst.code, src, size, force_rex=force)
+
+    def encode_sse(self, mnemonic, ops):
+        dst, src = ops
+        if mnemonic == "movdqu" and isinstance(dst, Mem):
+            self.emit_sse(b"\xf3", b"\x0f\x7f", src, dst)
+        elif mnemonic in SSE_OPS:
+            self.emit_sse(*SSE_OPS[mnemonic], dst, src)
+        elif mnemonic in SSE_SHIFT_OPS:
+            self.emit_sse(b"\x66", b"\x0f\x73", SSE_SHIFT_OPS[mnemonic], dst,
+                          imm=self.imm_bytes(src, 1)[0])
+        elif isinstance(src, Xmm) or not isinstance(dst, Xmm):
+            raise NotImplementedError("only movq of a 64-bit register or memory to xmm")
+        elif isinstance(src, Reg):
+            if src.size != 64:
+                raise ValueError("operand size mismatch")
+            self.emit_sse(b"\x66", b"\x0f\x6e", dst, src, w=1)
+        else:
+            self.emit_sse(b"\xf3", b"\x0f\x7e", dst, src)
+
+    def emit_sse(self, prefix, opcode, reg, rm, w=0, imm=b""):
+        """
+        The mandatory prefix goes before REX. `reg` is a register or a /digit.
+        """
+        if isinstance(rm, Reg) and not isinstance(rm, Xmm) and w == 0:
+            raise ValueError("xmm operand expected")
+        code = reg if isinstance(reg, int) else reg.code
+        modrm, (x, b), reloc = self.modrm_bytes(code, rm)
+        self.emit(prefix, self.rex_byte(w, code >> 3, x, b), opcode, modrm, reloc, imm)
+
+    def encode_imul(self, ops):
+        if len(ops) == 2:
+            dst, src = ops
+            if isinstance(src, Imm):
+                ops = [dst, dst, src]
+            else:
+                size = self.operand_size(dst, src)
+                self.emit_modrm(b"\x0f\xaf", dst.code, src, size)
+                return
+        dst, src, imm = ops
+        size = self.operand_size(dst, src)
+        if -128 <= imm.value < 128:
+            self.emit_modrm(b"\x6b", dst.code, src, size, self.imm_bytes(imm, 1)[0])
+        else:
+            self.emit_modrm(b"\x69", dst.code, src, size, self.imm_bytes(imm, 4)[0])
+
+    ### Symbol resolution ###
+    def resolve_local(self):
+        """
+        Patch pc-relative references to labels of the same section,
+        everything else is left for the ELF writer.
+        """
+        remaining = []
+        for reloc in self.relocs:
+            target = self.symbols.get(reloc.symbol)
+            if target is not None and target[0] == reloc.section and reloc.kind in (PC32, PLT32):
+                value = target[1] + reloc.addend - reloc.offset
+                data = self.sections[reloc.section].data
+                data[reloc.offset:reloc.offset + 4] = value.to_bytes(4, "little", signed=True)
+            else:
+                if target is None and reloc.symbol not in self.externs:
+                    raise ValueError(f"undefined symbol {reloc.symbol}")
+                remaining.append(reloc)
+        self.relocs = remaining
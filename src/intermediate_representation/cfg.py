@@ -0,0 +1,233 @@
+from intermediate_representation.ir_instruction import IRInstr
+
+class BasicBlock:
+    """
+    Straight-line run of IR instructions with a single entry and exit.
+    """
+    def __init__(self, index, label=None):
+        self.index = index      # position in ControlFlowGraph.blocks
+        self.label = label      # label starting the block, if any
+        self.instrs = []
+        self.preds = []
+        self.succs = []
+
+    def terminator(self):
+        if self.instrs and self.instrs[-1].op in IRInstr.JUMP_OPS:
+            return self.instrs[-1]
+        return None
+
+    def __repr__(self):
+        return f"BasicBlock({self.index}, {self.label}, {len(self.instrs)} instrs)"
+
+
+class Loop:
+    """
+    Natural loop: its header block, the indices of the blocks in its body
+    (header included), the latches jumping back to the header and the
+    innermost loop it is nested in.
+    """
+    def __init__(self, header):
+        self.header = header
+        self.blocks = {header.index}
+        self.latches = []
+        self.parent = None
+
+    def __repr__(self):
+        return f"Loop({self.header.index}, {sorted(self.blocks)})"
+
+
+class Dominance:
+    """
+    Dominance queries in constant time: every block gets the interval of
+    a depth-first walk of the dominator tree, a block dominates exactly
+    the blocks whose interval lies within its own.
+    """
+    def __init__(self, idom):
+        self.idom = idom
+        self.enter = [None] * len(idom)
+        self.exit = [None] * len(idom)
+        children = [[] for _ in idom]
+        for index, parent in enumerate(idom):
+            if parent is not None and parent != index:
+                children[parent].append(index)
+        clock = 0
+        roots = [index for index, parent in enumerate(idom) if parent == index]
+        for root in roots:
+            self.enter[root] = clock
+            stack = [(root, iter(children[root]))]
+            while stack:
+                index, kids = stack[-1]
+                child = next(kids, None)
+                clock += 1
+                if child is None:
+                    self.exit[index] = clock
+                    stack.pop()
+                else:
+                    self.enter[child] = clock
+                    stack.append((child, iter(children[child])))
+
+    def dominates(self, a, b):
+        """
+        True if block index `a` dominates block index `b`, both reachable.
+        """
+        return self.enter[a] <= self.enter[b] and self.exit[b] <= self.exit[a]
+
+
+class ControlFlowGraph:
+    """
+    Split the flat IR list into basic blocks at labels and branches,
+    and connect them with predecessor/successor edges.
+    """
+    def __init__(self, ir_list):
+        self.blocks = []
+        self.label_to_block = {}
+        self.build_blocks(ir_list)
+        self.build_edges()
+
+    def build_blocks(self, ir_list):
+        block = None
+        for instr in ir_list:
+            if instr.op == "label":
+                # a label always starts a new block
+                block = self.new_block(instr.dest)
+                self.label_to_block[instr.dest] = block
+            elif block is None:
+                block = self.new_block()
+            block.instrs.append(instr)
+            if instr.op in IRInstr.JUMP_OPS:
+                block = None
+        if not self.blocks:
+            self.new_block()
+
+    def new_block(self, label=None):
+        block = BasicBlock(len(self.blocks), label)
+        self.blocks.append(block)
+        return block
+
+    def build_edges(self):
+        for i, block in enumerate(self.blocks):
+            last = block.terminator()
+            targets = []
+            if last is not None:
+                targets.append(self.label_to_block[last.dest])
+            if (last is None or last.op != "goto") and i + 1 < len(self.blocks):
+                targets.append(self.blocks[i + 1])    # fall through
+            for target in targets:
+                if target not in block.succs:
+                    block.succs.append(target)
+                    target.preds.append(block)
+
+    @property
+    def entry(self):
+        return self.blocks[0]
+
+    def reverse_postorder(self):
+        """
+        Blocks reachable from entry in reverse postorder (iterative DFS).
+        """
+        order = []
+        visited = {self.entry.index}
+        stack = [(self.entry, iter(self.entry.succs))]
+        while stack:
+            block, succs = stack[-1]
+            for succ in succs:
+                if succ.index not in visited:
+                    visited.add(succ.index)
+                    stack.append((succ, iter(succ.succs)))
+                    break
+            else:
+                stack.pop()
+                order.append(block)
+        order.reverse()
+        return order
+
+    def immediate_dominators(self):
+        """
+        Immediate dominator index of every block (Cooper, Harvey & Kennedy),
+        the entry is its own, unreachable blocks get None.
+        """
+        order = self.reverse_postorder()
+        position = {block.index: i for i, block in enumerate(order)}
+        idom = [None] * len(self.blocks)
+        idom[self.entry.index] = self.entry.index
+
+        def intersect(a, b):
+            while a != b:
+                while position[a] > position[b]:
+                    a = idom[a]
+                while position[b] > position[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                new = None
+                for pred in block.preds:
+                    if idom[pred.index] is not None:
+                        new = pred.index if new is None else intersect(pred.index, new)
+                if idom[block.index] != new:
+                    idom[block.index] = new
+                    changed = True
+        return idom
+
+    def dominator_tree(self):
+        """
+        (idom list, children list): the blocks each block immediately dominates.
+        """
+        idom = self.immediate_dominators()
+        children = [[] for _ in self.blocks]
+        for index, parent in enumerate(idom):
+            if parent is not None and parent != index:
+                children[parent].append(self.blocks[index])
+        return idom, children
+
+    def natural_loops(self, dominance=None):
+        """
+        Natural loops, one per header, outer loops before the loops nested
+        in them. An edge to a block dominating its source is a back edge,
+        the loop body is what reaches the source without passing the header.
+        """
+        if dominance is None:
+            dominance = Dominance(self.immediate_dominators())
+        idom = dominance.idom
+        loops = {}
+        for block in self.blocks:
+            if idom[block.index] is None:
+                continue
+            for succ in block.succs:
+                if not dominance.dominates(succ.index, block.index):
+                    continue
+                loop = loops.get(succ.index)
+                if loop is None:
+                    loop = loops[succ.index] = Loop(succ)
+                loop.latches.append(block)
+                stack = [block]
+                while stack:
+                    current = stack.pop()
+                    if current.index not in loop.blocks:
+                        loop.blocks.add(current.index)
+                        stack.extend(pred for pred in current.preds if idom[pred.index] is not None)
+        ordered = sorted(loops.values(), key=lambda loop: (-len(loop.blocks), loop.header.index))
+        # a loop is smaller than the loops around it, so they are seen first
+        innermost = {}
+        for loop in ordered:
+            loop.parent = innermost.get(loop.header.index)
+            for index in loop.blocks:
+                innermost[index] = loop
+        return ordered
+
+    def flatten(self):
+        """
+        Concatenate the blocks back into a flat IR list.
+        """
+        return [instr for block in self.blocks for instr in block.instrs]
+
+    def __repr__(self):
+        lines = []
+        for block in self.blocks:
+            succs = ", ".join(str(s.index) for s in block.succs)
+            lines.append(f"B{block.index} ({block.label}) -> [{succs}]")
+            lines.extend(f"    {instr}" for instr in block.instrs)
+        return "\n".join(lines)
@@ -0,0 +1,329 @@
+from collections import deque
+from intermediate_representation.ir_instruction import IRInstr
+
+def to_bits(indices, size):
+    """
+    Build a bitset (python int) from bit indices in O(size/8 + len(indices)).
+    """
+    buf = bytearray((size >> 3) + 1)
+    for i in indices:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+def from_bits(bits):
+    """
+    Indices of the set bits of a bitset.
+    """
+    indices = []
+    text = bin(bits)[:1:-1]     # least significant bit first
+    i = text.find("1")
+    while i != -1:
+        indices.append(i)
+        i = text.find("1", i + 1)
+    return indices
+
+
+class DataflowAnalysis:
+    """
+    Generic iterative worklist solver over a ControlFlowGraph.
+    Facts are numbered 0..size-1 and every per-block set is a bitset,
+    transfer function is  out = gen | (in & ~kill).
+    Subclasses fill self.facts, self.gen and self.kill (one bitset per block).
+    """
+    forward = True
+    meet_union = True   # union (may) or intersection (must) at join points
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.facts = []     # fact index -> fact
+        self.index = {}     # fact -> fact index
+        n = len(cfg.blocks)
+        self.gen = [0] * n
+        self.kill = [0] * n
+        self.block_in = [0] * n
+        self.block_out = [0] * n
+
+    def add_fact(self, fact):
+        if fact not in self.index:
+            self.index[fact] = len(self.facts)
+            self.facts.append(fact)
+        return self.index[fact]
+
+    def boundary(self):
+        """
+        Value at the entry (forward) or exit (backward) of the graph.
+        """
+        return 0
+
+    def solve(self):
+        blocks = self.cfg.blocks
+        full = (1 << len(self.facts)) - 1
+        init = 0 if self.meet_union else full
+        if self.forward:
+            order = self.cfg.reverse_postorder()
+            in_sets, out_sets = self.block_in, self.block_out
+            sources = lambda b: b.preds
+            targets = lambda b: b.succs
+            boundary_blocks = {self.cfg.entry.index}
+        else:
+            order = list(reversed(self.cfg.reverse_postorder()))
+            in_sets, out_sets = self.block_out, self.block_in
+            sources = lambda b: b.succs
+            targets = lambda b: b.preds
+            boundary_blocks = {b.index for b in blocks if not b.succs}
+        for block in blocks:
+            in_sets[block.index] = init
+            out_sets[block.index] = self.gen[block.index] | (init & ~self.kill[block.index])
+
+        # unreachable blocks are solved too, after the reachable ones
+        seen = {b.index for b in order}
+        order += [b for b in blocks if b.index not in seen]
+        worklist = deque(order)
+        queued = [True] * len(blocks)
+        boundary = self.boundary()
+        gen, kill = self.gen, self.kill
+        while worklist:
+            block = worklist.popleft()
+            i = block.index
+            queued[i] = False
+            if i in boundary_blocks:
+                value = boundary
+            else:
+                value = init
+            others = sources(block)
+            if others:
+                if self.meet_union:
+                    for other in others:
+                        value |= out_sets[other.index]
+                else:
+                    for other in others:
+                        value &= out_sets[other.index]
+            in_sets[i] = value
+            out = gen[i] | (value & ~kill[i])
+            if out != out_sets[i]:
+                out_sets[i] = out
+                for target in targets(block):
+                    if not queued[target.index]:
+                        queued[target.index] = True
+                        worklist.append(target)
+        return self
+
+    def facts_of(self, bits):
+        return {self.facts[i] for i in from_bits(bits)}
+
+    def facts_in(self, block):
+        return self.facts_of(self.block_in[block.index])
+
+    def facts_out(self, block):
+        return self.facts_of(self.block_out[block.index])
+
+
+def global_names(cfg):
+    """
+    Names read in some block before being written there (upward exposed).
+    Every other name is dead at all block boundaries, so only these need
+    to be tracked across blocks, which keeps the bitsets small.
+    """
+    names = set()
+    for block in cfg.blocks:
+        written = set()
+        for instr in block.instrs:
+            for name in instr.reads():
+                if name not in written:
+                    names.add(name)
+            name = instr.writes()
+            if name is not None:
+                written.add(name)
+    return names
+
+
+class Liveness(DataflowAnalysis):
+    """
+    Backward may-analysis: names (temps and variables) read later
+    before being overwritten. Only written names live across blocks are tracked.
+    `exit_live` holds names still read after the end of the code (variables
+    of a REPL session), it is only tested with `in`, so it can be large.
+    """
+    forward = False
+    meet_union = True
+
+    def __init__(self, cfg, exit_live=()):
+        super().__init__(cfg)
+        self.exit_live = exit_live
+        tracked = global_names(cfg)
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                name = instr.writes()
+                if name in tracked or name in exit_live:
+                    self.add_fact(name)
+        size = len(self.facts)
+        for block in cfg.blocks:
+            uses, defs = set(), set()
+            for instr in block.instrs:
+                for name in instr.reads():
+                    i = self.index.get(name)
+                    if i is not None and i not in defs:
+                        uses.add(i)
+                i = self.index.get(instr.writes())
+                if i is not None:
+                    defs.add(i)
+            self.gen[block.index] = to_bits(uses, size)
+            self.kill[block.index] = to_bits(defs, size)
+
+    def boundary(self):
+        return to_bits((i for i, name in enumerate(self.facts) if name in self.exit_live),
+                       len(self.facts))
+
+    def live_in(self, block):
+        return self.facts_in(block)
+
+    def live_out(self, block):
+        return self.facts_out(block)
+
+
+class StrongLiveness:
+    """
+    Backward analysis: names read later by an instruction that is itself
+    useful. A read by a pure instruction whose result is dead doesn't make
+    a name live, so whole chains of dead computations and stores die in
+    one solve. The transfer function depends on the live set, so blocks
+    are walked instruction by instruction with name sets, not bitsets.
+    `exit_live` is only tested with `in`, like in Liveness. A div is pure
+    when its divisor is one of `safe_divisors`.
+    """
+    def __init__(self, cfg, pure_ops, exit_live=(), safe_divisors=()):
+        self.cfg = cfg
+        self.pure_ops = pure_ops
+        self.safe_divisors = safe_divisors
+        self.block_in = [set() for _ in cfg.blocks]
+        self.block_out = [set() for _ in cfg.blocks]
+        self.exit_names = set()
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                name = instr.writes()
+                if name is not None and name in exit_live:
+                    self.exit_names.add(name)
+
+    def transfer(self, block, live, keep=None):
+        """
+        Live names at the start of `block` given the ones live at its end,
+        the useful instructions are appended to `keep` in reverse order.
+        """
+        live = set(live)
+        pure_ops = self.pure_ops
+        safe_divisors = self.safe_divisors
+        for instr in reversed(block.instrs):
+            name = instr.writes()
+            if name not in live and (instr.op in pure_ops or instr.op == "div" and instr.arg2 in safe_divisors):
+                continue
+            if name is not None:
+                live.discard(name)
+            live.update(instr.reads())
+            if keep is not None:
+                keep.append(instr)
+        return live
+
+    def solve(self):
+        blocks = self.cfg.blocks
+        order = list(reversed(self.cfg.reverse_postorder()))
+        seen = {b.index for b in order}
+        order += [b for b in blocks if b.index not in seen]
+        worklist = deque(order)
+        queued = [True] * len(blocks)
+        while worklist:
+            block = worklist.popleft()
+            i = block.index
+            queued[i] = False
+            out = set(self.exit_names) if not block.succs else set()
+            for succ in block.succs:
+                out |= self.block_in[succ.index]
+            self.block_out[i] = out
+            live = self.transfer(block, out)
+            if live != self.block_in[i]:
+                self.block_in[i] = live
+                for pred in block.preds:
+                    if not queued[pred.index]:
+                        queued[pred.index] = True
+                        worklist.append(pred)
+        return self
+
+    def useful(self, block):
+        """
+        The instructions of `block` that are not dead.
+        """
+        keep = []
+        self.transfer(block, self.block_out[block.index], keep)
+        keep.reverse()
+        return keep
+
+
+class ReachingDefinitions(DataflowAnalysis):
+    """
+    Forward may-analysis: definitions (instructions writing a name)
+    that can reach a point without being overwritten.
+    Facts are the defining IRInstr objects, only definitions of names
+    read across blocks are tracked (see global_names).
+    """
+    forward = True
+    meet_union = True
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        tracked = global_names(cfg)
+        defs_of = {}
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                name = instr.writes()
+                if name in tracked:
+                    defs_of.setdefault(name, []).append(self.add_fact(instr))
+        size = len(self.facts)
+        for block in cfg.blocks:
+            last_def = {}
+            for instr in block.instrs:
+                name = instr.writes()
+                if name in defs_of:
+                    last_def[name] = self.index[instr]
+            killed = [i for name in last_def for i in defs_of[name]]
+            self.gen[block.index] = to_bits(last_def.values(), size)
+            self.kill[block.index] = to_bits(killed, size)
+
+
+class AvailableExpressions(DataflowAnalysis):
+    """
+    Forward must-analysis: expressions computed on every path to a point
+    and not invalidated since. Expressions are (op, arg1, arg2) tuples of
+    binary ops and ('load', var, None) for variable loads.
+    """
+    forward = True
+    meet_union = False
+
+    @staticmethod
+    def expression(instr):
+        if instr.op in IRInstr.BINARY_OPS or instr.op == "load":
+            return (instr.op, instr.arg1, instr.arg2)
+        return None
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        uses_of = {}    # name -> indices of expressions reading it
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                expr = self.expression(instr)
+                if expr is not None and expr not in self.index:
+                    i = self.add_fact(expr)
+                    for name in instr.reads():
+                        uses_of.setdefault(name, []).append(i)
+        size = len(self.facts)
+        for block in cfg.blocks:
+            available, killed = set(), set()
+            for instr in block.instrs:
+                expr = self.expression(instr)
+                if expr is not None:
+                    available.add(self.index[expr])
+                name = instr.writes()
+                if name is not None:
+                    for i in uses_of.get(name, ()):
+                        killed.add(i)
+                        available.discard(i)
+            self.gen[block.index] = to_bits(available, size)
+            self.kill[block.index] = to_bits(killed, size)
@@ -0,0 +1,146 @@
+from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.ir_function import IRFunction
+
+
+def call_args(ir, call):
+    """
+    Remove the params of `call` from the end of `ir` (they come right
+    before it) and return their arguments.
+    """
+    count = call.arg2
+    params = ir[len(ir) - count:] if count else []
+    if len(params) != count or any(instr.op != "param" for instr in params):
+        raise RuntimeError(f"call of {call.arg1} without its {count} params")
+    del ir[len(ir) - count:]
+    return [instr.arg1 for instr in params]
+
+
+def eliminate_tail_calls(ir_list, function):
+    """
+    A call of `function` by itself whose result is returned right away
+    becomes a jump back to the start of its body, after storing the
+    arguments to the parameters: tail recursion runs as a loop, in
+    constant stack space. The arguments are all computed before the
+    first store, so no parameter is overwritten before it is read.
+    """
+    ir = []
+    index = 0
+    while index < len(ir_list):
+        instr = ir_list[index]
+        if instr.op == "call" and instr.arg1 == function.symbol and index + 2 < len(ir_list):
+            store, goto = ir_list[index + 1], ir_list[index + 2]
+            if (store.op == "store" and store.arg1 == IRFunction.RETURN_VARIABLE and store.arg2 == instr.dest
+                    and goto.op == "goto" and goto.dest == function.exit_label):
+                args = call_args(ir, instr)
+                for name, arg in zip(function.param_names, args):
+                    ir.append(IRInstr("store", name, arg))
+                ir.append(IRInstr("goto", None, None, function.body_label))
+                index += 3
+                continue
+        ir.append(instr)
+        index += 1
+    return ir
+
+
+class Inliner:
+    """
+    Replaces calls of small functions by a copy of their optimized body
+    (IRFunction.inline_ir): the parameters become stores of the arguments
+    and the temp the body returns becomes the result of the call. Temps
+    get new numbers, variables and labels of the copy the suffix `.iN`.
+    The passes after it then optimize the body with the caller's
+    constants and drop the loads and stores of the parameters.
+
+    Cost model, in IR instructions: the copy replaces the params and the
+    call, it is inlined when it is at most BUDGET instructions larger.
+    Every constant argument lowers its cost by CONSTANT_ARG_BONUS, as
+    constant propagation will fold part of the body. A function calling
+    itself is never inlined (its tail calls are loops already, see
+    eliminate_tail_calls), and a caller stops inlining once it has grown
+    by its own size or MIN_GROWTH instructions, whichever is more.
+    """
+    BUDGET = 24
+    CONSTANT_ARG_BONUS = 8
+    MIN_GROWTH = 1000
+
+    def __init__(self, ir_list, functions):
+        self.ir_list = ir_list
+        self.functions = functions      # symbol -> IRFunction
+        self.count = 0                  # inlined calls
+        self.next_temp = max((int(instr.dest[1:]) for instr in ir_list
+                              if instr.dest and instr.dest[:1] == "t" and instr.dest[1:].isdigit()),
+                             default=0)
+
+    def new_temp(self):
+        self.next_temp += 1
+        return f"t{self.next_temp}"
+
+    @staticmethod
+    def size(function):
+        return sum(instr.op != "label" for instr in function.inline_ir)
+
+    def inlinable(self, function, args, constants):
+        if function is None or not function.inline_ir or function.inline_ir[-1].op != "return":
+            return False
+        if any(instr.op == "call" and instr.arg1 == function.symbol for instr in function.inline_ir):
+            return False
+        bonus = self.CONSTANT_ARG_BONUS * sum(arg in constants for arg in args)
+        return self.size(function) - (len(args) + 1) - bonus <= self.BUDGET
+
+    def run(self):
+        growth = max(self.MIN_GROWTH, len(self.ir_list))
+        constants = {instr.dest for instr in self.ir_list if instr.op == "const"}
+        ir = []
+        for instr in self.ir_list:
+            if instr.op == "call" and instr.arg2 is not None and growth > 0:
+                function = self.functions.get(instr.arg1)
+                args = [param.arg1 for param in ir[len(ir) - instr.arg2:]] if instr.arg2 else []
+                if self.inlinable(function, args, constants):
+                    call_args(ir, instr)
+                    body = self.inline(function, args, instr.dest)
+                    growth -= len(body) - len(args) - 1
+                    ir.extend(body)
+                    continue
+            ir.append(instr)
+        return ir
+
+    def inline(self, function, args, result):
+        """
+        The body of `function` for one call, its result written to `result`.
+        """
+        self.count += 1
+        suffix = f".i{self.count}"
+        body = function.inline_ir
+        returned = body[-1].arg1 if body and body[-1].op == "return" else None
+        temps = {}
+        for instr in body:
+            if instr.dest is not None and instr.op != "label" and instr.writes() == instr.dest:
+                temps[instr.dest] = result if instr.dest == returned else self.new_temp()
+        code = [IRInstr("store", name + suffix, arg) for name, arg in zip(function.param_names, args)]
+        for instr in body:
+            if instr.op == "return":
+                continue
+            code.append(self.renamed(instr, temps, suffix))
+        return code
+
+    @staticmethod
+    def renamed(instr, temps, suffix):
+        op = instr.op
+        if op in ("label", "goto"):
+            return IRInstr(op, None, None, instr.dest + suffix)
+        if op in ("if", "if_false"):
+            return IRInstr(op, temps[instr.arg1], None, instr.dest + suffix)
+        if op in IRInstr.BINARY_OPS:
+            return IRInstr(op, temps[instr.arg1], temps[instr.arg2], temps[instr.dest])
+        if op == "load":
+            return IRInstr(op, instr.arg1 + suffix, None, temps[instr.dest])
+        if op in ("const", "addr"):
+            return IRInstr(op, instr.arg1, None, temps[instr.dest])
+        if op == "store":
+            return IRInstr(op, instr.arg1 + suffix, temps[instr.arg2])
+        if op == "param":
+            return IRInstr(op, temps.get(instr.arg1, instr.arg1))
+        if op == "call" and instr.arg2 is not None:
+            return IRInstr(op, instr.arg1, instr.arg2, temps[instr.dest])
+        # string constants and printf calls are shared by every copy
+        return instr
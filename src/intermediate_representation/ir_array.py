@@ -0,0 +1,83 @@
+import re
+from array import array
+from intermediate_representation.ir_instruction import IRInstr
+
+# generated names: temps (t12), labels (start3, call7), string labels (str5)
+NUMBERED_NAME = re.compile(r"([A-Za-z_]+)([1-9]\d*|0)")
+PREFIX_BITS = 16
+
+class IRArray:
+    """
+    Compact IR stream stored as struct-of-arrays: parallel array('q')
+    columns for op, arg1, arg2 and dest.
+    A column value >= 0 indexes a table of interned operands, -1 is None
+    and other negative values pack a generated name like t12 as
+    (number, interned prefix), so unique temps and labels cost no table entry.
+    IRInstr objects are materialized only when indexed or iterated.
+    """
+    __slots__ = ("ops", "arg1", "arg2", "dest", "operands", "operand_ids")
+
+    def __init__(self, instrs=()):
+        self.ops  = array('q')
+        self.arg1 = array('q')
+        self.arg2 = array('q')
+        self.dest = array('q')
+        self.operands = []      # operand id -> value
+        self.operand_ids = {}   # value -> operand id
+        self.extend(instrs)
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        if isinstance(value, str):
+            match = NUMBERED_NAME.fullmatch(value)
+            if match:
+                prefix = self.intern(match.group(1))
+                if prefix < (1 << PREFIX_BITS):
+                    return -2 - ((int(match.group(2)) << PREFIX_BITS) | prefix)
+        operand_id = self.operand_ids.get(value)
+        if operand_id is None:
+            operand_id = len(self.operands)
+            self.operand_ids[value] = operand_id
+            self.operands.append(value)
+        return operand_id
+
+    def operand(self, code):
+        if code >= 0:
+            return self.operands[code]
+        if code == -1:
+            return None
+        code = -2 - code
+        return self.operands[code & ((1 << PREFIX_BITS) - 1)] + str(code >> PREFIX_BITS)
+
+    def append(self, instr):
+        self.ops.append(self.intern(instr.op))
+        self.arg1.append(self.intern(instr.arg1))
+        self.arg2.append(self.intern(instr.arg2))
+        self.dest.append(self.intern(instr.dest))
+
+    def extend(self, instrs):
+        for instr in instrs:
+            self.append(instr)
+
+    def op(self, i):
+        return self.operands[self.ops[i]]
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __getitem__(self, i):
+        operand = self.operand
+        return IRInstr(self.operands[self.ops[i]], operand(self.arg1[i]),
+                       operand(self.arg2[i]), operand(self.dest[i]))
+
+    def __iter__(self):
+        operand = self.operand
+        for op, arg1, arg2, dest in zip(self.ops, self.arg1, self.arg2, self.dest):
+            yield IRInstr(self.operands[op], operand(arg1), operand(arg2), operand(dest))
+
+    def to_list(self):
+        return list(self)
+
+    def __repr__(self):
+        return f"IRArray({len(self)} instrs, {len(self.operands)} operands)"
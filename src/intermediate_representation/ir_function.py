@@ -0,0 +1,49 @@
+class IRFunction:
+    """
+    IR of a user-defined function. `symbol` is the name calls use, also
+    its label in the assembly. The body starts at `body_label`, after the
+    store of the default return value, and leaves through `exit_label`:
+    every `return` stores the hidden variable `return` and jumps there,
+    where it is loaded and returned.
+    `ir_opt` is the optimized IR code is generated from, `inline_ir` the
+    optimized body before variable promotion, set by the optimizer for the
+    inliner of the functions declared later and of the top-level code.
+    """
+    __slots__ = ("name", "symbol", "params", "return_type", "ir_list", "ir_opt",
+                 "body_label", "exit_label", "inline_ir")
+
+    RETURN_VARIABLE = "return"
+
+    def __init__(self, name, params, return_type):
+        self.name = name
+        self.symbol = "fn." + name
+        self.params = params            # [(type, name)]
+        self.return_type = return_type
+        self.ir_list = []
+        self.ir_opt = self.ir_list
+        self.body_label = None
+        self.exit_label = None
+        self.inline_ir = None
+
+    @property
+    def param_names(self):
+        return [name for _, name in self.params]
+
+    def __repr__(self):
+        params = ", ".join(f"{param_type} {name}" for param_type, name in self.params)
+        return f"IRFunction({self.return_type} {self.name}({params}), {len(self.ir_list)} instrs)"
+
+
+def called_functions(ir_list, functions):
+    """
+    The functions (IRFunction) `ir_list` calls directly or through other
+    functions, in declaration order; what inlining left uncalled needs no code.
+    """
+    called = set()
+    stack = [ir_list]
+    while stack:
+        for instr in stack.pop():
+            if instr.op == "call" and instr.arg1 in functions and instr.arg1 not in called:
+                called.add(instr.arg1)
+                stack.append(functions[instr.arg1].ir_opt)
+    return [function for symbol, function in functions.items() if symbol in called]
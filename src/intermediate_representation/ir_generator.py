@@ -1,17 +1,50 @@
 from ast_classes import *
+from ast_visitor import ASTVisitor
 from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.ir_function import IRFunction
+from semantic_analysis.semantic_analyzer import array_size, array_type
 
-class IRGenerator:
+class IRGenerator(ASTVisitor):
     """
     Generate Intermediate Representation (IR) from AST nodes.
     Tracks variable types for print/assignment of string or int.
+    The IR of every function goes to its IRFunction in `functions`
+    (symbol -> IRFunction), gen() returns the IR of the top-level code.
+    A str variable of the top level is a label in the data section, one
+    inside a function is a variable holding the address of the string.
+    Every index of an array is checked against its size before the
+    element is read or written.
     """
+    handlers = {
+        PrintStmt:     "gen_print",
+        VarDeclStmt:   "gen_var_decl",
+        IfStmt:        "gen_if",
+        WhileStmt:     "gen_while",
+        AssignStmt:    "gen_assign",
+        BlockStmt:     "gen_block",
+        CompareExpr:   "gen_compare",
+        BinaryExpr:    "gen_binary",
+        NumberExpr:    "gen_number",
+        VarIdentifier: "gen_var",
+        StringExpr:    "gen_string",
+        FunctionDecl:  "gen_function",
+        ReturnStmt:    "gen_return",
+        CallExpr:      "gen_call",
+        ArrayDeclStmt: "gen_array_decl",
+        IndexExpr:     "gen_index",
+        IndexAssignStmt: "gen_index_assign",
+    }
+    COMPARE_OPS = {'==':'eq', '!=':'neq', '<':'lt', '>':'gt', '<=':'leq', '>=':'geq'}
+    BINARY_OPS  = {'+':'add', '-':'sub', '*':'mul', '/':'div'}
+
     def __init__(self, asts):
         self.ast_nodes = asts
         self.temp_id  = 0
         self.label_id = 0
         self.ir_list = []
         self.var_symbols = {}
+        self.functions = {}     # symbol -> IRFunction, in declaration order
+        self.function = None    # IRFunction being generated
 
     def new_temp(self):
         self.temp_id += 1
@@ -29,36 +62,28 @@ class IRGenerator:
 
     def gen(self):
         for node in self.ast_nodes:
-            self.gen_node(node)
+            self.visit(node)
         return self.ir_list
 
     def gen_node(self, node):
-        if isinstance(node, PrintStmt):
-            self.gen_print(node)
-        elif isinstance(node, VarDeclStmt):
-            self.gen_var_decl(node)
-        elif isinstance(node, IfStmt):
-            self.gen_if(node)
-        elif isinstance(node, WhileStmt):
-            self.gen_while(node)
-        elif isinstance(node, AssignStmt):
-            self.gen_assign(node)
-        else:
-            raise NotImplementedError(f"Unimplemented AST : {type(node)}")
+        self.visit(node)
+
+    def gen_expr(self, node):
+        return self.visit(node)
 
     def gen_while(self, node):
         start_label = self.new_label("start")
         end_label = self.new_label("end")
         self.ir_list.append(IRInstr('label', None, None, start_label))
-        cond_tmp = self.gen_expr(node.condition)
+        cond_tmp = yield node.condition
         self.ir_list.append(IRInstr('if_false', cond_tmp, None, end_label))
         if isinstance(node.body, BlockStmt):
-            self.gen_block(node.body)
+            yield node.body
         self.ir_list.append(IRInstr('goto', None, None, start_label))
         self.ir_list.append(IRInstr('label', None, None, end_label))
 
     def gen_if(self, node):
-        cond_tmp = self.gen_expr(node.condition)
+        cond_tmp = yield node.condition
         true_label = self.new_label("true")
         false_label = self.new_label("false")
         end_label = self.new_label("end")
@@ -66,90 +91,188 @@ class IRGenerator:
         self.ir_list.append(IRInstr('goto', None, None, false_label))
         self.ir_list.append(IRInstr('label', None, None, true_label))
         if isinstance(node.then_branch, BlockStmt):
-            self.gen_block(node.then_branch)
+            yield node.then_branch
         self.ir_list.append(IRInstr('goto', None, None, end_label))
         self.ir_list.append(IRInstr('label', None, None, false_label))
         if isinstance(node.else_branch, BlockStmt):
-            self.gen_block(node.else_branch)
+            yield node.else_branch
         self.ir_list.append(IRInstr('label', None, None, end_label))
 
     def gen_block(self, node):
         for stmt in node.statements:
-            self.gen_node(stmt)
+            yield stmt
 
     def gen_print(self, node):
         expr = node.expr
         if isinstance(expr, NumberExpr):
-            tmp = self.gen_expr(expr)
+            tmp = yield expr
             self.ir_list.append(IRInstr('param', "fmt_int"))
             self.ir_list.append(IRInstr('param', tmp))
         elif isinstance(expr, StringExpr):
-            tmp = self.gen_expr(expr)
+            tmp = yield expr
             self.ir_list.append(IRInstr('param', "fmt_str"))
             self.ir_list.append(IRInstr('param', tmp))
         elif isinstance(expr, VarIdentifier):
             typ = self.get_var_type(expr.name)
-            if typ == "STRING":
+            if typ == "STRING" and self.function is None:
                 self.ir_list.append(IRInstr('param', "fmt_str"))
                 self.ir_list.append(IRInstr('param', expr.name))
+            elif typ == "STRING":
+                tmp = yield expr
+                self.ir_list.append(IRInstr('param', "fmt_str"))
+                self.ir_list.append(IRInstr('param', tmp))
             else:
-                tmp = self.gen_expr(expr)
+                tmp = yield expr
                 self.ir_list.append(IRInstr('param', "fmt_int"))
                 self.ir_list.append(IRInstr('param', tmp))
+        elif isinstance(expr, IndexExpr):
+            tmp = yield expr
+            self.ir_list.append(IRInstr('param', "fmt_int"))
+            self.ir_list.append(IRInstr('param', tmp))
+        elif isinstance(expr, CallExpr):
+            tmp = yield expr
+            function = self.functions["fn." + expr.name]
+            fmt = "fmt_str" if function.return_type == "STRING" else "fmt_int"
+            self.ir_list.append(IRInstr('param', fmt))
+            self.ir_list.append(IRInstr('param', tmp))
         else:
-            raise NotImplementedError("print only supports numbers, variables, or strings")
+            raise NotImplementedError("print only supports numbers, variables, strings, array elements or calls")
         call_tmp = self.new_label("call")
         self.ir_list.append(IRInstr('call', 'printf', None, call_tmp))
 
     def gen_var_decl(self, node):
         # node.var_type must be 'INT' or 'STRING'
         self.var_symbols[node.var_name] = node.var_type
-        if node.var_type == 'STRING':
+        if node.var_type == 'STRING' and self.function is None:
             string_val = self.get_string_val(node.expr)
             self.ir_list.append(IRInstr('store_str', node.var_name, string_val , None))
             return
-        expr_tmp = self.gen_expr(node.expr)
+        expr_tmp = yield node.expr
+        expr_tmp = self.as_pointer(node.expr, expr_tmp)
         self.ir_list.append(IRInstr('store', node.var_name, expr_tmp, None))
 
     def gen_assign(self, node):
         typ = self.get_var_type(node.var_name)
-        expr_tmp = self.gen_expr(node.expr)
-        if typ == "STRING":
+        expr_tmp = yield node.expr
+        if typ == "STRING" and self.function is None:
+            if isinstance(node.expr, CallExpr):
+                raise NotImplementedError("a str variable outside of a function can only be assigned a literal")
             self.ir_list.append(IRInstr('store_str', node.var_name, expr_tmp, None))
         else:
+            expr_tmp = self.as_pointer(node.expr, expr_tmp)
             self.ir_list.append(IRInstr('store', node.var_name, expr_tmp, None))
 
-    def gen_expr(self, node):
-        if isinstance(node, CompareExpr):
-            left = self.gen_expr(node.left)
-            right = self.gen_expr(node.right)
-            dest = self.new_temp()
-            operator_map = {'==':'eq', '!=':'neq', '<':'lt', '>':'gt', '<=':'leq', '>=':'geq'}
-            operator = operator_map[node.op]
-            self.ir_list.append(IRInstr(operator, left, right, dest))
-            return dest
-        if isinstance(node, NumberExpr):
-            dest  = self.new_temp()
-            self.ir_list.append(IRInstr('const', node.value, None, dest))
-            return dest
-        if isinstance(node, BinaryExpr):
-            left = self.gen_expr(node.left)
-            right = self.gen_expr(node.right)
-            dest = self.new_temp()
-            operator_map = {'+':'add', '-':'sub', '*':'mul', '/':'div'}
-            operator = operator_map[node.op]
-            self.ir_list.append(IRInstr(operator, left, right, dest))
-            return dest
-        if isinstance(node, VarIdentifier):
-            typ = self.get_var_type(node.name)
-            dest = self.new_temp()
+    def gen_array_decl(self, node):
+        self.var_symbols[node.name] = array_type(node.size)
+        self.ir_list.append(IRInstr('array', node.name, node.size))
+
+    def gen_index(self, node):
+        index = yield from self.gen_checked_index(node.name, node.index)
+        dest = self.new_temp()
+        self.ir_list.append(IRInstr('load_idx', node.name, index, dest))
+        return dest
+
+    def gen_index_assign(self, node):
+        index = yield from self.gen_checked_index(node.name, node.index)
+        value = yield node.expr
+        self.ir_list.append(IRInstr('store_idx', index, value, node.name))
+
+    def gen_checked_index(self, name, node):
+        index = yield node
+        self.ir_list.append(IRInstr('check', index, array_size(self.get_var_type(name))))
+        return index
+
+    def gen_compare(self, node):
+        left = yield node.left
+        right = yield node.right
+        dest = self.new_temp()
+        self.ir_list.append(IRInstr(self.COMPARE_OPS[node.op], left, right, dest))
+        return dest
+
+    def gen_binary(self, node):
+        left = yield node.left
+        right = yield node.right
+        dest = self.new_temp()
+        self.ir_list.append(IRInstr(self.BINARY_OPS[node.op], left, right, dest))
+        return dest
+
+    def gen_number(self, node):
+        dest  = self.new_temp()
+        self.ir_list.append(IRInstr('const', node.value, None, dest))
+        return dest
+
+    def gen_var(self, node):
+        typ = self.get_var_type(node.name)
+        dest = self.new_temp()
+        if typ == "STRING" and self.function is None:
+            self.ir_list.append(IRInstr('addr', node.name, None, dest))
+        else:
             self.ir_list.append(IRInstr('load', node.name, None, dest))
-            return dest
-        if isinstance(node, StringExpr):
-            string_name = self.new_label("str")
-            self.ir_list.append(IRInstr('store_str', string_name , node.value, None, ))
-            return string_name
-        raise NotImplementedError(f"IR gen for {type(node)} error")
+        return dest
+
+    def gen_string(self, node):
+        string_name = self.new_label("str")
+        self.ir_list.append(IRInstr('store_str', string_name , node.value, None, ))
+        return string_name
+
+    def as_pointer(self, node, value):
+        """
+        A str value as a temp: a string literal is a label, its address is
+        loaded with addr.
+        """
+        if not isinstance(node, StringExpr):
+            return value
+        dest = self.new_temp()
+        self.ir_list.append(IRInstr('addr', value, None, dest))
+        return dest
+
+    def gen_function(self, node):
+        """
+        The body gets its own IR list and variables: the parameters and
+        the hidden variable `return`, which holds the value to return and
+        starts as 0 or "".
+        """
+        function = IRFunction(node.name, node.params, node.return_type)
+        self.functions[function.symbol] = function
+        outer = self.ir_list, self.var_symbols
+        self.ir_list = function.ir_list
+        self.var_symbols = {name: param_type for param_type, name in node.params}
+        self.function = function
+        default = StringExpr('""') if node.return_type == "STRING" else NumberExpr(0)
+        value = self.as_pointer(default, (yield default))
+        self.ir_list.append(IRInstr('store', IRFunction.RETURN_VARIABLE, value, None))
+        function.body_label = self.new_label("body")
+        function.exit_label = self.new_label("exit")
+        self.ir_list.append(IRInstr('label', None, None, function.body_label))
+        yield node.body
+        result = self.new_temp()
+        self.ir_list.append(IRInstr('label', None, None, function.exit_label))
+        self.ir_list.append(IRInstr('load', IRFunction.RETURN_VARIABLE, None, result))
+        self.ir_list.append(IRInstr('return', result))
+        self.ir_list, self.var_symbols = outer
+        self.function = None
+
+    def gen_return(self, node):
+        value = self.as_pointer(node.expr, (yield node.expr))
+        self.ir_list.append(IRInstr('store', IRFunction.RETURN_VARIABLE, value, None))
+        self.ir_list.append(IRInstr('goto', None, None, self.function.exit_label))
+
+    def gen_call(self, node):
+        """
+        One param per argument, then the call with the number of
+        arguments in arg2; the result is a temp.
+        """
+        args = []
+        for arg in node.args:
+            args.append(self.as_pointer(arg, (yield arg)))
+        for arg in args:
+            self.ir_list.append(IRInstr('param', arg))
+        dest = self.new_temp()
+        self.ir_list.append(IRInstr('call', "fn." + node.name, len(args), dest))
+        return dest
+
+    def generic_visit(self, node):
+        raise NotImplementedError(f"Unimplemented AST : {type(node)}")
     
     def get_string_val(self, node):
         if isinstance(node, StringExpr):
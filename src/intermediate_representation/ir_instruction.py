@@ -1,4 +1,26 @@
 class IRInstr:
+    BINARY_OPS = {"add", "sub", "mul", "div", "eq", "neq", "lt", "gt", "leq", "geq"}
+    VALUE_OPS  = BINARY_OPS | {"const", "load", "addr", "load_idx"}    # ops writing a temp in dest
+    JUMP_OPS   = {"goto", "if", "if_false"}         # ops ending a basic block
+    # int arrays: `array a, N` declares a of N elements, `check t, N`
+    # traps unless 0 <= t < N, `t = load_idx a, ti` reads a[ti] and
+    # `store_idx ti, tv -> a` writes it; the indices are checked before
+    ARRAY_OPS  = {"array", "check", "load_idx", "store_idx"}
+    # vector loops (loops.py): temps holding VECTOR_WIDTH consecutive
+    # elements, `v = vload a, ti` reads a[ti:ti+VECTOR_WIDTH], `vsplat t`
+    # repeats t in every lane, `vstore ti, v -> a` writes them back
+    VECTOR_BINARY_OPS = {"vadd", "vsub", "vmul"}
+    VECTOR_OPS = VECTOR_BINARY_OPS | {"vload", "vsplat"}    # ops writing a vector temp in dest
+    VECTOR_WIDTH = 2
+    # SSA form (ssa.py): a phi picks a value per predecessor block, the
+    # copies replacing it may write their temp more than once
+    SSA_OPS    = {"phi", "copy"}
+    # A call of a user function (ir_function.py) follows a param per
+    # argument, arg2 is the number of arguments and dest the temp for the
+    # result. A printf call has no arg2, its dest is only a label.
+
+    __slots__ = ("op", "arg1", "arg2", "dest")
+
     def __init__(self, op, arg1=None, arg2=None, dest=None):
         self.op   = op      # operator name, e.g. 'add', 'mul', 'param', 'call', 'return'
         self.arg1 = arg1    # first argument
@@ -24,12 +46,64 @@ class IRInstr:
             return f"{self.dest} = const {self.arg1}"
         if self.op == "param":
             return f"param {self.arg1}"
+        if self.op == "call" and self.arg2 is not None:
+            return f"{self.dest} = call {self.arg1}, {self.arg2}"
         if self.op == "call":
             return f"{self.dest} = call {self.arg1}"
+        if self.op == "return":
+            return f"return {self.arg1}"
+        if self.op == "addr":
+            return f"{self.dest} = addr {self.arg1}"
+        if self.op == "copy":
+            return f"{self.dest} = copy {self.arg1}"
+        if self.op in ("array", "check"):
+            return f"{self.op} {self.arg1}, {self.arg2}"
+        if self.op in ("load_idx", "vload"):
+            return f"{self.dest} = {self.op} {self.arg1}, {self.arg2}"
+        if self.op in ("store_idx", "vstore"):
+            return f"{self.op} {self.arg1}, {self.arg2} -> {self.dest}"
+        if self.op == "vsplat":
+            return f"{self.dest} = vsplat {self.arg1}"
+        if self.op in self.VECTOR_BINARY_OPS:
+            return f"{self.dest} = {self.op} {self.arg1} {self.arg2}"
+        if self.op == "phi":
+            args = ", ".join(f"B{pred}: {name}" for pred, name in self.arg1.items())
+            return f"{self.dest} = phi [{args}]"
         if self.op in {"add", "sub", "mul", "div", "eq", "neq", "lt", "gt", "leq", "geq"}:
             return f"{self.dest} = {self.op} {self.arg1} {self.arg2}"
         return f"{self.op} {self.arg1 or ''} {self.arg2 or ''} {self.dest or ''}"
     
+    def reads(self):
+        """
+        Names (temps or variables) whose value this instruction reads.
+        """
+        if self.op in self.BINARY_OPS or self.op in self.VECTOR_BINARY_OPS:
+            return (self.arg1, self.arg2)
+        if self.op in ("load", "if", "if_false", "param", "copy", "return", "check", "vsplat"):
+            return (self.arg1,)
+        if self.op in ("load_idx", "vload"):
+            return (self.arg2,)
+        if self.op in ("store_idx", "vstore"):
+            return (self.arg1, self.arg2)
+        if self.op == "store":
+            return (self.arg2,)
+        if self.op == "phi":
+            return tuple(self.arg1.values())
+        return ()
+
+    def writes(self):
+        """
+        Name (temp or variable) this instruction writes, or None. An
+        array element is not a name, store_idx and vstore write None.
+        """
+        if self.op in self.VALUE_OPS or self.op in self.SSA_OPS or self.op in self.VECTOR_OPS:
+            return self.dest
+        if self.op in ("store", "store_str"):
+            return self.arg1
+        if self.op == "call" and self.arg2 is not None:
+            return self.dest
+        return None
+
     def full_str(self):
         """
         Return full string representation of the instruction.
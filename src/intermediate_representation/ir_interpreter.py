@@ -0,0 +1,376 @@
+# ir_interpreter.py
+"""
+Running the IR in-process, without assembling or linking
+"""
+import sys
+from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.cfg import ControlFlowGraph
+from intermediate_representation.loops import INT64_MIN, INT64_MAX
+from intermediate_representation.sccp import wrap
+
+OUTPUT_CHUNK = 1 << 16      # bytes written at once, like the output runtime's buffer
+PYTHON_OPS = {"add": "+", "sub": "-", "mul": "*",
+              "eq": "==", "neq": "!=", "lt": "<", "gt": ">", "leq": "<=", "geq": ">="}
+WRAPPED_OPS = {"add", "sub", "mul"}
+# readers that give the same result for a value off by a multiple of 2**64
+MODULAR_READERS = WRAPPED_OPS | {"param"}
+COMPARE_OPS = {"eq", "neq", "lt", "gt", "leq", "geq"}
+TRAPPED = "Program terminated by SIGFPE"
+STACK_OVERFLOW = "Program terminated by SIGSEGV"
+OUT_OF_BOUNDS = "Program terminated by SIGILL"
+# user function calls nested deeper than this overflow the stack, about
+# where the native stack of 8 MiB runs out for small functions
+MAX_CALL_DEPTH = 100000
+# Python frames on top of the user calls: the program itself and the
+# helpers a call can reach before it returns
+CALL_HEADROOM = 50
+
+
+def trap():
+    raise RuntimeError(TRAPPED)
+
+
+def out_of_bounds():
+    raise RuntimeError(OUT_OF_BOUNDS)
+
+
+class IRInterpreter:
+    """
+    Runs an IR list with the semantics of the native code: int64
+    wrap-around, division truncating toward zero that traps on zero and
+    on INT64_MIN / -1, print of an int as its low 32 bits, signed.
+
+    The IR is translated once into the source of one Python function,
+    so running it compares no op names and looks up no labels. Temps
+    and variables are its local variables, constants written once are
+    inlined. The result of add, sub or mul is only brought back into the
+    int64 range where that matters: not when it is only read by add,
+    sub, mul or print, which give the same result for it. A compare read
+    by the branch after it is that branch's condition, and a result
+    copied right away is written to the copy's destination.
+
+    A trace, a basic block and the blocks only reached by
+    falling through from it, is straight-line code in a `while True`
+    loop: a jump back to its own start is `continue`, any other jump
+    sets the number of the target trace and leaves the loop, to find
+    that trace by a binary search over if statements. A loop whose body
+    is one trace so runs as a plain Python loop.
+
+    Every user function in `functions` (IRFunction) is translated the
+    same way into a Python function of its own, taking the output buffer
+    and the arguments; a string is a bytes object.
+
+    An array is a list, a vector a list of VECTOR_WIDTH lanes, whose
+    lanes are brought back into range when they are stored. A failed
+    bounds check stops the program like the native code's ud2 (SIGILL).
+    """
+    def __init__(self, ir_list, functions=()):
+        self.ir_list = ir_list
+        self.lines = []
+        for function in functions:
+            self.translate(function.ir_opt, function)
+        self.translate(ir_list)
+        self.source = "\n".join(self.lines) + "\n"
+        namespace = {"wrap": wrap, "trap": trap, "out_of_bounds": out_of_bounds}
+        exec(compile(self.source, "<ir>", "exec"), namespace)
+        self.program = namespace["program"]
+
+    def run(self, output=None):
+        """
+        Run the program, its output goes to the binary stream `output`
+        (stdout by default). Output not written yet is lost on a trap.
+        """
+        output = output or sys.stdout.buffer
+        limit = sys.getrecursionlimit()
+        depth, frame = 0, sys._getframe()
+        while frame is not None:
+            depth, frame = depth + 1, frame.f_back
+        sys.setrecursionlimit(max(limit, depth + MAX_CALL_DEPTH + CALL_HEADROOM))
+        try:
+            self.program(output.write)
+        except ZeroDivisionError:
+            raise RuntimeError(TRAPPED) from None
+        except RecursionError:
+            raise RuntimeError(STACK_OVERFLOW) from None
+        finally:
+            sys.setrecursionlimit(limit)
+            output.flush()
+
+    ### Translation ###
+    def translate(self, ir_list, function=None):
+        """
+        Append the Python function running `ir_list`: `program`, or the
+        one of the user function `function`.
+        """
+        self.function = function
+        self.cfg = ControlFlowGraph(ir_list)
+        self.variables = {}     # variable -> local name
+        self.constants = {}     # temp written once, by a const -> its value
+        self.defs = {}          # temp -> number of writes
+        self.readers = {}       # temp -> ops reading it
+        self.uses = {}          # temp -> number of reads
+        self.pending = []       # params of the next call
+        defs, readers, uses = self.defs, self.readers, self.uses
+        args = set()            # params passing an argument to a user function
+        pending = []
+        for instr in ir_list:
+            if instr.op in IRInstr.VALUE_OPS or instr.op in IRInstr.VECTOR_OPS or instr.op == "copy" \
+                    or instr.op == "call" and instr.arg2 is not None:
+                defs[instr.dest] = defs.get(instr.dest, 0) + 1
+            if instr.op == "param":
+                pending.append(instr)
+            elif instr.op == "call":
+                if instr.arg2:
+                    args.update(map(id, pending[-instr.arg2:]))
+                pending = []
+        for instr in ir_list:
+            # an argument is read as a whole, unlike a printed value
+            op = "arg" if id(instr) in args else instr.op
+            for arg in (instr.arg1, instr.arg2):
+                if arg in defs:
+                    readers.setdefault(arg, set()).add(op)
+                    uses[arg] = uses.get(arg, 0) + 1
+        params = [self.variable(name) for name in function.param_names] if function else []
+        for instr in ir_list:
+            op = instr.op
+            if op == "const" and defs[instr.dest] == 1:
+                self.constants[instr.dest] = instr.arg1
+            elif op in ("load", "store", "store_str", "addr", "array", "load_idx", "vload"):
+                self.variable(instr.arg1)
+                if op == "store_str" and instr.arg2[:1] != '"':
+                    self.variable(instr.arg2)
+            elif op in ("store_idx", "vstore"):
+                self.variable(instr.dest)
+            elif op == "param" and instr.arg1 not in defs and instr.arg1 not in ("fmt_int", "fmt_str"):
+                self.variable(instr.arg1)   # a printed string
+        names = [temp for temp in defs if temp not in self.constants] + list(self.variables.values())[len(params):]
+
+        if function is None:
+            self.emit(0, "def program(write):")
+            self.emit(1, "buf = bytearray()")
+        else:
+            self.emit(0, f"def {self.python_name(function.symbol)}({', '.join(['write', 'buf'] + params)}):")
+        for start in range(0, len(names), 100):
+            self.emit(1, " = ".join(names[start:start + 100]) + " = 0")
+        self.emit(1, "block = 0")
+        self.emit(1, "while True:")
+        self.dispatch(self.traces(), 2)
+
+    @staticmethod
+    def python_name(symbol):
+        return symbol.replace(".", "_")
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def variable(self, name):
+        if name not in self.variables:
+            self.variables[name] = f"v{len(self.variables)}"
+        return self.variables[name]
+
+    def value(self, name):
+        """
+        Python expression for the value of a temp.
+        """
+        if name in self.constants:
+            return str(self.constants[name])
+        return name
+
+    def traces(self):
+        traces = []
+        for block in self.cfg.blocks:
+            if traces and block.preds == [traces[-1][-1]] and not self.ends_with_goto(traces[-1][-1]):
+                traces[-1].append(block)
+            else:
+                traces.append([block])
+        return traces
+
+    def ends_with_goto(self, block):
+        last = block.terminator()
+        return last is not None and last.op == "goto"
+
+    def dispatch(self, traces, indent):
+        """
+        Binary search for the trace starting at block number `block`.
+        """
+        if len(traces) == 1:
+            self.emit(indent, "while True:")
+            self.trace(traces[0], indent + 1)
+            return
+        middle = len(traces) // 2
+        self.emit(indent, f"if block < {traces[middle][0].index}:")
+        self.dispatch(traces[:middle], indent + 1)
+        self.emit(indent, "else:")
+        self.dispatch(traces[middle:], indent + 1)
+
+    def trace(self, blocks, indent):
+        head = blocks[0]
+        for position, block in enumerate(blocks):
+            instrs = block.instrs
+            skip = False
+            for index, instr in enumerate(instrs):
+                if skip:
+                    skip = False
+                    continue
+                following = instrs[index + 1] if index + 1 < len(instrs) else None
+                if following is not None and self.uses.get(instr.dest) == 1 and following.arg1 == instr.dest:
+                    if instr.op in COMPARE_OPS and following.op in ("if", "if_false"):
+                        condition = f"{self.value(instr.arg1)} {PYTHON_OPS[instr.op]} {self.value(instr.arg2)}"
+                        if following.op == "if_false":
+                            condition = f"not {condition}"
+                        target = self.cfg.label_to_block[following.dest]
+                        self.emit(indent, f"if {condition}: {self.jump(head, target)}")
+                        skip = True
+                        continue
+                    if instr.op in PYTHON_OPS or instr.op == "div":
+                        if following.op == "copy":
+                            instr = IRInstr(instr.op, instr.arg1, instr.arg2, following.dest)
+                            skip = True
+                handler = getattr(self, f"translate_{instr.op}", None)
+                if handler is None:
+                    raise NotImplementedError(f"Unsupported IR: {instr.op}")
+                if instr.op in IRInstr.JUMP_OPS:
+                    target = self.cfg.label_to_block[instr.dest]
+                    if position + 1 < len(blocks) and target is blocks[position + 1]:
+                        continue    # a branch to the block falling through
+                    handler(instr, self.jump(head, target), indent)
+                else:
+                    handler(instr, indent)
+        last = blocks[-1]
+        if self.ends_with_goto(last):
+            return
+        if last.index + 1 < len(self.cfg.blocks):
+            self.emit(indent, self.jump(head, self.cfg.blocks[last.index + 1]))
+        elif self.function is not None:
+            if not last.instrs or last.instrs[-1].op != "return":
+                self.emit(indent, "return 0")
+        else:
+            self.emit(indent, "write(buf)")
+            self.emit(indent, "return")
+
+    def jump(self, head, target):
+        if target is head:
+            return "continue"
+        return f"block = {target.index}; break"
+
+    ### Instructions ###
+    def translate_label(self, instr, indent):
+        pass
+
+    def translate_const(self, instr, indent):
+        if instr.dest not in self.constants:
+            self.emit(indent, f"{instr.dest} = {instr.arg1}")
+
+    def translate_load(self, instr, indent):
+        self.emit(indent, f"{instr.dest} = {self.variable(instr.arg1)}")
+
+    def translate_store(self, instr, indent):
+        self.emit(indent, f"{self.variable(instr.arg1)} = {self.value(instr.arg2)}")
+
+    def translate_store_str(self, instr, indent):
+        value = instr.arg2
+        if value[:1] == '"':
+            # the string is printed with its newline
+            value = repr(value[1:-1].encode() + b"\n")
+        else:
+            value = self.variable(value)
+        self.emit(indent, f"{self.variable(instr.arg1)} = {value}")
+
+    def translate_array(self, instr, indent):
+        self.emit(indent, f"{self.variable(instr.arg1)} = [0] * {instr.arg2}")
+
+    def translate_check(self, instr, indent):
+        self.emit(indent, f"if not 0 <= {self.value(instr.arg1)} < {instr.arg2}: out_of_bounds()")
+
+    def translate_load_idx(self, instr, indent):
+        self.emit(indent, f"{instr.dest} = {self.variable(instr.arg1)}[{self.value(instr.arg2)}]")
+
+    def translate_store_idx(self, instr, indent):
+        self.emit(indent, f"{self.variable(instr.dest)}[{self.value(instr.arg1)}] = {self.value(instr.arg2)}")
+
+    def translate_vload(self, instr, indent):
+        index = self.value(instr.arg2)
+        self.emit(indent, f"{instr.dest} = {self.variable(instr.arg1)}[{index}:{index} + {IRInstr.VECTOR_WIDTH}]")
+
+    def translate_vsplat(self, instr, indent):
+        self.emit(indent, f"{instr.dest} = [{self.value(instr.arg1)}] * {IRInstr.VECTOR_WIDTH}")
+
+    def translate_vector_binary(self, instr, indent):
+        operator = PYTHON_OPS[instr.op[1:]]
+        self.emit(indent, f"{instr.dest} = [a {operator} b for a, b in zip({instr.arg1}, {instr.arg2})]")
+
+    translate_vadd = translate_vsub = translate_vmul = translate_vector_binary
+
+    def translate_vstore(self, instr, indent):
+        index = self.value(instr.arg1)
+        self.emit(indent, f"{self.variable(instr.dest)}[{index}:{index} + {IRInstr.VECTOR_WIDTH}] = "
+                          f"[a if {INT64_MIN} <= a <= {INT64_MAX} else wrap(a) for a in {instr.arg2}]")
+
+    def translate_copy(self, instr, indent):
+        self.emit(indent, f"{instr.dest} = {self.value(instr.arg1)}")
+
+    def translate_binary(self, instr, indent):
+        a, b, dest = self.value(instr.arg1), self.value(instr.arg2), instr.dest
+        self.emit(indent, f"{dest} = {a} {PYTHON_OPS[instr.op]} {b}")
+        if instr.op in WRAPPED_OPS and self.needs_wrap(dest):
+            self.emit(indent, f"if not {INT64_MIN} <= {dest} <= {INT64_MAX}: {dest} = wrap({dest})")
+
+    translate_add = translate_sub = translate_mul = translate_binary
+    translate_eq = translate_neq = translate_lt = translate_gt = translate_leq = translate_geq = translate_binary
+
+    def needs_wrap(self, temp):
+        """
+        A temp written more than once may carry a value around a loop, so
+        it is always brought back into range, or it could grow without bound.
+        """
+        return self.defs[temp] > 1 or not self.readers.get(temp, set()) <= MODULAR_READERS
+
+    def translate_div(self, instr, indent):
+        a, b, dest = self.value(instr.arg1), self.value(instr.arg2), instr.dest
+        divisor = self.constants.get(instr.arg2)
+        if divisor is not None and divisor > 0:
+            self.emit(indent, f"{dest} = {a} // {b} if {a} >= 0 else -(-{a} // {b})")
+            return
+        # // rounds down, idiv toward zero
+        self.emit(indent, f"{dest} = {a} // {b} if ({a} >= 0) == ({b} > 0) else -(-{a} // {b})")
+        self.emit(indent, f"if {dest} > {INT64_MAX}: trap()")
+
+    def translate_goto(self, instr, jump, indent):
+        self.emit(indent, jump)
+
+    def translate_if(self, instr, jump, indent):
+        self.emit(indent, f"if {self.value(instr.arg1)}: {jump}")
+
+    def translate_if_false(self, instr, jump, indent):
+        self.emit(indent, f"if not {self.value(instr.arg1)}: {jump}")
+
+    def translate_param(self, instr, indent):
+        self.pending.append(instr.arg1)
+
+    def translate_addr(self, instr, indent):
+        self.emit(indent, f"{instr.dest} = {self.variable(instr.arg1)}")
+
+    def translate_return(self, instr, indent):
+        self.emit(indent, f"return {self.value(instr.arg1)}")
+
+    def translate_call(self, instr, indent):
+        params, self.pending = self.pending, []
+        if instr.arg2 is not None:
+            args = ["write", "buf"] + [self.value(arg) for arg in params[len(params) - instr.arg2:]]
+            self.emit(indent, f"{instr.dest} = {self.python_name(instr.arg1)}({', '.join(args)})")
+            return
+        if len(params) < 2:
+            raise RuntimeError("Not enough parameters for printf call")
+        fmt, val = params[-2:]
+        if fmt == "fmt_int":
+            if val in self.constants:
+                value = (self.constants[val] + 2**31) % 2**32 - 2**31
+                line = repr(b"%d\n" % value)
+                self.emit(indent, f"buf += {line}")
+            else:
+                self.emit(indent, f'buf += b"%d\\n" % ((({val} + 2147483648) & 4294967295) - 2147483648)')
+        elif fmt == "fmt_str":
+            self.emit(indent, f"buf += {val if val in self.defs else self.variable(val)}")
+        else:
+            raise RuntimeError(f"Unknown format string: {fmt}")
+        self.emit(indent, f"if len(buf) >= {OUTPUT_CHUNK}: write(buf); buf.clear()")
@@ -1,71 +1,109 @@
 from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.cfg import ControlFlowGraph
+from intermediate_representation.dataflow import StrongLiveness
+from intermediate_representation.sccp import ConstantPropagation
+from intermediate_representation.value_numbering import ValueNumbering
+from intermediate_representation.loops import LoopOptimizer
+from intermediate_representation.ssa import SSABuilder
+from intermediate_representation.inlining import Inliner, eliminate_tail_calls
+from pass_stats import NO_STATS
 
 class IROptimizer:
-    def __init__(self, ir_list):
+    # instructions without side effects besides writing their result; div
+    # traps on a zero divisor, it's only pure by a constant (see
+    # dead_code_elimination)
+    PURE_OPS = (IRInstr.VALUE_OPS - {"div"}) | IRInstr.VECTOR_OPS | {"store"}
+    # passes in the order they run, each one is timed separately
+    PASSES = ("tail_calls", "inlining", "constant_propagation", "loop_optimization", "value_numbering",
+              "dead_code_elimination", "promote_variables")
+    # optimization level (-O) -> passes run at that level
+    OPT_LEVELS = {0: (), 1: PASSES}
+    DEFAULT_OPT_LEVEL = 1
+
+    def __init__(self, ir_list, live_out=(), stats=NO_STATS, opt_level=DEFAULT_OPT_LEVEL,
+                 functions=None, function=None):
         self.ir_list = ir_list
+        self.live_out = live_out    # names read after this code (any container)
+        self.stats = stats
+        self.passes = self.OPT_LEVELS[opt_level]
+        self.functions = functions or {}    # symbol -> IRFunction the code can call
+        self.function = function            # IRFunction whose body this is, or None
 
     def optimize(self):
-        # Implement optimization passes
-        self.constant_folding()
-        self.dead_code_elimination()
+        for name in self.passes:
+            with self.stats.phase(f"opt.{name}") as record:
+                record.counts["ir_before"] = len(self.ir_list)
+                getattr(self, name)()
+                record.counts["ir_after"] = len(self.ir_list)
         return self.ir_list
 
-    def constant_folding(self):
+    def tail_calls(self):
+        """
+        Tail calls of a function to itself become jumps to the start of
+        its body (see inlining.py).
+        """
+        if self.function is not None:
+            self.ir_list = eliminate_tail_calls(self.ir_list, self.function)
+
+    def inlining(self):
+        """
+        Calls of small functions are replaced by their body, cost model
+        in inlining.py. The callees are optimized already, the passes
+        after this one specialize the copies to their arguments.
+        """
+        if self.functions:
+            self.ir_list = Inliner(self.ir_list, self.functions).run()
+
+    def constant_propagation(self):
+        """
+        Sparse conditional constant propagation (see sccp.py): folds
+        arithmetic and comparisons with int64 semantics through temps and
+        variables, resolves branches on constants and removes the blocks
+        no executable path reaches.
+        """
+        cfg = ControlFlowGraph(self.ir_list)
+        self.ir_list = ConstantPropagation(cfg).solve().rewrite()
+
+    def loop_optimization(self):
+        """
+        Loop-invariant code motion, strength reduction of induction
+        variables and exit test replacement (see loops.py).
+        """
+        cfg = ControlFlowGraph(self.ir_list)
+        self.ir_list = LoopOptimizer(cfg).run()
+
+    def value_numbering(self):
         """
-        Perform constant folding optimization on the IR code.
-        This optimization replaces constant expressions with their computed values.
+        Dominator-scoped value numbering (see value_numbering.py): removes
+        repeated constants, redundant loads and common subexpressions.
         """
-        constants = {}
-        new_ir_code = []
-        for instr in self.ir_list:
-            if instr.op == 'const':
-                constants[instr.dest] = instr.arg1
-                new_ir_code.append(instr)
-            elif instr.op in {'add', 'sub', 'mul', 'div'}:
-                x = constants.get(instr.arg1)
-                y = constants.get(instr.arg2)
-                if x is not None and y is not None:
-                    # Fold constant expression
-                    if instr.op == 'add':
-                        result = x + y
-                    elif instr.op == 'sub':
-                        result = x - y
-                    elif instr.op == 'mul':
-                        result = x * y
-                    elif instr.op == 'div':
-                        if y == 0:
-                            raise ZeroDivisionError("Division by zero in constant folding")
-                        result = x / y
-                    
-                    # Create a new instruction with the folded constant
-                    new_instr = IRInstr('const', result, None, instr.dest)
-                    constants[instr.dest] = result
-                    new_ir_code.append(new_instr)
-                else:
-                    new_ir_code.append(instr)
-            else:
-                new_ir_code.append(instr)
-        self.ir_list = new_ir_code
-            
+        cfg = ControlFlowGraph(self.ir_list)
+        self.ir_list = ValueNumbering(cfg).run()
 
     def dead_code_elimination(self):
         """
         Perform dead code elimination optimization on the IR code.
+        Uses strong liveness over the control-flow graph: a temp computation
+        or a variable store whose result is never read by a useful
+        instruction afterwards is removed, dead chains across blocks included.
+        A division stays unless its divisor is a constant other than 0 and
+        -1: like in constant propagation, the trap is left to run time.
+        """
+        safe_divisors = {instr.dest for instr in self.ir_list
+                         if instr.op == "const" and instr.arg1 not in (0, -1)}
+        cfg = ControlFlowGraph(self.ir_list)
+        liveness = StrongLiveness(cfg, self.PURE_OPS, self.live_out, safe_divisors).solve()
+        for block in cfg.blocks:
+            block.instrs = liveness.useful(block)
+        self.ir_list = cfg.flatten()
+
+    def promote_variables(self):
+        """
+        Int variables become temps (see ssa.py): the IR goes through SSA
+        form and back, leaving copies where the phis were. Runs last, the
+        other passes expect every temp to be written once. The IR of a
+        function before it is kept for inlining it into later code.
         """
-        used_dests = set()
-        # collect all destinations that are used in args
-        for instr in self.ir_list:
-            for arg in (instr.arg1, instr.arg2):
-                if isinstance(arg, str) and arg.startswith('t'):
-                    used_dests.add(arg)
-        
-        new_ir_code = []
-        # filter out indtructions not in used_dests
-        for instr in self.ir_list:
-            if instr.op in ("const", "add", "sub", "mul", "div"):
-                if instr.dest in used_dests:
-                    new_ir_code.append(instr)
-            else:
-                new_ir_code.append(instr)
-        self.ir_list = new_ir_code
-            
\ No newline at end of file
+        if self.function is not None:
+            self.function.inline_ir = self.ir_list
+        self.ir_list = SSABuilder(self.ir_list, self.live_out).build().destruct()
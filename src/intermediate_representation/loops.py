@@ -0,0 +1,548 @@
+from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.cfg import Dominance
+from intermediate_representation.sccp import wrap
+
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+
+# compare op with its operands swapped
+MIRRORED = {"lt": "gt", "gt": "lt", "leq": "geq", "geq": "leq"}
+# scalar op -> vector op of a vectorized loop
+VECTOR_OP = {"add": "vadd", "sub": "vsub", "mul": "vmul"}
+# deepest vector expression of a vectorized loop, the code generator
+# evaluates them in the 16 xmm registers
+MAX_VECTOR_DEPTH = 12
+
+
+class InductionVariable:
+    """
+    Basic induction variable: a variable stored once per iteration of its
+    loop, with its value at the start of the iteration plus `step`.
+    """
+    def __init__(self, var, step, block, store):
+        self.var = var
+        self.step = step
+        self.block = block      # block of the store
+        self.store = store      # the store instruction
+        self.scaled = {}        # factor k -> variable holding var * k
+
+
+class LoopOptimizer:
+    """
+    Loop optimizations over the natural loops of a ControlFlowGraph, outer
+    loops first. Code leaving a loop goes to its preheader, the header's
+    only entry from outside: the instructions are placed just before the
+    header label, so a loop whose header is not entered by falling
+    through from the block before it is left alone.
+
+    - Loop-invariant code motion: constants, loads of variables the loop
+      never stores and arithmetic on invariant operands move to the
+      preheader. Their temps are written once, so the value is the same
+      on every iteration. `div` only moves with a constant divisor that
+      cannot trap, the loop may run zero times.
+    - Strength reduction: `i * k` for a basic induction variable i and a
+      constant k becomes a load of a new variable `i.ivN`, set to i * k in
+      the preheader and increased by step * k right after the store to i.
+    - Linear function test replacement: an exit test `i < n` becomes
+      `i.ivN < n * k` when the first value of i is a constant stored just
+      before the loop and no value i takes overflows once multiplied, so
+      i is left to dead code elimination when nothing else reads it.
+    - Bounds check elimination: the header's exit test `i < n` and the
+      first value of i bound i in the rest of the loop, a check of the
+      index i + c is dropped when every value it takes is in range.
+    - Vectorization: a loop of one block after its header, doing add,
+      sub and mul on array elements a[i + c] with i counting up by 1, gets
+      a copy in front of it handling VECTOR_WIDTH iterations at a time
+      (see vectorize); the loop itself runs the iterations left over.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.dominance = Dominance(cfg.immediate_dominators())
+        self.loops = cfg.natural_loops(self.dominance)
+        self.preheaders = {}    # header block index -> instructions placed before it
+        self.defs = {}          # temp -> (block, instruction writing it)
+        self.innermost = {}     # block index -> innermost loop containing it
+        self.iv_count = 0
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                if instr.op in IRInstr.VALUE_OPS or instr.op == "call" and instr.arg2 is not None:
+                    self.defs[instr.dest] = (block, instr)
+        self.next_temp = max((int(temp[1:]) for temp in self.defs
+                              if temp[:1] == "t" and temp[1:].isdigit()), default=0)
+        for loop in self.loops:
+            for index in loop.blocks:
+                self.innermost[index] = loop
+
+    def run(self):
+        for loop in self.loops:
+            if self.has_preheader(loop):
+                self.preheaders.setdefault(loop.header.index, [])
+                self.hoist_invariants(loop)
+                ivs = self.induction_variables(loop)
+                if ivs:
+                    bounds = self.iv_range(loop, ivs)
+                    if bounds is not None:
+                        self.eliminate_checks(loop, *bounds)
+                        if self.vectorize(loop, *bounds):
+                            continue
+                    self.reduce_strength(loop, ivs)
+                    self.replace_exit_test(loop, ivs)
+        ir = []
+        for block in self.cfg.blocks:
+            ir.extend(self.preheaders.get(block.index, ()))
+            ir.extend(block.instrs)
+        return ir
+
+    def new_temp(self):
+        self.next_temp += 1
+        return f"t{self.next_temp}"
+
+    def emit(self, instrs, op, arg1=None, arg2=None, dest=None):
+        """
+        Append a new instruction writing a fresh temp (or `dest`), return the temp.
+        """
+        if dest is None and (op in IRInstr.VALUE_OPS or op in IRInstr.VECTOR_OPS):
+            dest = self.new_temp()
+        instrs.append(IRInstr(op, arg1, arg2, dest))
+        return dest
+
+    def has_preheader(self, loop):
+        header = loop.header
+        entries = [pred for pred in header.preds
+                   if pred.index not in loop.blocks and self.dominance.idom[pred.index] is not None]
+        if len(entries) != 1 or entries[0].index != header.index - 1:
+            return False
+        last = entries[0].terminator()
+        return last is None or last.dest != header.label
+
+    def body(self, loop):
+        return [self.cfg.blocks[index] for index in sorted(loop.blocks)]
+
+    ### Loop-invariant code motion ###
+    def hoist_invariants(self, loop):
+        blocks = self.body(loop)
+        stored = {instr.arg1 for block in blocks for instr in block.instrs
+                  if instr.op in ("store", "store_str")}
+        defined = {instr.dest for block in blocks for instr in block.instrs
+                   if instr.op in IRInstr.VALUE_OPS or instr.op == "call"}
+        invariant = set()
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                for instr in block.instrs:
+                    if instr.op in IRInstr.VALUE_OPS and instr.dest not in invariant \
+                            and self.is_invariant(instr, defined, invariant, stored):
+                        invariant.add(instr.dest)
+                        changed = True
+        # constants are cheaper to repeat, they only move for a moved reader
+        moved = {instr.dest for block in blocks for instr in block.instrs
+                 if instr.dest in invariant and instr.op != "const"}
+        for block in blocks:
+            for instr in block.instrs:
+                if instr.dest in moved and instr.op in IRInstr.BINARY_OPS:
+                    moved.update(name for name in (instr.arg1, instr.arg2) if name in defined)
+        if not moved:
+            return
+        preheader = self.preheaders[loop.header.index]
+        for block in blocks:
+            kept = []
+            for instr in block.instrs:
+                if instr.op in IRInstr.VALUE_OPS and instr.dest in moved:
+                    preheader.append(instr)
+                    self.defs[instr.dest] = (None, instr)
+                else:
+                    kept.append(instr)
+            block.instrs = kept
+
+    def is_invariant(self, instr, defined, invariant, stored):
+        op = instr.op
+        if op == "const":
+            return True
+        if op == "load":
+            return instr.arg1 not in stored
+        if op == "load_idx":
+            # the check of its index stays in the loop
+            return False
+        if any(name in defined and name not in invariant for name in (instr.arg1, instr.arg2)):
+            return False
+        if op == "div":
+            divisor = self.constant(instr.arg2)
+            return divisor is not None and divisor not in (0, -1)
+        return True
+
+    def constant(self, temp):
+        block, instr = self.defs.get(temp, (None, None))
+        if instr is not None and instr.op == "const":
+            return instr.arg1
+        return None
+
+    ### Induction variables ###
+    def induction_variables(self, loop):
+        """
+        var -> InductionVariable for the variables `loop` stores exactly
+        once per iteration as their value at the start of the iteration
+        plus a constant.
+        """
+        stores = {}
+        for block in self.body(loop):
+            for instr in block.instrs:
+                if instr.op in ("store", "store_str"):
+                    stores.setdefault(instr.arg1, []).append((block, instr))
+        ivs = {}
+        for var, sites in stores.items():
+            if len(sites) != 1:
+                continue
+            block, store = sites[0]
+            if store.op != "store" or self.innermost[block.index] is not loop:
+                continue
+            if not all(self.dominance.dominates(block.index, latch.index) for latch in loop.latches):
+                continue
+            step = self.step(var, store, block)
+            if step is not None:
+                ivs[var] = InductionVariable(var, step, block, store)
+        return ivs
+
+    def step(self, var, store, block):
+        _, value = self.defs.get(store.arg2, (None, None))
+        if value is None or value.op not in ("add", "sub"):
+            return None
+        pairs = [(value.arg1, value.arg2)]
+        if value.op == "add":
+            pairs.append((value.arg2, value.arg1))
+        for current, step in pairs:
+            amount = self.constant(step)
+            if amount is not None and self.reads_start_value(current, var, block, store):
+                return amount if value.op == "add" else wrap(-amount)
+        return None
+
+    def reads_start_value(self, temp, var, store_block, store):
+        """
+        True if `temp` is a load of `var` done before its store on every
+        path through the iteration.
+        """
+        block, instr = self.defs.get(temp, (None, None))
+        if block is None or instr.op != "load" or instr.arg1 != var:
+            return False
+        if block is store_block:
+            return block.instrs.index(instr) < block.instrs.index(store)
+        return self.dominance.dominates(block.index, store_block.index)
+
+    ### Strength reduction ###
+    def reduce_strength(self, loop, ivs):
+        preheader = self.preheaders[loop.header.index]
+        for block in self.body(loop):
+            for instr in list(block.instrs):
+                if instr.op != "mul":
+                    continue
+                for factor, other in ((instr.arg1, instr.arg2), (instr.arg2, instr.arg1)):
+                    k = self.constant(other)
+                    iv = self.iv_read_by(factor, ivs)
+                    if k is None or iv is None:
+                        continue
+                    scaled = iv.scaled.get(k)
+                    if scaled is None:
+                        scaled = iv.scaled[k] = self.scale(loop, iv, k, preheader)
+                    replacement = IRInstr("load", scaled, None, instr.dest)
+                    block.instrs[block.instrs.index(instr)] = replacement
+                    self.defs[instr.dest] = (block, replacement)
+                    break
+
+    def iv_read_by(self, temp, ivs):
+        block, instr = self.defs.get(temp, (None, None))
+        if instr is None or instr.op != "load" or instr.arg1 not in ivs:
+            return None
+        iv = ivs[instr.arg1]
+        return iv if self.reads_start_value(temp, iv.var, iv.block, iv.store) else None
+
+    def scale(self, loop, iv, k, preheader):
+        """
+        New variable holding iv * k: set in the preheader, updated after the store to iv.
+        """
+        self.iv_count += 1
+        name = f"{iv.var}.iv{self.iv_count}"
+        first = self.start_value(loop, iv.var)
+        if first is not None:
+            product = self.emit(preheader, "const", wrap(first * k))
+        else:
+            start = self.emit(preheader, "load", iv.var)
+            product = self.emit(preheader, "mul", start, self.emit(preheader, "const", k))
+        self.emit(preheader, "store", name, product)
+        update = []
+        current = self.emit(update, "load", name)
+        total = self.emit(update, "add", current, self.emit(update, "const", wrap(iv.step * k)))
+        self.emit(update, "store", name, total)
+        position = iv.block.instrs.index(iv.store) + 1
+        iv.block.instrs[position:position] = update
+        return name
+
+    ### Linear function test replacement ###
+    def replace_exit_test(self, loop, ivs):
+        header = loop.header
+        last = header.terminator()
+        if last is None or last.op not in ("if", "if_false"):
+            return
+        block, test = self.defs.get(last.arg1, (None, None))
+        if block is not header or test.op not in MIRRORED:
+            return
+        op, value, bound = test.op, test.arg1, test.arg2
+        if self.constant(value) is not None:
+            op, value, bound = MIRRORED[op], bound, value
+        iv = self.iv_read_by(value, ivs)
+        n = self.constant(bound)
+        if iv is None or n is None:
+            return
+        k = next((k for k in iv.scaled if k > 0), None)
+        first = self.start_value(loop, iv.var)
+        if k is None or first is None:
+            return
+        if op in ("lt", "leq") and iv.step > 0:
+            low, high = first, max(first, n + iv.step)
+        elif op in ("gt", "geq") and iv.step < 0:
+            low, high = min(first, n + iv.step), first
+        else:
+            return
+        if not all(INT64_MIN <= v <= INT64_MAX for v in (low, high, low * k, high * k, n * k)):
+            return
+        position = header.instrs.index(test)
+        replacement = []
+        scaled = self.emit(replacement, "load", iv.scaled[k])
+        limit = self.emit(replacement, "const", n * k)
+        self.emit(replacement, op, scaled, limit, test.dest)
+        header.instrs[position:position + 1] = replacement
+        self.defs[test.dest] = (header, replacement[-1])
+
+    def start_value(self, loop, var):
+        """
+        Constant stored to `var` by the block falling into the loop, if any.
+        """
+        entry = self.cfg.blocks[loop.header.index - 1]
+        for instr in reversed(entry.instrs):
+            if instr.op in ("store", "store_str") and instr.arg1 == var:
+                return self.constant(instr.arg2) if instr.op == "store" else None
+        return None
+
+    ### Bounds check elimination ###
+    def iv_range(self, loop, ivs):
+        """
+        (induction variable, lowest, highest value) of the variable the
+        header's exit test compares to a constant, at the start of every
+        iteration that gets past the test, or None. The first value is
+        the constant stored before the loop; the bound the test allows
+        plus the step must not overflow, or the variable could wrap
+        around past it.
+        """
+        header = loop.header
+        last = header.terminator()
+        if last is None or last.op != "if_false" or self.cfg.label_to_block[last.dest].index in loop.blocks:
+            return None
+        block, test = self.defs.get(last.arg1, (None, None))
+        if block is not header or test.op not in MIRRORED:
+            return None
+        op, value, bound = test.op, test.arg1, test.arg2
+        if self.constant(value) is not None:
+            op, value, bound = MIRRORED[op], bound, value
+        iv = self.iv_read_by(value, ivs)
+        n = self.constant(bound)
+        if iv is None or n is None:
+            return None
+        first = self.start_value(loop, iv.var)
+        if first is None:
+            return None
+        if op in ("lt", "leq") and iv.step > 0:
+            low, high = first, n - 1 if op == "lt" else n
+            if high + iv.step > INT64_MAX:
+                return None
+        elif op in ("gt", "geq") and iv.step < 0:
+            low, high = n + 1 if op == "gt" else n, first
+            if low + iv.step < INT64_MIN:
+                return None
+        else:
+            return None
+        return iv, low, high
+
+    def eliminate_checks(self, loop, iv, low, high):
+        """
+        Drop the checks of the index iv + c in the blocks after the header,
+        which only run once the exit test passed.
+        """
+        for block in self.body(loop):
+            if block is loop.header:
+                continue
+            kept = []
+            for instr in block.instrs:
+                if instr.op == "check":
+                    offset = self.iv_offset(instr.arg1, iv)
+                    if offset is not None and 0 <= low + offset and high + offset < instr.arg2:
+                        continue
+                kept.append(instr)
+            block.instrs = kept
+
+    def iv_offset(self, temp, iv):
+        """
+        c if `temp` is the value of `iv` at the start of the iteration plus
+        a constant c, else None.
+        """
+        block, instr = self.defs.get(temp, (None, None))
+        if instr is None:
+            return None
+        if instr.op == "load":
+            return 0 if self.reads_start_value(temp, iv.var, iv.block, iv.store) else None
+        if instr.op not in ("add", "sub"):
+            return None
+        pairs = [(instr.arg1, instr.arg2)]
+        if instr.op == "add":
+            pairs.append((instr.arg2, instr.arg1))
+        for value, amount in pairs:
+            amount = self.constant(amount)
+            if amount is not None and self.iv_offset(value, iv) == 0:
+                return amount if instr.op == "add" else -amount
+        return None
+
+    ### Vectorization ###
+    def vectorize(self, loop, iv, low, high):
+        """
+        Put a vector loop in front of `loop`, running VECTOR_WIDTH of its
+        iterations at a time while that many are left; True if it did.
+
+        The loop must be its header and one block, with i counting up by 1
+        (its only store) and no checks left. The block only reads i as an
+        index i + c of array elements, computes add, sub and mul of them
+        and of values fixed in the loop, and stores to array elements. An
+        array it stores to is only accessed at one index i + c: the
+        elements an iteration uses are then its own, so the iterations of
+        a vector can run at once. The vector loop does the instructions
+        of the block in order, one vector per array access; a value fixed
+        in the loop is repeated in every lane by a vsplat.
+        """
+        header = loop.header
+        if iv.step != 1 or len(loop.blocks) != 2 or header.index + 1 not in loop.blocks:
+            return False
+        body = self.cfg.blocks[header.index + 1]
+        last = body.terminator()
+        if last is None or last.op != "goto" or last.dest != header.label:
+            return False
+        if not all(instr.op in ("label", "const", "load", "if_false") or instr.op in MIRRORED
+                   for instr in header.instrs):
+            return False
+        plan = self.vector_plan(loop, body, iv)
+        if plan is None:
+            return False
+        return self.emit_vector_loop(loop, body, iv, high, plan)
+
+    def vector_plan(self, loop, body, iv):
+        """
+        temp -> kind for the temps of `body`: "index" (i + c), "scalar"
+        (fixed in the loop), "vector" or "step" (the update of i), with
+        the offset c of every index; None if the body can't be vectorized.
+        """
+        kinds, offsets = {}, {}
+        accesses = {}       # array -> offsets it is accessed at
+        stored_arrays = set()
+        depth = {}
+        instrs = body.instrs[1:-1] if body.instrs[0].op == "label" else body.instrs[:-1]
+
+        def kind(temp):
+            if temp in kinds:
+                return kinds[temp]
+            block, _ = self.defs.get(temp, (None, None))
+            return None if block is not None and block.index in loop.blocks else "scalar"
+
+        for instr in instrs:
+            op = instr.op
+            if instr is iv.store:
+                kinds[instr.arg2] = "step"
+                continue
+            if op == "const":
+                kinds[instr.dest] = "scalar"
+            elif op == "load":
+                offset = self.iv_offset(instr.dest, iv)
+                if offset == 0:
+                    kinds[instr.dest], offsets[instr.dest] = "index", 0
+                elif instr.arg1 == iv.var:
+                    return None
+                else:
+                    kinds[instr.dest] = "scalar"    # the loop stores no other variable
+            elif op in ("add", "sub", "mul"):
+                a, b = kind(instr.arg1), kind(instr.arg2)
+                offset = self.iv_offset(instr.dest, iv)
+                if op != "mul" and offset is not None and "index" in (a, b):
+                    kinds[instr.dest], offsets[instr.dest] = "index", offset
+                elif a in ("scalar", "vector") and b in ("scalar", "vector"):
+                    kinds[instr.dest] = "vector" if "vector" in (a, b) else "scalar"
+                    depth[instr.dest] = 1 + max(depth.get(instr.arg1, 1), depth.get(instr.arg2, 1))
+                else:
+                    return None
+            elif op in ("load_idx", "store_idx"):
+                index = instr.arg2 if op == "load_idx" else instr.arg1
+                array = instr.arg1 if op == "load_idx" else instr.dest
+                if kind(index) != "index":
+                    return None
+                accesses.setdefault(array, set()).add(offsets[index])
+                if op == "load_idx":
+                    kinds[instr.dest] = "vector"
+                else:
+                    stored_arrays.add(array)
+                    if kind(instr.arg2) not in ("scalar", "vector"):
+                        return None
+            else:
+                return None
+        if any(len(accesses[array]) > 1 for array in stored_arrays):
+            return None
+        if any(value > MAX_VECTOR_DEPTH for value in depth.values()):
+            return None
+        _, step = self.defs[iv.store.arg2]
+        if kinds.get(iv.store.arg2) != "step" or step.op != "add":
+            return None
+        return kinds, offsets
+
+    def emit_vector_loop(self, loop, body, iv, high, plan):
+        kinds, offsets = plan
+        # one more element than the vector is wide must fit below the bound
+        limit = high - (IRInstr.VECTOR_WIDTH - 1) + 1
+        if limit <= INT64_MIN:
+            return False
+        header = loop.header
+        start, end = f"{header.label}.vec", f"{header.label}.vend"
+        code = [IRInstr("label", None, None, start)]
+        i = self.emit(code, "load", iv.var)
+        self.emit(code, "if_false", self.emit(code, "lt", i, self.emit(code, "const", limit)), None, end)
+        names = {}      # temp of the loop -> temp of the vector loop
+
+        def scalar(temp):
+            return names.get(temp, temp)
+
+        def vector(temp):
+            if kinds.get(temp) == "vector":
+                return names[temp]
+            return self.emit(code, "vsplat", scalar(temp))
+
+        def index(temp):
+            offset = offsets[temp]
+            if not offset:
+                return i
+            return self.emit(code, "add", i, self.emit(code, "const", offset))
+
+        for instr in body.instrs:
+            op = instr.op
+            kind = kinds.get(instr.dest)
+            if op in ("label", "goto") or instr is iv.store or kind in ("index", "step"):
+                continue
+            if op == "const":
+                names[instr.dest] = self.emit(code, "const", instr.arg1)
+            elif op == "load":
+                names[instr.dest] = self.emit(code, "load", instr.arg1)
+            elif op == "load_idx":
+                names[instr.dest] = self.emit(code, "vload", instr.arg1, index(instr.arg2))
+            elif op == "store_idx":
+                self.emit(code, "vstore", index(instr.arg1), vector(instr.arg2), instr.dest)
+            elif kind == "scalar":
+                names[instr.dest] = self.emit(code, op, scalar(instr.arg1), scalar(instr.arg2))
+            else:
+                names[instr.dest] = self.emit(code, VECTOR_OP[op], vector(instr.arg1), vector(instr.arg2))
+        step = self.emit(code, "add", self.emit(code, "load", iv.var),
+                         self.emit(code, "const", IRInstr.VECTOR_WIDTH))
+        self.emit(code, "store", iv.var, step)
+        self.emit(code, "goto", None, None, start)
+        code.append(IRInstr("label", None, None, end))
+        self.preheaders[header.index].extend(code)
+        return True
@@ -0,0 +1,207 @@
+from collections import deque
+from intermediate_representation.ir_instruction import IRInstr
+
+class Lattice:
+    """
+    Lattice element that is not a constant: TOP (no value seen yet) or
+    BOTTOM (not a compile-time constant). Constants are plain ints.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+TOP = Lattice("TOP")
+BOTTOM = Lattice("BOTTOM")
+
+INT64_MIN = -2**63
+
+
+def is_constant(value):
+    return value is not TOP and value is not BOTTOM
+
+
+def meet(a, b):
+    if a is TOP:
+        return b
+    if b is TOP or a == b:
+        return a
+    return BOTTOM
+
+
+def wrap(value):
+    """
+    Two's complement int64 wrap-around, like the 64 bit registers.
+    """
+    return (value - INT64_MIN) % 2**64 + INT64_MIN
+
+
+def divide(a, b):
+    """
+    idiv semantics: quotient truncated toward zero. None when idiv would
+    trap (division by zero, INT64_MIN / -1), that is left to run time.
+    """
+    if b == 0 or (a == INT64_MIN and b == -1):
+        return None
+    quotient = abs(a) // abs(b)
+    return -quotient if (a < 0) != (b < 0) else quotient
+
+
+FOLD = {
+    "add": lambda a, b: wrap(a + b),
+    "sub": lambda a, b: wrap(a - b),
+    "mul": lambda a, b: wrap(a * b),
+    "div": divide,
+    "eq":  lambda a, b: int(a == b),
+    "neq": lambda a, b: int(a != b),
+    "lt":  lambda a, b: int(a < b),
+    "gt":  lambda a, b: int(a > b),
+    "leq": lambda a, b: int(a <= b),
+    "geq": lambda a, b: int(a >= b),
+}
+
+
+class ConstantPropagation:
+    """
+    Sparse conditional constant propagation over a ControlFlowGraph.
+    Temps are written by a single instruction and get one lattice value
+    each. Variables are memory cells written by `store`, so every block
+    carries the value of each variable at its end; a variable missing
+    from a state is BOTTOM, variables are unknown at entry (REPL session).
+    Only edges found executable are followed, so a branch on a constant
+    keeps the blocks behind the other edge from ever being visited.
+    Array elements are not tracked, a bounds check of a constant index
+    in range goes away.
+    """
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.values = {}        # temp -> lattice value, missing = TOP
+        self.block_out = {}     # executable block index -> {variable: value}
+        self.edges = set()      # executable (from, to) block index pairs
+        self.users = {}         # temp -> blocks reading it
+        for block in cfg.blocks:
+            for instr in block.instrs:
+                for name in instr.reads():
+                    self.users.setdefault(name, set()).add(block)
+
+    def value(self, name):
+        return self.values.get(name, TOP)
+
+    def block_in(self, block):
+        if block is self.cfg.entry:
+            return {}
+        states = [self.block_out[pred.index] for pred in block.preds
+                  if (pred.index, block.index) in self.edges]
+        state = dict(states[0])
+        for other in states[1:]:
+            for name, value in list(state.items()):
+                merged = meet(value, other[name]) if name in other else BOTTOM
+                if merged is BOTTOM:
+                    del state[name]
+                else:
+                    state[name] = merged
+        return state
+
+    def evaluate(self, instr, state):
+        """
+        Value written by a VALUE_OPS instruction or a call.
+        """
+        if instr.op == "call" or instr.op == "addr" or instr.op == "load_idx":
+            return BOTTOM
+        if instr.op == "const":
+            return wrap(instr.arg1)
+        if instr.op == "load":
+            return state.get(instr.arg1, BOTTOM)
+        a, b = self.value(instr.arg1), self.value(instr.arg2)
+        if a is BOTTOM or b is BOTTOM:
+            return BOTTOM
+        if a is TOP or b is TOP:
+            return TOP
+        result = FOLD[instr.op](a, b)
+        return BOTTOM if result is None else result
+
+    def successors(self, block):
+        """
+        Successors reached from `block` given what is known so far.
+        """
+        last = block.terminator()
+        if last is None or last.op == "goto":
+            return block.succs
+        condition = self.value(last.arg1)
+        if condition is TOP:
+            return []
+        if condition is BOTTOM:
+            return block.succs
+        taken = (condition != 0) == (last.op == "if")
+        if taken:
+            return [self.cfg.label_to_block[last.dest]]
+        if block.index + 1 < len(self.cfg.blocks):
+            return [self.cfg.blocks[block.index + 1]]
+        return []
+
+    def solve(self):
+        entry = self.cfg.entry
+        worklist = deque([entry])
+        queued = {entry.index}
+        while worklist:
+            block = worklist.popleft()
+            queued.discard(block.index)
+            state = self.block_in(block)
+            for instr in block.instrs:
+                if instr.op in IRInstr.VALUE_OPS or instr.op == "call" and instr.arg2 is not None:
+                    old = self.value(instr.dest)
+                    new = meet(old, self.evaluate(instr, state))
+                    if new is not old and new != old:
+                        self.values[instr.dest] = new
+                        for user in self.users.get(instr.dest, ()):
+                            if user is not block and user.index in self.block_out \
+                                    and user.index not in queued:
+                                queued.add(user.index)
+                                worklist.append(user)
+                elif instr.op == "store":
+                    value = self.value(instr.arg2)
+                    if value is BOTTOM:
+                        state.pop(instr.arg1, None)
+                    else:
+                        state[instr.arg1] = value
+                elif instr.op == "store_str":
+                    state.pop(instr.arg1, None)
+            changed = self.block_out.get(block.index) != state
+            self.block_out[block.index] = state
+            for succ in self.successors(block):
+                edge = (block.index, succ.index)
+                if (changed or edge not in self.edges) and succ.index not in queued:
+                    queued.add(succ.index)
+                    worklist.append(succ)
+                self.edges.add(edge)
+        return self
+
+    def rewrite(self):
+        """
+        Drop unreachable blocks, turn constant temps into `const` and
+        branches on constants into a goto or nothing. Returns the new IR.
+        """
+        for block in self.cfg.blocks:
+            if block.index not in self.block_out:
+                block.instrs = []
+                continue
+            kept = []
+            for instr in block.instrs:
+                if instr.op in IRInstr.VALUE_OPS:
+                    value = self.value(instr.dest)
+                    if is_constant(value) and not (instr.op == "const" and instr.arg1 == value):
+                        instr = IRInstr("const", value, None, instr.dest)
+                elif instr.op in ("if", "if_false"):
+                    condition = self.value(instr.arg1)
+                    if is_constant(condition):
+                        if (condition != 0) != (instr.op == "if"):
+                            continue
+                        instr = IRInstr("goto", None, None, instr.dest)
+                elif instr.op == "check":
+                    index = self.value(instr.arg1)
+                    if is_constant(index) and 0 <= index < instr.arg2:
+                        continue
+                kept.append(instr)
+            block.instrs = kept
+        return self.cfg.flatten()
@@ -0,0 +1,308 @@
+from intermediate_representation.ir_instruction import IRInstr
+from intermediate_representation.cfg import ControlFlowGraph, Dominance
+from intermediate_representation.dataflow import Liveness
+from intermediate_representation.value_numbering import ScopedTable
+
+ENTRY_LABEL = "ssa_entry"
+
+
+def promotable_variables(ir_list):
+    """
+    Int variables the IR only reaches through load and store. String
+    variables are stored with store_str, printed by name and copied by
+    loading them into a store_str, they stay in memory.
+    """
+    names, strings, loaded = set(), set(), {}
+    for instr in ir_list:
+        op = instr.op
+        if op == "store":
+            names.add(instr.arg1)
+        elif op == "load":
+            names.add(instr.arg1)
+            loaded[instr.dest] = instr.arg1
+        elif op == "store_str":
+            strings.add(instr.arg1)
+            if instr.arg2 in loaded:
+                strings.add(loaded[instr.arg2])
+        elif op == "param":
+            strings.add(instr.arg1)
+    return names - strings
+
+
+class SSABuilder:
+    """
+    Pruned SSA form of the IR with its int variables promoted to temps
+    (mem2reg). A phi for a variable is placed on the iterated dominance
+    frontier of the blocks storing it, where the variable is live. The
+    renaming walk over the dominator tree then drops every load and
+    store of a promoted variable: a load's temp is replaced by the value
+    the variable holds there, a store makes its value the current one.
+
+    Memory is only touched where a value crosses the code: a variable
+    read before any store on some path is loaded once at the entry, and
+    one in `live_out` (REPL session) is stored once at the end.
+    """
+    def __init__(self, ir_list, live_out=()):
+        self.promoted = promotable_variables(ir_list)
+        self.live_out = live_out
+        self.cfg = self.reachable_graph([IRInstr("label", None, None, ENTRY_LABEL)] + ir_list)
+        self.dominance = Dominance(self.cfg.immediate_dominators())
+        self.phis = [[] for _ in self.cfg.blocks]   # block index -> [(variable, phi)]
+        self.replace = {}                           # temp of a removed load -> value
+        self.next_temp = max((int(instr.dest[1:]) for instr in ir_list
+                              if instr.dest and instr.dest[:1] == "t" and instr.dest[1:].isdigit()),
+                             default=0)
+
+    @staticmethod
+    def reachable_graph(ir_list):
+        """
+        CFG without the blocks no path reaches, those have no SSA names.
+        A reachable block falls through into a reachable one, so dropping
+        the others keeps the layout valid.
+        """
+        cfg = ControlFlowGraph(ir_list)
+        idom = cfg.immediate_dominators()
+        if all(parent is not None for parent in idom):
+            return cfg
+        return ControlFlowGraph([instr for block in cfg.blocks if idom[block.index] is not None
+                                 for instr in block.instrs])
+
+    def new_temp(self):
+        self.next_temp += 1
+        return f"t{self.next_temp}"
+
+    def build(self):
+        stored = {instr.arg1 for block in self.cfg.blocks for instr in block.instrs
+                  if instr.op == "store" and instr.arg1 in self.promoted}
+        self.exit_stores = sorted(name for name in stored if name in self.live_out)
+        liveness = Liveness(self.cfg, exit_live=set(self.exit_stores)).solve()
+        entry = self.cfg.entry
+        # read before any store on some path, or never stored (liveness
+        # only tracks written names): one load at the entry
+        needed = liveness.live_in(entry) & self.promoted | self.promoted - stored
+        self.entry_loads = {name: IRInstr("load", name, None, self.new_temp()) for name in sorted(needed)}
+        entry.instrs[1:1] = self.entry_loads.values()
+        self.place_phis(liveness)
+        self.rename()
+        return self
+
+    ### Phi placement ###
+    def dominance_frontiers(self):
+        idom = self.dominance.idom
+        frontiers = [set() for _ in self.cfg.blocks]
+        for block in self.cfg.blocks:
+            if len(block.preds) < 2:
+                continue
+            for pred in block.preds:
+                runner = pred.index
+                while runner != idom[block.index]:
+                    frontiers[runner].add(block.index)
+                    runner = idom[runner]
+        return frontiers
+
+    def place_phis(self, liveness):
+        frontiers = self.dominance_frontiers()
+        def_blocks = {name: {self.cfg.entry.index} for name in self.entry_loads}
+        for block in self.cfg.blocks:
+            for instr in block.instrs:
+                if instr.op == "store" and instr.arg1 in self.promoted:
+                    def_blocks.setdefault(instr.arg1, set()).add(block.index)
+        for name in sorted(def_blocks):
+            bit = liveness.index.get(name)
+            if bit is None:
+                continue
+            has_phi = set()
+            work = list(def_blocks[name])
+            while work:
+                for index in frontiers[work.pop()]:
+                    # pruned: no phi where the variable is dead
+                    if index in has_phi or not liveness.block_in[index] >> bit & 1:
+                        continue
+                    has_phi.add(index)
+                    self.phis[index].append((name, IRInstr("phi", {}, None, self.new_temp())))
+                    work.append(index)
+
+    ### Renaming ###
+    def rename(self):
+        current = ScopedTable()     # variable -> name holding its value
+        children = [[] for _ in self.cfg.blocks]
+        for index, parent in enumerate(self.dominance.idom):
+            if parent != index:
+                children[parent].append(self.cfg.blocks[index])
+        last = self.cfg.blocks[-1]
+        stack = [(self.cfg.entry, None)]
+        while stack:
+            block, mark = stack.pop()
+            if mark is not None:
+                current.undo(mark)
+                continue
+            stack.append((block, current.mark()))
+            for name, phi in self.phis[block.index]:
+                current.set(name, phi.dest)
+            self.rename_block(block, current)
+            if block is last:
+                # the code ends by falling off its last block
+                block.instrs.extend(IRInstr("store", name, current.get(name)) for name in self.exit_stores)
+            for succ in block.succs:
+                for name, phi in self.phis[succ.index]:
+                    phi.arg1[block.index] = current.get(name)
+            stack.extend((child, None) for child in reversed(children[block.index]))
+
+    def rename_block(self, block, current):
+        kept = []
+        for instr in block.instrs:
+            instr = self.renamed(instr)
+            op = instr.op
+            if op == "load" and instr.arg1 in self.promoted:
+                if self.entry_loads.get(instr.arg1) is instr:
+                    current.set(instr.arg1, instr.dest)
+                    kept.append(instr)
+                else:
+                    self.replace[instr.dest] = current.get(instr.arg1)
+                continue
+            if op == "store" and instr.arg1 in self.promoted:
+                current.set(instr.arg1, instr.arg2)
+                continue
+            kept.append(instr)
+        block.instrs = kept
+
+    def renamed(self, instr):
+        replace = self.replace
+        op = instr.op
+        if op in IRInstr.BINARY_OPS:
+            if instr.arg1 in replace or instr.arg2 in replace:
+                return IRInstr(op, replace.get(instr.arg1, instr.arg1),
+                               replace.get(instr.arg2, instr.arg2), instr.dest)
+        elif op == "store":
+            if instr.arg2 in replace:
+                return IRInstr(op, instr.arg1, replace[instr.arg2], instr.dest)
+        elif op in ("if", "if_false", "param", "copy", "return", "check", "vsplat"):
+            if instr.arg1 in replace:
+                return IRInstr(op, replace[instr.arg1], instr.arg2, instr.dest)
+        elif op in ("load_idx", "vload"):
+            if instr.arg2 in replace:
+                return IRInstr(op, instr.arg1, replace[instr.arg2], instr.dest)
+        elif op in ("store_idx", "vstore") or op in IRInstr.VECTOR_BINARY_OPS:
+            if instr.arg1 in replace or instr.arg2 in replace:
+                return IRInstr(op, replace.get(instr.arg1, instr.arg1),
+                               replace.get(instr.arg2, instr.arg2), instr.dest)
+        return instr
+
+    def blocks(self):
+        """
+        The SSA form, block by block: (block, [phi]).
+        """
+        return [(block, [phi for _, phi in self.phis[block.index]]) for block in self.cfg.blocks]
+
+    def destruct(self):
+        return SSADestructor(self).run()
+
+
+class SSADestructor:
+    """
+    Leaves SSA form before code generation: a phi becomes one copy per
+    predecessor, at the end of the predecessor. The copies of an edge
+    happen at once, so they are ordered to read every name before it is
+    overwritten, through a new temp for a cycle (a swap).
+
+    On an edge from a block with another successor the copies run on
+    both paths. That is harmless unless the phi's block dominates the
+    other successor, where its temps may be read: such an edge gets a
+    block of its own. It is placed right after the predecessor, so the
+    linear order the register allocator sees keeps every read after the
+    write (a split block before a loop header would read a value of the
+    loop ahead of the code writing it).
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        self.cfg = builder.cfg
+        self.fall_splits = {}   # block index -> copies on the edge to the next block
+        self.jump_splits = {}   # block index -> copies on the edge its branch takes
+        self.labels = {}        # block index -> label it needs as a branch target
+        self.split_count = 0
+
+    def run(self):
+        for block, phis in self.builder.blocks():
+            if not phis:
+                continue
+            for pred in block.preds:
+                copies = self.sequence([(phi.dest, phi.arg1[pred.index]) for phi in phis])
+                if not self.is_shared(pred, block):
+                    self.insert_at_end(pred, copies)
+                elif pred.terminator().dest == block.label:
+                    self.jump_splits[pred.index] = copies
+                else:
+                    self.fall_splits[pred.index] = copies
+        ir = []
+        for block in self.cfg.blocks:
+            if block.index in self.labels:
+                ir.append(IRInstr("label", None, None, self.labels[block.index]))
+            ir.extend(instr for instr in block.instrs if instr.dest != ENTRY_LABEL or instr.op != "label")
+            if block.index in self.fall_splits or block.index in self.jump_splits:
+                self.split(block, ir)
+        return ir
+
+    def new_label(self):
+        self.split_count += 1
+        return f"split{self.split_count}"
+
+    def label_of(self, block):
+        if block.label is not None:
+            return block.label
+        return self.labels.setdefault(block.index, self.new_label())
+
+    def split(self, pred, ir):
+        """
+        Emit the split blocks of `pred`'s edges after its code (ending `ir`).
+        """
+        branch = ir[-1]
+        after = self.label_of(self.cfg.blocks[pred.index + 1])
+        fall, jump = self.fall_splits.get(pred.index), self.jump_splits.get(pred.index)
+        if fall is None:
+            # branch to the next block instead, the copies follow the branch
+            ir[-1] = IRInstr("if_false" if branch.op == "if" else "if", branch.arg1, None, after)
+            ir.extend(jump + [IRInstr("goto", None, None, branch.dest)])
+            return
+        ir.extend(fall + [IRInstr("goto", None, None, after)])
+        if jump is not None:
+            label = self.new_label()
+            ir[-len(fall) - 2] = IRInstr(branch.op, branch.arg1, None, label)
+            ir.extend([IRInstr("label", None, None, label)] + jump + [IRInstr("goto", None, None, branch.dest)])
+
+    def is_shared(self, pred, block):
+        dominates = self.builder.dominance.dominates
+        return len(pred.succs) > 1 and (dominates(block.index, pred.index) or any(
+            succ is not block and dominates(block.index, succ.index) for succ in pred.succs))
+
+    def sequence(self, copies):
+        """
+        Parallel copies [(dest, source)] as a list of copy instructions.
+        """
+        pending = [(dest, source) for dest, source in copies if dest != source]
+        code = []
+        while pending:
+            sources = {source for _, source in pending}
+            ready = [(dest, source) for dest, source in pending if dest not in sources]
+            if not ready:
+                # a cycle: save one destination and read the saved value instead
+                dest = pending[0][0]
+                saved = self.builder.new_temp()
+                code.append(IRInstr("copy", dest, None, saved))
+                pending = [(d, saved if s == dest else s) for d, s in pending]
+                continue
+            for dest, source in ready:
+                code.append(IRInstr("copy", source, None, dest))
+            pending = [copy for copy in pending if copy not in ready]
+        return code
+
+    def insert_at_end(self, pred, copies):
+        last = pred.terminator()
+        if last is None:
+            pred.instrs.extend(copies)
+            return
+        if last.op != "goto" and last.arg1 in {copy.dest for copy in copies}:
+            # the branch reads its condition after the copies
+            saved = self.builder.new_temp()
+            copies.insert(0, IRInstr("copy", last.arg1, None, saved))
+            last = IRInstr(last.op, saved, None, last.dest)
+        pred.instrs[-1:] = copies + [last]
@@ -0,0 +1,209 @@
+from intermediate_representation.ir_instruction import IRInstr
+
+MISSING = object()
+
+class ScopedTable:
+    """
+    Dict whose changes can be undone back to a mark, one scope per
+    dominator tree node.
+    """
+    def __init__(self):
+        self.table = {}
+        self.log = []       # (key, previous value or MISSING)
+
+    def get(self, key):
+        return self.table.get(key)
+
+    def set(self, key, value):
+        self.log.append((key, self.table.get(key, MISSING)))
+        self.table[key] = value
+
+    def discard(self, key):
+        if key in self.table:
+            self.log.append((key, self.table.pop(key)))
+
+    def mark(self):
+        return len(self.log)
+
+    def undo(self, mark):
+        while len(self.log) > mark:
+            key, value = self.log.pop()
+            if value is MISSING:
+                self.table.pop(key, None)
+            else:
+                self.table[key] = value
+
+
+class ValueNumbering:
+    """
+    Dominator-scoped global value numbering over a ControlFlowGraph.
+    Every expression (op, operands) is hash-consed to the first temp that
+    computed it; a later instruction computing the same value in the same
+    block or a dominated one is removed and its temp renamed to the first.
+    A temp is written once, so expressions over temps stay valid in the
+    whole dominator subtree.
+
+    Variables are memory: `var_values` maps a variable to the temp holding
+    its current value, set by a load or a store (store-to-load forwarding).
+    A block whose only predecessor is its immediate dominator inherits it,
+    at a join the variables stored on some path from the dominator are
+    forgotten. Constants are only shared inside a block, a `const` is
+    cheaper to repeat than to keep live in a register.
+
+    An array is memory too: `var_values` maps it to a version, a new one
+    after every store to one of its elements, and an element load is
+    numbered by array, version and index. A store forwards its value to
+    the loads of the same index until the next store. A bounds check
+    dominated by the same check is removed. Vector instructions are only
+    renamed, every vector temp is read once.
+    """
+    COMMUTATIVE = {"add", "mul", "eq", "neq"}
+
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.replace = {}       # removed temp -> temp holding the same value
+        self.constant_of = {}   # const temp -> its value
+        self.stored = [{instr.arg1 for instr in block.instrs if instr.op in ("store", "store_str")}
+                       | {instr.dest for instr in block.instrs if instr.op in ("store_idx", "vstore")}
+                       for block in cfg.blocks]
+        self.versions = 0       # array versions handed out
+
+    def rename(self, name):
+        return self.replace.get(name, name)
+
+    def value_key(self, temp):
+        """
+        Constants are equal by value, whichever temp holds them.
+        """
+        if temp in self.constant_of:
+            return ("const", self.constant_of[temp])
+        return temp
+
+    def stored_between(self, block, idom):
+        """
+        Variables stored on a path from the end of `idom` to the start of `block`.
+        """
+        names = set()
+        seen = {idom}
+        stack = list(block.preds)
+        while stack:
+            current = stack.pop()
+            if current.index in seen:
+                continue
+            seen.add(current.index)
+            names |= self.stored[current.index]
+            stack.extend(pred for pred in current.preds if pred.index not in seen)
+        return names
+
+    def run(self):
+        idom, children = self.cfg.dominator_tree()
+        exprs, var_values = ScopedTable(), ScopedTable()
+        entry = self.cfg.entry
+        stack = [(entry, None)]
+        while stack:
+            block, marks = stack.pop()
+            if marks is not None:
+                exprs.undo(marks[0])
+                var_values.undo(marks[1])
+                continue
+            stack.append((block, (exprs.mark(), var_values.mark())))
+            parent = idom[block.index]
+            if block is not entry and block.preds != [self.cfg.blocks[parent]]:
+                for name in self.stored_between(block, parent):
+                    var_values.discard(name)
+            self.number_block(block, exprs, var_values)
+            stack.extend((child, None) for child in reversed(children[block.index]))
+        # blocks no path reaches keep their code, only renamed
+        for block in self.cfg.blocks:
+            if idom[block.index] is None:
+                block.instrs = [self.renamed(instr) for instr in block.instrs]
+        return self.cfg.flatten()
+
+    def renamed(self, instr):
+        op = instr.op
+        if op in IRInstr.BINARY_OPS:
+            arg1, arg2 = self.rename(instr.arg1), self.rename(instr.arg2)
+            if arg1 != instr.arg1 or arg2 != instr.arg2:
+                return IRInstr(op, arg1, arg2, instr.dest)
+        elif op == "store":
+            arg2 = self.rename(instr.arg2)
+            if arg2 != instr.arg2:
+                return IRInstr(op, instr.arg1, arg2, instr.dest)
+        elif op in ("if", "if_false", "param", "return", "check", "vsplat"):
+            arg1 = self.rename(instr.arg1)
+            if arg1 != instr.arg1:
+                return IRInstr(op, arg1, instr.arg2, instr.dest)
+        elif op in ("load_idx", "vload"):
+            arg2 = self.rename(instr.arg2)
+            if arg2 != instr.arg2:
+                return IRInstr(op, instr.arg1, arg2, instr.dest)
+        elif op in ("store_idx", "vstore") or op in IRInstr.VECTOR_BINARY_OPS:
+            arg1, arg2 = self.rename(instr.arg1), self.rename(instr.arg2)
+            if arg1 != instr.arg1 or arg2 != instr.arg2:
+                return IRInstr(op, arg1, arg2, instr.dest)
+        return instr
+
+    def version(self, array, var_values, new=False):
+        """
+        Current version of `array`'s elements, a new one with `new` set
+        or when no version is known here.
+        """
+        version = None if new else var_values.get(array)
+        if version is None:
+            self.versions += 1
+            version = self.versions
+            var_values.set(array, version)
+        return version
+
+    def number_block(self, block, exprs, var_values):
+        constants = {}      # value -> temp, this block only
+        kept = []
+        for instr in block.instrs:
+            instr = self.renamed(instr)
+            op = instr.op
+            if op == "const":
+                first = constants.get(instr.arg1)
+                if first is not None:
+                    self.replace[instr.dest] = first
+                    continue
+                constants[instr.arg1] = instr.dest
+                self.constant_of[instr.dest] = instr.arg1
+            elif op == "load":
+                first = var_values.get(instr.arg1)
+                if first is not None:
+                    self.replace[instr.dest] = first
+                    continue
+                var_values.set(instr.arg1, instr.dest)
+            elif op in IRInstr.BINARY_OPS:
+                a, b = self.value_key(instr.arg1), self.value_key(instr.arg2)
+                if op in self.COMMUTATIVE and str(b) < str(a):
+                    a, b = b, a
+                key = (op, a, b)
+                first = exprs.get(key)
+                if first is not None:
+                    self.replace[instr.dest] = first
+                    continue
+                exprs.set(key, instr.dest)
+            elif op == "store":
+                var_values.set(instr.arg1, instr.arg2)
+            elif op == "store_str":
+                var_values.discard(instr.arg1)
+            elif op == "load_idx":
+                key = ("load_idx", instr.arg1, self.version(instr.arg1, var_values), self.value_key(instr.arg2))
+                first = var_values.get(key)
+                if first is not None:
+                    self.replace[instr.dest] = first
+                    continue
+                var_values.set(key, instr.dest)
+            elif op == "store_idx":
+                version = self.version(instr.dest, var_values, new=True)
+                var_values.set(("load_idx", instr.dest, version, self.value_key(instr.arg1)), instr.arg2)
+            elif op == "vstore":
+                self.version(instr.dest, var_values, new=True)
+            elif op == "check":
+                key = ("check", self.value_key(instr.arg1), instr.arg2)
+                if exprs.get(key) is not None:
+                    continue
+                exprs.set(key, True)
+            kept.append(instr)
+        block.instrs = kept
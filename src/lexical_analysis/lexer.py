@@ -1,40 +1,143 @@
 import re
+import mmap
 from lexical_analysis.token_specification import TokenSpecification
-from lexical_analysis.token import Token
+from lexical_analysis.token import Token, KINDS, KIND_CODES
+from lexical_analysis.token_array import TokenArray
+from lexical_analysis.source_positions import SourcePositions
+
+# compiled once, the bytes version scans memory-mapped files; the groups are
+# in the order of KINDS, so a match's kind code is its lastindex - 1
+MASTER_SOURCE = "|".join(f"(?P<{name}>{pat})" for name, pat in TokenSpecification.spec)
+MASTER_PATTERN = re.compile(MASTER_SOURCE)
+MASTER_PATTERN_BYTES = re.compile(MASTER_SOURCE.encode())
+
+# The fast scanner's pattern skips whitespace and comments in front of a
+# token and matches the token in one of these groups. Identifiers and
+# operators are matched generically and looked up in the keyword and
+# punctuation tables, anything else is a mismatch.
+SPEC = dict(TokenSpecification.spec)
+OPERATORS = sorted(TokenSpecification.punctuation, key=len, reverse=True)
+IDENT_GROUP, NUMBER_GROUP, STRING_GROUP, PUNCTUATION_GROUP = 1, 2, 3, 4
+FAST_SOURCE = (f"(?:{SPEC['SKIP']}|{SPEC['NEWLINE']}|{SPEC['COMMENT']})*"
+               f"(?:({SPEC['IDENT']})|({SPEC['NUMBER']})|({SPEC['STRING_LITERAL']})"
+               f"|({'|'.join(map(re.escape, OPERATORS))})|({SPEC['MISMATCH']}))?")
+FAST_PATTERN = re.compile(FAST_SOURCE)
+FAST_PATTERN_BYTES = re.compile(FAST_SOURCE.encode())
+KEYWORD_CODES = {text: KIND_CODES[kind] for text, kind in TokenSpecification.keywords.items()}
+PUNCTUATION_CODES = {text: KIND_CODES[kind] for text, kind in TokenSpecification.punctuation.items()}
+IDENT, NUMBER, STRING_LITERAL, EOF = (KIND_CODES[kind] for kind in ("IDENT", "NUMBER", "STRING_LITERAL", "EOF"))
 
 class Lexer():
-    def __init__(self, src: str):
-       self.src = src
-       self.tokens = []
+    SCANNERS = ("fast", "regex")
+
+    def __init__(self, src, scanner="fast"):
+       if scanner not in self.SCANNERS:
+           raise ValueError(f"Unknown scanner: {scanner}")
+       self.src = src   # str, or bytes-like (bytes, mmap) in UTF-8
+       self.scanner = scanner
+       self.positions = SourcePositions(src)
+       self.tokens = TokenArray()
+       self.file = None
+
+    @classmethod
+    def from_file(cls, path, scanner="fast"):
+        """
+        Lexer over a memory-mapped source file, nothing is read up front.
+        """
+        file = open(path, "rb")
+        try:
+            src = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            src = b""   # empty files cannot be mapped
+        lexer = cls(src, scanner)
+        lexer.file = file
+        return lexer
+
+    def close(self):
+        """
+        Close the source file. The mapping itself goes away with the last
+        token referring to it, tokens read their line and column from it.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def tokenize(self):
-        master_pattern = re.compile(
-            "|".join(f"(?P<{name}>{pat})" for name, pat in TokenSpecification.spec)
-            )
-        
-        line = 1
-        col = 1
-        for match in re.finditer(master_pattern, self.src):
+        self.tokens.extend(self.stream())
+        return self.tokens
+
+    def stream(self):
+        """
+        Yield tokens lazily, ending with EOF.
+        """
+        if self.scanner == "fast":
+            yield from self.scan_fast()
+        else:
+            yield from self.scan_regex()
+        yield Token("EOF", "", len(self.src), self.positions, EOF)
+
+    def scan_fast(self):
+        """
+        One match per token: whitespace and comments are skipped by the
+        pattern, keywords are identifiers found in KEYWORD_CODES.
+        """
+        decode = not isinstance(self.src, str)
+        pattern = FAST_PATTERN_BYTES if decode else FAST_PATTERN
+        positions = self.positions
+        keyword = KEYWORD_CODES.get
+        texts = {}  # bytes -> decoded text, shared by repeated tokens
+        for match in pattern.finditer(self.src):
+            group = match.lastindex
+            if group is None:
+                break   # only whitespace and comments were left
+            text = match.group(group)
+            if decode:
+                if group == STRING_GROUP:
+                    text = text.decode("utf-8", "replace")
+                else:
+                    raw, text = text, texts.get(text)
+                    if text is None:
+                        text = texts[raw] = raw.decode("utf-8", "replace")
+            if group == IDENT_GROUP:
+                code = keyword(text, IDENT)
+            elif group == NUMBER_GROUP:
+                code = NUMBER
+            elif group == STRING_GROUP:
+                code = STRING_LITERAL
+            elif group == PUNCTUATION_GROUP:
+                code = PUNCTUATION_CODES[text]
+            else:
+                self.mismatch(text, match.start(group))
+            yield Token(KINDS[code], text, match.start(group), positions, code)
+
+    def scan_regex(self):
+        """
+        Try the patterns of TokenSpecification.spec in order at every position.
+        """
+        if isinstance(self.src, str):
+            matches = MASTER_PATTERN.finditer(self.src)
+            decode = False
+        else:
+            matches = MASTER_PATTERN_BYTES.finditer(self.src)
+            decode = True
+
+        for match in matches:
             kind = match.lastgroup # matched group
-            value = match.group() # value captured
-            if kind == "NEWLINE":
-                line += 1
-                col = 1
-                continue
-            if kind == "COMMENT":
-                col = 1
-                line += 1
-                continue
-            if kind == "SKIP":
-                col += len(value)
-                line += value.count("\n")
+            if kind == "SKIP" or kind == "NEWLINE" or kind == "COMMENT":
                 continue
+            value = match.group() # value captured
+            if decode:
+                value = value.decode("utf-8", "replace")
             if kind == "MISMATCH":
-                raise RuntimeError(f"Nieczekiwany {value!r} na {line}:{col}")
-            
-            tok = Token(kind, value, line, col)
-            self.tokens.append(tok)
-            col += len(value)
+                self.mismatch(value, match.start())
+            yield Token(kind, value, match.start(), self.positions, match.lastindex - 1)
 
-        self.tokens.append(Token("EOF", "", line, col))
-        return self.tokens
+    def mismatch(self, value, offset):
+        line, col = self.positions.line(offset), self.positions.col(offset)
+        raise RuntimeError(f"Nieczekiwany {value!r} na {line}:{col}")
@@ -0,0 +1,36 @@
+from bisect import bisect_right
+
+class SourcePositions:
+    """
+    Line and column of an offset in a source. Tokens only record their
+    offset; the line starts are found the first time a position is asked
+    for, which normally only happens for an error or debug output.
+    Offsets into a bytes-like source are byte offsets, columns count
+    characters either way.
+    """
+    __slots__ = ("src", "starts")
+
+    def __init__(self, src):
+        self.src = src      # str, or bytes-like in UTF-8
+        self.starts = None  # offset at which every line starts
+
+    def line_starts(self):
+        if self.starts is None:
+            newline = "\n" if isinstance(self.src, str) else b"\n"
+            starts = [0]
+            position = self.src.find(newline)
+            while position != -1:
+                starts.append(position + 1)
+                position = self.src.find(newline, position + 1)
+            self.starts = starts
+        return self.starts
+
+    def line(self, offset):
+        return bisect_right(self.line_starts(), offset)
+
+    def col(self, offset):
+        start = self.line_starts()[self.line(offset) - 1]
+        text = self.src[start:offset]
+        if not isinstance(text, str):
+            text = text.decode("utf-8", "replace")
+        return len(text) + 1
@@ -1,8 +1,25 @@
+from lexical_analysis.token_specification import TokenSpecification
+
+KINDS = [name for name, _ in TokenSpecification.spec] + ["EOF"]
+KIND_CODES = {kind: code for code, kind in enumerate(KINDS)}
+
 class Token:
-    def __init__(self, kind: str, text: str, line: int, col: int):
+    __slots__ = ("kind", "text", "offset", "positions", "code")
+
+    def __init__(self, kind: str, text: str, offset: int, positions, code: int = None):
         self.kind = kind    # ex. "NUMBER", "PRINT", "ADD"
         self.text = text
-        self.line = line
-        self.col  = col
+        self.offset = offset        # in the source
+        self.positions = positions  # SourcePositions of the source
+        self.code = KIND_CODES[kind] if code is None else code  # index of kind in KINDS
+
+    @property
+    def line(self):
+        return self.positions.line(self.offset)
+
+    @property
+    def col(self):
+        return self.positions.col(self.offset)
+
     def __repr__(self):
         return f"{self.kind}({self.text!r})@{self.line}:{self.col}"
\ No newline at end of file
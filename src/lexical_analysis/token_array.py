@@ -0,0 +1,46 @@
+import sys
+from array import array
+from lexical_analysis.token import Token, KINDS, KIND_CODES
+
+class TokenArray:
+    """
+    Compact token stream stored as struct-of-arrays: parallel array('q')
+    columns for kind code and source offset, plus a list of interned texts.
+    Tokens are materialized only when indexed or iterated. The tokens are
+    from one source, their line and column come from its SourcePositions.
+    """
+    __slots__ = ("kinds", "offsets", "texts", "positions")
+
+    def __init__(self, tokens=()):
+        self.kinds   = array('q')
+        self.offsets = array('q')
+        self.texts   = []
+        self.positions = None
+        self.extend(tokens)
+
+    def append(self, token):
+        self.kinds.append(token.code)
+        self.offsets.append(token.offset)
+        self.texts.append(sys.intern(token.text))
+        self.positions = token.positions
+
+    def extend(self, tokens):
+        for token in tokens:
+            self.append(token)
+
+    def kind(self, i):
+        return KINDS[self.kinds[i]]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        return Token(KINDS[self.kinds[i]], self.texts[i], self.offsets[i], self.positions, self.kinds[i])
+
+    def __iter__(self):
+        positions = self.positions
+        for code, text, offset in zip(self.kinds, self.texts, self.offsets):
+            yield Token(KINDS[code], text, offset, positions, code)
+
+    def __repr__(self):
+        return f"TokenArray({len(self)} tokens)"
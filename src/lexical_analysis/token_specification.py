@@ -9,6 +9,7 @@ class TokenSpecification():
         ("IF",    r"if\b"),
         ("ELSE",  r"else\b"),
         ("WHILE", r"while\b"),
+        ("RETURN", r"return\b"),
 
         # IDENTIFIERS
         ("IDENT", r"[a-zA-Z_][a-zA-Z0-9_]*"), # variable names, function names, etc
@@ -28,12 +29,15 @@ class TokenSpecification():
         #PUNCTUATION
         ("SEMI", r";"),
         ("ASSIGN", r"="),
+        ("COMMA", r","),
 
         #BRACETS
         ("LPAREN", r"\("),
         ("RPAREN", r"\)"),
         ("LBRACE", r"\{"),
         ("RBRACE", r"\}"),
+        ("LBRACKET", r"\["),
+        ("RBRACKET", r"\]"),
 
         #MATH OPERATORS
         ("ADD", r"\+"),
@@ -47,4 +51,15 @@ class TokenSpecification():
         ("SKIP", r"[ \t]+"), #skip tabs, whitespace
         ("MISMATCH", r"."), #other - error catch (needs to be last)
 
-        ]
\ No newline at end of file
+        ]
+
+    # The scanner matches identifiers and operators generically, then looks
+    # them up here instead of trying every pattern above at each position.
+    # Every entry matches the pattern of its kind.
+    keywords = {"print": "PRINT", "int": "INT", "str": "STRING",
+                "if": "IF", "else": "ELSE", "while": "WHILE", "return": "RETURN"}
+    punctuation = {"==": "EQ", "!=": "NEQ", "<=": "LEQ", ">=": "GEQ", "<": "LT", ">": "GT",
+                   ";": "SEMI", "=": "ASSIGN", ",": "COMMA",
+                   "(": "LPAREN", ")": "RPAREN", "{": "LBRACE", "}": "RBRACE",
+                   "[": "LBRACKET", "]": "RBRACKET",
+                   "+": "ADD", "-": "SUB", "*": "MUL", "/": "DIV"}
@@ -1,16 +1,18 @@
 import subprocess
 import argparse
-from code_generator.asm_generator import AsmGenerator
-from lexical_analysis.lexer import Lexer
-from syntax_analysis.parser import Parser
-from semantic_analysis.semantic_analyzer import SemanticAnalyzer
-from intermediate_representation.ir_generator import IRGenerator
+import sys
+from build import compile_file, toolchain, build_outputs, assemble_and_link, build_batch, build_program
+from build_cache import BuildCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_SIZE
+from repl_session import ReplSession
+from pass_stats import CompileStats, NO_STATS
 from intermediate_representation.ir_optimizer import IROptimizer
+from intermediate_representation.ir_interpreter import IRInterpreter
+from intermediate_representation.ir_function import called_functions
 
 
 def main():
     parser = argparse.ArgumentParser(description="Simple Compiler to assembly code")
-    parser.add_argument("source", nargs="?", help="Input source file")
+    parser.add_argument("source", nargs="*", help="Input source file(s), several files are built as a batch")
     parser.add_argument("--spec", action="store_true", help="Print language specification")
     parser.add_argument("--lex", action="store_true", help="Print lexical analysis")
     parser.add_argument("--par", action="store_true", help="Print syntax analysis")
@@ -19,76 +21,186 @@ def main():
     parser.add_argument("--asm", action="store_true", help="Print assembly code")
     parser.add_argument("--all", action="store_true", help="Print all stages and run the program")
     parser.add_argument("--run", action="store_true", help="Compile and run the program")
+    parser.add_argument("--interp", action="store_true",
+                        help="Run the optimized IR in-process instead of building an executable")
+    parser.add_argument("--no-cache", action="store_true", help="Always rebuild, bypass the build cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Build cache directory")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // 2**20,
+                        help="Build cache size limit in MiB (least recently used builds are evicted)")
+    parser.add_argument("--assembler", choices=["builtin", "nasm"], default="builtin",
+                        help="Encode machine code in-process or with nasm")
+    parser.add_argument("--linker", choices=["builtin", "gcc"], default="builtin",
+                        help="Write the executable in-process or link with gcc")
+    parser.add_argument("-O", "--opt-level", type=int, choices=sorted(IROptimizer.OPT_LEVELS),
+                        default=IROptimizer.DEFAULT_OPT_LEVEL, help="Optimization level, 0 turns the IR and peephole optimizers off")
+    parser.add_argument("--printf", action="store_true",
+                        help="Print with printf instead of the buffered output runtime, "
+                             "output isn't lost when the program crashes")
+    parser.add_argument("--link", action="store_true",
+                        help="Compile the sources separately and link them into one program 'a.out'")
+    parser.add_argument("-j", "--jobs", type=int, help="Batch mode: number of parallel compile processes")
+    parser.add_argument("-o", "--out-dir", default="build",
+                        help="Batch mode: output directory, one <name>.asm and executable <name> per input "
+                             "(<name>.asm and <name>.o with --link)")
+    parser.add_argument("--time-passes", action="store_true",
+                        help="Print time, peak memory and item counts of every phase and optimizer pass to stderr")
+    parser.add_argument("--stats-json", metavar="PATH",
+                        help="Write the --time-passes measurements as JSON to PATH ('-' for stdout)")
     args = parser.parse_args()
+    if args.assembler == "nasm" and args.linker == "builtin":
+        parser.error("the builtin linker needs the builtin assembler")
+
+    if args.link:
+        if args.lex or args.par or args.ir or args.iro or args.asm or args.all or args.interp:
+            parser.error("--link only builds, stage printing and --interp need a single source")
+        if not args.source:
+            parser.error("--link needs source files")
+        if args.time_passes or args.stats_json:
+            parser.error("--time-passes and --stats-json measure a single source")
+        cache = None if args.no_cache else BuildCache(args.cache_dir, args.cache_size * 2**20)
+        results = build_program(args.source, "a.out", args.out_dir, args.jobs or 1, args.assembler,
+                                args.linker, cache, opt_level=args.opt_level, printf=args.printf)
+        if any(result.error is not None for result in results):
+            sys.exit(1)
+        if args.run:
+            print()
+            subprocess.run(["./a.out"])
+        return
+
+    if len(args.source) > 1 or args.jobs is not None:
+        if args.lex or args.par or args.ir or args.iro or args.asm or args.all or args.run or args.interp:
+            parser.error("batch mode only builds, stage printing, --run and --interp need a single source")
+        if not args.source:
+            parser.error("batch mode needs source files")
+        if args.time_passes or args.stats_json:
+            parser.error("--time-passes and --stats-json measure a single source")
+        cache = None if args.no_cache else BuildCache(args.cache_dir, args.cache_size * 2**20)
+        results = build_batch(args.source, args.jobs or 1, args.out_dir,
+                              args.assembler, args.linker, cache, opt_level=args.opt_level, printf=args.printf)
+        sys.exit(1 if any(result.error is not None for result in results) else 0)
+    source = args.source[0] if args.source else None
 
     if args.spec:
         with open("docs/language_specification.txt", "r") as spec_file:
             print(spec_file.read())
 
-    if args.source:
-        with open(args.source, 'r') as file:
-            source_code = file.read()
-        
-        tokens = Lexer(source_code).tokenize()
-        ast = Parser(tokens).parse()
-        analyzer = SemanticAnalyzer(ast)
-        analyzer.analyze()
-        ir = IRGenerator(ast).gen()
-        ir_opt = IROptimizer(ir).optimize()
-        asm = AsmGenerator(ir_opt).gen()
+    if source:
+        build = (args.run or args.all) and not args.interp
+        gen_asm = build or args.asm or args.all
+        # intermediate stages only exist when the pipeline actually runs
+        show_stages = args.lex or args.par or args.ir or args.iro or args.all
+        measure = args.time_passes or args.stats_json
+        stats = CompileStats(source) if measure else NO_STATS
+        cache = None
+        if build and not show_stages and not measure and not args.no_cache:
+            cache = BuildCache(args.cache_dir, args.cache_size * 2**20)
+        outputs = build_outputs("out.asm", "out.o", "a.out", args.linker)
+
+        if cache is not None:
+            key = cache.key(source, toolchain(args.assembler, args.linker, args.opt_level, args.printf))
+            if cache.lookup(key, outputs):
+                if args.asm:
+                    with open("out.asm") as asm_file:
+                        print("##### ASM #####")
+                        print(asm_file.read())
+                print("Executable 'a.out' restored from build cache.")
+                print()
+                subprocess.run(["./a.out"])
+                return
+
+        if measure:
+            with stats:
+                stages = compile_file(source, keep_tokens=args.lex or args.all, stats=stats,
+                                      opt_level=args.opt_level, printf=args.printf, gen_asm=gen_asm)
+                if build:
+                    assemble_and_link(stages["asm"], "out.asm", "out.o", "a.out",
+                                      args.assembler, args.linker, stats)
+            report_stats(stats, args.time_passes, args.stats_json)
+        else:
+            stages = compile_file(source, keep_tokens=args.lex or args.all, opt_level=args.opt_level,
+                                  printf=args.printf, gen_asm=gen_asm)
 
         if args.lex or args.all:
             print("##### Tokens #####")
-            for token in tokens:
+            for token in stages["tokens"]:
                 print(token)
         if args.par or args.all:
             print("##### AST #####")
-            print(ast)
+            print(stages["ast"])
         if args.ir or args.all:
             print("##### IR #####")
-            for instruction in ir:
-                print(instruction)
+            print_ir(stages["ir"], {symbol: function.ir_list for symbol, function in stages["functions"].items()})
         if args.iro or args.all:
             print("#####Optimized IR#####")
-            for instruction in ir_opt:
-                print(instruction)
+            functions = called_functions(stages["ir_opt"], stages["functions"])
+            print_ir(stages["ir_opt"], {function.symbol: function.ir_opt for function in functions})
         if args.asm or args.all:
             print("##### ASM #####")
-            print(asm)
-        
-        if args.run or args.all:
-            with open("out.asm", "w") as asm_file:
-                asm_file.write(asm)
-            subprocess.run(["nasm", "-felf64", "out.asm", "-o", "out.o"], check=True)
-            subprocess.run(["gcc", "out.o", "-no-pie", "-o", "a.out"], check=True)
+            print(stages["asm"])
+
+        if build:
+            if not measure:
+                assemble_and_link(stages["asm"], "out.asm", "out.o", "a.out", args.assembler, args.linker)
+            if cache is not None:
+                cache.store(key, outputs)
             print("Executable 'a.out' generated.")
             print()
             subprocess.run(["./a.out"])
+        elif args.interp:
+            interpret(stages["ir_opt"], called_functions(stages["ir_opt"], stages["functions"]))
     else:
         repl()
 
-        
+
+def print_ir(ir_list, functions):
+    """
+    The IR of every function under its symbol, then the top-level code.
+    """
+    for symbol, function_ir in functions.items():
+        print(f"{symbol}:")
+        for instruction in function_ir:
+            print(f"    {instruction}")
+    if functions:
+        print("main:")
+    for instruction in ir_list:
+        print(instruction)
+
+
+def interpret(ir_list, functions=()):
+    sys.stdout.flush()
+    try:
+        IRInterpreter(ir_list, functions).run()
+    except RuntimeError as error:
+        sys.exit(f"Error: {error}")
+
+
+def report_stats(stats, table, json_path):
+    """
+    The table goes to stderr, so it doesn't mix with the program's output.
+    """
+    if table:
+        print(stats.table(), file=sys.stderr)
+    if json_path == "-":
+        print(stats.to_json())
+    elif json_path:
+        with open(json_path, "w") as json_file:
+            json_file.write(stats.to_json() + "\n")
+
+
 def repl():
     print("Compiler REPL mode. Type code and press enter. Empty line = quit.")
+    session = ReplSession()
     while True:
         src = input(">>> ")
         if not src.strip():
             break
-        tokens = Lexer(src).tokenize()
-        ast = Parser(tokens).parse()
-        SemanticAnalyzer(ast).analyze()
-        ir = IRGenerator(ast).gen()
-        asm = AsmGenerator(ir).gen()
-        print("ASM:")
-        print(asm)
-        with open("out.asm", "w") as asm_file:
-                asm_file.write(asm)
-        subprocess.run(["nasm", "-felf64", "out.asm", "-o", "out.o"], check=True)
-        subprocess.run(["gcc", "out.o", "-no-pie", "-o", "a.out"], check=True)
-        print("Executable 'a.out' generated.")
-        print()
-        subprocess.run(["./a.out"])
-        
+        try:
+            asm, address = session.compile(src)
+            print("ASM:")
+            print(asm)
+            session.run(address)
+        except (SyntaxError, RuntimeError, NotImplementedError, ValueError, ZeroDivisionError) as error:
+            print(f"Error: {error}")
 
 if __name__ == "__main__":
     main()
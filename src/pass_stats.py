@@ -0,0 +1,145 @@
+# pass_stats.py
+"""
+Per-phase timing and memory instrumentation (--time-passes / --stats-json)
+"""
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from ast_classes import ASTNode
+from build_cache import compiler_version
+
+
+def count_nodes(nodes):
+    """
+    Number of AST nodes reachable from a node list, walked with an explicit
+    stack like the visitors, so deep trees don't hit the recursion limit.
+    """
+    count = 0
+    stack = list(nodes)
+    while stack:
+        item = stack.pop()
+        if isinstance(item, ASTNode):
+            count += 1
+            for slot in type(item).__mro__:
+                for name in getattr(slot, "__slots__", ()):
+                    stack.append(getattr(item, name, None))
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+    return count
+
+
+def child_cpu_time():
+    """
+    CPU time of waited-for child processes (nasm, gcc).
+    """
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class PhaseRecord:
+    """
+    Measurements of one phase or optimizer pass.
+    `peak` is the highest traced Python memory above the phase's start.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0     # seconds
+        self.cpu = 0.0      # seconds, this process and its children
+        self.peak = 0       # bytes
+        self.counts = {}    # item counts, e.g. ir_before/ir_after
+
+    def to_dict(self):
+        return {"name": self.name, "wall_s": self.wall, "cpu_s": self.cpu,
+                "peak_bytes": self.peak, "counts": self.counts}
+
+
+class NullStats:
+    """
+    Stand-in when nothing is measured: phases run without timing and the
+    records are thrown away. Callers skip expensive counts unless `enabled`.
+    """
+    enabled = False
+
+    @contextmanager
+    def phase(self, name):
+        yield PhaseRecord(name)
+
+
+NO_STATS = NullStats()
+
+
+class CompileStats:
+    """
+    Collects a PhaseRecord per phase, in the order the phases ran.
+    Memory is traced with tracemalloc while the stats object is active,
+    which slows the compiler down, so compare timings only between runs
+    that both traced memory (see `trace_memory` in the JSON).
+    """
+    enabled = True
+
+    def __init__(self, source=None, trace_memory=True):
+        self.source = source
+        self.trace_memory = trace_memory
+        self.phases = []
+        self._started_tracing = False
+
+    def __enter__(self):
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def __exit__(self, *exc):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the body of the with block, the caller fills record.counts.
+        """
+        record = PhaseRecord(name)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        wall, cpu, child = time.perf_counter(), time.process_time(), child_cpu_time()
+        try:
+            yield record
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu + child_cpu_time() - child
+            if tracing:
+                record.peak = max(0, tracemalloc.get_traced_memory()[1] - base)
+            self.phases.append(record)
+
+    def total(self):
+        return (sum(record.wall for record in self.phases),
+                sum(record.cpu for record in self.phases))
+
+    def to_dict(self):
+        wall, cpu = self.total()
+        return {"source": self.source, "compiler_version": compiler_version(),
+                "trace_memory": self.trace_memory,
+                "total": {"wall_s": wall, "cpu_s": cpu},
+                "phases": [record.to_dict() for record in self.phases]}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def table(self):
+        """
+        Human readable report, one row per phase.
+        """
+        width = max([len(record.name) for record in self.phases] + [5])
+        lines = [f"{'phase':<{width}}  {'wall ms':>9}  {'cpu ms':>9}  {'peak KiB':>9}  counts"]
+        for record in self.phases:
+            counts = " ".join(f"{key}={value}" for key, value in record.counts.items())
+            lines.append(f"{record.name:<{width}}  {record.wall * 1000:>9.2f}  {record.cpu * 1000:>9.2f}  "
+                         f"{record.peak / 1024:>9.1f}  {counts}")
+        wall, cpu = self.total()
+        lines.append(f"{'total':<{width}}  {wall * 1000:>9.2f}  {cpu * 1000:>9.2f}")
+        return "\n".join(lines)
@@ -0,0 +1,229 @@
+# repl_session.py
+"""
+Persistent, incremental REPL session
+"""
+import ctypes
+import faulthandler
+import mmap
+import os
+import signal
+import sys
+from code_generator.asm_generator import AsmGenerator
+from code_generator.peephole import PeepholeOptimizer
+from code_generator.elf_writer import ElfWriter
+from code_generator.x86_encoder import Assembler
+from code_generator.output_runtime import RUNTIME_ASM
+from lexical_analysis.lexer import Lexer
+from syntax_analysis.parser import Parser
+from semantic_analysis.semantic_analyzer import SemanticAnalyzer, array_size
+from intermediate_representation.ir_generator import IRGenerator
+from intermediate_representation.ir_optimizer import IROptimizer
+
+DEFAULT_ARENA_SIZE = 64 * 2**20   # bytes
+MAP_32BIT = 0x40    # Linux x86-64: map below 2 GiB, [var] operands are 32 bit absolute
+
+
+class Arena:
+    """
+    One shared, executable mapping in the low 2 GiB. Code, data and
+    variables of every entry are bump-allocated here and never freed.
+    The mapping is shared, so a forked child running an entry writes the
+    session's variables in place.
+    """
+    def __init__(self, size=DEFAULT_ARENA_SIZE):
+        self.memory = mmap.mmap(-1, size, flags=mmap.MAP_SHARED | mmap.MAP_ANONYMOUS | MAP_32BIT,
+                                prot=mmap.PROT_READ | mmap.PROT_WRITE | mmap.PROT_EXEC)
+        self.base = ctypes.addressof(ctypes.c_char.from_buffer(self.memory))
+        self.used = 0
+
+    def allocate(self, size, alignment=16):
+        start = -(-self.used // alignment) * alignment
+        if start + size > len(self.memory):
+            raise RuntimeError("REPL session out of memory, start a new session")
+        self.used = start + size
+        return self.base + start
+
+    def write(self, address, data):
+        offset = address - self.base
+        self.memory[offset:offset + len(data)] = data
+
+
+class ReplSession:
+    """
+    The symbol tables, IR generator state and loaded code of every entry
+    carry over, so each entry only compiles and loads its own statements.
+    Entries are assembled in-process and linked against the session:
+    int variables live in the arena for the whole session, string
+    variables resolve to the data of the entry that last assigned them,
+    functions to the code of the entry that declared them, the output runtime is loaded once and libc functions are called
+    through stubs `jmp [rel slot]`.
+    """
+    def __init__(self, arena_size=DEFAULT_ARENA_SIZE):
+        self.arena = Arena(arena_size)
+        self.analyzer = SemanticAnalyzer([])
+        self.ir_generator = IRGenerator([])
+        self.variables = {}     # int variable -> address
+        self.strings = {}       # string variable -> address of its data
+        self.functions = {}     # function symbol -> address of its code
+        self.externals = {}     # libc function -> stub address
+        self.libc = ctypes.CDLL(None)
+        self.runtime = self.load_runtime()  # output runtime symbol -> address
+
+    def compile(self, src):
+        """
+        Compile one entry and load it, return (asm, entry address).
+        A failing entry leaves the session unchanged.
+        """
+        ast = Parser(Lexer(src).tokenize()).parse()
+        analyzer_symbols = dict(self.analyzer.var_symbols)
+        generator_symbols = dict(self.ir_generator.var_symbols)
+        analyzer_functions = dict(self.analyzer.functions)
+        generator_functions = dict(self.ir_generator.functions)
+        try:
+            for node in ast:
+                self.analyzer.visit(node)
+            self.ir_generator.ast_nodes = ast
+            self.ir_generator.ir_list = []
+            ir = self.ir_generator.gen()
+            # the entry's functions are all loaded, later entries may call them
+            functions = self.ir_generator.functions
+            new = [function for symbol, function in functions.items() if symbol not in generator_functions]
+            for function in new:
+                function.ir_opt = IROptimizer(function.ir_list, functions=functions, function=function).optimize()
+            # every variable may be read by a later entry
+            ir_opt = IROptimizer(ir, live_out=self.analyzer.var_symbols, functions=functions).optimize()
+            asm = PeepholeOptimizer(AsmGenerator(ir_opt, runtime=False, functions=new).gen()).optimize()
+            return asm, self.load(asm, ir_opt + [instr for function in new for instr in function.ir_opt])
+        except Exception:
+            self.analyzer.var_symbols = analyzer_symbols
+            self.ir_generator.var_symbols = generator_symbols
+            self.analyzer.functions = analyzer_functions
+            self.ir_generator.functions = generator_functions
+            raise
+
+    def load(self, asm, ir):
+        """
+        Assemble, place and relocate an entry in the arena. Only the
+        entry's own symbols are looked at, so loading doesn't slow down
+        as the session grows.
+        """
+        # string variables, arrays and functions of earlier entries used here
+        externs = {instr.arg1 for instr in ir if instr.op in ("param", "addr") and instr.arg1 in self.strings}
+        externs.update(instr.arg1 for instr in ir if instr.op in ("load_idx", "vload") and instr.arg1 in self.variables)
+        externs.update(instr.dest for instr in ir if instr.op in ("store_idx", "vstore") and instr.dest in self.variables)
+        externs.update(instr.arg1 for instr in ir if instr.op == "call" and instr.arg1 in self.functions)
+        header = f"extern {', '.join(externs)}\n" if externs else ""
+        assembler = Assembler().assemble(header + asm)
+
+        types = self.analyzer.var_symbols
+        for name, (section, _) in assembler.symbols.items():
+            size = 1 if types.get(name) == "INT" else array_size(types.get(name))
+            if section == ".bss" and size and name not in self.variables:
+                self.variables[name] = self.arena.allocate(8 * size, 8)
+        sections = {}
+        for name, section in assembler.sections.items():
+            size = section.size if section.nobits else len(section.data)
+            sections[name] = self.arena.allocate(size, section.align)
+
+        def symbol_address(name):
+            if name in self.variables:
+                return self.variables[name]
+            if name in assembler.symbols:
+                section, offset = assembler.symbols[name]
+                return sections[section] + offset
+            if name in self.strings:
+                return self.strings[name]
+            if name in self.functions:
+                return self.functions[name]
+            if name in self.runtime:
+                return self.runtime[name]
+            return self.external(name)
+
+        ElfWriter(assembler).relocate(sections.__getitem__, symbol_address)
+        for name, section in assembler.sections.items():
+            if not section.nobits:
+                self.arena.write(sections[name], section.data)
+        for name, (section, _) in assembler.symbols.items():
+            if section == ".data" and types.get(name) == "STRING":
+                self.strings[name] = symbol_address(name)
+            elif name in self.ir_generator.functions:
+                self.functions[name] = symbol_address(name)
+        return symbol_address("main")
+
+    def load_runtime(self):
+        """
+        Place the output runtime in the arena, return its symbol addresses.
+        """
+        assembler = Assembler().assemble(RUNTIME_ASM)
+        sections = {name: self.arena.allocate(section.size if section.nobits else len(section.data), section.align)
+                    for name, section in assembler.sections.items()}
+
+        def symbol_address(name):
+            section, offset = assembler.symbols[name]
+            return sections[section] + offset
+
+        ElfWriter(assembler).relocate(sections.__getitem__, symbol_address)
+        for name, section in assembler.sections.items():
+            if not section.nobits:
+                self.arena.write(sections[name], section.data)
+        return {name: symbol_address(name) for name in assembler.symbols}
+
+    def external(self, name):
+        """
+        Stub for a libc function: an 8 byte slot with its address and
+        `jmp [rel slot]`, close enough to the arena code for a rel32 call.
+        """
+        if name not in self.externals:
+            try:
+                target = ctypes.cast(getattr(self.libc, name), ctypes.c_void_p).value
+            except AttributeError:
+                raise RuntimeError(f"Undefined symbol {name}") from None
+            slot = self.arena.allocate(14, 8)
+            stub = slot + 8
+            jump = b"\xff\x25" + (slot - (stub + 6)).to_bytes(4, "little", signed=True)
+            self.arena.write(slot, target.to_bytes(8, "little") + jump)
+            self.externals[name] = stub
+        return self.externals[name]
+
+    def run(self, address, capture=False):
+        """
+        Run a loaded entry in a forked child, so a crashing entry (division
+        by zero) doesn't take the session down. Returns the output when
+        `capture` is set, otherwise it goes straight to stdout.
+        """
+        function = ctypes.CFUNCTYPE(ctypes.c_int)(address)
+        # lines a crashed entry left in the output buffer died with it
+        self.arena.write(self.runtime["out_len"], bytes(8))
+        sys.stdout.flush()
+        if capture:
+            read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                # a trap of the entry is reported by the parent, not dumped as a Python crash
+                faulthandler.disable()
+                if capture:
+                    os.close(read_fd)
+                    os.dup2(write_fd, 1)
+                function()
+                self.libc.fflush(None)
+                status = 0
+            finally:
+                os._exit(status)
+        output = ""
+        if capture:
+            os.close(write_fd)
+            with os.fdopen(read_fd, "rb") as pipe:
+                output = pipe.read().decode(errors="replace")
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            raise RuntimeError(f"Program terminated by {signal.Signals(os.WTERMSIG(status)).name}")
+        return output
+
+    def execute(self, src, capture=False):
+        """
+        Compile, load and run one entry, return (asm, output).
+        """
+        asm, address = self.compile(src)
+        return asm, self.run(address, capture)
@@ -1,59 +1,188 @@
 from ast_classes import *
+from ast_visitor import ASTVisitor
+
+
+def array_type(size):
+    """
+    Symbol type of an int array of `size` elements.
+    """
+    return f"INT[{size}]"
+
+
+def array_size(var_type):
+    """
+    Element count of an array symbol type, None for a scalar type.
+    """
+    if var_type is not None and var_type.startswith("INT["):
+        return int(var_type[4:-1])
+    return None
+
+
+class SemanticAnalyzer(ASTVisitor):
+    handlers = {
+        VarDeclStmt:   "visit_var_decl",
+        AssignStmt:    "visit_assign",
+        VarIdentifier: "visit_var",
+        PrintStmt:     "visit_print",
+        BinaryExpr:    "visit_binary",
+        CompareExpr:   "visit_binary",
+        NumberExpr:    "visit_literal",
+        StringExpr:    "visit_literal",
+        IfStmt:        "visit_if",
+        WhileStmt:     "visit_while",
+        BlockStmt:     "visit_block",
+        FunctionDecl:  "visit_function",
+        ReturnStmt:    "visit_return",
+        CallExpr:      "visit_call",
+        ArrayDeclStmt: "visit_array_decl",
+        IndexExpr:     "visit_index",
+        IndexAssignStmt: "visit_index_assign",
+    }
 
-class SemanticAnalyzer:
     def __init__(self, asts):
         self.asts = asts
         self.var_symbols = {}
+        self.functions = {}     # name -> (parameter types, return type)
+        self.function = None    # FunctionDecl being checked
 
     def analyze(self):
         for node in self.asts:
             self.visit(node)
 
-    def visit(self, node):
-        """
-        Check for variable decalraction, assignemt, undeclared errors
-        """
-        if isinstance(node, VarDeclStmt):
-            if node.var_name in self.var_symbols:
-                raise RuntimeError(f"Redefinition of variable {node.var_name}")
-            expr_type = self.guess_type(node.expr)
-            if node.var_type != expr_type:
-                raise RuntimeError(
-                    f"Type mismatch in declaration: variable '{node.var_name}' is '{node.var_type}', but assigned value is '{expr_type}'"
-                )
-            self.var_symbols[node.var_name] = node.var_type
-            self.visit(node.expr)
-        elif isinstance(node, AssignStmt):
-            if node.var_name not in self.var_symbols:
-                raise RuntimeError(f"Assignment to undeclared variable {node.var_name}")
-            expected_type = self.var_symbols[node.var_name]
-            actual_type = self.guess_type(node.expr)
-            if expected_type != actual_type:
+    # Check for variable decalraction, assignemt, undeclared errors
+    def visit_var_decl(self, node):
+        if node.var_name in self.var_symbols:
+            raise RuntimeError(f"Redefinition of variable {node.var_name}")
+        # the variable isn't declared yet in its own initializer
+        yield node.expr
+        expr_type = self.guess_type(node.expr)
+        if node.var_type != expr_type:
+            raise RuntimeError(
+                f"Type mismatch in declaration: variable '{node.var_name}' is '{node.var_type}', but assigned value is '{expr_type}'"
+            )
+        self.var_symbols[node.var_name] = node.var_type
+
+    def visit_assign(self, node):
+        if node.var_name not in self.var_symbols:
+            raise RuntimeError(f"Assignment to undeclared variable {node.var_name}")
+        expected_type = self.var_symbols[node.var_name]
+        actual_type = self.guess_type(node.expr)
+        if expected_type != actual_type:
+            raise RuntimeError(
+                f"Type mismatch: cannot assign {actual_type} to {expected_type} variable '{node.var_name}'"
+            )
+        yield node.expr
+
+    def visit_var(self, node):
+        if node.name not in self.var_symbols:
+            raise RuntimeError(f"Use of undeclared variable {node.name}")
+        if array_size(self.var_symbols[node.name]) is not None:
+            raise RuntimeError(f"Array {node.name} used without an index")
+
+    # Arrays are int only, indexed from 0. An index known at compile time
+    # must be in range, any other one is checked when the program runs.
+    def visit_array_decl(self, node):
+        if node.name in self.var_symbols:
+            raise RuntimeError(f"Redefinition of variable {node.name}")
+        self.var_symbols[node.name] = array_type(node.size)
+
+    def visit_index(self, node):
+        yield from self.check_index(node.name, node.index)
+
+    def visit_index_assign(self, node):
+        yield from self.check_index(node.name, node.index)
+        yield node.expr
+        actual_type = self.guess_type(node.expr)
+        if actual_type != "INT":
+            raise RuntimeError(
+                f"Type mismatch: cannot assign {actual_type} to an element of INT array '{node.name}'")
+
+    def check_index(self, name, index):
+        if name not in self.var_symbols:
+            raise RuntimeError(f"Use of undeclared array {name}")
+        size = array_size(self.var_symbols[name])
+        if size is None:
+            raise RuntimeError(f"{name} is not an array")
+        yield index
+        index_type = self.guess_type(index)
+        if index_type != "INT":
+            raise RuntimeError(f"Type mismatch: index of array '{name}' is {index_type}, not INT")
+        if isinstance(index, NumberExpr) and not 0 <= index.value < size:
+            raise RuntimeError(f"Index {index.value} out of range for array {name} of size {size}")
+
+    # A function is declared before its calls, so it may call itself but
+    # not a later function. Its body sees its parameters and its own
+    # variables only.
+    def visit_function(self, node):
+        if node.name in self.functions:
+            raise RuntimeError(f"Redefinition of function {node.name}")
+        names = [name for _, name in node.params]
+        if len(set(names)) != len(names):
+            raise RuntimeError(f"Duplicate parameter name in function {node.name}")
+        self.functions[node.name] = (tuple(param_type for param_type, _ in node.params), node.return_type)
+        global_symbols = self.var_symbols
+        self.var_symbols = {name: param_type for param_type, name in node.params}
+        self.function = node
+        try:
+            yield node.body
+        finally:
+            self.var_symbols = global_symbols
+            self.function = None
+
+    def visit_return(self, node):
+        if self.function is None:
+            raise RuntimeError("return outside of a function")
+        yield node.expr
+        actual_type = self.guess_type(node.expr)
+        if actual_type != self.function.return_type:
+            raise RuntimeError(
+                f"Type mismatch: function '{self.function.name}' returns "
+                f"{self.function.return_type}, not {actual_type}"
+            )
+
+    def visit_call(self, node):
+        if node.name not in self.functions:
+            raise RuntimeError(f"Call of undeclared function {node.name}")
+        param_types, _ = self.functions[node.name]
+        if len(node.args) != len(param_types):
+            raise RuntimeError(
+                f"Function {node.name} takes {len(param_types)} arguments, {len(node.args)} given")
+        for number, (arg, param_type) in enumerate(zip(node.args, param_types), 1):
+            yield arg
+            arg_type = self.guess_type(arg)
+            if arg_type != param_type:
                 raise RuntimeError(
-                    f"Type mismatch: cannot assign {actual_type} to {expected_type} variable '{node.var_name}'"
-                )
-            self.visit(node.expr)
-        elif isinstance(node, VarIdentifier):
-            if node.name not in self.var_symbols:
-                raise RuntimeError(f"Use of undeclared variable {node.name}")
-        elif isinstance(node, PrintStmt):
-            self.visit(node.expr)
-        elif isinstance(node, BinaryExpr):
-            self.visit(node.left)
-            self.visit(node.right)
-        elif isinstance(node, CompareExpr):
-            self.visit(node.left)
-            self.visit(node.right)
-        elif isinstance(node, NumberExpr) or isinstance(node, StringExpr):
-            pass
-        elif isinstance(node, IfStmt):
-            self.visit(node.condition)
-            self.visit(node.then_branch)
-            if node.else_branch:
-                self.visit(node.else_branch)
-        elif isinstance(node, BlockStmt):
-            for stmt in node.statements:
-                self.visit(stmt)
+                    f"Type mismatch: argument {number} of {node.name} is {param_type}, not {arg_type}")
+
+    def visit_print(self, node):
+        yield node.expr
+
+    # arithmetic and comparisons are on INT only, which is what
+    # guess_type reports for them
+    def visit_binary(self, node):
+        yield node.left
+        yield node.right
+        left_type, right_type = self.guess_type(node.left), self.guess_type(node.right)
+        if left_type != "INT" or right_type != "INT":
+            raise RuntimeError(
+                f"Type mismatch: operands of '{node.op}' are {left_type} and {right_type}, not INT")
+
+    def visit_literal(self, node):
+        pass
+
+    def visit_if(self, node):
+        yield node.condition
+        yield node.then_branch
+        if node.else_branch:
+            yield node.else_branch
+
+    def visit_while(self, node):
+        yield node.condition
+        yield node.body
+
+    def visit_block(self, node):
+        for stmt in node.statements:
+            yield stmt
 
     def guess_type(self, expr):
         if isinstance(expr, NumberExpr):
@@ -62,4 +191,9 @@ class SemanticAnalyzer:
             return "STRING"
         elif isinstance(expr, VarIdentifier):
             return self.var_symbols.get(expr.name, None)
+        elif isinstance(expr, BinaryExpr) or isinstance(expr, CompareExpr) or isinstance(expr, IndexExpr):
+            return "INT"
+        elif isinstance(expr, CallExpr):
+            function = self.functions.get(expr.name)
+            return function and function[1]
         return None
@@ -1,17 +1,57 @@
+from collections import deque
 from ast_classes import *
+from lexical_analysis.token import KINDS, KIND_CODES
+
+# token kinds the parser branches on, as kind codes
+(PRINT, INT, STRING, IF, WHILE, RETURN, IDENT, NUMBER, STRING_LITERAL,
+ SEMI, COMMA, LPAREN, RPAREN, RBRACE, LBRACKET, EOF) = (KIND_CODES[kind] for kind in (
+    "PRINT", "INT", "STRING", "IF", "WHILE", "RETURN", "IDENT", "NUMBER", "STRING_LITERAL",
+    "SEMI", "COMMA", "LPAREN", "RPAREN", "RBRACE", "LBRACKET", "EOF"))
+
+# binding power of the binary operators by kind code, 0 for any other token
+COMPARE_POWER = 1
+BINDING_POWER = [0] * len(KINDS)
+for kinds, power in ((("EQ", "NEQ", "LT", "LEQ", "GT", "GEQ"), COMPARE_POWER),
+                     (("ADD", "SUB"), 2),
+                     (("MUL", "DIV"), 3)):
+    for kind in kinds:
+        BINDING_POWER[KIND_CODES[kind]] = power
+
+# arrays are addressed with 32-bit absolute displacements, in the low 2 GiB
+MAX_ARRAY_SIZE = 2**28
 
 class Parser:
     def __init__(self, tokens):
-        self.tokens  = tokens
-        self.pos     = 0
-        self.current = tokens[0]
-        self.asts    = [] #Abstract Syntax Trees
+        # tokens can be a list or a lazy stream (Lexer.stream()),
+        # they are pulled one at a time through a small lookahead buffer
+        self.tokens    = iter(tokens)
+        self.lookahead = deque()
+        self.pos       = 0
+        self.current   = next(self.tokens)
+        self.kind      = self.current.code  # KINDS index of current
+        self.asts      = [] #Abstract Syntax Trees
+        self.errors    = [] # SyntaxErrors recovered from
+        self.error_pos = -1 # token position of the last one
 
     def advance(self):
         """move to the next token"""
         self.pos += 1
-        if self.pos < len(self.tokens):
-            self.current = self.tokens[self.pos]
+        if self.lookahead:
+            self.current = current = self.lookahead.popleft()
+        elif self.kind != EOF:
+            self.current = current = next(self.tokens, self.current)
+        else:
+            return
+        self.kind = current.code
+
+    def peek(self, offset=1):
+        """token `offset` positions after current, without consuming it"""
+        while len(self.lookahead) < offset:
+            last = self.lookahead[-1] if self.lookahead else self.current
+            if last.kind == "EOF":
+                return last
+            self.lookahead.append(next(self.tokens, last))
+        return self.lookahead[offset - 1]
 
     def expect(self, kind):
         """check expected token, raise error or advance"""
@@ -25,32 +65,147 @@ class Parser:
         return token
 
     def parse(self):
-        while self.current.kind != "EOF":
-            self.asts.append(self.parse_statment())
-        self.expect("EOF")
+        """
+        A statement with a syntax error is skipped and parsing goes on, the
+        errors of the whole source are raised together at the end.
+        """
+        while self.kind != EOF:
+            try:
+                self.asts.append(self.parse_statment())
+            except SyntaxError as error:
+                self.recover(error)
+                if self.kind == RBRACE:
+                    self.advance()  # nothing to close at the top level
+        if self.errors:
+            raise SyntaxError("\n".join(str(error) for error in self.errors))
         return self.asts
 
+    def recover(self, error):
+        """
+        Record the error and skip to the end of the statement: past the
+        next ";", or up to the "}" closing the enclosing block. An error at
+        the position of the previous one is the same error seen again by
+        an enclosing statement, and is only recorded once.
+        """
+        if self.pos != self.error_pos:
+            self.errors.append(error)
+            self.error_pos = self.pos
+        while self.kind not in (SEMI, RBRACE, EOF):
+            self.advance()
+        if self.kind == SEMI:
+            self.advance()
+
     def parse_statment(self):
         """
-        Statement  ::= PrintStmt | ExprStmt
+        Statement  ::= PrintStmt | ExprStmt | ... | FunctionDecl | ArrayDeclStmt
+        Functions and arrays are only declared at the top level.
+        Compound statements are generators that yield the parsers of nested
+        statements, they are driven here with an explicit stack so nesting
+        depth is not limited by the Python recursion limit. A SyntaxError
+        raised by a nested statement is thrown into the statement
+        containing it, so a block can recover from it.
         """
-        if self.current.kind == "PRINT":
+        if self.function_header():
+            stack = [self.parse_function_decl()]
+        elif self.kind == INT and self.peek().code == LBRACKET:
+            return self.parse_array_decl_stmt()
+        else:
+            stack = [self.statement()]
+        result = None
+        error = None
+        while stack:
+            try:
+                if error is None:
+                    nested = stack[-1].send(result)
+                else:
+                    nested = stack[-1].throw(error)
+                    error = None
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                error = None
+                continue
+            except SyntaxError as raised:
+                stack.pop()
+                if not stack:
+                    raise
+                error = raised
+                continue
+            stack.append(nested)
+            result = None
+        return result
+
+    def function_header(self):
+        """Type Identifier "(" starts a function declaration"""
+        return ((self.kind == INT or self.kind == STRING)
+                and self.peek().code == IDENT and self.peek(2).code == LPAREN)
+
+    def statement(self):
+        kind = self.kind
+        if kind == PRINT:
             return self.parse_print_stmt()
-        if self.current.kind == "INT":
+        if kind == INT or kind == STRING:
+            if self.function_header():
+                raise SyntaxError(
+                    f"Functions can only be declared at the top level, "
+                    f"at {self.current.line}:{self.current.col}")
+            if kind == INT and self.peek().code == LBRACKET:
+                raise SyntaxError(
+                    f"Arrays can only be declared at the top level, "
+                    f"at {self.current.line}:{self.current.col}")
             return self.parse_var_decl_stmt()
-        if self.current.kind == "STRING":
-            return self.parse_var_decl_stmt()
-        if self.current.kind == "IF":
-            return self.parse_if_stmt()
-        if self.current.kind == "WHILE":
-            return self.parse_while_stmt()
-        if self.current.kind == "IDENT":
-            return self.parse_assign_stmt()
-        
+        if kind == IF:
+            return (yield self.parse_if_stmt())
+        if kind == WHILE:
+            return (yield self.parse_while_stmt())
+        if kind == RETURN:
+            return self.parse_return_stmt()
+        if kind == IDENT:
+            following = self.peek().code
+            if following == LBRACKET:
+                return self.parse_index_assign_stmt()
+            if following != LPAREN:
+                return self.parse_assign_stmt()
+
         expr = self.parse_expr()
         self.expect("SEMI")
         return expr
     
+    def parse_function_decl(self):
+        """
+        FunctionDecl ::= Type Identifier "(" [ Param { "," Param } ] ")" BlockStmt
+        Param        ::= Type Identifier
+        """
+        return_type = self.current.kind
+        self.advance()
+        name = self.expect("IDENT").text
+        self.expect("LPAREN")
+        params = []
+        if self.kind != RPAREN:
+            while True:
+                if self.kind != INT and self.kind != STRING:
+                    raise SyntaxError(
+                        f"Expected a parameter type, got {self.current.kind} "
+                        f"at {self.current.line}:{self.current.col}")
+                param_type = self.current.kind
+                self.advance()
+                params.append((param_type, self.expect("IDENT").text))
+                if self.kind != COMMA:
+                    break
+                self.advance()
+        self.expect("RPAREN")
+        body = yield self.parse_block_stmt()
+        return FunctionDecl(return_type, name, params, body)
+
+    def parse_return_stmt(self):
+        """
+        ReturnStmt ::= "return" Expr ";"
+        """
+        self.expect("RETURN")
+        expr = self.parse_expr()
+        self.expect("SEMI")
+        return ReturnStmt(expr)
+
     def parse_while_stmt(self):
         """
         WhileStmt  ::= "while" "(" Expr ")" BlockStmt
@@ -59,7 +214,7 @@ class Parser:
         self.expect("LPAREN")
         condition = self.parse_expr()
         self.expect("RPAREN")
-        body = self.parse_block_stmt()
+        body = yield self.parse_block_stmt()
         return WhileStmt(condition, body)
 
     def parse_if_stmt(self):
@@ -70,11 +225,11 @@ class Parser:
         self.expect("LPAREN")
         condition = self.parse_expr()
         self.expect("RPAREN")
-        true_branch = self.parse_block_stmt()
+        true_branch = yield self.parse_block_stmt()
         if self.current.kind == "ELSE":
             self.expect("ELSE")
 
-            false_branch = self.parse_block_stmt()
+            false_branch = yield self.parse_block_stmt()
 
             return IfStmt(condition, true_branch, false_branch)
         return IfStmt(condition, true_branch)
@@ -85,8 +240,11 @@ class Parser:
         """
         statements = []
         self.expect("LBRACE")
-        while self.current.kind != "RBRACE":
-            statements.append(self.parse_statment())
+        while self.kind != RBRACE and self.kind != EOF:
+            try:
+                statements.append((yield self.statement()))
+            except SyntaxError as error:
+                self.recover(error)
         self.expect("RBRACE")
         return BlockStmt(statements)
 
@@ -122,6 +280,41 @@ class Parser:
         self.expect("SEMI")
         return AssignStmt(var_name, expr)
 
+    def parse_array_decl_stmt(self):
+        """
+        ArrayDeclStmt ::= "int" "[" Number "]" Identifier ";"
+        """
+        self.expect("INT")
+        self.expect("LBRACKET")
+        size = self.expect("NUMBER")
+        if not 0 < int(size.text) <= MAX_ARRAY_SIZE:
+            raise SyntaxError(f"Array size must be between 1 and {MAX_ARRAY_SIZE}, "
+                              f"got {size.text} at {size.line}:{size.col}")
+        self.expect("RBRACKET")
+        name = self.expect("IDENT").text
+        self.expect("SEMI")
+        return ArrayDeclStmt(name, int(size.text))
+
+    def parse_index_assign_stmt(self):
+        """
+        IndexAssignStmt ::= Identifier "[" Expr "]" "=" Expr ";"
+        """
+        name = self.expect("IDENT").text
+        index = self.parse_index()
+        self.expect("ASSIGN")
+        expr = self.parse_expr()
+        self.expect("SEMI")
+        return IndexAssignStmt(name, index, expr)
+
+    def parse_index(self):
+        """
+        "[" Expr "]"
+        """
+        self.expect("LBRACKET")
+        index = self.parse_expr()
+        self.expect("RBRACKET")
+        return index
+
     def parse_print_stmt(self):
         """
         PrintStmt  ::= "print" "(" Expr ")"
@@ -138,54 +331,97 @@ class Parser:
         Expr         ::= CompareExpr
         CompareExpr  ::= AddExpr [ CompareOp AddExpr ]
         CompareOp    ::= "==" | "!=" | "<" | "<=" | ">" | ">="
+        AddExpr      ::= Term { ("+" | "-") Term }
+        Term         ::= Factor { ("*" | "/") Factor }
+        Factor       ::= Number | Identifier | CallExpr | IndexExpr | String | "(" Expr ")"
+        CallExpr     ::= Identifier "(" [ Expr { "," Expr } ] ")"
+        IndexExpr    ::= Identifier "[" Expr "]"
+        Precedence climbing over BINDING_POWER without recursion: the
+        operators waiting for their right operand are on a stack, and an
+        operator first folds the ones on top binding at least as tight
+        (left-associative). A "(", call or index saves the operands and
+        operators of the expression around it on `enclosing` until its
+        closing token, so expressions nest as deep as memory allows.
         """
-        left = self.parse_add_expr()
-        if self.current.kind in ("EQ", "NEQ", "LT", "LEQ", "GT", "GEQ"):
-            operator = self.current.text
-            self.advance()
-            right = self.parse_add_expr()
-            return CompareExpr(left, operator, right)
-        return left
-    
-    def parse_add_expr(self):
-        """
-        AddExpr     ::= Term [ ("+" | "-") Term ]
-        """
-        left = self.parse_term() 
-        while self.current.kind in ("ADD", "SUB"):
-            operator = self.current.text
-            self.advance()
-            right = self.parse_term()
-            left = BinaryExpr(operator, left, right) # Left build up until no more addition or substraction
-        return left
+        advance = self.advance
+        enclosing = []      # (opener kind, called/indexed name, args) + operands and operators around
+        operands = []
+        operators = []      # (binding power, operator)
+        while True:
+            kind = self.kind
+            if kind == IDENT:
+                name = self.current.text
+                advance()
+                if self.kind == LPAREN:
+                    advance()
+                    if self.kind != RPAREN:
+                        enclosing.append((LPAREN, name, [], operands, operators))
+                        operands, operators = [], []
+                        continue
+                    advance()
+                    operand = CallExpr(name, [])
+                elif self.kind == LBRACKET:
+                    advance()
+                    enclosing.append((LBRACKET, name, None, operands, operators))
+                    operands, operators = [], []
+                    continue
+                else:
+                    operand = VarIdentifier(name)
+            elif kind == NUMBER:
+                operand = NumberExpr(int(self.current.text))
+                advance()
+            elif kind == STRING_LITERAL:
+                operand = StringExpr(self.current.text)
+                advance()
+            elif kind == LPAREN:
+                advance()
+                enclosing.append((LPAREN, None, None, operands, operators))
+                operands, operators = [], []
+                continue
+            else:
+                raise SyntaxError(f"Unexpected {self.current}")
+
+            while True:
+                operands.append(operand)
+                power = BINDING_POWER[self.kind]
+                # comparisons don't chain: a second one ends the expression
+                if power and not (power == COMPARE_POWER and operators and operators[0][0] == COMPARE_POWER):
+                    while operators and operators[-1][0] >= power:
+                        self.fold(operands, operators)
+                    operators.append((power, self.current.text))
+                    advance()
+                    break
+                while operators:
+                    self.fold(operands, operators)
+                value = operands.pop()
+                if not enclosing:
+                    return value
+                opener, name, args, operands, operators = enclosing.pop()
+                if opener == LBRACKET:
+                    self.expect("RBRACKET")
+                    operand = IndexExpr(name, value)
+                elif name is None:
+                    self.expect("RPAREN")
+                    operand = value
+                else:
+                    args.append(value)
+                    if self.kind == COMMA:
+                        advance()
+                        enclosing.append((opener, name, args, operands, operators))
+                        operands, operators = [], []
+                        break
+                    self.expect("RPAREN")
+                    operand = CallExpr(name, args)
 
-    def parse_term(self):
+    @staticmethod
+    def fold(operands, operators):
         """
-        Term        ::= Factor [ ("*" | "/") Factor ]
+        Replace the top two operands by the top operator applied to them.
         """
-        left = self.parse_factor()
-        while self.current.kind in ("MUL", "DIV"):
-            operator = self.current.text
-            self.advance()
-            right = self.parse_factor()
-            left = BinaryExpr(operator, left, right)
-        return left
-
-    def parse_factor(self):
-        if self.current.kind == "NUMBER":
-            token = self.expect("NUMBER")
-            return NumberExpr(int(token.text))
-        if self.current.kind == "IDENT":
-            token = self.expect("IDENT")
-            return VarIdentifier(token.text)
-        if self.current.kind == "STRING_LITERAL":
-            token = self.expect("STRING_LITERAL")
-            return StringExpr(token.text)
-        if self.current.kind == "LPAREN":
-            self.expect("LPAREN")
-            expr = self.parse_expr()
-            self.expect("RPAREN")
-            return expr
-        raise SyntaxError(f"Unexpected {self.current}")
-
-
+        power, operator = operators.pop()
+        right = operands.pop()
+        left = operands.pop()
+        if power == COMPARE_POWER:
+            operands.append(CompareExpr(left, operator, right))
+        else:
+            operands.append(BinaryExpr(operator, left, right))
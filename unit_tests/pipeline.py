@@ -0,0 +1,69 @@
+"""
+The compiler pipeline the tests run programs through: source to IR like
+compile_file, the IR interpreter and native executables.
+"""
+import io
+import os
+import subprocess
+import tempfile
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.semantic_analysis.semantic_analyzer import SemanticAnalyzer
+from src.intermediate_representation.ir_generator import IRGenerator
+from src.intermediate_representation.ir_optimizer import IROptimizer
+from src.intermediate_representation.ir_interpreter import IRInterpreter
+from src.intermediate_representation.ir_function import called_functions
+from src.code_generator.asm_generator import AsmGenerator
+from src.code_generator.peephole import PeepholeOptimizer
+from src.code_generator.x86_encoder import Assembler
+from src.code_generator.elf_writer import ElfWriter
+
+def compile_source(source, opt_level=None):
+    """
+    (main IR, functions) like compile_file: every function is optimized
+    before the code after it. With opt_level None nothing is optimized.
+    """
+    ast = Parser(Lexer(source).tokenize()).parse()
+    SemanticAnalyzer(ast).analyze()
+    generator = IRGenerator(ast)
+    ir = generator.gen()
+    functions = generator.functions
+    if opt_level is None:
+        return ir, functions
+    for function in functions.values():
+        function.ir_opt = IROptimizer(function.ir_list, opt_level=opt_level,
+                                      functions=functions, function=function).optimize()
+    return IROptimizer(ir, opt_level=opt_level, functions=functions).optimize(), functions
+
+def gen_ir(source, opt_level=None):
+    return compile_source(source, opt_level)[0]
+
+def interpret(source, opt_level=1):
+    """
+    The output of the program run by the IR interpreter.
+    """
+    ir, functions = compile_source(source, opt_level)
+    output = io.BytesIO()
+    IRInterpreter(ir, called_functions(ir, functions)).run(output)
+    return output.getvalue().decode()
+
+def gen_asm(ir, functions=None, printf=False, peephole=False):
+    """
+    Assembly for `ir` and the functions it calls out of `functions`.
+    """
+    called = called_functions(ir, functions) if functions else ()
+    asm = AsmGenerator(ir, printf=printf, functions=called).gen()
+    return PeepholeOptimizer(asm).optimize() if peephole else asm
+
+def run_asm(asm):
+    """
+    Assemble and link `asm` into a temporary executable and run it, the
+    completed process has the output as bytes.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "a.out")
+        ElfWriter(Assembler().assemble(asm)).write_executable(path)
+        return subprocess.run([path], capture_output=True)
+
+def run_ir(ir, functions=None, printf=False, peephole=False):
+    return run_asm(gen_asm(ir, functions, printf, peephole))
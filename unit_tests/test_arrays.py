@@ -0,0 +1,108 @@
+import os
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.semantic_analysis.semantic_analyzer import SemanticAnalyzer
+from src.repl_session import ReplSession
+from unit_tests.pipeline import gen_ir, interpret, run_ir
+
+# a vectorizable loop over arrays read at two offsets, an odd trip count
+# for the scalar remainder and an element indexing another array
+PROGRAM = """
+int[10] a;
+int[10] b;
+int[9] c;
+int k = 7;
+int i = 0;
+while (i < 10) {
+    a[i] = i * 3;
+    b[i] = 10 - i;
+    i = i + 1;
+}
+i = 0;
+while (i < 9) {
+    c[i] = a[i] * b[i + 1] + k - a[i];
+    i = i + 1;
+}
+int s = 0;
+i = 0;
+while (i < 9) {
+    s = s + c[i];
+    i = i + 1;
+}
+print(s);
+int j = b[a[3]];
+print(j);
+print(c[8]);
+"""
+
+EXPECTED = "315\n1\n7\n"
+
+class TestArrays(unittest.TestCase):
+    def test_parse(self):
+        ast = Parser(Lexer("int[4] a;\na[1] = a[0] + 2;").stream()).parse()
+        self.assertEqual(repr(ast[0]), "ArrayDeclStmt('a', 4)")
+        self.assertEqual(repr(ast[1]), "IndexAssignStmt('a', NumberExpr(1), "
+                         "BinaryExpr(IndexExpr('a', NumberExpr(0)), '+', NumberExpr(2)))")
+        for source, message in {"while (1 < 2) { int[2] a; }": "top level",
+                                "int[0] a;": "between 1 and"}.items():
+            with self.subTest(source=source), self.assertRaisesRegex(SyntaxError, message):
+                Parser(Lexer(source).stream()).parse()
+
+    def test_semantic_errors(self):
+        cases = {
+            "int[2] a;\nint[3] a;": "Redefinition of variable a",
+            "int[2] a;\nprint(a);": "Array a used without an index",
+            "int x = 1;\nx[0] = 1;": "x is not an array",
+            "b[0] = 1;": "undeclared array b",
+            "int[2] a;\na[2] = 1;": "Index 2 out of range for array a of size 2",
+            "int[2] a;\na[\"x\"] = 1;": "Type mismatch",
+            "int[2] a;\na[0] = \"x\";": "Type mismatch",
+        }
+        for source, message in cases.items():
+            with self.subTest(source=source), self.assertRaisesRegex(RuntimeError, message):
+                SemanticAnalyzer(Parser(Lexer(source).stream()).parse()).analyze()
+
+    def test_loop_bounds_checks_are_eliminated(self):
+        checks = [instr for instr in gen_ir(PROGRAM, 0) if instr.op == "check"]
+        self.assertEqual(len(checks), 10)
+        # only the index loaded from a stays checked, constant ones are in range
+        self.assertEqual([instr.arg2 for instr in gen_ir(PROGRAM, 1) if instr.op == "check"], [10])
+
+    def test_loop_is_vectorized(self):
+        ir = gen_ir(PROGRAM, 1)
+        self.assertLessEqual({"vload", "vsplat", "vadd", "vsub", "vmul", "vstore"}, {instr.op for instr in ir})
+        # the sum reads s, written by the loop before: it stays scalar
+        self.assertEqual(sum(instr.op == "vstore" for instr in ir), 1)
+        self.assertEqual(interpret(PROGRAM, 0), EXPECTED)
+        self.assertEqual(interpret(PROGRAM, 1), EXPECTED)
+
+    def test_out_of_bounds_traps(self):
+        for index in ("4", "0 - 1"):
+            source = f"int[4] a;\nint i = {index};\na[i] = 1;\n"
+            with self.subTest(index=index), self.assertRaisesRegex(RuntimeError, "SIGILL"):
+                interpret(source)
+
+    @unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+    def test_native(self):
+        for opt_level in (0, 1):
+            for printf in (False, True):
+                output = run_ir(gen_ir(PROGRAM, opt_level), printf=printf, peephole=bool(opt_level)).stdout
+                self.assertEqual(output.decode(), EXPECTED, (opt_level, printf))
+        process = run_ir(gen_ir("int[4] a;\nint i = 0 - 1;\na[i] = 1;\nprint(i);\n", 1), printf=True)
+        self.assertEqual(process.returncode, -4)    # SIGILL
+        self.assertEqual(process.stdout, b"")
+
+    def test_repl(self):
+        session = ReplSession(arena_size=2**20)
+        run_line = lambda src: session.execute(src, capture=True)[1]
+        run_line("int[10] a; int i = 0; while (i < 10) { a[i] = i * i; i = i + 1; }")
+        self.assertEqual(run_line("int[10] b; i = 0; while (i < 9) { b[i] = a[i] + a[i + 1]; i = i + 1; } "
+                                  "print(b[8]);"), "145\n")
+        self.assertEqual(run_line("print(a[9]);"), "81\n")
+        with self.assertRaisesRegex(RuntimeError, "SIGILL"):
+            run_line("i = 10; a[i] = 1;")
+        self.assertEqual(run_line("i = 3; a[i] = 5; print(a[3]);"), "5\n")
+
+if __name__ == "__main__":
+    unittest.main()
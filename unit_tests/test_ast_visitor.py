@@ -0,0 +1,68 @@
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.semantic_analysis.semantic_analyzer import SemanticAnalyzer
+from src.intermediate_representation.ir_generator import IRGenerator
+
+def parse(source):
+    return Parser(Lexer(source).stream()).parse()
+
+class TestASTVisitor(unittest.TestCase):
+    def test_long_left_deep_expression(self):
+        ast = parse("int a = 1;\nint s = " + " + ".join(["a"] * 5000) + ";\n")
+        SemanticAnalyzer(ast).analyze()
+        ir = IRGenerator(ast).gen()
+        self.assertEqual(sum(1 for instr in ir if instr.op == "add"), 4999)
+
+    def test_deeply_nested_blocks(self):
+        depth = 3000
+        source = "int x = 1;\n" + "if (x > 0) { " * depth + "x = x + 1;" + " }" * depth
+        ast = parse(source)
+        SemanticAnalyzer(ast).analyze()
+        ir = IRGenerator(ast).gen()
+        self.assertEqual(sum(1 for instr in ir if instr.op == "if"), depth)
+
+    def test_deeply_nested_parentheses(self):
+        depth = 10000
+        ast = parse("int a = 1;\nint y = " + "(" * depth + "a + 2" + ")" * depth + " * 3;\n")
+        self.assertEqual(repr(ast[1].expr), "BinaryExpr(BinaryExpr(VarExpr('a'), '+', NumberExpr(2)), '*', NumberExpr(3))")
+        SemanticAnalyzer(ast).analyze()
+        IRGenerator(ast).gen()
+        with self.assertRaisesRegex(SyntaxError, "Expected RPAREN"):
+            parse("int y = " + "(" * depth + "1" + ")" * (depth - 1) + ";\n")
+
+    def test_deep_right_operands(self):
+        depth = 10000
+        ast = parse("int a = 1;\nint y = " + "a - (" * depth + "a" + ")" * depth + ";\n"
+                    "int[2] v;\nint z = " + "v[" * depth + "0" + "]" * depth + " * 2 + a;\n")
+        SemanticAnalyzer(ast).analyze()
+        ir = IRGenerator(ast).gen()
+        self.assertEqual(sum(1 for instr in ir if instr.op == "sub"), depth)
+        self.assertEqual(repr(ast[3].expr.left.right), "NumberExpr(2)")
+
+    def test_dispatch_table_cached_per_class(self):
+        ast = parse("int x = 1;\nprint(x);\n")
+        SemanticAnalyzer(ast).analyze()
+        IRGenerator(ast).gen()
+        self.assertIn("_dispatch", SemanticAnalyzer.__dict__)
+        self.assertIn("_dispatch", IRGenerator.__dict__)
+        self.assertIsNot(SemanticAnalyzer._dispatch, IRGenerator._dispatch)
+
+    def test_undeclared_variable_inside_while(self):
+        ast = parse("int x = 1;\nwhile (x > 0) { y = 2; }\n")
+        with self.assertRaises(RuntimeError):
+            SemanticAnalyzer(ast).analyze()
+
+    def test_string_operands_are_rejected(self):
+        for source in ('str s = "abc";\nint x = s + 1;\nprint(x);\n',
+                       'str s = "abc";\nint x = 1;\nwhile (s < x) { x = x + 1; }\n',
+                       'str s = "abc";\nint[2] a;\na[0] = 2 * s;\n'):
+            with self.subTest(source=source), self.assertRaisesRegex(RuntimeError, "Type mismatch"):
+                SemanticAnalyzer(parse(source)).analyze()
+
+    def test_variable_not_declared_in_its_initializer(self):
+        with self.assertRaisesRegex(RuntimeError, "Use of undeclared variable x"):
+            SemanticAnalyzer(parse("int x = x + 1;\n")).analyze()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.semantic_analysis.semantic_analyzer import SemanticAnalyzer
+from src.intermediate_representation.ir_generator import IRGenerator
+from src.intermediate_representation.ir_optimizer import IROptimizer
+from src.code_generator.asm_generator import AsmGenerator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from program_generator import generate_program
+from compile_throughput import fit_power_law, compare
+import runtime
+
+class TestProgramGenerator(unittest.TestCase):
+    def compile(self, src):
+        ast = Parser(Lexer(src).tokenize()).parse()
+        SemanticAnalyzer(ast).analyze()
+        return AsmGenerator(IROptimizer(IRGenerator(ast).gen()).optimize()).gen()
+
+    def test_every_shape_compiles(self):
+        for width, depth, variables, strings in [(1, 0, 1, 0), (3, 2, 20, 4), (8, 5, 3, 10)]:
+            src = generate_program(300, width, depth, variables, strings, seed=width)
+            self.assertIn("main:", self.compile(src))
+            # one statement per line, closing braces on their own lines
+            statements = [line for line in src.splitlines() if line.strip() != "}"]
+            self.assertGreaterEqual(len(statements), 300)
+
+    def test_shape(self):
+        src = generate_program(200, width=4, depth=3, variables=5, strings=2)
+        self.assertIn("int v4 = 5;", src)
+        self.assertNotIn("v5", src)
+        self.assertIn('str s1 = "string 1";', src)
+        self.assertIn("\n        while (n2 > 0) {", src)     # third level
+        self.assertNotIn("\n            if (", src)
+
+    def test_deterministic(self):
+        self.assertEqual(generate_program(100, seed=3), generate_program(100, seed=3))
+        self.assertNotEqual(generate_program(100, seed=3), generate_program(100, seed=4))
+
+
+class TestScalingFit(unittest.TestCase):
+    def test_fit_power_law(self):
+        sizes = [100, 1000, 10000]
+        a, k = fit_power_law(sizes, [2e-7 * n ** 2 for n in sizes])
+        self.assertAlmostEqual(k, 2.0)
+        self.assertAlmostEqual(a, 2e-7)
+        # timings under the noise floor don't count
+        self.assertIsNone(fit_power_law(sizes, [1e-5, 1e-4, 0.5]))
+
+    def test_regression_is_reported(self):
+        results = {"sizes": [100, 1000], "phases": {
+            "parse": {"seconds": [0.01, 0.1], "exponent": 1.0},
+            "opt.dead_code_elimination": {"seconds": [0.01, 1.0], "exponent": 2.0}}}
+        baseline = {"phases": {"parse": {"exponent": 1.05}, "opt.dead_code_elimination": {"exponent": 1.1}}}
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(compare(results, baseline, 0.15), ["opt.dead_code_elimination"])
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestRuntimeBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_every_level_is_measured(self):
+        path = os.path.join(self.tmp, "loop.txt")
+        with open(path, "w") as file:
+            file.write("int i = 0;\nint unused = 5;\nwhile (i < 100) { i = i + 1; }\nprint(i);\n")
+        results = runtime.run([path], [0, 1], runs=2, report=lambda line: None)
+        levels = results["programs"]["loop"]
+        self.assertEqual(set(levels), {"O0", "O1"})
+        for row in levels.values():
+            self.assertEqual(len(row["times_s"]), 2)
+            self.assertGreater(row["median_s"], 0)
+        # the optimizer drops the dead store
+        self.assertLess(levels["O1"]["code_bytes"], levels["O0"]["code_bytes"])
+
+    def test_programs_exist(self):
+        names = {os.path.basename(path) for path in os.listdir(runtime.PROGRAMS)}
+        self.assertTrue({"count_loop.txt", "nested_while.txt", "division.txt", "print_loop.txt"} <= names)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+from src.build import build_batch, build_program, output_bases
+from src.build_cache import BuildCache
+from src.code_generator.elf_writer import ElfWriter
+from src.code_generator.linker import Linker
+from src.code_generator.x86_encoder import Assembler
+
+class TestBatchBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp, "build")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def test_output_bases_are_unique(self):
+        bases = output_bases(["a/prog.txt", "b/prog.txt", "main.txt"], "out")
+        self.assertEqual(bases, [os.path.join("out", "prog"), os.path.join("out", "prog-2"),
+                                 os.path.join("out", "main")])
+
+    def test_numbered_names_skip_taken_ones(self):
+        bases = output_bases(["a.txt", "d/a.txt", "a-2.txt"], "out")
+        self.assertEqual(bases, [os.path.join("out", name) for name in ("a", "a-2", "a-2-2")])
+        sources = [self.write(name, f"int x = {i};\nprint(x);\n")
+                   for i, name in enumerate(("a.txt", "d/a.txt", "a-2.txt"))]
+        results = build_batch(sources, 2, self.out_dir, report=lambda line: None)
+        self.assertTrue(all(result.error is None for result in results))
+        for i, name in enumerate(("a", "a-2", "a-2-2")):
+            output = subprocess.run([os.path.join(self.out_dir, name)], capture_output=True, text=True).stdout
+            self.assertEqual(output, f"{i}\n")
+
+    def test_batch_builds_every_input(self):
+        sources = [self.write(f"prog{i}.txt", f"int x = {i};\nprint(x);\n") for i in range(4)]
+        sources.append(self.write("bad.txt", "print(nope);\n"))
+        lines = []
+        results = build_batch(sources, 2, self.out_dir, report=lines.append)
+
+        failed = [result.source for result in results if result.error is not None]
+        self.assertEqual(failed, [sources[-1]])
+        self.assertEqual(len(lines), len(sources) + 1)
+        self.assertIn("5 files, 1 failed", lines[-1])
+        for i in range(4):
+            exe = os.path.join(self.out_dir, f"prog{i}")
+            output = subprocess.run([exe], capture_output=True, text=True).stdout
+            self.assertEqual(output, f"{i}\n")
+
+
+    def test_missing_tool_fails_its_inputs_only(self):
+        sources = [self.write(f"prog{i}.txt", f"int x = {i};\nprint(x);\n") for i in range(3)]
+        lines = []
+        with mock.patch.dict(os.environ, {"PATH": self.tmp}):
+            results = build_batch(sources, 2, self.out_dir, linker="gcc", report=lines.append)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all("gcc" in result.error for result in results), lines)
+        self.assertIn("3 files, 3 failed", lines[-1])
+
+
+class TestProgramBuild(unittest.TestCase):
+    PARTS = {
+        "first.txt": 'int x = 5;\nstr greeting = "hello";\nprint(greeting);\n',
+        "second.txt": "x = x + 1;\nint y = x * 2;\nprint(y);\n",
+        "third-part.txt": "int i = 0;\nwhile (i < y) { i = i + x; }\nprint(i);\nprint(greeting);\n",
+    }
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp, "build")
+        self.exe = os.path.join(self.tmp, "prog")
+        self.sources = [self.write(name, text) for name, text in self.PARTS.items()]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def build(self, **options):
+        lines = []
+        results = build_program(self.sources, self.exe, self.out_dir, report=lines.append, **options)
+        return results, lines
+
+    def run_exe(self):
+        return subprocess.run([self.exe], capture_output=True, text=True).stdout
+
+    def test_files_share_variables(self):
+        results, lines = self.build(jobs=2)
+        self.assertTrue(all(result.error is None for result in results), lines)
+        self.assertEqual(self.run_exe(), "hello\n12\n12\nhello\n")
+        with open(os.path.join(self.out_dir, "second.asm")) as asm_file:
+            asm = asm_file.read()
+        self.assertIn("global y", asm)
+        self.assertIn("extern x", asm)
+        self.assertNotIn("x: resq", asm)
+
+    @unittest.skipUnless(shutil.which("gcc"), "gcc not installed")
+    def test_gcc_links_the_same_objects(self):
+        results, lines = self.build(linker="gcc", printf=True)
+        self.assertTrue(all(result.error is None for result in results), lines)
+        self.assertEqual(self.run_exe(), "hello\n12\n12\nhello\n")
+
+    def test_only_edited_file_is_compiled_again(self):
+        cache = BuildCache(os.path.join(self.tmp, "cache"))
+        self.build(cache=cache)
+        self.write("second.txt", "x = x + 2;\nint y = x * 2;\nprint(y);\n")
+        results, lines = self.build(cache=cache)
+        self.assertEqual([result.cached for result in results], [True, False, True, False])
+        self.assertIn("3 files, 1 compiled, 2 cached, 0 failed", lines[-1])
+        self.assertEqual(self.run_exe(), "hello\n14\n14\nhello\n")
+
+    def test_variable_declared_twice(self):
+        self.sources.append(self.write("again.txt", "int y = 1;\n"))
+        results, lines = self.build()
+        self.assertEqual(len(results), 1)
+        self.assertIn("Variable y declared in both", results[0].error)
+        self.assertFalse(os.path.exists(self.exe))
+
+    def test_functions_are_local_to_their_file(self):
+        # both files declare fib, its parameter x isn't the variable x
+        fib = "int fib(int x) {{ if (x < 2) {{ return {}; }} return fib(x - 1) + fib(x - 2); }}\n"
+        self.sources.append(self.write("fib1.txt", fib.format("x") + "print(fib(x));\n"))
+        self.sources.append(self.write("fib2.txt", fib.format("1") + "print(fib(x));\n"))
+        results, lines = self.build()
+        self.assertTrue(all(result.error is None for result in results), lines)
+        self.assertEqual(self.run_exe(), "hello\n12\n12\nhello\n8\n13\n")
+
+    def test_files_share_arrays(self):
+        self.sources.append(self.write("fill.txt", "int[4] v;\ni = 0;\nwhile (i < 4) { v[i] = i * x; i = i + 1; }\n"))
+        self.sources.append(self.write("use.txt", "int last = v[3];\nprint(last);\n"))
+        results, lines = self.build()
+        self.assertTrue(all(result.error is None for result in results), lines)
+        self.assertEqual(self.run_exe(), "hello\n12\n12\nhello\n18\n")
+        with open(os.path.join(self.out_dir, "use.asm")) as asm_file:
+            asm = asm_file.read()
+        self.assertRegex(asm, r"extern .*\bv\b")
+        self.assertNotIn("v: resq", asm)
+
+    def test_numbered_names_skip_taken_ones(self):
+        self.sources = [self.write("p1.txt", "int x = 1;\nprint(x);\n"),
+                        self.write("p2.txt", "x = x + 1;\nprint(x);\n")]
+        os.makedirs(os.path.join(self.tmp, "d"))
+        self.sources.append(self.write("d/p1.txt", "x = x * 10;\nprint(x);\n"))
+        self.sources.append(self.write("p1-2.txt", "x = x + 3;\nprint(x);\n"))
+        results, lines = self.build(jobs=2)
+        self.assertTrue(all(result.error is None for result in results), lines)
+        self.assertEqual(self.run_exe(), "1\n2\n20\n23\n")
+        self.assertEqual(sorted(name for name in os.listdir(self.out_dir) if name.endswith(".o")),
+                         ["main.o", "p1-2-2.o", "p1-2.o", "p1.o", "p2.o"])
+
+    def test_linker_rejects_duplicate_symbols(self):
+        code = ElfWriter(Assembler().assemble("global f\nf:\n    ret")).object_file()
+        linker = Linker()
+        linker.add_object(code, "a.o")
+        with self.assertRaisesRegex(ValueError, "f defined in both a.o and b.o"):
+            linker.add_object(code, "b.o")
+
+if __name__ == "__main__":
+    unittest.main()
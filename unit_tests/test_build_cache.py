@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import unittest
+from src.build_cache import BuildCache
+
+class TestBuildCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.cache = BuildCache(os.path.join(self.tmp, "cache"), max_size=12_000)
+        self.source = self.write("prog.txt", "int x = 1;\nprint(x);\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp, name)
+        with open(path, "w") as file:
+            file.write(text)
+        return path
+
+    def test_key_depends_on_source_and_flags(self):
+        key = self.cache.key(self.source, {"gcc": ["-no-pie"]})
+        self.assertEqual(key, self.cache.key(self.source, {"gcc": ["-no-pie"]}))
+        self.assertNotEqual(key, self.cache.key(self.source, {"gcc": ["-O2"]}))
+        self.write("prog.txt", "int x = 2;\nprint(x);\n")
+        self.assertNotEqual(key, self.cache.key(self.source, {"gcc": ["-no-pie"]}))
+
+    def test_store_and_lookup(self):
+        asm = self.write("out.asm", "section .text")
+        key = self.cache.key(self.source, {})
+        restored = os.path.join(self.tmp, "restored.asm")
+        self.assertFalse(self.cache.lookup(key, {"out.asm": restored}))
+        self.cache.store(key, {"out.asm": asm})
+        self.assertTrue(self.cache.lookup(key, {"out.asm": restored}))
+        with open(restored) as file:
+            self.assertEqual(file.read(), "section .text")
+
+    def test_lru_eviction(self):
+        blob = self.write("blob", "x" * 4000)
+        for name in ("a", "b", "c"):
+            self.cache.store(name, {"blob": blob})
+        # touch 'a' so 'b' becomes the least recently used
+        os.utime(self.cache.entry_path("a"), (0, 1))
+        os.utime(self.cache.entry_path("b"), (0, 0))
+        os.utime(self.cache.entry_path("c"), (0, 2))
+        self.cache.store("d", {"blob": blob})
+        names = sorted(os.path.basename(path) for _, _, path in self.cache.entries())
+        self.assertEqual(names, ["a", "c", "d"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+import os
+import unittest
+from src.intermediate_representation.ir_optimizer import IROptimizer
+from src.intermediate_representation.cfg import ControlFlowGraph, Dominance
+from src.intermediate_representation.dataflow import Liveness, ReachingDefinitions, AvailableExpressions
+from src.intermediate_representation.value_numbering import ValueNumbering
+from src.intermediate_representation.loops import LoopOptimizer
+from unit_tests.pipeline import gen_ir, interpret, run_ir
+
+WHILE_PROGRAM = """
+int x = 3;
+int y = 0;
+while (x > 0) {
+    y = y + x;
+    x = x - 1;
+}
+print(y);
+"""
+
+class TestControlFlowGraph(unittest.TestCase):
+    def test_while_blocks_and_edges(self):
+        cfg = ControlFlowGraph(gen_ir(WHILE_PROGRAM))
+        header = cfg.label_to_block["start1"]
+        exit_block = cfg.label_to_block["end2"]
+        body = cfg.blocks[header.index + 1]
+        self.assertEqual(len(cfg.blocks), 4)
+        self.assertEqual(header.succs, [exit_block, body])
+        self.assertEqual(body.succs, [header])
+        self.assertEqual(set(header.preds), {cfg.entry, body})
+        self.assertEqual(cfg.entry.succs, [header])
+
+    def test_flatten_roundtrip(self):
+        ir = gen_ir(WHILE_PROGRAM)
+        self.assertEqual(ControlFlowGraph(ir).flatten(), ir)
+
+    def test_dominators(self):
+        cfg = ControlFlowGraph(gen_ir("int x = 1;\nwhile (x > 0) {\n"
+                                      "if (x > 5) { x = 0; } else { x = x - 1; }\n}\nprint(x);\n"))
+        idom, children = cfg.dominator_tree()
+        header = cfg.label_to_block["start1"]
+        join = cfg.label_to_block["end5"]
+        branch = cfg.blocks[header.index + 1]
+        self.assertEqual(idom[cfg.entry.index], cfg.entry.index)
+        self.assertEqual(idom[header.index], cfg.entry.index)
+        # the if/else join is dominated by the block with the branch, not by either side
+        self.assertEqual(idom[join.index], branch.index)
+        self.assertEqual(idom[cfg.label_to_block["end2"].index], header.index)
+        self.assertIn(join, children[branch.index])
+        dominance = Dominance(idom)
+        self.assertTrue(dominance.dominates(header.index, join.index))
+        self.assertTrue(dominance.dominates(join.index, join.index))
+        self.assertFalse(dominance.dominates(join.index, branch.index))
+        self.assertFalse(dominance.dominates(branch.index + 1, join.index))
+
+    def test_reverse_postorder_starts_at_entry(self):
+        cfg = ControlFlowGraph(gen_ir(WHILE_PROGRAM))
+        order = cfg.reverse_postorder()
+        self.assertIs(order[0], cfg.entry)
+        self.assertEqual(len(order), len(cfg.blocks))
+
+    def test_natural_loops(self):
+        cfg = ControlFlowGraph(gen_ir("int i = 0;\nwhile (i < 3) {\nint j = 0;\n"
+                                      "while (j < 3) { j = j + 1; }\ni = i + 1;\n}\n"))
+        outer, inner = cfg.natural_loops()
+        self.assertIs(outer.header, cfg.label_to_block["start1"])
+        self.assertIs(inner.header, cfg.label_to_block["start3"])
+        self.assertIs(inner.parent, outer)
+        self.assertIsNone(outer.parent)
+        self.assertLess(inner.blocks, outer.blocks)
+        self.assertNotIn(cfg.label_to_block["end2"].index, outer.blocks)
+        self.assertEqual(len(outer.latches), 1)
+
+
+class TestDataflow(unittest.TestCase):
+    def setUp(self):
+        self.cfg = ControlFlowGraph(gen_ir(WHILE_PROGRAM))
+        self.header = self.cfg.label_to_block["start1"]
+        self.exit_block = self.cfg.label_to_block["end2"]
+
+    def test_liveness(self):
+        liveness = Liveness(self.cfg).solve()
+        self.assertEqual(liveness.live_in(self.header), {"x", "y"})
+        self.assertEqual(liveness.live_in(self.exit_block), {"y"})
+        self.assertEqual(liveness.live_out(self.exit_block), set())
+
+    def test_reaching_definitions(self):
+        reaching = ReachingDefinitions(self.cfg).solve()
+        stores = {(d.arg1, d.arg2) for d in reaching.facts_in(self.header)}
+        # initial declarations and the stores from the loop body
+        self.assertEqual(len(stores), 4)
+        self.assertEqual({name for name, _ in stores}, {"x", "y"})
+
+    def test_available_expressions(self):
+        available = AvailableExpressions(self.cfg).solve()
+        self.assertNotIn(("load", "x", None), available.facts_in(self.header))
+        self.assertIn(("load", "x", None), available.facts_in(self.exit_block))
+
+
+class TestDeadCodeElimination(unittest.TestCase):
+    def test_removes_dead_store_chain(self):
+        ir = gen_ir("int a = 1;\nint b = a + 2;\nprint(a);\n")
+        ops = [(instr.op, instr.arg1) for instr in IROptimizer(ir).optimize()]
+        self.assertNotIn(("store", "b"), ops)
+        # a is a constant, print reads the constant, so its store is dead too
+        self.assertNotIn(("store", "a"), ops)
+        self.assertEqual(ops[0], ("const", 1))
+
+    def test_keeps_loop_carried_stores(self):
+        optimizer = IROptimizer(gen_ir(WHILE_PROGRAM))
+        optimizer.dead_code_elimination()
+        ir = optimizer.ir_list
+        stores = [instr.arg1 for instr in ir if instr.op == "store"]
+        self.assertEqual(stores.count("x"), 2)
+        self.assertEqual(stores.count("y"), 2)
+
+    def test_keeps_stores_live_after_the_code(self):
+        ir = gen_ir("int a = 1;\nint b = a + 2;\n")
+        ops = [(instr.op, instr.arg1) for instr in IROptimizer(ir, live_out={"b"}).optimize()]
+        self.assertEqual(ops, [("const", 3), ("store", "b")])
+
+
+    def test_dead_division_that_may_trap_is_kept(self):
+        source = "int x = 5;\nint y = x - 5;\nint z = x / y;\nprint(1);\n"
+        for opt_level in (0, 1):
+            with self.subTest(opt_level=opt_level), self.assertRaisesRegex(RuntimeError, "SIGFPE"):
+                interpret(source, opt_level)
+            if os.path.exists("/proc/self/maps"):
+                process = run_ir(gen_ir(source, opt_level))
+                self.assertEqual((process.returncode, process.stdout), (-8, b""), opt_level)    # SIGFPE
+        # by a constant other than 0 and -1 it can't trap
+        ir = IROptimizer(gen_ir("int x = 5;\nwhile (x < 100) { x = x * 3; }\nint z = x / 4;\nprint(1);\n")).optimize()
+        self.assertNotIn("div", [instr.op for instr in ir])
+
+
+class TestConstantPropagation(unittest.TestCase):
+    def optimize(self, source):
+        return IROptimizer(gen_ir(source)).optimize()
+
+    def test_resolves_branch_through_variables(self):
+        ir = self.optimize("int x = 4;\nif (x > 3) { print(x); } else { print(0); }\n")
+        ops = [instr.op for instr in ir]
+        self.assertNotIn("if", ops)
+        self.assertNotIn("gt", ops)
+        self.assertEqual(ops.count("call"), 1)
+        self.assertIn(("const", 4), [(instr.op, instr.arg1) for instr in ir])
+
+    def test_removes_loop_that_never_runs(self):
+        ir = self.optimize("int x = 0;\nwhile (x > 0) { print(x); x = x - 1; }\nprint(x);\n")
+        self.assertEqual([instr.op for instr in ir if instr.op not in ("label", "goto")],
+                         ["const", "param", "param", "call"])
+
+    def test_int64_semantics(self):
+        ir = self.optimize("int a = 0 - 7;\nint b = a / 2;\nprint(b);\n"
+                           "int big = 4611686018427387904;\nint c = big * 2;\nprint(c);\n")
+        consts = [instr.arg1 for instr in ir if instr.op == "const"]
+        # division truncates toward zero, multiplication wraps around
+        self.assertEqual(consts, [-3, -2**63])
+
+    def test_division_by_zero_is_left_to_run_time(self):
+        ir = self.optimize("int z = 0;\nint q = 5 / z;\nprint(q);\n")
+        self.assertIn("div", [instr.op for instr in ir])
+
+    def test_loop_variables_are_not_constant(self):
+        ir = self.optimize(WHILE_PROGRAM)
+        self.assertIn("if_false", [instr.op for instr in ir])
+
+
+class TestValueNumbering(unittest.TestCase):
+    def number(self, source):
+        return ValueNumbering(ControlFlowGraph(gen_ir(source))).run()
+
+    def count(self, ir, op, arg1=None):
+        return sum(instr.op == op and (arg1 is None or instr.arg1 == arg1) for instr in ir)
+
+    def test_common_subexpressions_and_loads(self):
+        ir = self.number("int x = 3;\nint y = x * x + x * x;\nprint(y);\n")
+        # x and y are forwarded from their stores, the product is computed once
+        self.assertEqual(self.count(ir, "load"), 0)
+        self.assertEqual(self.count(ir, "mul"), 1)
+        self.assertEqual(self.count(ir, "add"), 1)
+        add = next(instr for instr in ir if instr.op == "add")
+        self.assertEqual(add.arg1, add.arg2)
+
+    def test_repeated_constants_and_commutative_operands(self):
+        ir = self.number("int a = 7;\nint b = 7;\nint c = a + b;\nint d = b + a;\n")
+        self.assertEqual(self.count(ir, "const"), 1)
+        self.assertEqual(self.count(ir, "add"), 1)
+
+    def test_store_invalidates_loads(self):
+        ir = self.number(WHILE_PROGRAM)
+        # x and y are stored in the loop, the header reloads them
+        header = ControlFlowGraph(ir).label_to_block["start1"]
+        self.assertEqual(self.count(header.instrs, "load", "x"), 1)
+        # the loop body reuses the header's load of x instead of loading it again
+        self.assertEqual(self.count(ir, "load", "x"), 1)
+        self.assertEqual(self.count(ir, "load", "y"), 2)
+
+    def test_join_forgets_variables_stored_on_one_side(self):
+        ir = self.number("int x = 1;\nint y = 2;\nwhile (x > 0) {\n"
+                         "if (y > 1) { x = 0; } else { y = 0; }\nprint(x);\nprint(y);\n}\n")
+        cfg = ControlFlowGraph(ir)
+        join = cfg.label_to_block["end5"]
+        self.assertEqual(self.count(join.instrs, "load", "x"), 1)
+        self.assertEqual(self.count(join.instrs, "load", "y"), 1)
+
+
+class TestLoopOptimizer(unittest.TestCase):
+    def optimize(self, source):
+        return LoopOptimizer(ControlFlowGraph(gen_ir(source))).run()
+
+    def loop_body(self, ir, label="start1"):
+        start = next(i for i, instr in enumerate(ir) if instr.op == "label" and instr.dest == label)
+        end = next(i for i, instr in enumerate(ir) if instr.op == "goto" and instr.dest == label)
+        return ir[start:end + 1]
+
+    def test_hoists_invariant_arithmetic(self):
+        ir = self.optimize("int a = 6;\nint i = 0;\nint s = 0;\n"
+                           "while (i < 10) { s = s + a * a / 3; i = i + 1; }\nprint(s);\n")
+        body = self.loop_body(ir)
+        self.assertNotIn(("load", "a"), [(instr.op, instr.arg1) for instr in body])
+        self.assertNotIn("div", [instr.op for instr in body])
+        # computed once, before the header
+        header = ir.index(body[0])
+        self.assertIn("div", [instr.op for instr in ir[:header]])
+
+    def test_keeps_division_that_may_trap(self):
+        ir = self.optimize("int a = 6;\nint z = 0;\nint i = 0;\n"
+                           "while (i < 0) { a = 6 / z; i = i + 1; }\n")
+        self.assertIn("div", [instr.op for instr in self.loop_body(ir)])
+
+    def test_strength_reduction_and_exit_test(self):
+        ir = self.optimize("int i = 0;\nint s = 0;\n"
+                           "while (i < 100) { s = s + i * 4; i = i + 1; }\nprint(s);\n")
+        body = self.loop_body(ir)
+        self.assertNotIn("mul", [instr.op for instr in body])
+        # i.ivN steps by 4 and the header compares it to 400 instead of i to 100
+        stores = [instr.arg1 for instr in body if instr.op == "store"]
+        self.assertEqual(stores, ["s", "i", "i.iv1"])
+        self.assertIn(("const", 4), [(instr.op, instr.arg1) for instr in body])
+        defs = {instr.dest: (instr.op, instr.arg1) for instr in body}
+        test = next(instr for instr in body if instr.op == "lt")
+        self.assertEqual((defs[test.arg1], defs[test.arg2]), (("load", "i.iv1"), ("const", 400)))
+
+    def test_exit_test_kept_when_scaled_bound_overflows(self):
+        ir = self.optimize("int i = 4611686018427387000;\nint s = 0;\n"
+                           "while (i < 4611686018427387900) { s = s + i * 4; i = i + 100; }\nprint(s);\n")
+        body = self.loop_body(ir)
+        self.assertNotIn("mul", [instr.op for instr in body])
+        self.assertIn(("const", 4611686018427387900), [(instr.op, instr.arg1) for instr in body])
+
+    def test_conditional_update_is_not_an_induction_variable(self):
+        ir = self.optimize("int i = 0;\nint s = 0;\nwhile (i < 10) {\n"
+                           "if (s > 5) { i = i + 2; } else { i = i + 1; }\ns = s + i * 3;\n}\nprint(s);\n")
+        self.assertIn("mul", [instr.op for instr in self.loop_body(ir)])
+
+if __name__ == "__main__":
+    unittest.main()
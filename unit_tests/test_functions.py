@@ -0,0 +1,130 @@
+import os
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.semantic_analysis.semantic_analyzer import SemanticAnalyzer
+from src.intermediate_representation.ir_interpreter import MAX_CALL_DEPTH
+from src.intermediate_representation.ir_function import called_functions
+from src.repl_session import ReplSession
+from unit_tests.pipeline import compile_source, interpret, run_ir
+
+# inlined, tail recursive, recursive, string and stack argument functions
+PROGRAM = """
+int sq(int x) {
+    return x * x;
+}
+int fact(int n, int acc) {
+    if (n <= 1) { return acc; }
+    return fact(n - 1, acc * n);
+}
+int fib(int n) {
+    if (n < 2) { return n; }
+    return fib(n - 1) + fib(n - 2);
+}
+str pick(int n, str a, str b) {
+    str none = "none";
+    if (n > 1) { return none; }
+    if (n > 0) { return a; }
+    return b;
+}
+int many(int a, int b, int c, int d, int e, int f, int g, int h) {
+    print(h);
+    return a + b * 2 + c * 3 + d * 4 + e * 5 + f * 6 + g * 7 + h * 8;
+}
+str hi = "hi";
+int y = sq(7);
+print(y);
+print(fact(12, 1));
+print(fib(15));
+print(pick(1, hi, "no"));
+print(pick(0, hi, "no"));
+print(pick(2, hi, "no"));
+int z = fib(3);
+print(many(z, z + 1, z + 2, z + 3, z + 4, z + 5, z + 6, z + 7));
+int i = 0;
+while (i < 5) {
+    y = y + sq(i);
+    i = i + 1;
+}
+print(y);
+"""
+
+EXPECTED = "49\n479001600\n610\nhi\nno\nnone\n9\n240\n79\n"
+
+class TestFunctions(unittest.TestCase):
+    def test_parse(self):
+        ast = Parser(Lexer("int f(int a, str b) { return a; }\nprint(f(1, \"x\"));").stream()).parse()
+        self.assertEqual(repr(ast[0]), "FunctionDecl(INT, 'f', [('INT', 'a'), ('STRING', 'b')], "
+                         "BlockStmt([ReturnStmt(VarExpr('a'))]))")
+        self.assertEqual(repr(ast[1].expr), "CallExpr('f', [NumberExpr(1), StringExpr('\"x\"')])")
+        with self.assertRaisesRegex(SyntaxError, "top level"):
+            Parser(Lexer("if (1 < 2) { int g() { return 1; } }").stream()).parse()
+
+    def test_semantic_errors(self):
+        cases = {
+            "int f(int a) { return a; }\nint f(int b) { return b; }": "Redefinition of function f",
+            "int f(int a, int a) { return a; }": "Duplicate parameter",
+            "print(g(1));": "undeclared function g",
+            "int f(int a) { return a; }\nprint(f(1, 2));": "takes 1 arguments, 2 given",
+            "int f(int a) { return a; }\nprint(f(\"x\"));": "argument 1 of f",
+            "int f(int a) { return \"x\"; }": "Type mismatch",
+            "return 1;": "outside of a function",
+            "int x = 1;\nint f() { return x; }": "undeclared variable x",
+        }
+        for source, message in cases.items():
+            with self.subTest(source=source), self.assertRaisesRegex(RuntimeError, message):
+                SemanticAnalyzer(Parser(Lexer(source).stream()).parse()).analyze()
+
+    def test_small_functions_are_inlined(self):
+        ir, functions = compile_source(PROGRAM, 1)
+        called = {instr.arg1 for instr in ir if instr.op == "call" and instr.arg2 is not None}
+        # fib calls itself, many is over the budget; fact is a loop after tail call elimination
+        self.assertEqual(called, {"fn.fib", "fn.many"})
+        self.assertEqual([function.name for function in called_functions(ir, functions)], ["fib", "many"])
+        # with constant arguments, most of the body folds away
+        ir, _ = compile_source(PROGRAM.replace("print(many(z, z + 1", "print(many(2, z + 1"), 1)
+        self.assertNotIn("fn.many", {instr.arg1 for instr in ir if instr.op == "call"})
+
+    def test_tail_calls_become_jumps(self):
+        _, functions = compile_source("int fact(int n, int acc) {\nif (n <= 1) { return acc; }\n"
+                                      "return fact(n - 1, acc * n);\n}\nprint(fact(5, 1));\n", 1)
+        fact = functions["fn.fact"]
+        self.assertFalse(any(instr.op == "call" for instr in fact.ir_opt))
+        # deep enough to overflow the stack, were it still recursive
+        self.assertEqual(interpret("int count(int n, int acc) {\nif (n == 0) { return acc; }\n"
+                                   "return count(n - 1, acc + 1);\n}\nprint(count(1000000, 0));\n"),
+                         "1000000\n")
+
+    def test_optimization_levels_agree(self):
+        self.assertEqual(interpret(PROGRAM, 0), EXPECTED)
+        self.assertEqual(interpret(PROGRAM, 1), EXPECTED)
+
+    def test_call_depth_limit(self):
+        deep = "int deep(int n) {{ if (n == 0) {{ return 0; }} return 1 + deep(n - 1); }}\nprint(deep({}));\n"
+        self.assertEqual(interpret(deep.format(MAX_CALL_DEPTH)), f"{MAX_CALL_DEPTH}\n")
+        with self.assertRaisesRegex(RuntimeError, "SIGSEGV"):
+            interpret(deep.format(MAX_CALL_DEPTH + 100))
+
+    @unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+    def test_native(self):
+        for opt_level in (0, 1):
+            for printf in (False, True):
+                ir, functions = compile_source(PROGRAM, opt_level)
+                output = run_ir(ir, functions, printf=printf, peephole=bool(opt_level)).stdout
+                self.assertEqual(output.decode(), EXPECTED, (opt_level, printf))
+
+    def test_repl(self):
+        session = ReplSession(arena_size=2**20)
+        run_line = lambda src: session.execute(src, capture=True)[1]
+        run_line("int fib(int n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }")
+        run_line("int sq(int x) { return x * x; }")
+        self.assertEqual(run_line("int a = fib(10); print(sq(a));"), "3025\n")
+        self.assertEqual(run_line("int sum(int n) { int t = 0; while (n > 0) { t = t + fib(n); n = n - 1; } "
+                                  "return t; } print(sum(10));"), "143\n")
+        with self.assertRaises(RuntimeError):
+            run_line("int f(int x) { return x; } print(nope);")
+        # f wasn't declared, so it can be declared now
+        self.assertEqual(run_line("int f(int x) { return x + 1; } print(f(a));"), "56\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import unittest
+from src.intermediate_representation.ir_optimizer import IROptimizer
+from src.code_generator.asm_generator import AsmGenerator
+from unit_tests.pipeline import gen_ir, run_asm
+
+def gen_asm(source):
+    generator = AsmGenerator(gen_ir(source))
+    return generator.gen(), generator
+
+def body(source):
+    asm, generator = gen_asm(source)
+    return [line.strip() for line in asm.split("main:")[1].splitlines()], generator
+
+class TestInstructionSelector(unittest.TestCase):
+    def test_update_in_memory(self):
+        lines, generator = body("int x = 5; int y = 2; x = x + 1; y = y - x; x = x - 1; print(x);")
+        self.assertEqual(lines[3:9], ["mov qword [x], 5", "mov qword [y], 2", "inc qword [x]",
+                                      "mov rcx, [x]", "sub [y], rcx", "dec qword [x]"])
+        # only the two values in rcx need a location
+        self.assertEqual(len(generator.temp_to_loc), 2)
+
+    def test_immediates_and_cheaper_forms(self):
+        lines, _ = body("int x = 7; int y = x * 8; int z = x * 3 + 5; int w = x / z; print(w);")
+        self.assertIn("shl rcx, 3", lines)
+        self.assertIn("imul rcx, [x], 3", lines)
+        self.assertIn("lea r8, [rcx+5]", lines)
+        self.assertIn("idiv qword [z]", lines)
+
+    def test_multiply_by_lea(self):
+        lines, _ = body("int x = 7; int z = (x - 1) * 5 + (x + 2) * 9; print(z);")
+        self.assertIn("lea r8, [rcx+rcx*4]", lines)
+        self.assertIn("lea r9, [rcx+rcx*8]", lines)
+
+    def test_compare_and_branch(self):
+        lines, _ = body("int x = 3; if (7 > x) { print(x); }")
+        self.assertEqual(lines[4:6], ["cmp qword [x], 7", "jl true1"])
+        self.assertFalse([line for line in lines if line.startswith("set")])
+
+    def test_loop_variable_keeps_plain_loads(self):
+        lines, _ = body("int i = 0; while (i < 10) { i = i + 1; } print(i);")
+        self.assertEqual(lines[5:11], ["mov rcx, [i]", "cmp rcx, 10", "jge end2", "mov rcx, [i]",
+                                       "lea r8, [rcx+1]", "mov [i], r8"])
+
+    def test_promoted_loop_stays_in_registers(self):
+        ir = IROptimizer(gen_ir("int i = 0;\nint s = 0;\nwhile (i < 9) { s = s - i; i = i + 2; }\nprint(s);\n")).optimize()
+        generator = AsmGenerator(ir)
+        lines = [line.strip() for line in generator.gen().split("main:")[1].split("ret")[0].splitlines()]
+        i = generator.loc(ir[1].dest)
+        # i + 2 is computed in i's register, the copy back to it is gone
+        self.assertIn(f"add {i}, 2", lines)
+        self.assertNotIn(f"mov {i}, {i}", lines)
+        self.assertFalse([line for line in lines if "[" in line and "rel" not in line])
+
+    def test_destination_is_the_second_operand(self):
+        generator = AsmGenerator([])
+        generator.lower_binary("sub", "rcx", "r8", "rcx")
+        generator.lower_binary("add", "rcx", "r8", "rcx")
+        generator.lower_set("l", "rcx", "rcx", "5")
+        self.assertEqual(generator.asm, ["    mov rax, r8", "    sub rax, rcx", "    mov rcx, rax",
+                                         "    add rcx, r8", "    cmp rcx, 5", "    setl al",
+                                         "    movzx rax, al", "    mov rcx, rax"])
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestInstructionSelectorOutput(unittest.TestCase):
+    def run_program(self, source):
+        return run_asm(gen_asm(source)[0]).stdout.decode()
+
+    def test_spilled_operands(self):
+        # 12 products live at once, more than the free registers
+        names = [f"v{i}" for i in range(12)]
+        source = "".join(f"int {name} = {i + 2};\n" for i, name in enumerate(names))
+        expr = "0"
+        for name in reversed(names):
+            expr = f"({name} * {name} + {expr})"
+        source += f"int big = 5000000000;\nint sum = {expr} * big / (v0 * 500000000) - (v1 > 2) + (v3 == v3);\n"
+        source += "print(sum);\nsum = sum + sum * 3;\nprint(sum);\n"
+        # printf prints the low 32 bits, the intermediate values need all 64
+        self.assertEqual(self.run_program(source), "4090\n16360\n")
+
+if __name__ == "__main__":
+    unittest.main()
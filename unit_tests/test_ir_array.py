@@ -0,0 +1,24 @@
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.intermediate_representation.ir_generator import IRGenerator
+from src.intermediate_representation.ir_instruction import IRInstr
+from src.intermediate_representation.ir_array import IRArray
+
+class TestIRArray(unittest.TestCase):
+    def test_roundtrip(self):
+        source = 'int x = 10;\nwhile (x > 0) { x = x - 3; }\nstr s = "t1 done";\nprint(s);\nprint("t01");\n'
+        ir = IRGenerator(Parser(Lexer(source).tokenize()).parse()).gen()
+        packed = IRArray(ir)
+        self.assertEqual(len(packed), len(ir))
+        self.assertEqual([i.full_str() for i in packed], [i.full_str() for i in ir])
+        self.assertEqual(packed[3].full_str(), ir[3].full_str())
+        self.assertEqual(packed.op(0), ir[0].op)
+
+    def test_generated_names_not_in_table(self):
+        packed = IRArray(IRInstr('const', n, None, f"t{n}") for n in range(1, 1000))
+        self.assertEqual(packed[998].dest, "t999")
+        self.assertNotIn("t999", packed.operands)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import os
+import unittest
+from src.intermediate_representation.ir_interpreter import IRInterpreter
+from unit_tests.pipeline import gen_ir, interpret, run_ir
+
+# wrap-around, division toward zero, 32-bit print, strings, nested loops
+PROGRAM = """
+int big = 9223372036854775807;
+big = big + 1;
+print(big);
+int m = 0 - 7;
+int d = m / 2;
+print(d);
+int k = 7 / m;
+print(k);
+int wide = 5000000000;
+print(wide);
+int p = 3037000500 * 3037000500;
+print(p);
+str s = "héllo";
+print(s);
+print("");
+int i = 0;
+int sum = 0;
+while (i < 100) {
+    int j = 0;
+    while (j < i) {
+        sum = sum * 31 + j;
+        j = j + 1;
+    }
+    if (sum > 1000) {
+        sum = sum / 3;
+    }
+    i = i + 1;
+}
+print(sum);
+print(i);
+"""
+
+class TestIRInterpreter(unittest.TestCase):
+    def test_int64_semantics(self):
+        lines = interpret(PROGRAM).split("\n")
+        # big wraps to INT64_MIN, whose low 32 bits are 0
+        self.assertEqual(lines[:7], ["0", "-3", "-1", "705032704", "145474192", "héllo", ""])
+        self.assertEqual(lines[-2:], ["100", ""])
+
+    def test_optimization_levels_agree(self):
+        self.assertEqual(interpret(PROGRAM, 0), interpret(PROGRAM, 1))
+
+    def test_division_traps(self):
+        for divisor in ("0", "0 - 1"):
+            source = f"int a = 0 - 9223372036854775807;\na = a - 1;\nint b = {divisor};\nint c = a / b;\nprint(c);\n"
+            with self.assertRaisesRegex(RuntimeError, "SIGFPE"):
+                interpret(source)
+
+    def test_loop_runs_as_python_loop(self):
+        source = "int i = 0;\nwhile (i < 10) {\ni = i + 1;\n}\nprint(i);\n"
+        interpreter = IRInterpreter(gen_ir(source, 1))
+        self.assertIn("continue", interpreter.source)
+        output = io.BytesIO()
+        interpreter.run(output)
+        self.assertEqual(output.getvalue(), b"10\n")
+
+    def test_wrap_only_where_it_matters(self):
+        # x * 3 is only read by the add, so only the sum is brought into range
+        source = "int x = 5;\nint y = x * 3 + 1;\nwhile (y < 100) {\ny = y * 3 + 1;\n}\nprint(y);\n"
+        interpreter = IRInterpreter(gen_ir(source, 0))
+        self.assertEqual(interpreter.source.count("wrap("), 2)
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestIRInterpreterNative(unittest.TestCase):
+    def test_same_output_as_native(self):
+        ir = gen_ir(PROGRAM, 1)
+        native = run_ir(ir, peephole=True).stdout
+        output = io.BytesIO()
+        IRInterpreter(ir).run(output)
+        self.assertEqual(output.getvalue(), native)
+
+if __name__ == "__main__":
+    unittest.main()
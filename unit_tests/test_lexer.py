@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 from src.lexical_analysis.lexer import Lexer
 from src.lexical_analysis.token import Token
@@ -61,5 +63,58 @@ class TestLexer(unittest.TestCase):
             self.assertIsInstance(tok.line, int)
             self.assertIsInstance(tok.col, int)
 
+    def test_stream_matches_tokenize(self):
+        source = "int x = 1;\nwhile (x < 3) { x = x + 1; }\n"
+        streamed = [repr(tok) for tok in Lexer(source).stream()]
+        listed = [repr(tok) for tok in Lexer(source).tokenize()]
+        self.assertEqual(streamed, listed)
+
+    def test_token_array_layout(self):
+        tokens = Lexer("int x = 42;\nprint(x);").tokenize()
+        self.assertEqual(len(tokens.kinds), len(tokens.texts))
+        self.assertEqual(tokens.kind(0), "INT")
+        self.assertEqual(repr(tokens[5]), "PRINT('print')@2:1")
+        self.assertIs(tokens.texts[1], tokens.texts[7])
+
+    def test_from_file_memory_mapped(self):
+        source = 'str s = "hi";\nprint(s);\n'
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+            file.write(source)
+        try:
+            with Lexer.from_file(file.name) as lexer:
+                tokens = [repr(tok) for tok in lexer.stream()]
+        finally:
+            os.remove(file.name)
+        self.assertEqual(tokens, [repr(tok) for tok in Lexer(source).tokenize()])
+
+    def test_scanners_agree(self):
+        source = 'int x = 1; # é comment\nstr s = "a\nb ☃";\nprint(s); print_x = x-1 <= -7;\nwhile (x != 2) { x = x * 2 / 1; }'
+        for src in (source, source.encode()):
+            fast = [(tok.kind, tok.text, tok.offset) for tok in Lexer(src).stream()]
+            regex = [(tok.kind, tok.text, tok.offset) for tok in Lexer(src, scanner="regex").stream()]
+            self.assertEqual(fast, regex)
+        kinds = [tok.kind for tok in Lexer("print_x printx print(").stream()]
+        self.assertEqual(kinds, ["IDENT", "IDENT", "PRINT", "LPAREN", "EOF"])
+
+    def test_lazy_positions(self):
+        source = 'int a = 1; # comment\nstr s = "é\nx"; a = 2;'
+        tokens = list(Lexer(source).tokenize())
+        self.assertIsNone(tokens[0].positions.starts)
+        self.assertEqual(repr(tokens[5]), "STRING('str')@2:1")
+        self.assertEqual(repr(tokens[10]), "IDENT('a')@3:5")
+        for src in (source + " @", (source + " @").encode()):
+            with self.assertRaisesRegex(RuntimeError, "3:12"):
+                list(Lexer(src).stream())
+
+    def test_from_empty_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+            pass
+        try:
+            with Lexer.from_file(file.name) as lexer:
+                kinds = [tok.kind for tok in lexer.stream()]
+        finally:
+            os.remove(file.name)
+        self.assertEqual(kinds, ["EOF"])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
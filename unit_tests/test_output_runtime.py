@@ -0,0 +1,55 @@
+import os
+import unittest
+from src.code_generator.output_runtime import BUFFER_SIZE, RUNTIME_ASM, string_length
+from src.code_generator.peephole import PeepholeOptimizer
+from unit_tests.pipeline import gen_asm, gen_ir, run_ir
+
+class TestOutputRuntime(unittest.TestCase):
+    def test_print_calls_the_runtime(self):
+        asm = gen_asm(gen_ir('int x = 5;\nstr s = "hé";\nprint(x);\nprint(s);\n'))
+        main = asm.split("main:")[1].split("ret")[0]
+        self.assertIn("call out_int", main)
+        self.assertIn("call out_str", main)
+        self.assertIn("call out_flush", main)
+        self.assertNotIn("printf", asm)
+        # out_str reads the byte length in front of the string
+        self.assertIn('    dq 3\n    s: db "hé", 0', asm)
+
+    def test_printf_flag(self):
+        asm = gen_asm(gen_ir("int x = 5;\nprint(x);\n"), printf=True)
+        self.assertIn("call printf", asm)
+        self.assertNotIn("out_", asm)
+
+    def test_string_length(self):
+        self.assertEqual(string_length('""'), 0)
+        self.assertEqual(string_length('"a, b"'), 4)
+        self.assertEqual(string_length('"☃"'), 3)
+
+    def test_peephole_keeps_runtime(self):
+        self.assertEqual(PeepholeOptimizer(RUNTIME_ASM).optimize().splitlines(), RUNTIME_ASM.splitlines())
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestOutputRuntimeOutput(unittest.TestCase):
+    def run_program(self, source, printf=False):
+        return run_ir(gen_ir(source), printf=printf).stdout
+
+    def test_same_output_as_printf(self):
+        values = [0, -1, 9, 10, 99, 100, 2147483647, -2147483647, 4294967295, 5000000000, -5000000000]
+        source = "".join(f"int v{i} = {value};\nprint(v{i});\n" for i, value in enumerate(values))
+        source += "int m = 0 - 2147483647;\nm = m - 1;\nprint(m);\n"
+        source += 'str s = "héllo";\nprint(s);\nprint("");\n'
+        output = self.run_program(source)
+        self.assertEqual(output, self.run_program(source, printf=True))
+        self.assertTrue(output.startswith(b"0\n-1\n9\n10\n99\n100\n2147483647\n-2147483647\n-1\n705032704\n"))
+
+    def test_flush_when_full(self):
+        long_string = "x" * (BUFFER_SIZE + 10)
+        source = f'str big = "{long_string}";\nint i = 0;\n'
+        source += "while (i < 20000) {\nprint(i);\ni = i + 1;\n}\nprint(big);\nprint(i);\n"
+        lines = self.run_program(source).decode().split("\n")
+        self.assertEqual(lines[:20000], [str(i) for i in range(20000)])
+        self.assertEqual(lines[20000:], [long_string, "20000", ""])
+
+if __name__ == "__main__":
+    unittest.main()
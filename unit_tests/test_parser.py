@@ -0,0 +1,66 @@
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+
+class TestParser(unittest.TestCase):
+    def test_streamed_tokens(self):
+        source = "int x = 2;\nif (x > 1) { print(x); } else { x = x * 3; }\n"
+        from_list = Parser(Lexer(source).tokenize()).parse()
+        from_stream = Parser(Lexer(source).stream()).parse()
+        self.assertEqual(repr(from_stream), repr(from_list))
+
+    def test_peek_does_not_consume(self):
+        parser = Parser(Lexer("x = 1;").stream())
+        self.assertEqual(parser.peek().kind, "ASSIGN")
+        self.assertEqual(parser.peek(2).kind, "NUMBER")
+        self.assertEqual(parser.current.kind, "IDENT")
+        parser.advance()
+        self.assertEqual(parser.current.kind, "ASSIGN")
+        self.assertEqual(parser.peek(5).kind, "EOF")
+
+    def test_syntax_error(self):
+        with self.assertRaises(SyntaxError):
+            Parser(Lexer("print(1;").stream()).parse()
+
+    def test_precedence(self):
+        ast = Parser(Lexer("x = a - b - c * d / e;\nprint((1 + 2) * 3 < 4 + a);").stream()).parse()
+        self.assertEqual(repr(ast[0].expr), "BinaryExpr(BinaryExpr(VarExpr('a'), '-', VarExpr('b')), '-', "
+                         "BinaryExpr(BinaryExpr(VarExpr('c'), '*', VarExpr('d')), '/', VarExpr('e')))")
+        self.assertEqual(repr(ast[1].expr), "CompareExpr(BinaryExpr(BinaryExpr(NumberExpr(1), '+', NumberExpr(2)), "
+                         "'*', NumberExpr(3)), '<', BinaryExpr(NumberExpr(4), '+', VarExpr('a')))")
+        # comparisons don't chain
+        with self.assertRaises(SyntaxError):
+            Parser(Lexer("int w = 1 < 2 < 3;").stream()).parse()
+
+    def test_all_errors_reported(self):
+        source = ("int x = ;\nprint(x;\nif (x > 1) { y = ; print(2); z = (3; }\n"
+                  "int w = 1 < 2 < 3;\nint ok = 1;\n")
+        parser = Parser(Lexer(source).stream())
+        with self.assertRaises(SyntaxError) as raised:
+            parser.parse()
+        self.assertEqual(len(parser.errors), 5)
+        self.assertEqual(str(raised.exception).split("\n"), [str(error) for error in parser.errors])
+        self.assertIn("at 3:36", str(parser.errors[3]))
+        # only the statements with errors are skipped
+        self.assertEqual(len(parser.asts), 2)
+        self.assertEqual(len(parser.asts[0].then_branch.statements), 1)
+
+    def test_errors_reported_around_deep_expressions(self):
+        deep = "1 - (" * 10000 + "2" + ")" * 10000
+        source = f"int x = {deep};\nint y = (;\nprint(f({deep}, 3 < 4));\nint z = {deep} +;\nx = x;\n"
+        parser = Parser(Lexer(source).stream())
+        with self.assertRaises(SyntaxError):
+            parser.parse()
+        self.assertEqual([str(error) for error in parser.errors],
+                         ["Unexpected SEMI(';')@2:10", "Unexpected SEMI(';')@4:60012"])
+        self.assertEqual(len(parser.asts), 3)
+
+    def test_recovery_at_braces(self):
+        for source, count in (("while (1) { print(1); ", 1), ("} int x = 1; }", 2), ("if (1) { if (2) { x = 1; }", 1)):
+            parser = Parser(Lexer(source).stream())
+            with self.assertRaises(SyntaxError):
+                parser.parse()
+            self.assertEqual(len(parser.errors), count, source)
+
+if __name__ == "__main__":
+    unittest.main()
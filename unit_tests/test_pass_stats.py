@@ -0,0 +1,57 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from src.build import compile_file
+from src.pass_stats import CompileStats, count_nodes
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+
+class TestPassStats(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "prog.txt")
+        with open(self.path, "w") as file:
+            file.write("int x = 2 + 3;\nint y = 7;\nprint(x);\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_count_nodes(self):
+        ast = Parser(Lexer("int x = 2 + 3; if (x > 1) { print(x); }").tokenize()).parse()
+        # VarDecl, Binary, 2 Numbers, If, Compare, Var, Number, Block, Print, Var
+        self.assertEqual(count_nodes(ast), 11)
+
+    def test_every_phase_is_recorded(self):
+        with CompileStats(self.path) as stats:
+            stages = compile_file(self.path, stats=stats)
+        names = [record.name for record in stats.phases]
+        self.assertEqual(names, ["lex", "parse", "semantic", "irgen", "opt.tail_calls", "opt.inlining",
+                                 "opt.constant_propagation",
+                                 "opt.loop_optimization", "opt.value_numbering", "opt.dead_code_elimination",
+                                 "opt.promote_variables", "asmgen", "peephole"])
+        counts = {record.name: record.counts for record in stats.phases}
+        self.assertEqual(counts["lex"]["tokens"], len(stages["tokens"]))
+        self.assertEqual(counts["irgen"]["ir"], len(stages["ir"]))
+        self.assertEqual(counts["opt.constant_propagation"]["ir_before"], len(stages["ir"]))
+        # y is never read, x is a constant
+        self.assertLess(counts["opt.dead_code_elimination"]["ir_after"],
+                        counts["opt.dead_code_elimination"]["ir_before"])
+        self.assertEqual(counts["opt.promote_variables"]["ir_after"], len(stages["ir_opt"]))
+        self.assertTrue(all(record.wall >= 0 and record.cpu >= 0 for record in stats.phases))
+        self.assertGreater(stats.phases[0].peak, 0)
+
+    def test_json_and_table(self):
+        with CompileStats(self.path) as stats:
+            compile_file(self.path, stats=stats)
+        data = json.loads(stats.to_json())
+        self.assertEqual(data["source"], self.path)
+        self.assertEqual(len(data["phases"]), len(stats.phases))
+        self.assertEqual(set(data["phases"][0]), {"name", "wall_s", "cpu_s", "peak_bytes", "counts"})
+        table = stats.table().splitlines()
+        self.assertEqual(len(table), len(stats.phases) + 2)
+        self.assertTrue(table[-1].startswith("total"))
+
+if __name__ == "__main__":
+    unittest.main()
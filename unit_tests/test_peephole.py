@@ -0,0 +1,94 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from src.build import compile_file
+from src.code_generator.x86_encoder import Assembler
+from src.code_generator.elf_writer import ElfWriter
+from src.code_generator.peephole import PeepholeOptimizer, Rule
+
+def body(asm):
+    return [line.strip() for line in asm.splitlines()]
+
+def optimize(lines):
+    peephole = PeepholeOptimizer("\n".join(lines))
+    return body(peephole.optimize()), peephole.hits
+
+class TestPeephole(unittest.TestCase):
+    def test_compare_and_branch_fuse(self):
+        lines, hits = optimize(["start1:", "    mov rcx, [x]", "    mov r9, 0", "    cmp rcx, r8",
+                                "    setl r9b", "    cmp r9, 0", "    je end2", "    mov r9, [y]",
+                                "    jmp start1", "end2:", "    mov rax, 0", "    ret"])
+        self.assertEqual(lines, ["start1:", "mov rcx, [x]", "cmp rcx, r8", "jge end2", "mov r9, [y]",
+                                 "jmp start1", "end2:", "xor eax, eax", "ret"])
+        self.assertEqual(hits["branch_on_compare_je"], 1)
+        self.assertEqual(hits["dead_condition"], 1)
+        self.assertEqual(hits["zero_register"], 1)
+
+    def test_condition_read_later_is_kept(self):
+        lines, _ = optimize(["    mov r9, 0", "    cmp rcx, r8", "    sete r9b", "    cmp r9, 0",
+                             "    jne true1", "    mov [x], rcx", "true1:", "    mov [y], r9", "    ret"])
+        self.assertEqual(lines, ["xor r9d, r9d", "cmp rcx, r8", "sete r9b", "je true1", "mov [x], rcx",
+                                 "true1:", "mov [y], r9", "ret"])
+
+    def test_flags_read_later_keep_mov_zero(self):
+        lines, hits = optimize(["    cmp rcx, r8", "    mov rdx, 0", "    jl done", "    mov [x], rdx",
+                                "done:", "    ret"])
+        self.assertIn("mov rdx, 0", lines)
+        self.assertEqual(hits["zero_register"], 0)
+
+    def test_jumps(self):
+        lines, hits = optimize(["    cmp rcx, 0", "    jne true1", "    jmp false2", "true1:", "    mov [x], rcx",
+                                "    jmp end3", "false2:", "end3:", "    jmp next", "next:", "    ret"])
+        self.assertEqual(lines, ["cmp rcx, 0", "je false2", "true1:", "mov [x], rcx", "false2:", "end3:",
+                                 "next:", "ret"])
+        self.assertEqual((hits["jump_over_jump"], hits["jump_over_labels"], hits["jump_to_next_label"]),
+                         (1, 1, 1))
+
+    def test_moves_and_operands(self):
+        lines, hits = optimize(["    mov rcx, 3", "    mov [x], rcx", "    mov r8, 7", "    mov r10, r9",
+                                "    imul r10, r8", "    mov r11, [y]", "    mov qword [rbp-8], r11",
+                                "    mov r11, [y]", "    mov [x], r10", "    mov r10, r11", "    ret"])
+        self.assertEqual(lines, ["mov qword [x], 3", "mov r10, r9", "imul r10, 7", "mov r11, [y]",
+                                 "mov qword [rbp-8], r11", "mov r11, [y]", "mov [x], r10", "mov r10, r11",
+                                 "ret"])
+        self.assertEqual((hits["forward_move"], hits["fold_operand_past_move"]), (1, 1))
+
+    def test_big_immediates_stay_in_registers(self):
+        source = ["    mov rcx, 5000000000", "    mov [x], rcx", "    mov r8, 5000000000",
+                  "    add r9, r8", "    mov [y], r9", "    ret"]
+        lines, _ = optimize(source)
+        self.assertEqual(lines, body("\n".join(source)))
+
+    def test_rule_table(self):
+        double = Rule("double", ["add {r}, {r1}", "add {r}, {r1}"], ["lea {r}, [{r}+2*{r1}]"])
+        peephole = PeepholeOptimizer("    add rax, rcx\n    add rax, rcx\n    add rax, rdx\n    ret",
+                                     rules=(double,))
+        self.assertEqual(body(peephole.optimize()), ["lea rax, [rax+2*rcx]", "add rax, rdx", "ret"])
+        self.assertEqual(peephole.hits, {"double": 1})
+
+    def test_fixpoint(self):
+        asm = compile_file("test_programs/while_if.txt")["asm"]
+        self.assertEqual(PeepholeOptimizer(asm).optimize(), asm)
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestPeepholeOutput(unittest.TestCase):
+    def run_program(self, source, opt_level):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "prog.txt")
+            with open(path, "w") as file:
+                file.write(source)
+            asm = compile_file(path, opt_level=opt_level)["asm"]
+            exe = os.path.join(tmp, "prog")
+            ElfWriter(Assembler().assemble(asm)).write_executable(exe)
+            return subprocess.run([exe], capture_output=True, text=True).stdout
+
+    def test_same_output_as_unoptimized(self):
+        source = ("int x = 3;\nint y = 0;\nif (x > 2) { y = 1; } else { y = 2; }\n"
+                  "while (x > 0) { if (x == 2) { print(y); } x = x - 1; y = y * 10 + x; }\n"
+                  "int big = 5000000000;\nbig = big + big;\nprint(big);\nprint(y);\n")
+        self.assertEqual(self.run_program(source, 1), self.run_program(source, 0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from src.repl_session import ReplSession
+
+class TestReplSession(unittest.TestCase):
+    def setUp(self):
+        self.session = ReplSession(arena_size=2**20)
+
+    def run_line(self, src):
+        return self.session.execute(src, capture=True)[1]
+
+    def test_variables_carry_over(self):
+        self.assertEqual(self.run_line("int x = 5;"), "")
+        self.assertEqual(self.run_line("x = x * 3;"), "")
+        self.assertEqual(self.run_line("print(x);"), "15\n")
+        self.run_line("while (x > 13) { x = x - 1; }")
+        self.assertEqual(self.run_line("int y = x + 1; print(y);"), "14\n")
+
+    def test_string_variables(self):
+        self.run_line('str msg = "hello";')
+        self.assertEqual(self.run_line("print(msg);"), "hello\n")
+        self.assertEqual(self.run_line("int n = 1; print(msg);"), "hello\n")
+
+    def test_failing_entry_leaves_session_unchanged(self):
+        self.run_line("int x = 1;")
+        with self.assertRaises(RuntimeError):
+            self.run_line("int z = 2; print(nope);")
+        with self.assertRaises(RuntimeError):
+            self.run_line("print(z);")
+        # z wasn't declared, so it can be declared now
+        self.assertEqual(self.run_line("int z = 3; int w = z + x; print(w);"), "4\n")
+
+    def test_crash_keeps_session(self):
+        self.run_line("int x = 7; int zero = 0;")
+        with self.assertRaises(RuntimeError):
+            self.run_line("int q = x / zero;")
+        self.assertEqual(self.run_line("print(x);"), "7\n")
+
+    def test_crashed_entry_output_is_dropped(self):
+        self.run_line("int zero = 0;")
+        with self.assertRaises(RuntimeError):
+            self.run_line("print(1); int q = 1 / zero;")
+        self.assertEqual(self.run_line("print(2);"), "2\n")
+
+    def test_only_new_code_is_loaded(self):
+        self.run_line("int x = 1;")
+        # from here on every entry starts at the same alignment
+        self.run_line("x = x + 1;")
+        used = self.session.arena.used
+        self.run_line("x = x + 1;")
+        step = self.session.arena.used - used
+        for _ in range(20):
+            self.run_line("x = x + 1;")
+        self.assertEqual(self.session.arena.used - used, 21 * step)
+        self.assertEqual(self.run_line("print(x);"), "23\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import unittest
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.intermediate_representation.ir_generator import IRGenerator
+from src.intermediate_representation.ir_instruction import IRInstr
+from src.intermediate_representation.ir_optimizer import IROptimizer
+from src.intermediate_representation.ssa import SSABuilder
+from unit_tests.pipeline import gen_ir, run_ir
+
+def memory_ops(ir):
+    return [(instr.op, instr.arg1) for instr in ir if instr.op in ("load", "store")]
+
+SWAP_PROGRAM = """
+int i = 0;
+int s = 0;
+int a = 5;
+int b = 7;
+while (i < 10) {
+    s = s + i;
+    int c = a;
+    a = b;
+    b = c;
+    if (s > 10) {
+        s = s - 3;
+    }
+    i = i + 1;
+}
+print(s);
+print(a);
+print(b);
+"""
+
+# do-while: the latch branches back to the header and falls out of the
+# loop, where the old value of i (read as j) is printed
+DO_WHILE_IR = [
+    IRInstr("const", 0, None, "t1"), IRInstr("store", "i", "t1"),
+    IRInstr("label", None, None, "loop1"),
+    IRInstr("load", "i", None, "t2"), IRInstr("store", "j", "t2"),
+    IRInstr("const", 1, None, "t3"), IRInstr("add", "t2", "t3", "t4"), IRInstr("store", "i", "t4"),
+    IRInstr("const", 5, None, "t5"), IRInstr("lt", "t4", "t5", "t6"),
+    IRInstr("if", "t6", None, "loop1"),
+    IRInstr("load", "j", None, "t7"), IRInstr("param", "fmt_int"), IRInstr("param", "t7"),
+    IRInstr("call", "printf", None, "call2"),
+]
+
+
+class TestSSABuilder(unittest.TestCase):
+    def build(self, source, live_out=()):
+        return SSABuilder(gen_ir(source), live_out).build()
+
+    def test_phis_at_loop_header(self):
+        ssa = self.build("int x = 3;\nint y = 0;\nwhile (x > 0) {\ny = y + x;\nx = x - 1;\n}\nprint(y);\n")
+        phis = {block.label: len(block_phis) for block, block_phis in ssa.blocks() if block_phis}
+        self.assertEqual(phis, {"start1": 2})
+        instrs = [instr for block, _ in ssa.blocks() for instr in block.instrs]
+        self.assertEqual(memory_ops(instrs), [])
+
+    def test_pruned_where_dead(self):
+        # x is stored on both sides but never read after the join
+        ssa = self.build("int x = 1;\nint c = 2;\nif (c > 1) { x = 2; print(x); } else { x = 3; print(x); }\n")
+        self.assertFalse(any(phis for _, phis in ssa.blocks()))
+
+    def test_string_variables_stay_in_memory(self):
+        ssa = self.build('str s = "a";\nint n = 2;\nprint(s);\nprint(n);\n')
+        self.assertEqual(ssa.promoted, {"n"})
+
+    def test_session_variables_are_loaded_and_stored_once(self):
+        # x was declared by an earlier REPL entry
+        generator = IRGenerator(Parser(Lexer("int y = 2;\nwhile (y < 10) { y = y * x; }\n").tokenize()).parse())
+        generator.var_symbols["x"] = "INT"
+        ir = IROptimizer(generator.gen(), live_out={"x", "y"}).optimize()
+        # x is only read, y is only written back for the next entry
+        self.assertEqual(memory_ops(ir), [("load", "x"), ("store", "y")])
+        self.assertEqual(ir[-1].op, "store")
+
+
+class TestSSADestructor(unittest.TestCase):
+    def promote(self, ir):
+        optimizer = IROptimizer(ir)
+        optimizer.promote_variables()
+        return optimizer.ir_list
+
+    def test_swap_goes_through_a_saved_temp(self):
+        ir = IROptimizer(gen_ir(SWAP_PROGRAM)).optimize()
+        self.assertEqual(memory_ops(ir), [])
+        written = [instr.dest for instr in ir if instr.op == "copy"]
+        # one value of the a/b cycle is saved before the latch overwrites it
+        saved = [instr for instr in ir if instr.op == "copy"
+                 and written.count(instr.dest) == 1 and written.count(instr.arg1) > 1]
+        self.assertEqual(len(saved), 1)
+
+    def test_critical_back_edge_is_split_after_the_latch(self):
+        ir = self.promote(list(DO_WHILE_IR))
+        ops = [instr.op for instr in ir]
+        branch = ops.index("if_false")
+        # the branch leaves the loop, the copy for the header comes after it
+        self.assertEqual(ops[branch + 1:branch + 3], ["copy", "goto"])
+        self.assertEqual(ir[branch + 2].dest, "loop1")
+        label = ir[branch + 3]
+        self.assertEqual((label.op, label.dest), ("label", ir[branch].dest))
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestPromotedOutput(unittest.TestCase):
+    def run_ir(self, ir):
+        return run_ir(ir, peephole=True).stdout.decode()
+
+    def test_program_output(self):
+        ir = gen_ir(SWAP_PROGRAM)
+        self.assertEqual(self.run_ir(IROptimizer(ir).optimize()), "30\n5\n7\n")
+
+    def test_lost_copy(self):
+        optimizer = IROptimizer(list(DO_WHILE_IR))
+        optimizer.promote_variables()
+        self.assertEqual(self.run_ir(optimizer.ir_list), "4\n")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from src.code_generator.x86_encoder import Assembler
+from src.code_generator.elf_writer import ElfWriter
+from src.code_generator.asm_generator import AsmGenerator
+from src.lexical_analysis.lexer import Lexer
+from src.syntax_analysis.parser import Parser
+from src.intermediate_representation.ir_generator import IRGenerator
+
+def encode(line):
+    asm = Assembler().assemble("section .text\n" + line)
+    return bytes(asm.sections[".text"].data)
+
+class TestEncoder(unittest.TestCase):
+    def test_register_forms(self):
+        self.assertEqual(encode("mov rax, rbx"), bytes.fromhex("4889d8"))
+        self.assertEqual(encode("add r8, r15"), bytes.fromhex("4d01f8"))
+        self.assertEqual(encode("imul rcx, r9"), bytes.fromhex("490fafc9"))
+        self.assertEqual(encode("idiv r10"), bytes.fromhex("49f7fa"))
+        self.assertEqual(encode("cqo"), bytes.fromhex("4899"))
+        self.assertEqual(encode("xor eax, eax"), bytes.fromhex("31c0"))
+        self.assertEqual(encode("push r12"), bytes.fromhex("4154"))
+        self.assertEqual(encode("pop rbp"), bytes.fromhex("5d"))
+
+    def test_byte_registers(self):
+        self.assertEqual(encode("setl al"), bytes.fromhex("0f9cc0"))
+        # sil needs an empty REX prefix, r9b needs REX.B
+        self.assertEqual(encode("sete sil"), bytes.fromhex("400f94c6"))
+        self.assertEqual(encode("setne r9b"), bytes.fromhex("410f95c1"))
+        self.assertEqual(encode("movzx rax, al"), bytes.fromhex("480fb6c0"))
+
+    def test_immediates(self):
+        self.assertEqual(encode("cmp rcx, 0"), bytes.fromhex("4883f900"))
+        self.assertEqual(encode("sub rsp, 1024"), bytes.fromhex("4881ec00040000"))
+        self.assertEqual(encode("mov rax, -1"), bytes.fromhex("48c7c0ffffffff"))
+        self.assertEqual(encode("mov rax, 4294967295"), bytes.fromhex("b8ffffffff"))
+        self.assertEqual(encode("mov rax, 1099511627776"), bytes.fromhex("48b80000000000010000"))
+        self.assertEqual(encode("push 5"), bytes.fromhex("6a05"))
+        self.assertEqual(encode("push 1000"), bytes.fromhex("68e8030000"))
+
+    def test_memory_operands(self):
+        self.assertEqual(encode("mov qword [rbp-8], rcx"), bytes.fromhex("48894df8"))
+        self.assertEqual(encode("mov rax, qword [rbp-1024]"), bytes.fromhex("488b8500fcffff"))
+        self.assertEqual(encode("mov rax, [rsp]"), bytes.fromhex("488b0424"))
+        self.assertEqual(encode("mov rax, [r13]"), bytes.fromhex("498b4500"))
+        self.assertEqual(encode("mov rax, [rax+rcx*8+16]"), bytes.fromhex("488b44c810"))
+        self.assertEqual(encode("mov qword [rbp-16], 7"), bytes.fromhex("48c745f007000000"))
+        self.assertEqual(encode("push qword [rbp-8]"), bytes.fromhex("ff75f8"))
+        self.assertEqual(encode("pop qword [rbp-8]"), bytes.fromhex("8f45f8"))
+        with self.assertRaises(ValueError):
+            encode("idiv [rbp-8]")      # no operand size
+
+    def test_sse_forms(self):
+        # the mandatory prefix goes before REX
+        self.assertEqual(encode("paddq xmm0, xmm1"), bytes.fromhex("660fd4c1"))
+        self.assertEqual(encode("psubq xmm9, xmm2"), bytes.fromhex("66440ffbca"))
+        self.assertEqual(encode("psllq xmm10, 32"), bytes.fromhex("66410f73f220"))
+        self.assertEqual(encode("movq xmm1, r9"), bytes.fromhex("66490f6ec9"))
+        self.assertEqual(encode("movq xmm0, qword [rbp-8]"), bytes.fromhex("f30f7e45f8"))
+        self.assertEqual(encode("movdqu xmm0, [rcx*8+8]"), bytes.fromhex("f30f6f04cd08000000"))
+        self.assertEqual(encode("movdqu [r10*8], xmm0"), bytes.fromhex("f3420f7f04d500000000"))
+        self.assertEqual(encode("ud2"), bytes.fromhex("0f0b"))
+        with self.assertRaises(ValueError):
+            encode("paddq xmm0, rax")
+
+    def test_labels_and_relocations(self):
+        asm = Assembler().assemble(
+            "section .data\n"
+            "fmt: db \"%d\", 10, 0\n"
+            "section .text\n"
+            "extern printf\n"
+            "top:\n"
+            "    lea rdi, [rel fmt]\n"
+            "    call printf\n"
+            "    jmp top\n"
+            "    je done\n"
+            "done:\n"
+        )
+        text = asm.sections[".text"].data
+        self.assertEqual(bytes(asm.sections[".data"].data), b"%d\n\0")
+        # jumps inside .text are resolved, rel32 from the next instruction
+        self.assertEqual(text[12:17], bytes.fromhex("e9efffffff"))
+        self.assertEqual(text[17:23], bytes.fromhex("0f8400000000"))
+        kinds = {(reloc.symbol, reloc.kind, reloc.offset, reloc.addend) for reloc in asm.relocs}
+        self.assertEqual(kinds, {("fmt", "pc32", 3, -4), ("printf", "plt32", 8, -4)})
+
+    def test_undefined_symbol(self):
+        with self.assertRaises(ValueError):
+            Assembler().assemble("section .text\njmp nowhere\n")
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/maps"), "needs Linux")
+class TestElfWriter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        src = 'int x = 6; int y = x * 7; print(y); str msg = "hello"; print(msg);'
+        ast = Parser(Lexer(src).tokenize()).parse()
+        self.asm = AsmGenerator(IRGenerator(ast).gen()).gen()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_executable_runs(self):
+        path = os.path.join(self.tmp, "a.out")
+        ElfWriter(Assembler().assemble(self.asm)).write_executable(path)
+        result = subprocess.run([path], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0)
+        self.assertEqual(result.stdout, "42\nhello\n")
+
+    @unittest.skipUnless(shutil.which("gcc"), "needs gcc")
+    def test_object_links_with_gcc(self):
+        obj, exe = os.path.join(self.tmp, "out.o"), os.path.join(self.tmp, "a.out")
+        ElfWriter(Assembler().assemble(self.asm)).write_object(obj)
+        subprocess.run(["gcc", "-no-pie", obj, "-o", exe], check=True)
+        result = subprocess.run([exe], capture_output=True, text=True)
+        self.assertEqual(result.stdout, "42\nhello\n")
+
+if __name__ == "__main__":
+    unittest.main()